@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Sistema Ágil - Vistoria de Veículos
+Entrada ASGI: rotas de API de leitura atendidas de forma assíncrona
+(db.async_database) e todo o resto delegado à aplicação Flask.
+
+Só os GETs de ROTAS_ASYNC (health, listagem, busca e pdf_info) rodam no
+event loop. Todas as escritas (salvar_vistoria_completa, assinatura,
+uploads) e as rotas pesadas em I/O (buscar_vistoria_completa, PDF,
+arquivos) continuam no Flask, em threads do WsgiToAsgi, com o pool
+síncrono. O cache de tokens é compartilhado entre os dois caminhos.
+
+Uso:
+    pip install uvicorn asgiref "psycopg[binary]" psycopg_pool
+    uvicorn asgi:app --workers 2
+
+O servidor de desenvolvimento (python create_app.py) continua igual.
+"""
+import re
+from datetime import datetime
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+
+from create_app import create_app
+from db import VistoriaInfo
+from db.async_database import (
+    init_async_database, get_async_vistoria_db, get_async_pool_stats, close_async_database
+)
+
+flask_app = create_app()
+wsgi_app = WsgiToAsgi(flask_app)
+
+
+async def health_check(params):
+    """Endpoint para verificar se a API está funcionando"""
+    return 200, {
+        'status': 'ok',
+        'service': 'Sistema Ágil - Vistoria',
+        'version': '2.0.0',
+        'database': 'connected',
+        'pool': get_async_pool_stats(),
+        'token_cache': get_async_vistoria_db().token_cache.stats(),
+        'timestamp': datetime.now().isoformat()
+    }
+
+
+async def listar_vistorias(params):
+    """Listar vistorias do banco de dados (mesmo contrato de api_routes)"""
+    try:
+        per_page = min(max(int(params.get('per_page', 20)), 1), 100)
+        data_inicio = params.get('data_inicio')
+        data_fim = params.get('data_fim')
+
+        resultado = await get_async_vistoria_db().listar_vistorias_resumo(
+            limit=per_page,
+            cursor=params.get('cursor'),
+            status=params.get('status'),
+            placa=params.get('placa'),
+            conferente=params.get('conferente'),
+            data_inicio=datetime.fromisoformat(data_inicio) if data_inicio else None,
+            data_fim=datetime.fromisoformat(data_fim) if data_fim else None
+        )
+
+        return 200, {
+            'success': True,
+            'total': len(resultado['vistorias']),
+            'total_estimado': resultado['total_estimado'],
+            'per_page': per_page,
+            'next_cursor': resultado['next_cursor'],
+            'vistorias': resultado['vistorias']
+        }
+
+    except ValueError as e:
+        return 400, {'success': False, 'message': f'Parâmetro inválido: {str(e)}'}
+
+    except Exception as e:
+        print(f"❌ Erro ao listar vistorias: {e}")
+        return 500, {'success': False, 'message': f'Erro ao listar: {str(e)}'}
+
+
+async def buscar_vistorias(params):
+    """Busca aproximada de vistorias (mesmo contrato de api_routes)"""
+    try:
+        per_page = min(max(int(params.get('per_page', 20)), 1), 100)
+
+        resultado = await get_async_vistoria_db().buscar_vistorias(
+            params.get('q', ''),
+            limit=per_page,
+            cursor=params.get('cursor')
+        )
+
+        return 200, {
+            'success': True,
+            'total': len(resultado['vistorias']),
+            'per_page': per_page,
+            'next_cursor': resultado['next_cursor'],
+            'vistorias': resultado['vistorias']
+        }
+
+    except ValueError as e:
+        return 400, {'success': False, 'message': f'Parâmetro inválido: {str(e)}'}
+
+    except Exception as e:
+        print(f"❌ Erro na busca de vistorias: {e}")
+        return 500, {'success': False, 'message': f'Erro na busca: {str(e)}'}
+
+
+async def obter_info_pdf(params, token):
+    """Obter informações para geração de PDF"""
+    try:
+        vistoria = await get_async_vistoria_db().buscar_vistoria_por_token(token, projecao=VistoriaInfo)
+
+        if not vistoria:
+            return 404, {'success': False, 'message': 'Vistoria não encontrada'}
+
+        return 200, {
+            'success': True,
+            'data': {
+                'token': vistoria.get('token'),
+                'cliente': vistoria.get('nome_cliente'),
+                'placa': vistoria.get('placa'),
+                'modelo': vistoria.get('modelo'),
+                'status': vistoria.get('status')
+            }
+        }
+
+    except Exception as e:
+        print(f"❌ Erro ao obter info PDF: {e}")
+        return 500, {'success': False, 'message': f'Erro interno: {str(e)}'}
+
+
+# (padrão do path, handler) - só GET; o resto vai para o Flask
+ROTAS_ASYNC = [
+    (re.compile(r'^/api/health$'), health_check),
+    (re.compile(r'^/api/vistorias$'), listar_vistorias),
+    (re.compile(r'^/api/vistorias/search$'), buscar_vistorias),
+    (re.compile(r'^/api/pdf_info/([^/]+)$'), obter_info_pdf),
+]
+
+
+async def _responder_json(send, status, body):
+    # Mesmo serializador do jsonify (datas, Decimal etc. saem iguais)
+    payload = flask_app.json.dumps(body).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(payload)).encode()),
+            (b'access-control-allow-origin', b'*'),
+            (b'x-content-type-options', b'nosniff'),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': payload})
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                await init_async_database()
+                await send({'type': 'lifespan.startup.complete'})
+            except Exception as e:
+                print(f"❌ Erro ao abrir pool assíncrono: {e}")
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+        elif message['type'] == 'lifespan.shutdown':
+            await close_async_database()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """Aplicação ASGI"""
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+
+    if scope['type'] == 'http' and scope['method'] == 'GET':
+        for padrao, handler in ROTAS_ASYNC:
+            match = padrao.match(scope['path'])
+            if match:
+                query = parse_qs(scope.get('query_string', b'').decode('latin-1'), keep_blank_values=True)
+                params = {chave: valores[0] for chave, valores in query.items()}
+                status, body = await handler(params, *match.groups())
+                return await _responder_json(send, status, body)
+
+    return await wsgi_app(scope, receive, send)
@@ -34,6 +34,32 @@ UPLOAD_CONFIG = {
     'UPLOAD_FOLDER': Path(__file__).parent / 'uploads'
 }
 
+# Processamento de fotos: threads que gravam as fotos de uma vistoria em paralelo
+# e normalização na entrada (orientação EXIF, maior lado, formato/qualidade,
+# sem metadados); o original só é guardado com PHOTO_KEEP_ORIGINAL=true.
+# Quase-duplicatas na mesma vistoria (hash perceptual a até
+# PHOTO_DUPLICATE_DISTANCE bits): marcar, descartar ou desligado
+PHOTO_CONFIG = {
+    'WORKERS': int(os.getenv('PHOTO_WORKERS', str(min(8, os.cpu_count() or 1)))),
+    'NORMALIZE': os.getenv('PHOTO_NORMALIZE', 'true').lower() == 'true',
+    'MAX_SIDE': int(os.getenv('PHOTO_MAX_SIDE', '2048')),
+    'FORMAT': os.getenv('PHOTO_FORMAT', 'JPEG').upper(),  # JPEG ou WEBP
+    'QUALITY': int(os.getenv('PHOTO_QUALITY', '82')),
+    'KEEP_ORIGINAL': os.getenv('PHOTO_KEEP_ORIGINAL', 'false').lower() == 'true',
+    'DUPLICATES': os.getenv('PHOTO_DUPLICATES', 'marcar').lower(),
+    'DUPLICATE_DISTANCE': int(os.getenv('PHOTO_DUPLICATE_DISTANCE', '6'))
+}
+
+# Derivadas redimensionadas de /uploads (?w=480&fmt=webp&q=70): larguras e
+# qualidades permitidas e cache em disco com limite de tamanho (LRU)
+DERIVATIVE_CONFIG = {
+    'WIDTHS': tuple(int(w) for w in os.getenv('DERIVATIVE_WIDTHS', '160,320,480,640,960,1280').split(',')),
+    'QUALITIES': (50, 60, 70, 75, 80, 90),
+    'DEFAULT_QUALITY': 75,
+    'FOLDER': Path(__file__).parent / 'cache_derivadas',
+    'MAX_BYTES': int(os.getenv('DERIVATIVE_CACHE_MB', '512')) * 1024 * 1024
+}
+
 # Configurações de assinatura
 SIGNATURE_CONFIG = {
     'FOLDER': Path(__file__).parent / 'assinaturas',
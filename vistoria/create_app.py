@@ -7,15 +7,22 @@ import sys
 import webbrowser
 import threading
 import time
-from flask import Flask, request
+from flask import Flask, request, g
 from flask_cors import CORS
 
 # Importar módulos organizados
 from db import init_database, close_database
+from db.database import DatabaseConfig
+from db.migrations import apply_migrations
+from db.partitions import garantir_particoes
+from db.sweeper import start_expiry_sweeper, stop_expiry_sweeper
+from db.jobs import start_job_workers, stop_job_workers
+from db.metrics import iniciar_requisicao, finalizar_requisicao
 from routes.vistoria_routes import vistoria_bp
 from routes.assinatura_routes import assinatura_bp
 from routes.api_routes import api_bp
 from routes.pdf_routes import pdf_bp
+from routes.upload_routes import upload_bp
 from routes.auth_routes import auth_bp
 
 
@@ -34,6 +41,21 @@ def create_app():
     app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB máximo (reduzido para mobile)
     app.config['SECRET_KEY'] = 'sistema-agil-vistoria-2025'
     
+    # Contagem de consultas por requisição (N+1 aparece no log e no header)
+    @app.before_request
+    def start_query_count():
+        g.db_metrics_token = iniciar_requisicao()
+    
+    @app.after_request
+    def add_query_count_headers(response):
+        token = g.pop('db_metrics_token', None)
+        if token is not None:
+            resumo = finalizar_requisicao(token, f"{request.method} {request.path}")
+            if resumo:
+                response.headers['X-DB-Query-Count'] = str(resumo['count'])
+                response.headers['X-DB-Query-Time-Ms'] = f"{resumo['ms']:.1f}"
+        return response
+    
     # Headers de otimização para mobile
     @app.after_request
     def add_mobile_headers(response):
@@ -59,12 +81,34 @@ def create_app():
         print("🔧 Verifique as configurações em db/database.py")
         sys.exit(1)
     
+    # Aplicar migrações pendentes (ou rode: python -m db.migrations upgrade)
+    if DatabaseConfig.AUTO_MIGRATE:
+        try:
+            apply_migrations()
+        except Exception as e:
+            print(f"❌ Erro ao aplicar migrações: {e}")
+            sys.exit(1)
+    
+    # Partições do mês atual e seguintes (também: python -m db.partitions ensure)
+    try:
+        with init_database().connection() as conn:
+            garantir_particoes(conn)
+    except Exception as e:
+        print(f"⚠️ Não foi possível garantir as partições mensais: {e}")
+    
+    # Expirar links vencidos em fundo (ou rode: python -m db.sweeper loop)
+    start_expiry_sweeper()
+    
+    # Workers da fila de tarefas (ou rode: python -m db.jobs worker)
+    start_job_workers()
+    
     # Registrar blueprints
     app.register_blueprint(auth_bp)
     app.register_blueprint(vistoria_bp)
     app.register_blueprint(assinatura_bp)
     app.register_blueprint(api_bp)
     app.register_blueprint(pdf_bp)
+    app.register_blueprint(upload_bp)
     
     return app
 
@@ -100,9 +144,13 @@ def main():
         )
     except KeyboardInterrupt:
         print("\n⏹️  Servidor parado pelo usuário")
+        stop_expiry_sweeper()
+        stop_job_workers()
         close_database()
     except Exception as e:
         print(f"❌ Erro ao iniciar servidor: {e}")
+        stop_expiry_sweeper()
+        stop_job_workers()
         close_database()
         sys.exit(1)
 
@@ -1,6 +1,11 @@
 """
 Módulo de banco de dados
 """
-from .database import init_database, get_vistoria_db, close_database
+from .database import init_database, get_vistoria_db, close_database, get_pool_stats, get_cache_stats
+from .pool import PoolTimeoutError
+from .metrics import get_query_metrics
+from .rows import VistoriaStatus, VistoriaInfo, VistoriaCliente
 
-__all__ = ['init_database', 'get_vistoria_db', 'close_database']
+__all__ = ['init_database', 'get_vistoria_db', 'close_database', 'get_pool_stats', 'get_cache_stats', 'get_query_metrics',
+           'PoolTimeoutError',
+           'VistoriaStatus', 'VistoriaInfo', 'VistoriaCliente']
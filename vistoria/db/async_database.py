@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+"""
+Acesso assíncrono ao banco (psycopg 3 + psycopg_pool) para deploy ASGI
+Sistema Vistoria Agil - PostgreSQL Integration
+
+AsyncVistoriaDatabase tem os mesmos métodos e resultados de
+VistoriaDatabase, como corrotinas. SQL, montagem de valores, projeções e
+cursores de paginação são herdados da classe síncrona; só o I/O muda.
+O caminho síncrono (Flask + psycopg2) continua disponível sem alterações.
+
+Dependências (opcionais, só para o deploy ASGI):
+    pip install "psycopg[binary]" psycopg_pool
+"""
+
+import json
+import time
+import logging
+
+from .database import (
+    DatabaseConfig, VistoriaDatabase, get_vistoria_db,
+    SQL_INSERIR_VISTORIA, SQL_INSERIR_FOTOS, SQL_INSERIR_OBSERVACOES, SQL_REGISTRAR_BLOBS,
+    SQL_BUSCAR_FOTOS, SQL_BUSCAR_POR_TOKEN, SQL_BUSCAR_POR_ID, SQL_CRIADO_EM_FOTO,
+    SQL_ATUALIZAR_ASSINATURA, SQL_EXPIRAR_VISTORIAS, SQL_LISTAR_RECENTES, SQL_ESTIMAR_TOTAL,
+    TEMPLATE_FOTO, TEMPLATE_OBSERVACAO,
+)
+from .cache import TTLCache, NAO_ENCONTRADO
+
+try:
+    import psycopg
+    from psycopg.rows import dict_row, tuple_row
+    from psycopg_pool import AsyncConnectionPool
+except ImportError:  # deploy WSGI não precisa do psycopg 3
+    psycopg = None
+
+logger = logging.getLogger(__name__)
+
+
+def _sql_multi_linha(sql, valores, linha=None):
+    """Expandir o `VALUES %s` dos INSERTs multi-linha (execute_values no psycopg2)"""
+    linha = linha or '(' + ', '.join(['%s'] * len(valores[0])) + ')'
+    params = [valor for tupla in valores for valor in tupla]
+    return sql.replace('VALUES %s', 'VALUES ' + ', '.join([linha] * len(valores))), params
+
+
+class AsyncDatabaseManager:
+    """Pool assíncrono de conexões PostgreSQL"""
+
+    def __init__(self):
+        if psycopg is None:
+            raise RuntimeError('psycopg 3 não instalado: pip install "psycopg[binary]" psycopg_pool')
+        params = DatabaseConfig.get_connection_params()
+        params.pop('cursor_factory')
+        params['dbname'] = params.pop('database')
+        self.pool = AsyncConnectionPool(
+            psycopg.conninfo.make_conninfo(**params),
+            min_size=DatabaseConfig.MIN_CONNECTIONS,
+            max_size=DatabaseConfig.MAX_CONNECTIONS,
+            timeout=DatabaseConfig.POOL_TIMEOUT,
+            max_lifetime=DatabaseConfig.POOL_MAX_LIFETIME,
+            max_idle=DatabaseConfig.POOL_MAX_LIFETIME,
+            kwargs={'row_factory': dict_row},
+            open=False
+        )
+
+    async def open(self):
+        """Abrir o pool (precisa de um event loop rodando)"""
+        await self.pool.open(wait=True, timeout=DatabaseConfig.POOL_TIMEOUT)
+        logger.info("✅ Pool assíncrono PostgreSQL inicializado")
+
+    def connection(self, timeout=None):
+        """
+        Checkout de conexão: `async with manager.connection() as conn`
+
+        Commit ao sair sem erro, rollback em caso de exceção; conexões
+        quebradas são descartadas pelo próprio pool.
+        """
+        return self.pool.connection(timeout=timeout)
+
+    def get_pool_stats(self):
+        stats = self.pool.get_stats()
+        return {
+            'max': self.pool.max_size,
+            'size': stats.get('pool_size', 0),
+            'idle': stats.get('pool_available', 0),
+            'waiters': stats.get('requests_waiting', 0),
+            'checkouts': stats.get('requests_num', 0),
+            'timeouts': stats.get('requests_errors', 0),
+            'wait_time_total': stats.get('requests_wait_ms', 0) / 1000.0,
+        }
+
+    async def close(self):
+        await self.pool.close()
+        logger.info("✅ Pool assíncrono fechado")
+
+
+class AsyncVistoriaDatabase(VistoriaDatabase):
+    """Versão assíncrona de VistoriaDatabase (mesmos métodos, como corrotinas)"""
+
+    def __init__(self, db_manager, token_cache=None):
+        """
+        token_cache: cache de tokens do VistoriaDatabase do mesmo processo;
+            as escritas passam pelo Flask (síncrono) e só invalidam esse
+            cache, então um cache próprio serviria status antigos
+        """
+        self.db_manager = db_manager
+        self.token_cache = token_cache or TTLCache(
+            maxsize=DatabaseConfig.TOKEN_CACHE_MAX,
+            ttl=DatabaseConfig.TOKEN_CACHE_TTL,
+            negative_ttl=DatabaseConfig.TOKEN_CACHE_NEGATIVE_TTL
+        )
+
+    async def _inserir_vistoria_cursor(self, cursor, dados_vistoria, token):
+        await cursor.execute(SQL_INSERIR_VISTORIA, self._preparar_valores_vistoria(dados_vistoria, token))
+        resultado = await cursor.fetchone()
+        return resultado['id'], resultado['token'], resultado['criado_em']
+
+    async def _inserir_multi_linha(self, cursor, sql, valores, template):
+        if not valores:
+            return []
+        sql, params = _sql_multi_linha(sql, valores, template)
+        await cursor.execute(sql, params)
+        return [row['id'] for row in await cursor.fetchall()]
+
+    async def _inserir_fotos_cursor(self, cursor, vistoria_id, fotos):
+        blobs = self._valores_blobs(fotos)
+        if blobs:
+            await cursor.execute(*_sql_multi_linha(SQL_REGISTRAR_BLOBS, blobs))
+        valores = [self._valores_foto(vistoria_id, categoria, info) for categoria, info in fotos]
+        return await self._inserir_multi_linha(cursor, SQL_INSERIR_FOTOS, valores, TEMPLATE_FOTO)
+
+    async def _inserir_observacoes_cursor(self, cursor, observacoes):
+        valores = [self._valores_observacao(obs) for obs in observacoes]
+        return await self._inserir_multi_linha(cursor, SQL_INSERIR_OBSERVACOES, valores, TEMPLATE_OBSERVACAO)
+
+    async def inserir_vistoria(self, dados_vistoria):
+        """Inserir nova vistoria no banco de dados"""
+        try:
+            token = self.gerar_token_unico()
+            async with self.db_manager.connection() as conn:
+                vistoria_id, token_retornado, _ = await self._inserir_vistoria_cursor(
+                    conn.cursor(), dados_vistoria, token
+                )
+            self.invalidar_cache_token(token_retornado)
+
+            print(f"✅ [DB] Vistoria inserida com ID sequencial: {vistoria_id}")
+            return {
+                'id': vistoria_id,
+                'token': token_retornado,
+                'success': True
+            }
+
+        except Exception as e:
+            logger.error(f"❌ Erro ao inserir vistoria: {e}")
+            raise
+
+    async def inserir_foto_vistoria(self, vistoria_id, categoria, arquivo_info):
+        """Inserir foto da vistoria"""
+        return (await self.inserir_fotos_vistoria(vistoria_id, [(categoria, arquivo_info)]))[0]
+
+    async def inserir_fotos_vistoria(self, vistoria_id, fotos):
+        """Inserir várias fotos de uma vistoria em um único INSERT e commit"""
+        try:
+            async with self.db_manager.connection() as conn:
+                foto_ids = await self._inserir_fotos_cursor(conn.cursor(), vistoria_id, fotos)
+
+            print(f"✅ [DB] {len(foto_ids)} fotos inseridas: {foto_ids}")
+            return foto_ids
+
+        except Exception as e:
+            logger.error(f"❌ Erro ao inserir fotos: {e}")
+            raise
+
+    async def inserir_vistoria_completa(self, dados_vistoria, fotos=None, observacoes=None, token=None):
+        """Inserir vistoria, fotos e observações em uma única transação"""
+        fotos = fotos or []
+        observacoes = observacoes or []
+        token = token or self.gerar_token_unico()
+
+        try:
+            async with self.db_manager.connection() as conn:
+                cursor = conn.cursor()
+
+                vistoria_id, token_retornado, criado_em = await self._inserir_vistoria_cursor(
+                    cursor, dados_vistoria, token
+                )
+                foto_ids = await self._inserir_fotos_cursor(cursor, vistoria_id, fotos)
+                observacao_ids = await self._inserir_observacoes_cursor(cursor, [
+                    {**obs, 'foto_vistoria_id': foto_ids[obs['foto_index']], 'vistoria_criado_em': criado_em}
+                    for obs in observacoes
+                ])
+            self.invalidar_cache_token(token_retornado)
+
+            print(f"✅ [DB] Vistoria {vistoria_id} salva em uma transação: "
+                  f"{len(foto_ids)} fotos, {len(observacao_ids)} observações")
+
+            return {
+                'id': vistoria_id,
+                'token': token_retornado,
+                'foto_ids': foto_ids,
+                'observacao_ids': observacao_ids,
+                'success': True
+            }
+
+        except Exception as e:
+            logger.error(f"❌ Erro ao inserir vistoria completa: {e}")
+            raise
+
+    async def inserir_observacao_foto(self, foto_vistoria_id, descricao, tipo='dano', gravidade='baixa', prioridade='normal',
+                                      vistoria_criado_em=None):
+        """Inserir observação de uma foto (ver VistoriaDatabase.inserir_observacao_foto)"""
+        try:
+            async with self.db_manager.connection() as conn:
+                cursor = conn.cursor()
+                if vistoria_criado_em is None:
+                    await cursor.execute(SQL_CRIADO_EM_FOTO, (foto_vistoria_id,))
+                    foto = await cursor.fetchone()
+                    if foto is None:
+                        raise ValueError(f"Foto {foto_vistoria_id} não encontrada")
+                    vistoria_criado_em = foto['vistoria_criado_em']
+                observacao_id = (await self._inserir_observacoes_cursor(cursor, [{
+                    'foto_vistoria_id': foto_vistoria_id,
+                    'vistoria_criado_em': vistoria_criado_em,
+                    'descricao': descricao,
+                    'tipo': tipo,
+                    'gravidade': gravidade,
+                    'prioridade': prioridade
+                }]))[0]
+
+            print(f"✅ [DB] Observação inserida com ID sequencial: {observacao_id}")
+            return observacao_id
+
+        except Exception as e:
+            logger.error(f"❌ Erro ao inserir observação: {e}")
+            raise
+
+    async def buscar_fotos_vistoria(self, vistoria_id):
+        """Buscar fotos de uma vistoria com observações"""
+        try:
+            async with self.db_manager.connection() as conn:
+                cursor = await conn.execute(SQL_BUSCAR_FOTOS, (vistoria_id,))
+                return await cursor.fetchall()
+
+        except Exception as e:
+            logger.error(f"❌ Erro ao buscar fotos: {e}")
+            raise
+
+    async def _buscar_projecao(self, coluna, valor, projecao):
+        """Buscar uma vistoria como linha compacta da projeção informada"""
+        async with self.db_manager.connection() as conn:
+            cursor = conn.cursor(row_factory=tuple_row)
+            await cursor.execute(self.sql_projecao(projecao, coluna), (valor,))
+            result = await cursor.fetchone()
+            return projecao._make(result) if result else None
+
+    async def _buscar_uma(self, sql, coluna, valor):
+        """Buscar uma vistoria completa (dict) por `coluna` = `valor`"""
+        async with self.db_manager.connection() as conn:
+            cursor = await conn.execute(sql, (valor,))
+            return await cursor.fetchone()
+
+    async def _buscar_linha_por_token(self, token):
+        """Linha completa da vistoria (dict) pelo token, lendo através do cache"""
+        encontrado, linha = self.token_cache.get(token)
+        if encontrado:
+            return None if linha is NAO_ENCONTRADO else linha
+
+        lido_em = time.monotonic()
+        linha = await self._buscar_uma(SQL_BUSCAR_POR_TOKEN, 'token', token)
+
+        self.token_cache.set(token, NAO_ENCONTRADO if linha is None else linha, lido_em=lido_em)
+        return linha
+
+    async def buscar_vistoria_por_token(self, token, projecao=None):
+        """Buscar vistoria pelo token (ver VistoriaDatabase.buscar_vistoria_por_token)"""
+        try:
+            if self.token_cache.enabled:
+                linha = await self._buscar_linha_por_token(token)
+                if linha is None:
+                    return None
+                if projecao is not None:
+                    return projecao._make(linha[coluna] for coluna in projecao.COLUMNS)
+                return dict(linha)
+
+            if projecao is not None:
+                return await self._buscar_projecao('token', token, projecao)
+
+            return await self._buscar_uma(SQL_BUSCAR_POR_TOKEN, 'token', token)
+
+        except Exception as e:
+            logger.error(f"❌ Erro ao buscar vistoria por token: {e}")
+            return None
+
+    async def buscar_vistoria_completa(self, token, projecao=None):
+        """Vistoria com fotos e observações aninhadas (ver VistoriaDatabase.buscar_vistoria_completa)"""
+        try:
+            return await self._buscar_uma(self.sql_agregado('token', projecao), 'token', token)
+
+        except Exception as e:
+            logger.error(f"❌ Erro ao buscar vistoria completa: {e}")
+            return None
+
+    async def buscar_vistoria_por_id(self, vistoria_id, projecao=None):
+        """Buscar vistoria por ID sequencial (projecao: ver buscar_vistoria_por_token)"""
+        try:
+            if projecao is not None:
+                return await self._buscar_projecao('id', vistoria_id, projecao)
+
+            return await self._buscar_uma(SQL_BUSCAR_POR_ID, 'id', vistoria_id)
+
+        except Exception as e:
+            logger.error(f"❌ Erro ao buscar vistoria por ID: {e}")
+            return None
+
+    async def atualizar_assinatura_vistoria(self, token, assinatura_path, cliente_nome, checksum=None):
+        """Atualizar vistoria com dados da assinatura"""
+        try:
+            async with self.db_manager.connection() as conn:
+                cursor = await conn.execute(SQL_ATUALIZAR_ASSINATURA, (assinatura_path, cliente_nome, checksum, token))
+                resultado = await cursor.fetchone()
+
+            if resultado:
+                print(f"✅ [DB] Assinatura salva para vistoria ID: {resultado['id']}")
+                return {
+                    'id': resultado['id'],
+                    'placa': resultado['placa'],
+                    'modelo': resultado['modelo'],
+                    'token': resultado['token']
+                }
+            print(f"❌ [DB] Token inválido ou vistoria já assinada: {token}")
+            return None
+
+        except Exception as e:
+            logger.error(f"❌ Erro ao atualizar assinatura: {e}")
+            raise
+        finally:
+            self.invalidar_cache_token(token)
+
+    async def expirar_vistorias(self, limite=500):
+        """Marcar como 'expirado' até `limite` vistorias com link vencido"""
+        try:
+            async with self.db_manager.connection() as conn:
+                cursor = await conn.execute(SQL_EXPIRAR_VISTORIAS, (limite,))
+                expiradas = await cursor.fetchall()
+
+            for vistoria in expiradas:
+                self.invalidar_cache_token(vistoria['token'])
+            return expiradas
+
+        except Exception as e:
+            logger.error(f"❌ Erro ao expirar vistorias: {e}")
+            raise
+
+    async def listar_vistorias_recentes(self, limite=10):
+        """Listar vistorias mais recentes"""
+        try:
+            async with self.db_manager.connection() as conn:
+                cursor = await conn.execute(SQL_LISTAR_RECENTES, (limite,))
+                return await cursor.fetchall()
+
+        except Exception as e:
+            logger.error(f"❌ Erro ao listar vistorias: {e}")
+            return []
+
+    async def _estimar_total(self, conn, where_sql, params):
+        """Estimativa barata de linhas: estatísticas da tabela ou plano do EXPLAIN"""
+        if not where_sql:
+            cursor = await conn.execute(SQL_ESTIMAR_TOTAL)
+            row = await cursor.fetchone()
+            return max(int(row['total']), 0) if row else 0
+
+        # EXPLAIN não aceita parâmetros do servidor: interpolar no cliente
+        cursor = psycopg.AsyncClientCursor(conn, row_factory=dict_row)
+        await cursor.execute(f"EXPLAIN (FORMAT JSON) SELECT 1 FROM vistorias {where_sql}", params)
+        plano = (await cursor.fetchone())['QUERY PLAN']
+        if isinstance(plano, str):
+            plano = json.loads(plano)
+        return int(plano[0]['Plan']['Plan Rows'])
+
+    async def listar_vistorias_resumo(self, limit=20, cursor=None, status=None, placa=None,
+                                      conferente=None, data_inicio=None, data_fim=None):
+        """Listar vistorias com paginação por cursor (ver VistoriaDatabase.listar_vistorias_resumo)"""
+        sql, params_pagina, where_filtros, params = self.montar_consulta_resumo(
+            limit, cursor, status, placa, conferente, data_inicio, data_fim
+        )
+
+        try:
+            async with self.db_manager.connection() as conn:
+                db_cursor = await conn.execute(sql, params_pagina)
+                results = await db_cursor.fetchall()
+
+                next_cursor = None
+                if len(results) > limit:
+                    results = results[:limit]
+                    ultimo = results[-1]
+                    next_cursor = self.codificar_cursor(ultimo['criado_em'], ultimo['id'])
+
+                total_estimado = await self._estimar_total(conn, where_filtros, params)
+
+            return {
+                'vistorias': results,
+                'next_cursor': next_cursor,
+                'total_estimado': total_estimado
+            }
+
+        except Exception as e:
+            logger.error(f"❌ Erro ao listar resumo de vistorias: {e}")
+            raise
+
+    async def buscar_vistorias(self, termo, limit=20, cursor=None):
+        """Busca aproximada (ver VistoriaDatabase.buscar_vistorias)"""
+        sql, params = self.montar_consulta_busca(termo, limit, cursor)
+
+        try:
+            async with self.db_manager.connection() as conn:
+                db_cursor = await conn.execute(sql, params)
+                results = await db_cursor.fetchall()
+
+            next_cursor = None
+            if len(results) > limit:
+                results = results[:limit]
+                ultimo = results[-1]
+                next_cursor = self.codificar_cursor_busca(
+                    ultimo['relevancia'], ultimo['criado_em'], ultimo['id']
+                )
+
+            return {'vistorias': results, 'next_cursor': next_cursor}
+
+        except Exception as e:
+            logger.error(f"❌ Erro na busca de vistorias: {e}")
+            raise
+
+
+# Instância global (criada no startup do servidor ASGI)
+_async_database_manager = None
+_async_vistoria_db = None
+
+async def init_async_database():
+    """
+    Abrir o pool assíncrono (chamar dentro do event loop do servidor)
+
+    O cache de tokens é o mesmo do get_vistoria_db(): uma assinatura
+    gravada pelo Flask invalida também as leituras assíncronas.
+    """
+    global _async_database_manager, _async_vistoria_db
+    if _async_database_manager is None:
+        manager = AsyncDatabaseManager()
+        await manager.open()
+        _async_database_manager = manager
+        _async_vistoria_db = AsyncVistoriaDatabase(manager, token_cache=get_vistoria_db().token_cache)
+    return _async_database_manager
+
+def get_async_vistoria_db():
+    """Obter instância global assíncrona (após init_async_database)"""
+    if _async_vistoria_db is None:
+        raise RuntimeError("Banco assíncrono não inicializado: chame init_async_database()")
+    return _async_vistoria_db
+
+def get_async_pool_stats():
+    return _async_database_manager.get_pool_stats() if _async_database_manager else {}
+
+async def close_async_database():
+    """Fechar o pool assíncrono"""
+    global _async_database_manager, _async_vistoria_db
+    if _async_database_manager:
+        await _async_database_manager.close()
+        _async_database_manager = None
+    _async_vistoria_db = None
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Armazenamento de fotos endereçado por conteúdo
+Sistema Vistoria Agil - PostgreSQL Integration
+
+Cada arquivo fica uma única vez em DB_BLOB_DIR/ab/cd/<sha256><ext>; as
+linhas de fotos_vistoria apontam para ele por blob_sha256. Reenvios e a
+mesma imagem nos formatos 'photos' e 'fotos' não ocupam disco de novo.
+
+A tabela blobs (migração 9) guarda a contagem de referências, mantida
+por gatilho em fotos_vistoria. A coleta apaga blobs sem referência há
+mais de DB_BLOB_GC_GRACE_HOURS; arquivos no disco sem linha em blobs
+(transação que falhou) também são apagados após o mesmo prazo. Todo
+reuso de um arquivo atualiza seu mtime, e a coleta nunca apaga arquivo
+com mtime dentro do prazo: um envio em andamento não perde o blob.
+
+Meses arquivados (db/partitions.py) continuam contando como referência.
+
+A partir da pasta vistoria/:
+    python -m db.blobs stats
+    python -m db.blobs gc [--orfaos]
+    python -m db.blobs backfill [--lote 500]
+"""
+
+import os
+import sys
+import time
+import argparse
+import logging
+
+from psycopg2.extras import execute_values
+
+from .database import DatabaseConfig, VistoriaDatabase, SQL_REGISTRAR_BLOBS, init_database
+from .metrics import consulta_nomeada
+
+logger = logging.getLogger(__name__)
+
+EXTENSOES = {
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/gif': '.gif',
+    'image/webp': '.webp',
+    'application/pdf': '.pdf',
+    'application/msword': '.doc',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document': '.docx',
+}
+
+LOTE_COLETA = 1000
+
+# Linha travada e condição reavaliada: uma foto inserida em paralelo impede a exclusão
+SQL_COLETAR = """
+    DELETE FROM blobs WHERE sha256 IN (
+        SELECT sha256 FROM blobs
+        WHERE referencias <= 0
+          AND sem_referencia_desde <= CURRENT_TIMESTAMP - %s * INTERVAL '1 hour'
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    ) AND referencias <= 0
+    RETURNING sha256, caminho
+"""
+
+SQL_EXISTENTES = "SELECT sha256 FROM blobs WHERE sha256 = ANY(%s)"
+
+SQL_ESTATISTICAS = """
+    SELECT count(*) AS blobs,
+        coalesce(sum(tamanho), 0) AS bytes,
+        coalesce(sum(referencias), 0) AS referencias,
+        count(*) FILTER (WHERE referencias <= 0) AS sem_referencia,
+        (SELECT coalesce(sum(arquivo_tamanho) FILTER (WHERE blob_sha256 IS NOT NULL), 0)
+              + coalesce(sum(arquivo_tamanho_original) FILTER (WHERE original_blob_sha256 IS NOT NULL), 0)
+         FROM fotos_vistoria) AS bytes_sem_dedup,
+        (SELECT coalesce(sum(arquivo_tamanho_original), 0) FROM fotos_vistoria
+         WHERE arquivo_tamanho_original IS NOT NULL) AS bytes_recebidos,
+        (SELECT coalesce(sum(arquivo_tamanho_original - arquivo_tamanho), 0) FROM fotos_vistoria
+         WHERE arquivo_tamanho_original IS NOT NULL) AS bytes_economizados_normalizacao
+    FROM blobs
+"""
+
+SQL_FOTOS_LEGADAS = """
+    SELECT id, vistoria_criado_em, arquivo_path, arquivo_tipo
+    FROM fotos_vistoria
+    WHERE blob_sha256 IS NULL AND arquivo_path IS NOT NULL AND arquivo_path <> ''
+      AND id > %s
+    ORDER BY id
+    LIMIT %s
+"""
+
+SQL_APONTAR_BLOBS = """
+    UPDATE fotos_vistoria f SET blob_sha256 = n.sha256, arquivo_path = n.caminho, arquivo_url = n.url
+    FROM (VALUES %s) AS n(id, vistoria_criado_em, sha256, caminho, url)
+    WHERE f.id = n.id AND f.vistoria_criado_em = n.vistoria_criado_em
+"""
+
+
+class BlobStore:
+    """Arquivos por SHA-256 no disco e coleta dos sem referência"""
+
+    def __init__(self, raiz=None, db_manager=None):
+        self.raiz = os.path.abspath(raiz or DatabaseConfig.BLOB_DIR)
+        self._db_manager = db_manager
+
+    @property
+    def db_manager(self):
+        if self._db_manager is None:
+            self._db_manager = init_database()
+        return self._db_manager
+
+    @staticmethod
+    def extensao(mimetype, padrao='.bin'):
+        return EXTENSOES.get(mimetype or '', padrao)
+
+    def caminho(self, sha256, ext):
+        return os.path.join(self.raiz, sha256[:2], sha256[2:4], sha256 + ext)
+
+    def url(self, caminho):
+        """URL servida por /uploads/<path> (DB_BLOB_DIR fica dentro de uploads/)"""
+        relativo = os.path.relpath(caminho, os.path.abspath('uploads'))
+        return '/uploads/' + relativo.replace(os.sep, '/')
+
+    def guardar(self, temporario, sha256, ext):
+        """
+        Colocar o arquivo temporário no lugar do blob
+
+        Returns:
+            tuple: (caminho, novo) - novo=False se o conteúdo já existia
+                (o temporário é apagado e o mtime do existente, renovado)
+        """
+        destino = self.caminho(sha256, ext)
+        if os.path.exists(destino):
+            try:
+                os.utime(destino)
+                os.remove(temporario)
+                return destino, False
+            except FileNotFoundError:
+                pass  # coletado entre o exists e o utime: gravar de novo
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        os.replace(temporario, destino)
+        return destino, True
+
+    def registrar_cursor(self, cursor, arquivos):
+        """Garantir as linhas de blobs de arquivo_info com 'blob' (mesma transação, sem commit)"""
+        valores = VistoriaDatabase._valores_blobs([(None, info) for info in arquivos])
+        if valores:
+            execute_values(cursor, SQL_REGISTRAR_BLOBS, valores, page_size=len(valores))
+
+    def _remover_arquivo(self, caminho, prazo):
+        """Apagar se o mtime for anterior ao prazo; False se foi reusado ou não existe"""
+        try:
+            if os.path.getmtime(caminho) > prazo:
+                return False
+            os.remove(caminho)
+            return True
+        except FileNotFoundError:
+            return False
+
+    @consulta_nomeada
+    def coletar(self, horas=None, limite=LOTE_COLETA):
+        """
+        Apagar blobs sem referência há mais de `horas`
+
+        Returns:
+            int: blobs apagados (o arquivo fica se foi reusado dentro do prazo)
+        """
+        horas = DatabaseConfig.BLOB_GC_GRACE_HOURS if horas is None else horas
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(SQL_COLETAR, (horas, limite))
+            coletados = cursor.fetchall()
+            conn.commit()
+
+        prazo = time.time() - horas * 3600
+        for row in coletados:
+            self._remover_arquivo(row['caminho'], prazo)
+        return len(coletados)
+
+    def coletar_orfaos(self, horas=None, lote=LOTE_COLETA):
+        """
+        Apagar arquivos sem linha em blobs (envios cuja transação falhou)
+
+        Percorre toda a árvore: rode pela CLI, fora do horário de pico.
+        """
+        horas = DatabaseConfig.BLOB_GC_GRACE_HOURS if horas is None else horas
+        prazo = time.time() - horas * 3600
+        removidos = 0
+        candidatos = {}
+
+        def verificar():
+            nonlocal removidos
+            with self.db_manager.connection(read_only=True) as conn:
+                cursor = conn.cursor()
+                cursor.execute(SQL_EXISTENTES, (list(candidatos),))
+                existentes = {row['sha256'] for row in cursor.fetchall()}
+            for sha256, caminho in candidatos.items():
+                if sha256 not in existentes:
+                    removidos += self._remover_arquivo(caminho, prazo)
+            candidatos.clear()
+
+        for pasta, _, arquivos in os.walk(self.raiz):
+            for nome in arquivos:
+                caminho = os.path.join(pasta, nome)
+                sha256 = os.path.splitext(nome)[0]
+                if len(sha256) != 64 or os.path.getmtime(caminho) > prazo:
+                    continue
+                candidatos[sha256] = caminho
+                if len(candidatos) >= lote:
+                    verificar()
+        if candidatos:
+            verificar()
+        return removidos
+
+    @consulta_nomeada
+    def estatisticas(self):
+        with self.db_manager.connection(read_only=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute(SQL_ESTATISTICAS)
+            stats = dict(cursor.fetchone())
+        stats['bytes_economizados'] = max(int(stats['bytes_sem_dedup']) - int(stats['bytes']), 0)
+        return stats
+
+    def backfill(self, lote=500, calcular=None):
+        """
+        Mover fotos antigas (sem blob_sha256) para o armazenamento por conteúdo
+
+        Args:
+            calcular: função(caminho) -> (sha256, mimetype, largura, altura)
+
+        Returns:
+            int: fotos migradas
+        """
+        migradas = 0
+        ultimo_id = 0
+        while True:
+            with self.db_manager.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(SQL_FOTOS_LEGADAS, (ultimo_id, lote))
+                fotos = cursor.fetchall()
+                if not fotos:
+                    return migradas
+                ultimo_id = fotos[-1]['id']
+
+                arquivos, apontar = [], []
+                for foto in fotos:
+                    origem = foto['arquivo_path']
+                    if not os.path.exists(origem):
+                        continue
+                    sha256, mimetype, largura, altura = calcular(origem)
+                    ext = self.extensao(mimetype or foto['arquivo_tipo'], os.path.splitext(origem)[1] or '.bin')
+                    destino = self.caminho(sha256, ext)
+                    if not os.path.exists(destino):
+                        os.makedirs(os.path.dirname(destino), exist_ok=True)
+                        # Link, não move: se a transação falhar, a linha antiga continua válida
+                        os.link(origem, destino)
+                    else:
+                        os.utime(destino)
+                    arquivos.append({'blob': sha256, 'path': destino, 'size': os.path.getsize(destino),
+                                     'mimetype': mimetype, 'largura': largura, 'altura': altura})
+                    apontar.append((foto['id'], foto['vistoria_criado_em'], sha256, destino, self.url(destino)))
+
+                if apontar:
+                    self.registrar_cursor(cursor, arquivos)
+                    execute_values(cursor, SQL_APONTAR_BLOBS, apontar,
+                                   template="(%s::integer, %s::timestamp, %s::char(64), %s::text, %s::text)")
+                conn.commit()
+
+            # Só depois do commit: o arquivo antigo deixa de ser referenciado
+            for foto in fotos:
+                origem = foto['arquivo_path']
+                if os.path.exists(origem) and not os.path.abspath(origem).startswith(self.raiz + os.sep):
+                    try:
+                        os.remove(origem)
+                    except OSError as e:
+                        logger.warning(f"⚠️ Não foi possível remover {origem}: {e}")
+            migradas += len(apontar)
+            logger.info(f"📦 {migradas} fotos migradas para {self.raiz}")
+
+
+_blob_store = None
+
+def get_blob_store():
+    """Obter instância global do armazenamento por conteúdo"""
+    global _blob_store
+    if _blob_store is None:
+        _blob_store = BlobStore()
+    return _blob_store
+
+
+def _calcular_arquivo(caminho):
+    """SHA-256, MIME e dimensões de um arquivo existente (backfill)"""
+    import hashlib
+    from PIL import Image
+    sha = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(64 * 1024), b''):
+            sha.update(bloco)
+    try:
+        with Image.open(caminho) as img:
+            mimetype = 'image/jpeg' if img.format == 'MPO' else Image.MIME.get(img.format)
+            largura, altura = img.size
+    except Exception:
+        mimetype, largura, altura = None, None, None
+    return sha.hexdigest(), mimetype, largura, altura
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Armazenamento de fotos por conteúdo')
+    sub = parser.add_subparsers(dest='comando', required=True)
+    sub.add_parser('stats', help='Blobs, bytes e economia da deduplicação e da normalização')
+    gc = sub.add_parser('gc', help='Apagar blobs sem referência')
+    gc.add_argument('--horas', type=float, default=None, help='Prazo (padrão: DB_BLOB_GC_GRACE_HOURS)')
+    gc.add_argument('--orfaos', action='store_true', help='Também varrer o disco atrás de arquivos sem linha')
+    bf = sub.add_parser('backfill', help='Migrar fotos antigas para o armazenamento por conteúdo')
+    bf.add_argument('--lote', type=int, default=500)
+    args = parser.parse_args(argv)
+
+    store = get_blob_store()
+    try:
+        if args.comando == 'stats':
+            for chave, valor in store.estatisticas().items():
+                print(f"{chave}: {valor}")
+        elif args.comando == 'gc':
+            total = 0
+            while True:
+                apagados = store.coletar(args.horas)
+                total += apagados
+                if apagados < LOTE_COLETA:
+                    break
+            print(f"🗑️ {total} blobs sem referência apagados")
+            if args.orfaos:
+                print(f"🗑️ {store.coletar_orfaos(args.horas)} arquivos órfãos apagados")
+        else:
+            print(f"📦 {store.backfill(args.lote, _calcular_arquivo)} fotos migradas")
+        return 0
+    except Exception as e:
+        logger.error(f"❌ Erro no armazenamento por conteúdo: {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Importação/exportação em massa com COPY
+Sistema Vistoria Agil - PostgreSQL Integration
+
+Uso (a partir da pasta vistoria/):
+    python -m db.bulk export --saida export/ [--desde 2025-01-01]
+        # vistorias.csv, fotos_vistoria.csv e observacoes_fotos_vistoria.csv
+        # (COPY ... TO STDOUT); tabelas já exportadas são puladas ao retomar
+    python -m db.bulk import-backups [--dir vistorias_backup] [--lote 500]
+        # reconstruir vistorias, fotos e observações a partir dos JSON de
+        # save_vistoria_complete (COPY ... FROM STDIN em tabelas temporárias)
+
+A importação é retomável: o último arquivo confirmado fica em um arquivo
+de estado e tokens já presentes no banco são ignorados (ON CONFLICT).
+"""
+
+import io
+import os
+import sys
+import glob
+import gzip
+import json
+import time
+import argparse
+import logging
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+
+import psycopg2
+
+from .rows import CAMPOS_QUESTIONARIO, CAMPOS_PNEUS
+from .database import DatabaseConfig, VistoriaDatabase
+from .blobs import get_blob_store
+from .partitions import garantir_particoes_intervalo
+
+logger = logging.getLogger(__name__)
+
+# Colunas na ordem de VistoriaDatabase._preparar_valores_vistoria
+COLUNAS_VISTORIA = (
+    'token', 'placa', 'chassi', 'modelo', 'cor', 'ano', 'nome_conferente', 'nome_cliente',
+    'km_rodado', 'proprio', 'nome_terceiro',
+) + CAMPOS_QUESTIONARIO + CAMPOS_PNEUS
+
+COLUNAS_FOTO = (
+    'categoria', 'tipo', 'arquivo_nome', 'arquivo_path',
+    'arquivo_url', 'arquivo_tamanho', 'arquivo_tipo', 'arquivo_checksum', 'blob_sha256'
+)
+
+# Exportação: (tabela, SELECT com filtro opcional por criado_em da vistoria)
+EXPORTS = [
+    ('vistorias', "SELECT * FROM vistorias v {where} ORDER BY v.id"),
+    ('fotos_vistoria',
+     "SELECT f.* FROM fotos_vistoria f JOIN vistorias v ON v.id = f.vistoria_id {where} ORDER BY f.id"),
+    ('observacoes_fotos_vistoria',
+     "SELECT o.* FROM observacoes_fotos_vistoria o "
+     "JOIN fotos_vistoria f ON f.id = o.foto_vistoria_id "
+     "JOIN vistorias v ON v.id = f.vistoria_id {where} ORDER BY o.id"),
+]
+
+# Staging da importação (ON COMMIT DROP: nada sobra se o lote falhar)
+SQL_STAGING = f"""
+    CREATE TEMP TABLE stg_vistorias (
+        {', '.join(f'{c} text' for c in COLUNAS_VISTORIA)},
+        criado_em timestamp
+    ) ON COMMIT DROP;
+    CREATE TEMP TABLE stg_fotos (
+        token text, {', '.join(f'{c} text' for c in COLUNAS_FOTO)}
+    ) ON COMMIT DROP;
+    CREATE TEMP TABLE stg_observacoes (
+        token text, categoria text, descricao text
+    ) ON COMMIT DROP;
+"""
+
+TIPOS_VISTORIA = {'ano': 'integer', 'proprio': 'boolean', **{c: 'boolean' for c in CAMPOS_QUESTIONARIO}}
+
+# Conversões text -> tipo da coluna no INSERT ... SELECT. Só vistorias com
+# token ainda inexistente (vistorias_chaves) entram; fotos e observações
+# seguem as novas, na mesma partição mensal (vistoria_criado_em).
+SQL_MOVER_STAGING = f"""
+    CREATE TEMP TABLE stg_novas (id integer, token text, criado_em timestamp) ON COMMIT DROP;
+
+    INSERT INTO blobs (sha256, caminho, tamanho, mimetype)
+    SELECT DISTINCT ON (blob_sha256) blob_sha256, arquivo_path, arquivo_tamanho::bigint, arquivo_tipo
+    FROM stg_fotos WHERE blob_sha256 IS NOT NULL
+    ORDER BY blob_sha256
+    ON CONFLICT (sha256) DO NOTHING;
+
+    WITH novas AS (
+        INSERT INTO vistorias ({', '.join(COLUNAS_VISTORIA)}, criado_em, atualizado_em, token_expira_em)
+        SELECT DISTINCT ON (s.token)
+               {', '.join(f"{c}::{TIPOS_VISTORIA.get(c, 'text')}" for c in COLUNAS_VISTORIA)},
+               criado_em, criado_em, criado_em + INTERVAL '24 hours'
+        FROM stg_vistorias s
+        WHERE NOT EXISTS (SELECT 1 FROM vistorias_chaves k WHERE k.token = s.token)
+        ORDER BY s.token
+        RETURNING id, token, criado_em
+    )
+    INSERT INTO stg_novas SELECT id, token, criado_em FROM novas;
+
+    WITH fotos AS (
+        INSERT INTO fotos_vistoria (vistoria_id, vistoria_criado_em, {', '.join(COLUNAS_FOTO)})
+        SELECT n.id, n.criado_em, s.categoria, s.tipo, s.arquivo_nome, s.arquivo_path,
+               s.arquivo_url, s.arquivo_tamanho::bigint, s.arquivo_tipo, s.arquivo_checksum, s.blob_sha256
+        FROM stg_fotos s JOIN stg_novas n ON n.token = s.token
+        RETURNING id, vistoria_id, vistoria_criado_em, categoria
+    )
+    INSERT INTO observacoes_fotos_vistoria (foto_vistoria_id, vistoria_criado_em, descricao, tipo, gravidade, prioridade)
+    SELECT f.id, f.vistoria_criado_em, o.descricao, 'dano', 'media', 'normal'
+    FROM stg_observacoes o
+    JOIN stg_novas n ON n.token = o.token
+    JOIN fotos f ON f.vistoria_id = n.id AND f.categoria = o.categoria;
+"""
+
+
+def _valor_copy(valor):
+    """Valor no formato text do COPY (\\N = NULL)"""
+    if valor is None:
+        return '\\N'
+    if isinstance(valor, bool):
+        return 't' if valor else 'f'
+    if isinstance(valor, datetime):
+        return valor.isoformat(sep=' ')
+    return (str(valor).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def _linhas_copy(linhas):
+    return io.StringIO(''.join('\t'.join(_valor_copy(v) for v in linha) + '\n' for linha in linhas))
+
+
+def get_bulk_connection():
+    """Conexão dedicada (fora do pool) para operações em massa"""
+    return psycopg2.connect(**DatabaseConfig.get_connection_params())
+
+
+class Progresso:
+    """Relatório de progresso periódico (itens, taxa e ETA)"""
+
+    def __init__(self, descricao, total=None, intervalo=2.0):
+        self.descricao = descricao
+        self.total = total
+        self.intervalo = intervalo
+        self.feitos = 0
+        self.inicio = time.monotonic()
+        self._ultimo = 0.0
+
+    def avancar(self, n=1, forcar=False):
+        self.feitos += n
+        agora = time.monotonic()
+        if not forcar and agora - self._ultimo < self.intervalo:
+            return
+        self._ultimo = agora
+        decorrido = max(agora - self.inicio, 1e-6)
+        taxa = self.feitos / decorrido
+        linha = f"📦 {self.descricao}: {self.feitos}"
+        if self.total:
+            restante = (self.total - self.feitos) / taxa if taxa else 0
+            linha += f"/{self.total} ({100.0 * self.feitos / self.total:.1f}%) - ETA {timedelta(seconds=int(restante))}"
+        print(f"{linha} - {taxa:.0f}/s", flush=True)
+
+
+class _ContadorLinhas(io.RawIOBase):
+    """Arquivo de saída do COPY que conta linhas para o progresso"""
+
+    def __init__(self, destino, progresso):
+        self.destino = destino
+        self.progresso = progresso
+
+    def writable(self):
+        return True
+
+    def write(self, dados):
+        if isinstance(dados, str):
+            dados = dados.encode('utf-8')
+        self.destino.write(dados)
+        self.progresso.avancar(dados.count(b'\n'))
+        return len(dados)
+
+
+def exportar(conn, saida, desde=None, compactar=False):
+    """
+    Exportar as três tabelas em CSV (com cabeçalho) via COPY TO STDOUT
+
+    Cada arquivo é gravado como .part e renomeado ao final, então uma
+    exportação interrompida recomeça só pelas tabelas incompletas.
+    """
+    os.makedirs(saida, exist_ok=True)
+    where = "WHERE v.criado_em >= %s" if desde else ""
+    params = (desde,) if desde else ()
+    extensao = '.csv.gz' if compactar else '.csv'
+
+    with conn.cursor() as cursor:
+        for tabela, select in EXPORTS:
+            destino = os.path.join(saida, tabela + extensao)
+            if os.path.exists(destino):
+                print(f"⏭️ {tabela}: já exportada ({destino})")
+                continue
+
+            consulta = cursor.mogrify(select.format(where=where), params).decode('utf-8')
+            parcial = destino + '.part'
+            progresso = Progresso(f"{tabela} (linhas)")
+            abrir = gzip.open if compactar else open
+            with abrir(parcial, 'wb') as arquivo:
+                cursor.copy_expert(
+                    f"COPY ({consulta}) TO STDOUT WITH (FORMAT csv, HEADER)",
+                    _ContadorLinhas(arquivo, progresso)
+                )
+            os.replace(parcial, destino)
+            progresso.avancar(0, forcar=True)
+            print(f"✅ {tabela}: {destino}")
+    conn.rollback()
+
+
+def _tipo_foto(categoria):
+    """Tipo da foto como em prepare_vistoria_photos"""
+    categoria = categoria.lower()
+    if 'pneu_' in categoria or 'marca_pneu' in categoria:
+        return 'pneu'
+    if 'obs_' in categoria or 'observacao' in categoria:
+        return 'observacao'
+    if 'documento' in categoria:
+        return 'documento'
+    return 'obrigatoria'
+
+
+def _localizar_arquivo(categoria, token, tipo, base_uploads):
+    """Arquivo gravado por prepare_vistoria_photos para a categoria/token"""
+    if tipo == 'documento':
+        padrao = os.path.join(base_uploads, 'documentos', f'documento_{token}_*')
+    else:
+        padrao = os.path.join(base_uploads, 'fotos', f'{categoria}_{token}_*')
+    encontrados = sorted(glob.glob(padrao))
+    return encontrados[0] if encontrados else None
+
+
+def _arquivo_do_backup(arquivos, categoria):
+    """Primeiro arquivo gravado da categoria na lista 'arquivos' (retirado da lista)"""
+    for i, arquivo in enumerate(arquivos):
+        if arquivo.get('categoria') == categoria:
+            return arquivos.pop(i)
+    return None
+
+
+def linhas_do_backup(backup, base_uploads, db):
+    """
+    Reconstruir (vistoria, fotos, observações) de um JSON de vistorias_backup
+
+    Os arquivos vêm da lista 'arquivos' do backup (armazenamento por
+    conteúdo, db/blobs.py); backups antigos são localizados por categoria e
+    token em uploads/. Fotos cujo arquivo não existe mais são ignoradas; as
+    observações seguem a mesma regra de save_vistoria_complete.
+    """
+    token = backup['token']
+    dados = backup['dados_originais']
+    with redirect_stdout(io.StringIO()):  # logs de debug por linha
+        vistoria = db._preparar_valores_vistoria(dados, token)
+    criado_em = datetime.fromisoformat(backup['created_at'])
+
+    fotos = []
+    categorias = set()
+    arquivos = list(dados.get('arquivos') or [])
+    for photo in dados.get('photos', []):
+        categoria = photo.get('category') or photo.get('name', 'unknown')
+        if categoria in categorias and categoria != 'documento_nota_fiscal':
+            continue
+        categorias.add(categoria)
+        tipo = _tipo_foto(categoria)
+        arquivo = _arquivo_do_backup(arquivos, categoria)
+        if arquivo and arquivo.get('blob') and os.path.exists(arquivo.get('path') or ''):
+            caminho, blob = arquivo['path'], arquivo['blob']
+            nome = photo.get('name') or os.path.basename(caminho)
+            url = get_blob_store().url(caminho)
+        else:
+            caminho, blob = _localizar_arquivo(categoria, token, tipo, base_uploads), None
+            if not caminho:
+                continue
+            nome = os.path.basename(caminho)
+            pasta = 'documentos' if tipo == 'documento' else 'fotos'
+            url = f'/uploads/{pasta}/{nome}'
+        fotos.append((
+            token, categoria, tipo, nome, caminho, url,
+            os.path.getsize(caminho), photo.get('type', 'image/jpeg'),
+            db.calcular_checksum_arquivo(caminho) or '', blob
+        ))
+
+    observacoes = []
+    for i in range(1, 5):
+        descricao = (dados.get(f'desc_obs_{i}') or '').strip()
+        if descricao:
+            observacoes.append((token, f'foto_obs_{i}', descricao))
+
+    return vistoria + (criado_em,), fotos, observacoes
+
+
+def _ler_estado(caminho):
+    if caminho and os.path.exists(caminho):
+        with open(caminho, encoding='utf-8') as f:
+            return json.load(f)
+    return {'ultimo_arquivo': None, 'importadas': 0}
+
+
+def _salvar_estado(caminho, estado):
+    temporario = caminho + '.tmp'
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(estado, f)
+    os.replace(temporario, caminho)
+
+
+def _importar_lote(conn, vistorias, fotos, observacoes):
+    """COPY do lote para staging e INSERT ... SELECT nas tabelas reais"""
+    criados_em = [linha[-1] for linha in vistorias]
+    with conn.cursor() as cursor:
+        # Backups antigos podem cair em meses ainda sem partição
+        garantir_particoes_intervalo(cursor, min(criados_em), max(criados_em))
+        cursor.execute(SQL_STAGING)
+        cursor.copy_from(_linhas_copy(vistorias), 'stg_vistorias')
+        cursor.copy_from(_linhas_copy(fotos), 'stg_fotos')
+        cursor.copy_from(_linhas_copy(observacoes), 'stg_observacoes')
+        cursor.execute(SQL_MOVER_STAGING)
+        cursor.execute("SELECT count(*) AS novas FROM stg_novas")
+        novas = cursor.fetchone()['novas']
+    conn.commit()
+    return novas
+
+
+def importar_backups(conn, diretorio, lote=500, estado_path=None, base_uploads='uploads'):
+    """
+    Importar os JSON de `diretorio` em lotes (uma transação por lote)
+
+    Returns:
+        int: vistorias novas inseridas nesta execução
+    """
+    estado_path = estado_path or os.path.join(diretorio, '.import_state.json')
+    estado = _ler_estado(estado_path)
+    # recursivo: no layout 'hash' do armazenamento os backups ficam em diretorio/ab/cd/
+    arquivos = sorted(glob.glob(os.path.join(diretorio, '**', 'vistoria_*.json'), recursive=True),
+                      key=os.path.basename)
+    if estado['ultimo_arquivo']:
+        arquivos = [a for a in arquivos if os.path.basename(a) > estado['ultimo_arquivo']]
+        print(f"↩️ Retomando após {estado['ultimo_arquivo']} ({len(arquivos)} arquivos restantes)")
+
+    db = VistoriaDatabase.__new__(VistoriaDatabase)  # só os helpers, sem pool
+    progresso = Progresso('arquivos', total=len(arquivos))
+    novas_total = 0
+
+    for inicio in range(0, len(arquivos), lote):
+        vistorias, fotos, observacoes = [], [], []
+        for caminho in arquivos[inicio:inicio + lote]:
+            try:
+                with open(caminho, encoding='utf-8') as f:
+                    v, fs, obs = linhas_do_backup(json.load(f), base_uploads, db)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"⚠️ Backup ignorado {os.path.basename(caminho)}: {e}")
+                continue
+            vistorias.append(v)
+            fotos.extend(fs)
+            observacoes.extend(obs)
+
+        novas = _importar_lote(conn, vistorias, fotos, observacoes) if vistorias else 0
+        novas_total += novas
+
+        estado['ultimo_arquivo'] = os.path.basename(arquivos[min(inicio + lote, len(arquivos)) - 1])
+        estado['importadas'] += novas
+        _salvar_estado(estado_path, estado)
+        progresso.avancar(min(lote, len(arquivos) - inicio))
+
+    progresso.avancar(0, forcar=True)
+    return novas_total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Importação/exportação em massa (COPY)')
+    sub = parser.add_subparsers(dest='comando', required=True)
+    exp = sub.add_parser('export', help='Exportar vistorias, fotos e observações em CSV')
+    exp.add_argument('--saida', required=True, help='Diretório de saída')
+    exp.add_argument('--desde', type=datetime.fromisoformat, help='Só vistorias criadas a partir desta data')
+    exp.add_argument('--gzip', action='store_true', help='Compactar os CSV')
+    imp = sub.add_parser('import-backups', help='Reconstruir linhas a partir de vistorias_backup/')
+    imp.add_argument('--dir', default='vistorias_backup', help='Diretório com os JSON de backup')
+    imp.add_argument('--lote', type=int, default=500, help='Arquivos por transação')
+    imp.add_argument('--estado', help='Arquivo de estado para retomar (padrão: <dir>/.import_state.json)')
+    imp.add_argument('--uploads', default='uploads', help='Pasta base dos arquivos das fotos')
+    args = parser.parse_args(argv)
+
+    conn = get_bulk_connection()
+    try:
+        if args.comando == 'export':
+            exportar(conn, args.saida, desde=args.desde, compactar=args.gzip)
+        else:
+            novas = importar_backups(conn, args.dir, lote=args.lote,
+                                     estado_path=args.estado, base_uploads=args.uploads)
+            print(f"✅ {novas} vistorias importadas")
+        return 0
+    except Exception as e:
+        logger.error(f"❌ Erro na operação em massa: {e}")
+        return 1
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Cache em memória com TTL e despejo LRU
+Sistema Vistoria Agil - PostgreSQL Integration
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+# Marcador para cache negativo (token consultado e inexistente)
+NAO_ENCONTRADO = object()
+
+
+class TTLCache:
+    """
+    Cache thread-safe limitado a `maxsize` entradas, com expiração por TTL.
+
+    Entradas expiram após `ttl` segundos; ao atingir o limite, a entrada
+    usada há mais tempo é descartada. Valores NAO_ENCONTRADO usam
+    `negative_ttl` (normalmente menor) para que tokens inválidos não
+    virem uma consulta ao banco a cada tentativa.
+    """
+
+    def __init__(self, maxsize=1024, ttl=30.0, negative_ttl=5.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._data = OrderedDict()  # chave -> (expira_em, valor)
+        self._invalidated = OrderedDict()  # chave -> instante da última invalidação
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.maxsize > 0
+
+    def get(self, key):
+        """
+        Returns:
+            tuple: (encontrado, valor) - valor pode ser NAO_ENCONTRADO
+        """
+        if not self.enabled:
+            return False, None
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._misses += 1
+                return False, None
+            expira_em, valor = entry
+            if expira_em <= time.monotonic():
+                del self._data[key]
+                self._misses += 1
+                return False, None
+            self._data.move_to_end(key)
+            self._hits += 1
+            return True, valor
+
+    def set(self, key, valor, lido_em=None):
+        """
+        Guardar valor. `lido_em` (time.monotonic() antes da leitura no banco)
+        evita gravar um valor lido antes de uma invalidação concorrente.
+        """
+        if not self.enabled:
+            return
+        ttl = self.negative_ttl if valor is NAO_ENCONTRADO else self.ttl
+        if not ttl:
+            return
+        with self._lock:
+            invalidado_em = self._invalidated.get(key)
+            if lido_em is not None and invalidado_em is not None and invalidado_em >= lido_em:
+                return
+            self._data[key] = (time.monotonic() + ttl, valor)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+            self._invalidated[key] = time.monotonic()
+            self._invalidated.move_to_end(key)
+            while len(self._invalidated) > self.maxsize:
+                self._invalidated.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._invalidated.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+            }
@@ -5,19 +5,232 @@ Sistema Vistoria Agil - PostgreSQL Integration
 """
 
 import os
+import re
+import json
+import base64
 import psycopg2
-from psycopg2.extras import RealDictCursor
-from psycopg2.pool import SimpleConnectionPool
+from psycopg2.extras import RealDictCursor, execute_values
 import logging
+from contextlib import contextmanager
 from datetime import datetime
 import hashlib
 import secrets
 import string
+import time
+import itertools
+
+from .pool import BoundedConnectionPool
+from .cache import TTLCache, NAO_ENCONTRADO
+from .metrics import (
+    InstrumentedCursor, InstrumentedTupleCursor, consulta_nomeada, registrar_espera_pool
+)
 
 # Configuração do logger
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# SQL de inserção - REMOVIDO documento_nota_fiscal
+SQL_INSERIR_VISTORIA = """
+    INSERT INTO vistorias (
+        token, placa, chassi, modelo, cor, ano, nome_conferente, nome_cliente, km_rodado,
+        proprio, nome_terceiro,
+        ar_condicionado, antenas, tapetes, tapete_porta_malas, bateria,
+        retrovisor_direito, retrovisor_esquerdo, extintor, roda_comum, roda_especial,
+        chave_principal, chave_reserva, manual, documento, nota_fiscal,
+        limpador_dianteiro, limpador_traseiro, triangulo, macaco, chave_roda, pneu_step, carregador_eletrico,
+        marca_pneu_dianteiro_esquerdo, marca_pneu_dianteiro_direito,
+        marca_pneu_traseiro_esquerdo, marca_pneu_traseiro_direito,
+        token_expira_em, status
+    ) VALUES (
+        %s, %s, %s, %s, %s, %s, %s, %s, %s,
+        %s, %s,
+        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
+        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
+        %s, %s, %s, %s,
+        CURRENT_TIMESTAMP + INTERVAL '24 hours', 'aguardando_assinatura'
+    ) RETURNING id, token, criado_em
+"""
+
+# INSERTs multi-linha (execute_values expande o %s em VALUES (...), (...)).
+# vistoria_criado_em (chave de partição) vem de vistorias_chaves / da foto;
+# por isso o primeiro valor de cada linha (o ID) aparece duas vezes.
+SQL_INSERIR_FOTOS = """
+    INSERT INTO fotos_vistoria (
+        vistoria_id, vistoria_criado_em, categoria, tipo, arquivo_nome, arquivo_path,
+        arquivo_url, arquivo_tamanho, arquivo_tipo, arquivo_checksum, blob_sha256,
+        arquivo_tamanho_original, largura, altura, original_blob_sha256, phash, duplicata_de
+    ) VALUES %s
+    RETURNING id
+"""
+TEMPLATE_FOTO = (
+    "(%s, (SELECT criado_em FROM vistorias_chaves WHERE id = %s), "
+    "%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
+)
+
+# Linhas de blobs (db/blobs.py) antes das fotos que as referenciam; o
+# DO UPDATE trava a linha existente até o commit, e a coleta a pula
+SQL_REGISTRAR_BLOBS = """
+    INSERT INTO blobs (sha256, caminho, tamanho, mimetype, largura, altura)
+    VALUES %s
+    ON CONFLICT (sha256) DO UPDATE SET sem_referencia_desde = blobs.sem_referencia_desde
+"""
+
+SQL_INSERIR_OBSERVACOES = """
+    INSERT INTO observacoes_fotos_vistoria (
+        foto_vistoria_id, vistoria_criado_em, descricao, tipo, gravidade, prioridade
+    ) VALUES %s
+    RETURNING id
+"""
+# vistoria_criado_em vai como parâmetro (sem ele a busca da foto por id
+# passaria por todas as partições mensais)
+TEMPLATE_OBSERVACAO = "(%s, %s, %s, %s, %s, %s)"
+
+# Só para observações avulsas, sem o criado_em da vistoria em mãos
+SQL_CRIADO_EM_FOTO = "SELECT vistoria_criado_em FROM fotos_vistoria WHERE id = %s LIMIT 1"
+
+# Fotos com observações ativas, na ordem usada pelo PDF e pela página de assinatura.
+# O JOIN com vistorias_chaves fornece a chave de partição (poda em execução).
+SQL_BUSCAR_FOTOS = """
+    SELECT 
+        f.id as foto_id,
+        f.categoria,
+        f.tipo,
+        f.arquivo_nome,
+        f.arquivo_path,
+        f.arquivo_url,
+        f.duplicata_de,
+        f.criado_em as foto_criado_em,
+        o.id as observacao_id,
+        o.descricao as observacao_descricao,
+        o.prioridade as observacao_prioridade,
+        o.status as observacao_status
+    FROM vistorias_chaves k
+    JOIN fotos_vistoria f ON f.vistoria_id = k.id AND f.vistoria_criado_em = k.criado_em
+    LEFT JOIN observacoes_fotos_vistoria o ON f.id = o.foto_vistoria_id
+        AND o.vistoria_criado_em = f.vistoria_criado_em AND o.status = 'ativa'
+    WHERE k.id = %s
+    ORDER BY 
+        CASE f.tipo 
+            WHEN 'obrigatoria' THEN 1 
+            WHEN 'pneu' THEN 2 
+            WHEN 'observacao' THEN 3 
+        END,
+        f.categoria, f.id
+"""
+
+# Vistoria + fotos + observações ativas em uma consulta (fotos na mesma
+# ordem de SQL_BUSCAR_FOTOS); {colunas} e {coluna} vêm de sql_agregado()
+SQL_BUSCAR_AGREGADO = """
+    SELECT
+        {colunas},
+        COALESCE((
+            SELECT json_agg(json_build_object(
+                'foto_id', f.id,
+                'categoria', f.categoria,
+                'tipo', f.tipo,
+                'arquivo_nome', f.arquivo_nome,
+                'arquivo_path', f.arquivo_path,
+                'arquivo_url', f.arquivo_url,
+                'duplicata_de', f.duplicata_de,
+                'foto_criado_em', f.criado_em,
+                'observacoes', COALESCE((
+                    SELECT json_agg(json_build_object(
+                        'observacao_id', o.id,
+                        'descricao', o.descricao,
+                        'prioridade', o.prioridade
+                    ) ORDER BY o.id)
+                    FROM observacoes_fotos_vistoria o
+                    WHERE o.foto_vistoria_id = f.id AND o.vistoria_criado_em = f.vistoria_criado_em
+                      AND o.status = 'ativa'
+                ), '[]'::json)
+            ) ORDER BY
+                CASE f.tipo
+                    WHEN 'obrigatoria' THEN 1
+                    WHEN 'pneu' THEN 2
+                    WHEN 'observacao' THEN 3
+                END,
+                f.categoria, f.id)
+            FROM fotos_vistoria f
+            WHERE f.vistoria_id = v.id AND f.vistoria_criado_em = v.criado_em
+        ), '[]'::json) AS fotos
+    FROM vistorias_chaves k
+    JOIN vistorias v ON v.id = k.id AND v.criado_em = k.criado_em
+    WHERE k.{coluna} = %s
+"""
+
+# Buscas pontuais de vistoria: id/token -> criado_em em vistorias_chaves,
+# então só a partição do mês da vistoria é lida
+SQL_BUSCAR_POR_CHAVE = """
+    SELECT {colunas} FROM vistorias_chaves k
+    JOIN vistorias v ON v.id = k.id AND v.criado_em = k.criado_em
+    WHERE k.{coluna} = %s
+"""
+
+SQL_BUSCAR_POR_TOKEN = SQL_BUSCAR_POR_CHAVE.format(colunas='v.*', coluna='token')
+
+SQL_BUSCAR_POR_ID = SQL_BUSCAR_POR_CHAVE.format(colunas='v.*', coluna='id')
+
+# Assinatura: só atualiza vistorias que ainda aguardam assinatura
+SQL_ATUALIZAR_ASSINATURA = """
+    UPDATE vistorias v SET
+        assinatura_arquivo_path = %s,
+        assinatura_cliente_nome = %s,
+        assinatura_data = CURRENT_TIMESTAMP,
+        assinatura_checksum = %s,
+        status = 'assinado',
+        atualizado_em = CURRENT_TIMESTAMP
+    FROM vistorias_chaves k
+    WHERE k.token = %s AND v.id = k.id AND v.criado_em = k.criado_em
+      AND v.status = 'aguardando_assinatura' AND v.token_expira_em > CURRENT_TIMESTAMP
+    RETURNING v.id, v.placa, v.modelo, v.token
+"""
+
+# Expiração em lote: pendentes vencidas -> 'expirado'. SKIP LOCKED deixa
+# vários varredores (um por processo) dividirem o trabalho sem esperar
+SQL_EXPIRAR_VISTORIAS = """
+    WITH vencidas AS (
+        SELECT id, criado_em FROM vistorias
+        WHERE status = 'aguardando_assinatura' AND token_expira_em <= CURRENT_TIMESTAMP
+        ORDER BY token_expira_em
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE vistorias v SET status = 'expirado', atualizado_em = CURRENT_TIMESTAMP
+    FROM vencidas e
+    WHERE v.id = e.id AND v.criado_em = e.criado_em
+    RETURNING v.id, v.token, v.criado_em
+"""
+
+# Listagem simples das mais recentes
+SQL_LISTAR_RECENTES = """
+    SELECT 
+        id,
+        token,
+        placa,
+        modelo,
+        cor,
+        ano,
+        nome_conferente,
+        status,
+        criado_em,
+        assinatura_data,
+        assinatura_cliente_nome
+    FROM vistorias 
+    ORDER BY criado_em DESC
+    LIMIT %s
+"""
+
+# Estimativa sem filtros: soma das estatísticas das partições (o pai
+# particionado não tem reltuples próprio)
+SQL_ESTIMAR_TOTAL = """
+    SELECT COALESCE(sum(GREATEST(c.reltuples, 0)), 0)::bigint AS total
+    FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'vistorias'::regclass
+"""
+
+# Busca aproximada: mesmo texto indexado em ix_vistorias_busca_trgm (migração 6)
+DOCUMENTO_BUSCA = "documento_busca_vistoria(placa, chassi, nome_cliente, modelo, nome_conferente)"
+
 class DatabaseConfig:
     """Configurações do banco de dados"""
     
@@ -29,9 +242,81 @@ class DatabaseConfig:
     DB_PASSWORD = os.getenv('DB_PASSWORD', '123')  # Voltando para a senha que estava funcionando
     
     # Pool de conexões
-    MIN_CONNECTIONS = 1
-    MAX_CONNECTIONS = 10
+    MIN_CONNECTIONS = int(os.getenv('DB_MIN_CONN', '1'))
+    MAX_CONNECTIONS = int(os.getenv('DB_MAX_CONN', '10'))
+    POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))  # segundos aguardando conexão livre
+    POOL_MAX_LIFETIME = float(os.getenv('DB_POOL_MAX_LIFETIME', '3600'))  # reciclar conexões antigas
+    POOL_VALIDATE_AFTER = float(os.getenv('DB_POOL_VALIDATE_AFTER', '30'))  # SELECT 1 se ociosa há mais tempo
+    
+    # Réplicas de leitura (DSNs separados por vírgula) e janela de leitura no
+    # primário após uma escrita no mesmo token/vistoria
+    REPLICA_DSNS = [dsn.strip() for dsn in os.getenv('DB_REPLICA_DSNS', '').split(',') if dsn.strip()]
+    REPLICA_STICKY_SECONDS = float(os.getenv('DB_REPLICA_STICKY_SECONDS', '10'))
     
+    # Cache de vistorias por token (0 desativa)
+    TOKEN_CACHE_TTL = float(os.getenv('DB_TOKEN_CACHE_TTL', '30'))
+    TOKEN_CACHE_NEGATIVE_TTL = float(os.getenv('DB_TOKEN_CACHE_NEGATIVE_TTL', '5'))
+    TOKEN_CACHE_MAX = int(os.getenv('DB_TOKEN_CACHE_MAX', '1024'))
+    
+    # Aplicar migrações pendentes (db/migrations.py) ao iniciar a aplicação
+    AUTO_MIGRATE = os.getenv('DB_AUTO_MIGRATE', 'false').lower() == 'true'
+    
+    # Varredura de links expirados (db/sweeper.py); intervalo 0 desativa a
+    # thread dentro da aplicação (use então: python -m db.sweeper loop)
+    EXPIRY_SWEEP_INTERVAL = float(os.getenv('DB_EXPIRY_SWEEP_INTERVAL', '60'))
+    EXPIRY_SWEEP_BATCH = int(os.getenv('DB_EXPIRY_SWEEP_BATCH', '500'))
+    # Pasta para onde mover as fotos das vistorias expiradas (vazio = não mover)
+    COLD_STORAGE_DIR = os.getenv('DB_COLD_STORAGE_DIR', '')
+    
+    # Chaves de idempotência (db/idempotency.py): validade da resposta gravada,
+    # posse da requisição em andamento e espera máxima das repetições (segundos)
+    IDEMPOTENCY_TTL_HOURS = float(os.getenv('DB_IDEMPOTENCY_TTL_HOURS', '24'))
+    IDEMPOTENCY_LEASE = float(os.getenv('DB_IDEMPOTENCY_LEASE', '120'))
+    IDEMPOTENCY_WAIT = float(os.getenv('DB_IDEMPOTENCY_WAIT', '30'))
+    
+    # Fila de tarefas (db/jobs.py): threads de worker na aplicação (0 = só
+    # pela CLI: python -m db.jobs worker), posse e repetição das tarefas
+    JOB_WORKERS = int(os.getenv('DB_JOB_WORKERS', '2'))
+    JOB_POLL_INTERVAL = float(os.getenv('DB_JOB_POLL_INTERVAL', '1.0'))
+    JOB_LEASE = float(os.getenv('DB_JOB_LEASE', '300'))
+    JOB_MAX_ATTEMPTS = int(os.getenv('DB_JOB_MAX_ATTEMPTS', '5'))
+    JOB_BACKOFF_BASE = float(os.getenv('DB_JOB_BACKOFF_BASE', '10'))
+    JOB_BACKOFF_MAX = float(os.getenv('DB_JOB_BACKOFF_MAX', '3600'))
+    JOB_RETENTION_HOURS = float(os.getenv('DB_JOB_RETENTION_HOURS', '168'))
+    
+    # Busca: tamanho mínimo do termo (trigramas) e máximo de resultados ranqueados
+    SEARCH_MIN_LENGTH = int(os.getenv('DB_SEARCH_MIN_LENGTH', '3'))
+    SEARCH_MAX_CANDIDATES = int(os.getenv('DB_SEARCH_MAX_CANDIDATES', '1000'))
+    
+    # Partições mensais (db/partitions.py): meses criados à frente e pasta do arquivo
+    PARTITION_MONTHS_AHEAD = int(os.getenv('DB_PARTITION_MONTHS_AHEAD', '3'))
+    ARCHIVE_DIR = os.getenv('DB_ARCHIVE_DIR', 'arquivo_vistorias')
+    
+    # Fotos por conteúdo (db/blobs.py): pasta dentro de uploads/ e prazo antes
+    # de apagar um blob sem referência
+    BLOB_DIR = os.getenv('DB_BLOB_DIR', os.path.join('uploads', 'blobs'))
+    BLOB_GC_GRACE_HOURS = float(os.getenv('DB_BLOB_GC_GRACE_HOURS', '24'))
+
+    # Uploads em partes (db/uploads.py): validade da sessão (não maior que o
+    # prazo da coleta de blobs), limites do arquivo e de cada PUT, pasta das partes
+    UPLOAD_SESSION_TTL_HOURS = min(float(os.getenv('DB_UPLOAD_SESSION_TTL_HOURS', '24')), BLOB_GC_GRACE_HOURS)
+    UPLOAD_MAX_BYTES = int(os.getenv('DB_UPLOAD_MAX_BYTES', str(50 * 1024 * 1024)))
+    UPLOAD_CHUNK_MAX_BYTES = int(os.getenv('DB_UPLOAD_CHUNK_MAX_BYTES', str(8 * 1024 * 1024)))
+    UPLOAD_SESSION_DIR = os.getenv('DB_UPLOAD_SESSION_DIR', os.path.join('uploads', '.sessoes'))
+
+    # Assinaturas, documentos avulsos, fotos do formulário, backups e PDFs
+    # (db/storage.py): driver local ou s3 (MinIO:
+    # DB_STORAGE_S3_ENDPOINT=http://localhost:9000) e layout das chaves.
+    # Fotos/documentos do envio (BLOB_DIR) e UPLOAD_SESSION_DIR ficam no
+    # disco mesmo com s3: s3 sozinho não permite vários nós
+    STORAGE_BACKEND = os.getenv('DB_STORAGE_BACKEND', 'local').lower()
+    STORAGE_LAYOUT = os.getenv('DB_STORAGE_LAYOUT', 'hash').lower()
+    STORAGE_ROOT = os.getenv('DB_STORAGE_ROOT', '.')
+    STORAGE_S3_BUCKET = os.getenv('DB_STORAGE_S3_BUCKET', '')
+    STORAGE_S3_PREFIX = os.getenv('DB_STORAGE_S3_PREFIX', '')
+    STORAGE_S3_ENDPOINT = os.getenv('DB_STORAGE_S3_ENDPOINT', '')
+    STORAGE_S3_REGION = os.getenv('DB_STORAGE_S3_REGION', '')
+
     @classmethod
     def get_connection_string(cls):
         """Gerar string de conexão PostgreSQL"""
@@ -51,55 +336,172 @@ class DatabaseConfig:
         }
 
 class DatabaseManager:
-    """Gerenciador de pool de conexões PostgreSQL"""
+    """Gerenciador de pool de conexões PostgreSQL (primário + réplicas opcionais)"""
     
     def __init__(self):
         self.pool = None
+        self.replica_pools = []
+        self._replica_rr = itertools.count()
         self.initialize_pool()
     
     def initialize_pool(self):
         """Inicializar pool de conexões"""
         try:
-            self.pool = SimpleConnectionPool(
+            self.pool = BoundedConnectionPool(
                 DatabaseConfig.MIN_CONNECTIONS,
                 DatabaseConfig.MAX_CONNECTIONS,
-                **DatabaseConfig.get_connection_params()
+                timeout=DatabaseConfig.POOL_TIMEOUT,
+                max_lifetime=DatabaseConfig.POOL_MAX_LIFETIME,
+                validate_after=DatabaseConfig.POOL_VALIDATE_AFTER,
+                **{**DatabaseConfig.get_connection_params(), 'cursor_factory': InstrumentedCursor}
             )
             logger.info("✅ Pool de conexões PostgreSQL inicializado")
             
         except Exception as e:
             logger.error(f"❌ Erro ao inicializar pool: {e}")
             raise
+        
+        # Réplicas abrem conexões sob demanda; uma réplica fora do ar não
+        # impede a aplicação de subir (as leituras caem no primário)
+        for dsn in DatabaseConfig.REPLICA_DSNS:
+            self.replica_pools.append(BoundedConnectionPool(
+                0,
+                DatabaseConfig.MAX_CONNECTIONS,
+                timeout=DatabaseConfig.POOL_TIMEOUT,
+                max_lifetime=DatabaseConfig.POOL_MAX_LIFETIME,
+                validate_after=DatabaseConfig.POOL_VALIDATE_AFTER,
+                dsn=dsn,
+                cursor_factory=InstrumentedCursor
+            ))
+        if self.replica_pools:
+            logger.info(f"✅ {len(self.replica_pools)} réplica(s) de leitura configurada(s)")
+    
+    @property
+    def has_replicas(self):
+        return bool(self.replica_pools)
     
-    def get_connection(self):
-        """Obter conexão do pool"""
+    def get_connection(self, timeout=None):
+        """Obter conexão do pool (aguarda até o timeout se estiver esgotado)"""
         try:
-            return self.pool.getconn()
+            return self.pool.getconn(timeout)
         except Exception as e:
             logger.error(f"❌ Erro ao obter conexão: {e}")
             raise
     
-    def return_connection(self, conn):
+    def return_connection(self, conn, discard=False):
         """Retornar conexão para o pool"""
         try:
-            self.pool.putconn(conn)
+            self.pool.putconn(conn, discard=discard)
         except Exception as e:
             logger.error(f"❌ Erro ao retornar conexão: {e}")
     
+    def _checkout(self, timeout, read_only):
+        """Escolher pool (réplica em round-robin para leituras) e obter conexão"""
+        inicio = time.perf_counter()
+        try:
+            if read_only and self.replica_pools:
+                pool = self.replica_pools[next(self._replica_rr) % len(self.replica_pools)]
+                try:
+                    return pool, pool.getconn(timeout)
+                except Exception as e:
+                    logger.warning(f"⚠️ Réplica indisponível, lendo do primário: {e}")
+            return self.pool, self.get_connection(timeout)
+        finally:
+            # Espera na fila + validação/abertura da conexão
+            registrar_espera_pool(time.perf_counter() - inicio)
+    
+    @contextmanager
+    def connection(self, timeout=None, read_only=False):
+        """
+        Checkout de conexão como context manager.
+        
+        Faz rollback em caso de erro e sempre devolve a conexão ao pool;
+        conexões com erro de rede/protocolo são descartadas. Com
+        read_only=True a conexão vem de uma réplica, se houver.
+        """
+        pool, conn = self._checkout(timeout, read_only)
+        discard = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            discard = True
+            raise
+        except Exception:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                discard = True
+            raise
+        finally:
+            try:
+                pool.putconn(conn, discard=discard)
+            except Exception as e:
+                logger.error(f"❌ Erro ao retornar conexão: {e}")
+    
+    def get_pool_stats(self):
+        """Estatísticas do pool (em uso, ociosas, aguardando, tempo de espera)"""
+        if not self.pool:
+            return {}
+        stats = self.pool.stats()
+        if self.replica_pools:
+            stats['replicas'] = [pool.stats() for pool in self.replica_pools]
+        return stats
+    
     def close_all_connections(self):
         """Fechar todas as conexões do pool"""
         try:
-            if self.pool:
-                self.pool.closeall()
-                logger.info("✅ Todas as conexões fechadas")
+            for pool in [self.pool] + self.replica_pools:
+                if pool:
+                    pool.closeall()
+            logger.info("✅ Todas as conexões fechadas")
         except Exception as e:
             logger.error(f"❌ Erro ao fechar conexões: {e}")
 
 class VistoriaDatabase:
     """Classe principal para operações de banco da Vistoria"""
     
-    def __init__(self):
-        self.db_manager = DatabaseManager()
+    def __init__(self, db_manager=None):
+        # Compartilhar o pool global em vez de abrir um segundo pool
+        self.db_manager = db_manager or init_database()
+        self.token_cache = TTLCache(
+            maxsize=DatabaseConfig.TOKEN_CACHE_MAX,
+            ttl=DatabaseConfig.TOKEN_CACHE_TTL,
+            negative_ttl=DatabaseConfig.TOKEN_CACHE_NEGATIVE_TTL
+        )
+        # Tokens/IDs escritos há pouco por este processo: leituras deles vão
+        # ao primário até a réplica alcançar (read-your-writes)
+        self.escritas_recentes = TTLCache(
+            maxsize=4096,
+            ttl=DatabaseConfig.REPLICA_STICKY_SECONDS,
+            negative_ttl=0
+        )
+    
+    def _marcar_escrita(self, token=None, vistoria_id=None):
+        """Registrar escrita para que leituras seguintes usem o primário"""
+        if token:
+            self.escritas_recentes.set(('token', token), True)
+        if vistoria_id is not None:
+            self.escritas_recentes.set(('id', vistoria_id), True)
+    
+    def _executar_leitura(self, consulta, *chaves, reler_vazio=True):
+        """
+        Executar `consulta(conn)` numa réplica de leitura, se houver
+        
+        Vai direto ao primário se alguma das `chaves` foi escrita há pouco.
+        Com reler_vazio, um resultado vazio da réplica (atraso de replicação,
+        ex.: vistoria criada por outro processo) é relido no primário.
+        """
+        usar_replica = self.db_manager.has_replicas and not any(
+            self.escritas_recentes.get(chave)[0] for chave in chaves
+        )
+        if usar_replica:
+            with self.db_manager.connection(read_only=True) as conn:
+                resultado = consulta(conn)
+            if resultado or not reler_vazio:
+                return resultado
+        
+        with self.db_manager.connection() as conn:
+            return consulta(conn)
     
     def gerar_token_unico(self):
         """Gerar token único para assinatura"""
@@ -121,450 +523,880 @@ class VistoriaDatabase:
             logger.error(f"❌ Erro ao calcular checksum: {e}")
             return None
     
+    def _preparar_valores_vistoria(self, dados_vistoria, token):
+        """Montar a tupla de valores do INSERT de vistorias"""
+        # Preparar dados
+        # Suporte para dados estruturados (objeto) e dados planos (form-data)
+        if 'veiculo' in dados_vistoria:
+            # Formato estruturado (objeto JSON)
+            veiculo = dados_vistoria.get('veiculo', {})
+            questionario = dados_vistoria.get('questionario', {})
+            pneus = dados_vistoria.get('pneus', {})
+        else:
+            # Formato plano (form-data) - reestruturar dados
+            proprio_raw = dados_vistoria.get('proprio', 'true')
+            nome_terceiro_raw = dados_vistoria.get('nome_terceiro', '')
+        
+            proprio_convertido = proprio_raw.lower() == 'true' if isinstance(proprio_raw, str) else bool(proprio_raw)
+        
+            veiculo = {
+                'placa': dados_vistoria.get('placa', ''),
+                'modelo': dados_vistoria.get('modelo', ''),
+                'cor': dados_vistoria.get('cor', ''),
+                'ano': dados_vistoria.get('ano', ''),
+                'km_rodado': dados_vistoria.get('km_rodado', ''),
+                'proprio': proprio_convertido,  # Usar valor convertido
+                'nome_terceiro': nome_terceiro_raw
+            }
+        
+            # Mapear questionário
+            questionario = {}
+            questionario_fields = [
+                'ar_condicionado', 'antenas', 'tapetes', 'tapete_porta_malas', 'bateria',
+                'retrovisor_direito', 'retrovisor_esquerdo', 'extintor', 'roda_comum', 'roda_especial',
+                'chave_principal', 'chave_reserva', 'manual', 'documento', 'nota_fiscal',
+                'limpador_dianteiro', 'limpador_traseiro', 'triangulo', 'macaco', 'chave_roda', 'pneu_step', 'carregador_eletrico'
+            ]
+        
+            for field in questionario_fields:
+                questionario[field] = dados_vistoria.get(field, 'false').lower() == 'true'
+        
+            # Mapear pneus
+            pneus = {
+                'marca_pneu_dianteiro_esquerdo': dados_vistoria.get('marca_pneu_dianteiro_esquerdo', ''),
+                'marca_pneu_dianteiro_direito': dados_vistoria.get('marca_pneu_dianteiro_direito', ''),
+                'marca_pneu_traseiro_esquerdo': dados_vistoria.get('marca_pneu_traseiro_esquerdo', ''),
+                'marca_pneu_traseiro_direito': dados_vistoria.get('marca_pneu_traseiro_direito', '')
+            }
+    
+        # DEBUG: Log dos dados dos pneus
+        logger.debug(f"🔍 [DEBUG] Dados completos dos pneus recebidos: {pneus}")
+    
+        # Validar e processar o ano
+        ano_raw = veiculo.get('ano')
+        ano_valido = None
+        if ano_raw:
+            try:
+                ano_int = int(ano_raw)
+                # Validar se o ano está dentro de um range válido (1900 até ano atual + 1)
+                ano_atual = datetime.now().year
+                if 1900 <= ano_int <= ano_atual + 1:
+                    ano_valido = ano_int
+                else:
+                    logger.warning(f"⚠️ Ano inválido ({ano_int}), usando None")
+            except (ValueError, TypeError):
+                logger.warning(f"⚠️ Ano não numérico ({ano_raw}), usando None")
+    
+        # Preparar valores finais
+        proprio_final = veiculo.get('proprio', True)  # Boolean, padrão True (próprio)
+        nome_terceiro_final = veiculo.get('nome_terceiro', '') or None  # Nome do terceiro se não for próprio
+    
+        valores = (
+            token,
+            veiculo.get('placa', '') or None,  # Permite null se vazio
+            veiculo.get('chassi', '') or None,  # Permite null se vazio
+            veiculo.get('modelo', ''),  # Obrigatório
+            veiculo.get('cor', ''),  # Obrigatório
+            ano_valido,  # Pode ser None
+            dados_vistoria.get('nome_conferente', ''),  # Obrigatório
+            dados_vistoria.get('nome_cliente', ''),  # Obrigatório
+            veiculo.get('km_rodado', '') or None,  # Campo KM, permite null se vazio
+        
+            # Campos de propriedade do veículo
+            proprio_final,
+            nome_terceiro_final,
+        
+            # Questionário
+            questionario.get('ar_condicionado', False),
+            questionario.get('antenas', False),
+            questionario.get('tapetes', False),
+            questionario.get('tapete_porta_malas', False),
+            questionario.get('bateria', False),
+            questionario.get('retrovisor_direito', False),
+            questionario.get('retrovisor_esquerdo', False),
+            questionario.get('extintor', False),
+            questionario.get('roda_comum', False),
+            questionario.get('roda_especial', False),
+            questionario.get('chave_principal', False),
+            questionario.get('chave_reserva', False),
+            questionario.get('manual', False),
+            questionario.get('documento', False),
+            questionario.get('nota_fiscal', False),
+            questionario.get('limpador_dianteiro', False),
+            questionario.get('limpador_traseiro', False),
+            questionario.get('triangulo', False),
+            questionario.get('macaco', False),
+            questionario.get('chave_roda', False),
+            questionario.get('pneu_step', False),
+            questionario.get('carregador_eletrico', False),
+        
+            # Marcas dos pneus
+            pneus.get('marca_pneu_dianteiro_esquerdo', ''),
+            pneus.get('marca_pneu_dianteiro_direito', ''),
+            pneus.get('marca_pneu_traseiro_esquerdo', ''),
+            pneus.get('marca_pneu_traseiro_direito', '')
+        )
+        
+        return valores
+    
+    def _inserir_vistoria_cursor(self, cursor, dados_vistoria, token):
+        """Executar o INSERT da vistoria no cursor informado (sem commit)"""
+        valores = self._preparar_valores_vistoria(dados_vistoria, token)
+        
+        logger.debug(f"🔧 [DB] Executando INSERT com {len(valores)} valores")
+        
+        cursor.execute(SQL_INSERIR_VISTORIA, valores)
+        resultado = cursor.fetchone()
+        return resultado['id'], resultado['token'], resultado['criado_em']
+    
+    @consulta_nomeada
     def inserir_vistoria(self, dados_vistoria):
         """Inserir nova vistoria no banco de dados"""
-        conn = None
         try:
-            print(f"🔧 [DB] Iniciando inserção da vistoria...")
-            print(f"🔧 [DB] Dados recebidos: {list(dados_vistoria.keys())}")
+            logger.debug(f"🔧 [DB] Iniciando inserção da vistoria...")
+            logger.debug(f"🔧 [DB] Dados recebidos: {list(dados_vistoria.keys())}")
             
-            conn = self.db_manager.get_connection()
-            cursor = conn.cursor()
-            
-            # Gerar token único
-            token = self.gerar_token_unico()
-            print(f"🔧 [DB] Token gerado: {token}")
-            
-            # SQL de inserção - REMOVIDO documento_nota_fiscal
-            sql = """
-            INSERT INTO vistorias (
-                token, placa, chassi, modelo, cor, ano, nome_conferente, nome_cliente, km_rodado,
-                proprio, nome_terceiro,
-                ar_condicionado, antenas, tapetes, tapete_porta_malas, bateria,
-                retrovisor_direito, retrovisor_esquerdo, extintor, roda_comum, roda_especial,
-                chave_principal, chave_reserva, manual, documento, nota_fiscal,
-                limpador_dianteiro, limpador_traseiro, triangulo, macaco, chave_roda, pneu_step, carregador_eletrico,
-                marca_pneu_dianteiro_esquerdo, marca_pneu_dianteiro_direito,
-                marca_pneu_traseiro_esquerdo, marca_pneu_traseiro_direito,
-                token_expira_em, status
-            ) VALUES (
-                %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                %s, %s,
-                %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                %s, %s, %s, %s,
-                CURRENT_TIMESTAMP + INTERVAL '24 hours', 'aguardando_assinatura'
-            ) RETURNING id, token
-            """
-            
-            # Preparar dados
-            # Suporte para dados estruturados (objeto) e dados planos (form-data)
-            if 'veiculo' in dados_vistoria:
-                # Formato estruturado (objeto JSON)
-                veiculo = dados_vistoria.get('veiculo', {})
-                questionario = dados_vistoria.get('questionario', {})
-                pneus = dados_vistoria.get('pneus', {})
-            else:
-                # Formato plano (form-data) - reestruturar dados
-                proprio_raw = dados_vistoria.get('proprio', 'true')
-                nome_terceiro_raw = dados_vistoria.get('nome_terceiro', '')
-                
-                proprio_convertido = proprio_raw.lower() == 'true' if isinstance(proprio_raw, str) else bool(proprio_raw)
-                
-                veiculo = {
-                    'placa': dados_vistoria.get('placa', ''),
-                    'modelo': dados_vistoria.get('modelo', ''),
-                    'cor': dados_vistoria.get('cor', ''),
-                    'ano': dados_vistoria.get('ano', ''),
-                    'km_rodado': dados_vistoria.get('km_rodado', ''),
-                    'proprio': proprio_convertido,  # Usar valor convertido
-                    'nome_terceiro': nome_terceiro_raw
-                }
-                
-                # Mapear questionário
-                questionario = {}
-                questionario_fields = [
-                    'ar_condicionado', 'antenas', 'tapetes', 'tapete_porta_malas', 'bateria',
-                    'retrovisor_direito', 'retrovisor_esquerdo', 'extintor', 'roda_comum', 'roda_especial',
-                    'chave_principal', 'chave_reserva', 'manual', 'documento', 'nota_fiscal',
-                    'limpador_dianteiro', 'limpador_traseiro', 'triangulo', 'macaco', 'chave_roda', 'pneu_step', 'carregador_eletrico'
-                ]
-                
-                for field in questionario_fields:
-                    questionario[field] = dados_vistoria.get(field, 'false').lower() == 'true'
-                
-                # Mapear pneus
-                pneus = {
-                    'marca_pneu_dianteiro_esquerdo': dados_vistoria.get('marca_pneu_dianteiro_esquerdo', ''),
-                    'marca_pneu_dianteiro_direito': dados_vistoria.get('marca_pneu_dianteiro_direito', ''),
-                    'marca_pneu_traseiro_esquerdo': dados_vistoria.get('marca_pneu_traseiro_esquerdo', ''),
-                    'marca_pneu_traseiro_direito': dados_vistoria.get('marca_pneu_traseiro_direito', '')
-                }
-            
-            # DEBUG: Log dos dados dos pneus
-            print(f"🔍 [DEBUG] Dados completos dos pneus recebidos: {pneus}")
-            print(f"🔍 [DEBUG] Marca pneu DE: '{pneus.get('marca_pneu_dianteiro_esquerdo', '')}'")
-            print(f"🔍 [DEBUG] Marca pneu DD: '{pneus.get('marca_pneu_dianteiro_direito', '')}'")
-            print(f"🔍 [DEBUG] Marca pneu TE: '{pneus.get('marca_pneu_traseiro_esquerdo', '')}'")
-            print(f"🔍 [DEBUG] Marca pneu TD: '{pneus.get('marca_pneu_traseiro_direito', '')}'")
-            
-            # Validar e processar o ano
-            ano_raw = veiculo.get('ano')
-            ano_valido = None
-            if ano_raw:
-                try:
-                    ano_int = int(ano_raw)
-                    # Validar se o ano está dentro de um range válido (1900 até ano atual + 1)
-                    ano_atual = datetime.now().year
-                    if 1900 <= ano_int <= ano_atual + 1:
-                        ano_valido = ano_int
-                    else:
-                        print(f"⚠️ Ano inválido ({ano_int}), usando None")
-                except (ValueError, TypeError):
-                    print(f"⚠️ Ano não numérico ({ano_raw}), usando None")
-            
-            # Preparar valores finais
-            proprio_final = veiculo.get('proprio', True)  # Boolean, padrão True (próprio)
-            nome_terceiro_final = veiculo.get('nome_terceiro', '') or None  # Nome do terceiro se não for próprio
-            
-            valores = (
-                token,
-                veiculo.get('placa', '') or None,  # Permite null se vazio
-                veiculo.get('chassi', '') or None,  # Permite null se vazio
-                veiculo.get('modelo', ''),  # Obrigatório
-                veiculo.get('cor', ''),  # Obrigatório
-                ano_valido,  # Pode ser None
-                dados_vistoria.get('nome_conferente', ''),  # Obrigatório
-                dados_vistoria.get('nome_cliente', ''),  # Obrigatório
-                veiculo.get('km_rodado', '') or None,  # Campo KM, permite null se vazio
-                
-                # Campos de propriedade do veículo
-                proprio_final,
-                nome_terceiro_final,
-                
-                # Questionário
-                questionario.get('ar_condicionado', False),
-                questionario.get('antenas', False),
-                questionario.get('tapetes', False),
-                questionario.get('tapete_porta_malas', False),
-                questionario.get('bateria', False),
-                questionario.get('retrovisor_direito', False),
-                questionario.get('retrovisor_esquerdo', False),
-                questionario.get('extintor', False),
-                questionario.get('roda_comum', False),
-                questionario.get('roda_especial', False),
-                questionario.get('chave_principal', False),
-                questionario.get('chave_reserva', False),
-                questionario.get('manual', False),
-                questionario.get('documento', False),
-                questionario.get('nota_fiscal', False),
-                questionario.get('limpador_dianteiro', False),
-                questionario.get('limpador_traseiro', False),
-                questionario.get('triangulo', False),
-                questionario.get('macaco', False),
-                questionario.get('chave_roda', False),
-                questionario.get('pneu_step', False),
-                questionario.get('carregador_eletrico', False),
-                
-                # Marcas dos pneus
-                pneus.get('marca_pneu_dianteiro_esquerdo', ''),
-                pneus.get('marca_pneu_dianteiro_direito', ''),
-                pneus.get('marca_pneu_traseiro_esquerdo', ''),
-                pneus.get('marca_pneu_traseiro_direito', '')
-            )
+            with self.db_manager.connection() as conn:
+                cursor = conn.cursor()
             
-            print(f"🔧 [DB] Executando SQL...")
-            print(f"🔍 [DEBUG] SQL count de %s: {sql.count('%s')}")
-            print(f"🔍 [DEBUG] Número de valores fornecidos: {len(valores)}")
-            print(f"🔍 [DEBUG] Valores: {valores}")
+                # Gerar token único
+                token = self.gerar_token_unico()
+                logger.debug(f"🔧 [DB] Token gerado: {token}")
             
-            cursor.execute(sql, valores)
-            resultado = cursor.fetchone()
-            vistoria_id = resultado['id']
-            token_retornado = resultado['token']
+                vistoria_id, token_retornado, _ = self._inserir_vistoria_cursor(cursor, dados_vistoria, token)
             
-            print(f"✅ [DB] Vistoria inserida com ID sequencial: {vistoria_id}")
-            print(f"✅ [DB] Token: {token_retornado}")
+                logger.debug(f"✅ [DB] Vistoria inserida com ID sequencial: {vistoria_id}")
+                logger.debug(f"✅ [DB] Token: {token_retornado}")
             
-            # Commit para finalizar inserção da vistoria
-            conn.commit()
+                # Commit para finalizar inserção da vistoria
+                conn.commit()
+                self.invalidar_cache_token(token_retornado)
+                self._marcar_escrita(token_retornado, vistoria_id)
             
-            return {
-                'id': vistoria_id,
-                'token': token_retornado,
-                'success': True
-            }
+                return {
+                    'id': vistoria_id,
+                    'token': token_retornado,
+                    'success': True
+                }
             
         except Exception as e:
-            if conn:
-                conn.rollback()
             logger.error(f"❌ Erro ao inserir vistoria: {e}")
             raise
-        finally:
-            if conn:
-                self.db_manager.return_connection(conn)
     
+    def _tipo_foto(self, categoria):
+        """Determinar tipo da foto a partir da categoria"""
+        if 'pneu' in categoria.lower():
+            return 'pneu'
+        elif 'obs' in categoria.lower() or 'observacao' in categoria.lower():
+            return 'observacao'
+        elif categoria == 'documento_nota_fiscal':
+            return 'documento'
+        return 'obrigatoria'
+    
+    def _valores_foto(self, vistoria_id, categoria, arquivo_info):
+        """Montar a tupla de valores do INSERT de fotos_vistoria (ver TEMPLATE_FOTO)"""
+        return (
+            vistoria_id,
+            vistoria_id,
+            categoria,
+            self._tipo_foto(categoria),
+            arquivo_info.get('filename', ''),
+            arquivo_info.get('path', ''),
+            arquivo_info.get('url', ''),
+            arquivo_info.get('size', 0),
+            arquivo_info.get('mimetype', 'image/jpeg'),
+            arquivo_info.get('checksum', ''),
+            arquivo_info.get('blob'),
+            arquivo_info.get('tamanho_original'),
+            arquivo_info.get('largura'),
+            arquivo_info.get('altura'),
+            (arquivo_info.get('original') or {}).get('blob'),
+            arquivo_info.get('phash'),
+            arquivo_info.get('duplicata_de')
+        )
+    
+    @staticmethod
+    def _valores_blobs(fotos):
+        """Tuplas de SQL_REGISTRAR_BLOBS das fotos (e originais) com 'blob', sem repetição e em ordem de sha256"""
+        valores = {}
+        for _, info in fotos:
+            for arquivo in (info, info.get('original') or {}):
+                if arquivo.get('blob'):
+                    valores[arquivo['blob']] = (arquivo['blob'], arquivo['path'], arquivo.get('size', 0),
+                                                arquivo.get('mimetype'), arquivo.get('largura'),
+                                                arquivo.get('altura'))
+        # Ordem fixa: duas transações com os mesmos blobs não se travam
+        return [valores[sha256] for sha256 in sorted(valores)]
+    
+    def _inserir_fotos_cursor(self, cursor, vistoria_id, fotos):
+        """
+        INSERT multi-linha de fotos no cursor informado (sem commit)
+        
+        Args:
+            fotos (list): Lista de tuplas (categoria, arquivo_info)
+            
+        Returns:
+            list: IDs gerados, na mesma ordem de `fotos`
+        """
+        if not fotos:
+            return []
+        blobs = self._valores_blobs(fotos)
+        if blobs:
+            execute_values(cursor, SQL_REGISTRAR_BLOBS, blobs, page_size=len(blobs))
+        valores = [self._valores_foto(vistoria_id, categoria, info) for categoria, info in fotos]
+        rows = execute_values(cursor, SQL_INSERIR_FOTOS, valores, template=TEMPLATE_FOTO,
+                              page_size=len(valores), fetch=True)
+        return [row['id'] for row in rows]
+    
+    @staticmethod
+    def _valores_observacao(obs):
+        """Montar a tupla de valores do INSERT de observações (ver TEMPLATE_OBSERVACAO)"""
+        return (
+            obs['foto_vistoria_id'],
+            obs['vistoria_criado_em'],
+            obs['descricao'],
+            obs.get('tipo', 'dano'),
+            obs.get('gravidade', 'baixa'),
+            obs.get('prioridade', 'normal')
+        )
+    
+    def _inserir_observacoes_cursor(self, cursor, observacoes):
+        """
+        INSERT multi-linha de observações no cursor informado (sem commit)
+        
+        Args:
+            observacoes (list): Dicts com foto_vistoria_id, vistoria_criado_em
+                (chave de partição), descricao e opcionalmente tipo,
+                gravidade e prioridade
+        """
+        if not observacoes:
+            return []
+        valores = [self._valores_observacao(obs) for obs in observacoes]
+        rows = execute_values(cursor, SQL_INSERIR_OBSERVACOES, valores, template=TEMPLATE_OBSERVACAO,
+                              page_size=len(valores), fetch=True)
+        return [row['id'] for row in rows]
+    
+    @consulta_nomeada
     def inserir_foto_vistoria(self, vistoria_id, categoria, arquivo_info):
         """Inserir foto da vistoria"""
-        conn = None
         try:
-            conn = self.db_manager.get_connection()
-            cursor = conn.cursor()
-            
-            # Determinar tipo da foto
-            if 'pneu' in categoria.lower():
-                tipo = 'pneu'
-            elif 'obs' in categoria.lower() or 'observacao' in categoria.lower():
-                tipo = 'observacao'
-            elif categoria == 'documento_nota_fiscal':
-                tipo = 'documento'
-            else:
-                tipo = 'obrigatoria'
-            
-            sql = """
-            INSERT INTO fotos_vistoria (
-                vistoria_id, categoria, tipo, arquivo_nome, arquivo_path,
-                arquivo_url, arquivo_tamanho, arquivo_tipo, arquivo_checksum
-            ) VALUES (
-                %s, %s, %s, %s, %s, %s, %s, %s, %s
-            ) RETURNING id
-            """
-            
-            valores = (
-                vistoria_id,
-                categoria,
-                tipo,
-                arquivo_info.get('filename', ''),
-                arquivo_info.get('path', ''),
-                arquivo_info.get('url', ''),
-                arquivo_info.get('size', 0),
-                arquivo_info.get('mimetype', 'image/jpeg'),
-                arquivo_info.get('checksum', '')
-            )
+            with self.db_manager.connection() as conn:
+                cursor = conn.cursor()
             
-            cursor.execute(sql, valores)
-            foto_id = cursor.fetchone()['id']
+                foto_id = self._inserir_fotos_cursor(cursor, vistoria_id, [(categoria, arquivo_info)])[0]
             
-            conn.commit()
+                conn.commit()
             
-            print(f"✅ [DB] Foto inserida com ID sequencial: {foto_id}")
+                logger.debug(f"✅ [DB] Foto inserida com ID sequencial: {foto_id}")
             
-            return foto_id
+                return foto_id
             
         except Exception as e:
-            if conn:
-                conn.rollback()
             logger.error(f"❌ Erro ao inserir foto: {e}")
             raise
-        finally:
-            if conn:
-                self.db_manager.return_connection(conn)
     
-    def inserir_observacao_foto(self, foto_vistoria_id, descricao, tipo='dano', gravidade='baixa', prioridade='normal'):
-        """Inserir observação de uma foto"""
-        conn = None
+    @consulta_nomeada
+    def inserir_fotos_vistoria(self, vistoria_id, fotos):
+        """Inserir várias fotos de uma vistoria em um único INSERT e commit"""
         try:
-            conn = self.db_manager.get_connection()
-            cursor = conn.cursor()
+            with self.db_manager.connection() as conn:
+                cursor = conn.cursor()
+                foto_ids = self._inserir_fotos_cursor(cursor, vistoria_id, fotos)
+                conn.commit()
+                self._marcar_escrita(vistoria_id=vistoria_id)
             
-            sql = """
-            INSERT INTO observacoes_fotos_vistoria (
-                foto_vistoria_id, descricao, tipo, gravidade, prioridade
-            ) VALUES (
-                %s, %s, %s, %s, %s
-            ) RETURNING id
-            """
+                logger.debug(f"✅ [DB] {len(foto_ids)} fotos inseridas: {foto_ids}")
+                return foto_ids
             
-            cursor.execute(sql, (foto_vistoria_id, descricao, tipo, gravidade, prioridade))
-            observacao_id = cursor.fetchone()['id']
+        except Exception as e:
+            logger.error(f"❌ Erro ao inserir fotos: {e}")
+            raise
+    
+    @consulta_nomeada
+    def inserir_vistoria_completa(self, dados_vistoria, fotos=None, observacoes=None, token=None):
+        """
+        Inserir vistoria, fotos e observações em uma única transação
+        
+        Args:
+            dados_vistoria (dict): Dados da vistoria (mesmo formato de inserir_vistoria)
+            fotos (list): Tuplas (categoria, arquivo_info) na ordem desejada
+            observacoes (list): Dicts com 'foto_index' (posição em `fotos`),
+                'descricao' e opcionalmente tipo, gravidade e prioridade
+            token (str): Token já gerado (ex.: usado nos nomes dos arquivos)
             
-            conn.commit()
+        Returns:
+            dict: id, token, foto_ids e observacao_ids
+        """
+        fotos = fotos or []
+        observacoes = observacoes or []
+        token = token or self.gerar_token_unico()
+        
+        try:
+            with self.db_manager.connection() as conn:
+                cursor = conn.cursor()
+                
+                vistoria_id, token_retornado, criado_em = self._inserir_vistoria_cursor(
+                    cursor, dados_vistoria, token
+                )
+                foto_ids = self._inserir_fotos_cursor(cursor, vistoria_id, fotos)
+                observacao_ids = self._inserir_observacoes_cursor(cursor, [
+                    {**obs, 'foto_vistoria_id': foto_ids[obs['foto_index']], 'vistoria_criado_em': criado_em}
+                    for obs in observacoes
+                ])
+                
+                conn.commit()
+                self.invalidar_cache_token(token_retornado)
+                self._marcar_escrita(token_retornado, vistoria_id)
+                
+                logger.info(f"✅ [DB] Vistoria {vistoria_id} salva em uma transação: "
+                            f"{len(foto_ids)} fotos, {len(observacao_ids)} observações")
+                
+                return {
+                    'id': vistoria_id,
+                    'token': token_retornado,
+                    'foto_ids': foto_ids,
+                    'observacao_ids': observacao_ids,
+                    'success': True
+                }
             
-            print(f"✅ [DB] Observação inserida com ID sequencial: {observacao_id}")
+        except Exception as e:
+            logger.error(f"❌ Erro ao inserir vistoria completa: {e}")
+            raise
+    
+    @consulta_nomeada
+    def inserir_observacao_foto(self, foto_vistoria_id, descricao, tipo='dano', gravidade='baixa', prioridade='normal',
+                                vistoria_criado_em=None):
+        """
+        Inserir observação de uma foto (sem vistoria_criado_em, lido da foto)
+        
+        Raises:
+            ValueError: foto_vistoria_id não existe
+        """
+        try:
+            with self.db_manager.connection() as conn:
+                cursor = conn.cursor()
+                
+                if vistoria_criado_em is None:
+                    cursor.execute(SQL_CRIADO_EM_FOTO, (foto_vistoria_id,))
+                    foto = cursor.fetchone()
+                    if foto is None:
+                        raise ValueError(f"Foto {foto_vistoria_id} não encontrada")
+                    vistoria_criado_em = foto['vistoria_criado_em']
             
-            return observacao_id
+                observacao_id = self._inserir_observacoes_cursor(cursor, [{
+                    'foto_vistoria_id': foto_vistoria_id,
+                    'vistoria_criado_em': vistoria_criado_em,
+                    'descricao': descricao,
+                    'tipo': tipo,
+                    'gravidade': gravidade,
+                    'prioridade': prioridade
+                }])[0]
+            
+                conn.commit()
+            
+                logger.debug(f"✅ [DB] Observação inserida com ID sequencial: {observacao_id}")
+            
+                return observacao_id
             
         except Exception as e:
-            if conn:
-                conn.rollback()
             logger.error(f"❌ Erro ao inserir observação: {e}")
             raise
-        finally:
-            if conn:
-                self.db_manager.return_connection(conn)
     
+    @consulta_nomeada
     def buscar_fotos_vistoria(self, vistoria_id):
         """Buscar fotos de uma vistoria com observações"""
-        conn = None
-        try:
-            conn = self.db_manager.get_connection()
+        def consulta(conn):
             cursor = conn.cursor()
-            
-            sql = """
-            SELECT 
-                f.id as foto_id,
-                f.categoria,
-                f.tipo,
-                f.arquivo_nome,
-                f.arquivo_path,
-                f.arquivo_url,
-                f.criado_em as foto_criado_em,
-                o.id as observacao_id,
-                o.descricao as observacao_descricao,
-                o.prioridade as observacao_prioridade,
-                o.status as observacao_status
-            FROM fotos_vistoria f
-            LEFT JOIN observacoes_fotos_vistoria o ON f.id = o.foto_vistoria_id AND o.status = 'ativa'
-            WHERE f.vistoria_id = %s
-            ORDER BY 
-                CASE f.tipo 
-                    WHEN 'obrigatoria' THEN 1 
-                    WHEN 'pneu' THEN 2 
-                    WHEN 'observacao' THEN 3 
-                END,
-                f.categoria, f.id
-            """
-            
-            cursor.execute(sql, (vistoria_id,))
-            results = cursor.fetchall()
-            
-            return [dict(row) for row in results]
+            cursor.execute(SQL_BUSCAR_FOTOS, (vistoria_id,))
+            return [dict(row) for row in cursor.fetchall()]
+        
+        try:
+            return self._executar_leitura(consulta, ('id', vistoria_id))
                 
         except Exception as e:
             logger.error(f"❌ Erro ao buscar fotos: {e}")
             raise
-        finally:
-            if conn:
-                self.db_manager.return_connection(conn)
     
-    def buscar_vistoria_por_token(self, token):
-        """Buscar vistoria pelo token"""
-        conn = None
-        try:
-            conn = self.db_manager.get_connection()
+    @staticmethod
+    def sql_projecao(projecao, coluna):
+        """SELECT só com as colunas da projeção, filtrando por `coluna`"""
+        colunas = ', '.join(f'v.{c}' for c in projecao.COLUMNS)
+        return SQL_BUSCAR_POR_CHAVE.format(colunas=colunas, coluna=coluna)
+    
+    def _buscar_projecao(self, coluna, valor, projecao):
+        """Buscar uma vistoria como linha compacta da projeção informada"""
+        def consulta(conn):
+            # Cursor de tuplas: sem montar um dict por linha
+            cursor = conn.cursor(cursor_factory=InstrumentedTupleCursor)
+            cursor.execute(self.sql_projecao(projecao, coluna), (valor,))
+            result = cursor.fetchone()
+            return projecao._make(result) if result else None
+        
+        return self._executar_leitura(consulta, (coluna, valor))
+    
+    def _buscar_uma(self, sql, coluna, valor):
+        """Buscar uma vistoria completa (dict) por `coluna` = `valor`"""
+        def consulta(conn):
             cursor = conn.cursor()
+            cursor.execute(sql, (valor,))
+            result = cursor.fetchone()
+            return dict(result) if result else None
+        
+        return self._executar_leitura(consulta, (coluna, valor))
+    
+    def _buscar_linha_por_token(self, token):
+        """Linha completa da vistoria (dict) pelo token, lendo através do cache"""
+        encontrado, linha = self.token_cache.get(token)
+        if encontrado:
+            return None if linha is NAO_ENCONTRADO else linha
+        
+        lido_em = time.monotonic()
+        linha = self._buscar_uma(SQL_BUSCAR_POR_TOKEN, 'token', token)
+        
+        self.token_cache.set(token, NAO_ENCONTRADO if linha is None else linha, lido_em=lido_em)
+        return linha
+    
+    @consulta_nomeada
+    def buscar_vistoria_por_token(self, token, projecao=None):
+        """
+        Buscar vistoria pelo token
+        
+        Com o cache ativo, a linha completa é lida uma vez e as projeções
+        são montadas a partir dela; sem cache, busca só as colunas da projeção.
+        
+        Args:
+            token (str): Token da vistoria
+            projecao: Tipo de linha de db.rows (ex.: VistoriaStatus) para buscar
+                só as colunas desse caso de uso; None = todas as colunas em dict
+        """
+        try:
+            if self.token_cache.enabled:
+                linha = self._buscar_linha_por_token(token)
+                if linha is None:
+                    return None
+                if projecao is not None:
+                    return projecao._make(linha[coluna] for coluna in projecao.COLUMNS)
+                return dict(linha)
+            
+            if projecao is not None:
+                return self._buscar_projecao('token', token, projecao)
             
-            sql = """
-            SELECT * FROM vistorias WHERE token = %s
-            """
+            return self._buscar_uma(SQL_BUSCAR_POR_TOKEN, 'token', token)
             
+        except Exception as e:
+            logger.error(f"❌ Erro ao buscar vistoria por token: {e}")
+            return None
+    
+    @staticmethod
+    def sql_agregado(coluna='token', projecao=None):
+        """SELECT da vistoria com as fotos aninhadas (json_agg), filtrando por `coluna`"""
+        colunas = ', '.join(f'v.{c}' for c in projecao.COLUMNS) if projecao is not None else 'v.*'
+        return SQL_BUSCAR_AGREGADO.format(colunas=colunas, coluna=coluna)
+    
+    @consulta_nomeada
+    def buscar_vistoria_completa(self, token, projecao=None):
+        """
+        Buscar vistoria, fotos e observações ativas em uma única consulta
+        
+        Args:
+            token (str): Token da vistoria
+            projecao: Tipo de linha de db.rows para limitar as colunas da
+                vistoria; None = todas
+            
+        Returns:
+            dict: Colunas da vistoria + 'fotos' (lista já ordenada, cada foto
+                com sua lista 'observacoes'), ou None se não existir
+        """
+        sql = self.sql_agregado('token', projecao)
+        
+        def consulta(conn):
+            cursor = conn.cursor()
             cursor.execute(sql, (token,))
             result = cursor.fetchone()
-            
             return dict(result) if result else None
+        
+        try:
+            return self._executar_leitura(consulta, ('token', token))
             
         except Exception as e:
-            logger.error(f"❌ Erro ao buscar vistoria por token: {e}")
+            logger.error(f"❌ Erro ao buscar vistoria completa: {e}")
             return None
-        finally:
-            if conn:
-                self.db_manager.return_connection(conn)
     
-    def buscar_vistoria_por_id(self, vistoria_id):
-        """Buscar vistoria por ID sequencial"""
-        conn = None
+    def invalidar_cache_token(self, token):
+        """Descartar a vistoria do cache (após qualquer alteração no banco)"""
+        self.token_cache.invalidate(token)
+    
+    @consulta_nomeada
+    def buscar_vistoria_por_id(self, vistoria_id, projecao=None):
+        """Buscar vistoria por ID sequencial (projecao: ver buscar_vistoria_por_token)"""
         try:
-            conn = self.db_manager.get_connection()
-            cursor = conn.cursor()
+            if projecao is not None:
+                return self._buscar_projecao('id', vistoria_id, projecao)
             
-            sql = """
-            SELECT * FROM vistorias WHERE id = %s
-            """
-            
-            cursor.execute(sql, (vistoria_id,))
-            result = cursor.fetchone()
-            
-            return dict(result) if result else None
+            return self._buscar_uma(SQL_BUSCAR_POR_ID, 'id', vistoria_id)
             
         except Exception as e:
             logger.error(f"❌ Erro ao buscar vistoria por ID: {e}")
             return None
-        finally:
-            if conn:
-                self.db_manager.return_connection(conn)
     
+    @consulta_nomeada
     def atualizar_assinatura_vistoria(self, token, assinatura_path, cliente_nome, checksum=None):
         """Atualizar vistoria com dados da assinatura"""
-        conn = None
         try:
-            conn = self.db_manager.get_connection()
-            cursor = conn.cursor()
+            with self.db_manager.connection() as conn:
+                cursor = conn.cursor()
             
-            sql = """
-            UPDATE vistorias SET
-                assinatura_arquivo_path = %s,
-                assinatura_cliente_nome = %s,
-                assinatura_data = CURRENT_TIMESTAMP,
-                assinatura_checksum = %s,
-                status = 'assinado',
-                atualizado_em = CURRENT_TIMESTAMP
-            WHERE token = %s AND status = 'aguardando_assinatura'
-            RETURNING id, placa, modelo, token
-            """
-            
-            cursor.execute(sql, (assinatura_path, cliente_nome, checksum, token))
-            resultado = cursor.fetchone()
-            
-            if resultado:
-                conn.commit()
-                vistoria_id = resultado['id']
-                print(f"✅ [DB] Assinatura salva para vistoria ID: {vistoria_id}")
-                return {
-                    'id': resultado['id'],
-                    'placa': resultado['placa'],
-                    'modelo': resultado['modelo'],
-                    'token': resultado['token']
-                }
-            else:
-                conn.rollback()
-                print(f"❌ [DB] Token inválido ou vistoria já assinada: {token}")
-                return None
+                cursor.execute(SQL_ATUALIZAR_ASSINATURA, (assinatura_path, cliente_nome, checksum, token))
+                resultado = cursor.fetchone()
+            
+                if resultado:
+                    conn.commit()
+                    vistoria_id = resultado['id']
+                    self._marcar_escrita(token, vistoria_id)
+                    logger.debug(f"✅ [DB] Assinatura salva para vistoria ID: {vistoria_id}")
+                    return {
+                        'id': resultado['id'],
+                        'placa': resultado['placa'],
+                        'modelo': resultado['modelo'],
+                        'token': resultado['token']
+                    }
+                else:
+                    conn.rollback()
+                    logger.warning(f"❌ [DB] Token inválido ou vistoria já assinada: {token}")
+                    return None
                 
         except Exception as e:
-            if conn:
-                conn.rollback()
             logger.error(f"❌ Erro ao atualizar assinatura: {e}")
             raise
         finally:
-            if conn:
-                self.db_manager.return_connection(conn)
+            # Status mudou (ou pode ter mudado): a próxima leitura vai ao banco
+            self.invalidar_cache_token(token)
     
+    @consulta_nomeada
+    def expirar_vistorias(self, limite=500, conn=None):
+        """
+        Marcar como 'expirado' até `limite` vistorias com link vencido
+        
+        Args:
+            conn: conexão com transação aberta (ex.: db/sweeper.py move as
+                fotos na mesma transação); quem chama faz o commit e depois
+                chama registrar_expiradas
+        
+        Returns:
+            list: dicts (id, token, criado_em) das vistorias expiradas
+        """
+        try:
+            if conn is not None:
+                cursor = conn.cursor()
+                cursor.execute(SQL_EXPIRAR_VISTORIAS, (limite,))
+                return [dict(row) for row in cursor.fetchall()]
+            
+            with self.db_manager.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(SQL_EXPIRAR_VISTORIAS, (limite,))
+                expiradas = [dict(row) for row in cursor.fetchall()]
+                conn.commit()
+            
+            self.registrar_expiradas(expiradas)
+            return expiradas
+            
+        except Exception as e:
+            logger.error(f"❌ Erro ao expirar vistorias: {e}")
+            raise
+    
+    def registrar_expiradas(self, expiradas):
+        """Tirar do cache as vistorias expiradas (depois do commit)"""
+        for vistoria in expiradas:
+            self.invalidar_cache_token(vistoria['token'])
+            self._marcar_escrita(vistoria['token'], vistoria['id'])
+    
+    @consulta_nomeada
     def listar_vistorias_recentes(self, limite=10):
         """Listar vistorias mais recentes"""
-        conn = None
-        try:
-            conn = self.db_manager.get_connection()
+        def consulta(conn):
             cursor = conn.cursor()
-            
-            sql = """
-            SELECT 
-                id,
-                token,
-                placa,
-                modelo,
-                cor,
-                ano,
-                nome_conferente,
-                status,
-                criado_em,
-                assinatura_data,
-                assinatura_cliente_nome
-            FROM vistorias 
-            ORDER BY criado_em DESC
-            LIMIT %s
-            """
-            
-            cursor.execute(sql, (limite,))
-            results = cursor.fetchall()
-            
-            return [dict(row) for row in results]
+            cursor.execute(SQL_LISTAR_RECENTES, (limite,))
+            return [dict(row) for row in cursor.fetchall()]
+        
+        try:
+            return self._executar_leitura(consulta, reler_vazio=False)
             
         except Exception as e:
             logger.error(f"❌ Erro ao listar vistorias: {e}")
             return []
-        finally:
-            if conn:
-                self.db_manager.return_connection(conn)
+
+    @staticmethod
+    def codificar_cursor(criado_em, vistoria_id):
+        """Gerar cursor opaco a partir da chave (criado_em, id) da última linha"""
+        raw = f"{criado_em.isoformat()}|{vistoria_id}"
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    @staticmethod
+    def decodificar_cursor(cursor_token):
+        """Converter cursor opaco em (criado_em, id); ValueError se inválido"""
+        try:
+            padded = cursor_token + '=' * (-len(cursor_token) % 4)
+            criado_em, vistoria_id = base64.urlsafe_b64decode(padded).decode().rsplit('|', 1)
+            return datetime.fromisoformat(criado_em), int(vistoria_id)
+        except Exception:
+            raise ValueError(f"Cursor inválido: {cursor_token}")
+
+    @staticmethod
+    def _prefixo_like(valor):
+        """Padrão LIKE de prefixo com curingas do usuário escapados"""
+        return valor.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+    def _estimar_total(self, cursor, where_sql, params):
+        """Estimativa barata de linhas: estatísticas da tabela ou plano do EXPLAIN"""
+        if not where_sql:
+            cursor.execute(SQL_ESTIMAR_TOTAL)
+            row = cursor.fetchone()
+            return max(int(row['total']), 0) if row else 0
+
+        cursor.execute(f"EXPLAIN (FORMAT JSON) SELECT 1 FROM vistorias {where_sql}", params)
+        plano = cursor.fetchone()['QUERY PLAN']
+        if isinstance(plano, str):
+            plano = json.loads(plano)
+        return int(plano[0]['Plan']['Plan Rows'])
+
+    @classmethod
+    def montar_consulta_resumo(cls, limit=20, cursor=None, status=None, placa=None,
+                               conferente=None, data_inicio=None, data_fim=None):
+        """
+        Montar o SQL da listagem resumida (usado também na verificação de planos)
+
+        Returns:
+            tuple: (sql, params da página, WHERE só dos filtros, params dos filtros)
+        """
+        filtros = []
+        params = []
+
+        if status:
+            filtros.append("status = %s")
+            params.append(status)
+        if placa:
+            filtros.append("upper(replace(placa, '-', '')) LIKE %s")
+            params.append(cls._prefixo_like(placa.strip().upper().replace('-', '')))
+        if conferente:
+            filtros.append("lower(nome_conferente) LIKE %s")
+            params.append(cls._prefixo_like(conferente.strip().lower()))
+        if data_inicio:
+            filtros.append("criado_em >= %s")
+            params.append(data_inicio)
+        if data_fim:
+            filtros.append("criado_em < %s")
+            params.append(data_fim)
+
+        where_filtros = f"WHERE {' AND '.join(filtros)}" if filtros else ""
+
+        filtros_pagina = list(filtros)
+        params_pagina = list(params)
+        if cursor:
+            ultimo_criado_em, ultimo_id = cls.decodificar_cursor(cursor)
+            # criado_em <= sozinho permite podar as partições mais novas
+            filtros_pagina.append("criado_em <= %s AND (criado_em, id) < (%s, %s)")
+            params_pagina.extend([ultimo_criado_em, ultimo_criado_em, ultimo_id])
+        where_pagina = f"WHERE {' AND '.join(filtros_pagina)}" if filtros_pagina else ""
+
+        # LIMIT limit + 1: a linha extra indica se existe próxima página
+        sql = f"""
+        SELECT
+            id,
+            token,
+            placa,
+            modelo,
+            cor,
+            ano,
+            nome_conferente,
+            nome_cliente,
+            status,
+            criado_em,
+            assinatura_data,
+            assinatura_cliente_nome
+        FROM vistorias
+        {where_pagina}
+        ORDER BY criado_em DESC, id DESC
+        LIMIT %s
+        """
+
+        return sql, params_pagina + [limit + 1], where_filtros, params
+
+    @consulta_nomeada
+    def listar_vistorias_resumo(self, limit=20, cursor=None, status=None, placa=None,
+                                conferente=None, data_inicio=None, data_fim=None):
+        """
+        Listar vistorias com paginação por cursor (keyset) em (criado_em, id)
+
+        Args:
+            limit (int): Itens por página
+            cursor (str): Cursor retornado pela página anterior (None = primeira)
+            status (str): Filtro exato por status
+            placa (str): Prefixo da placa (sem diferenciar maiúsculas)
+            conferente (str): Prefixo do nome do conferente
+            data_inicio (datetime): criado_em >= data_inicio
+            data_fim (datetime): criado_em < data_fim
+
+        Returns:
+            dict: vistorias, next_cursor (None na última página) e total_estimado
+        """
+        sql, params_pagina, where_filtros, params = self.montar_consulta_resumo(
+            limit, cursor, status, placa, conferente, data_inicio, data_fim
+        )
+
+        def consulta(conn):
+            db_cursor = conn.cursor()
+
+            # Buscar uma linha extra para saber se existe próxima página
+            db_cursor.execute(sql, params_pagina)
+            results = [dict(row) for row in db_cursor.fetchall()]
+
+            next_cursor = None
+            if len(results) > limit:
+                results = results[:limit]
+                ultimo = results[-1]
+                next_cursor = self.codificar_cursor(ultimo['criado_em'], ultimo['id'])
+
+            total_estimado = self._estimar_total(db_cursor, where_filtros, params)
+
+            return {
+                'vistorias': results,
+                'next_cursor': next_cursor,
+                'total_estimado': total_estimado
+            }
+
+        try:
+            # Listagem tolera o atraso da réplica (sem releitura no primário)
+            return self._executar_leitura(consulta, reler_vazio=False)
+
+        except Exception as e:
+            logger.error(f"❌ Erro ao listar resumo de vistorias: {e}")
+            raise
+
+    @staticmethod
+    def normalizar_placa(valor):
+        """Placa só com letras/dígitos maiúsculos, no formato Mercosul (ABC-1234 -> ABC1C34)"""
+        placa = re.sub(r'[^A-Za-z0-9]', '', valor or '').upper()
+        if re.fullmatch(r'[A-Z]{3}[0-9]{4}', placa):
+            placa = placa[:4] + 'ABCDEFGHIJ'[int(placa[4])] + placa[5:]
+        return placa
+
+    @staticmethod
+    def codificar_cursor_busca(relevancia, criado_em, vistoria_id):
+        """Cursor opaco da busca: chave (relevância, criado_em, id) da última linha"""
+        raw = f"{relevancia!r}|{criado_em.isoformat()}|{vistoria_id}"
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    @staticmethod
+    def decodificar_cursor_busca(cursor_token):
+        """Converter cursor da busca em (relevância, criado_em, id); ValueError se inválido"""
+        try:
+            padded = cursor_token + '=' * (-len(cursor_token) % 4)
+            relevancia, criado_em, vistoria_id = base64.urlsafe_b64decode(padded).decode().split('|')
+            return float(relevancia), datetime.fromisoformat(criado_em), int(vistoria_id)
+        except Exception:
+            raise ValueError(f"Cursor inválido: {cursor_token}")
+
+    @classmethod
+    def montar_consulta_busca(cls, termo, limit=20, cursor=None):
+        """
+        Montar o SQL da busca aproximada (usado também na verificação de planos)
+
+        O termo casa por substring (LIKE) ou por similaridade de palavra
+        (<%), ambos atendidos pelo índice de trigramas. Placa idêntica à
+        buscada (em qualquer formato) vem primeiro; o resto é ordenado por
+        word_similarity. Só as SEARCH_MAX_CANDIDATES correspondências mais
+        recentes são ranqueadas, o que limita o custo de termos comuns.
+
+        Returns:
+            tuple: (sql, params)
+
+        Raises:
+            ValueError: termo com menos de SEARCH_MIN_LENGTH caracteres
+        """
+        termo = ' '.join((termo or '').split())
+        # Placas e chassis são indexados sem pontuação: "abc-1234" -> "abc1234"
+        eh_codigo = re.fullmatch(r'[A-Za-z0-9\-.]+', termo) and re.search(r'\d', termo)
+        eh_placa = re.fullmatch(r'[A-Za-z]{3}[\s\-.]*\d[A-Za-z0-9]\d{2}', termo)
+        if eh_codigo or eh_placa:
+            termo = re.sub(r'[^A-Za-z0-9]', '', termo)
+        termo = termo.lower()
+        if len(termo) < DatabaseConfig.SEARCH_MIN_LENGTH:
+            raise ValueError(f"Termo de busca precisa de ao menos {DatabaseConfig.SEARCH_MIN_LENGTH} caracteres")
+
+        params = {
+            'termo': termo,
+            'padrao': '%' + cls._prefixo_like(termo),
+            'placa': cls.normalizar_placa(termo),
+            'max_candidatos': DatabaseConfig.SEARCH_MAX_CANDIDATES,
+            'limit': limit + 1,
+        }
+
+        where_pagina = ""
+        if cursor:
+            params['c_relevancia'], params['c_criado_em'], params['c_id'] = cls.decodificar_cursor_busca(cursor)
+            where_pagina = (
+                "WHERE (relevancia, criado_em, id) < "
+                "(%(c_relevancia)s::real, %(c_criado_em)s, %(c_id)s)"
+            )
+
+        sql = f"""
+        WITH candidatos AS (
+            SELECT
+                id, token, placa, chassi, modelo, cor, ano,
+                nome_conferente, nome_cliente, status, criado_em,
+                CASE WHEN normalizar_placa(placa) = %(placa)s THEN 2::real
+                     ELSE word_similarity(%(termo)s, {DOCUMENTO_BUSCA}) END AS relevancia
+            FROM vistorias
+            WHERE {DOCUMENTO_BUSCA} LIKE %(padrao)s
+               OR %(termo)s <%% {DOCUMENTO_BUSCA}
+            ORDER BY criado_em DESC, id DESC
+            LIMIT %(max_candidatos)s
+        )
+        SELECT * FROM candidatos
+        {where_pagina}
+        ORDER BY relevancia DESC, criado_em DESC, id DESC
+        LIMIT %(limit)s
+        """
+
+        return sql, params
+
+    @consulta_nomeada
+    def buscar_vistorias(self, termo, limit=20, cursor=None):
+        """
+        Busca aproximada por placa, chassi, cliente, modelo e conferente
+
+        Args:
+            termo (str): Texto digitado (placa em qualquer formato, parte do
+                chassi ou de um nome)
+            limit (int): Itens por página
+            cursor (str): Cursor retornado pela página anterior (None = primeira)
+
+        Returns:
+            dict: vistorias (com 'relevancia') e next_cursor (None na última página)
+        """
+        sql, params = self.montar_consulta_busca(termo, limit, cursor)
+
+        def consulta(conn):
+            db_cursor = conn.cursor()
+            db_cursor.execute(sql, params)
+            results = [dict(row) for row in db_cursor.fetchall()]
+
+            next_cursor = None
+            if len(results) > limit:
+                results = results[:limit]
+                ultimo = results[-1]
+                next_cursor = self.codificar_cursor_busca(
+                    ultimo['relevancia'], ultimo['criado_em'], ultimo['id']
+                )
+
+            return {'vistorias': results, 'next_cursor': next_cursor}
+
+        try:
+            return self._executar_leitura(consulta, reler_vazio=False)
+
+        except Exception as e:
+            logger.error(f"❌ Erro na busca de vistorias: {e}")
+            raise
 
 # Instância global da classe
 _database_manager = None
@@ -584,12 +1416,21 @@ def get_vistoria_db():
         _vistoria_db = VistoriaDatabase()
     return _vistoria_db
 
+def get_pool_stats():
+    """Estatísticas do pool global de conexões"""
+    return _database_manager.get_pool_stats() if _database_manager else {}
+
+def get_cache_stats():
+    """Estatísticas do cache de vistorias por token"""
+    return _vistoria_db.token_cache.stats() if _vistoria_db else {}
+
 def close_database():
     """Fechar todas as conexões do banco"""
-    global _database_manager
+    global _database_manager, _vistoria_db
     if _database_manager:
         _database_manager.close_all_connections()
         _database_manager = None
+    _vistoria_db = None
 
 def test_connection():
     """Testar conexão com o banco"""
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Chaves de idempotência das rotas de envio de vistoria
+Sistema Vistoria Agil - PostgreSQL Integration
+
+A primeira requisição com uma chave a reserva ('processando', com prazo
+de posse); a resposta é gravada ao final e devolvida às repetições sem
+reprocessar. Repetições concorrentes aguardam a primeira terminar.
+Enquanto a rota roda, a posse (DB_IDEMPOTENCY_LEASE) é renovada a cada
+terço do prazo (manter_posse): uma primeira requisição lenta não perde a
+chave para o reenvio; a posse só vence se o processo morrer. As
+chaves expiram após DB_IDEMPOTENCY_TTL_HOURS e são apagadas pelo
+db/sweeper.py. Tabela: migração 7.
+"""
+
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+from psycopg2.extras import Json
+
+from .database import DatabaseConfig, init_database
+from .metrics import consulta_nomeada
+
+logger = logging.getLogger(__name__)
+
+NOVA = 'nova'
+CONCLUIDA = 'concluida'
+PROCESSANDO = 'processando'
+CONFLITO = 'conflito'
+
+# Reserva a chave se ela não existe, já expirou ou se a posse da
+# requisição anterior (mesmo corpo) venceu sem resposta
+SQL_RESERVAR = """
+    INSERT INTO idempotency_keys (rota, chave, hash_requisicao, bloqueado_ate, expira_em)
+    VALUES (%(rota)s, %(chave)s, %(hash)s,
+            CURRENT_TIMESTAMP + %(posse)s * INTERVAL '1 second',
+            CURRENT_TIMESTAMP + %(ttl)s * INTERVAL '1 second')
+    ON CONFLICT (rota, chave) DO UPDATE SET
+        hash_requisicao = EXCLUDED.hash_requisicao,
+        status = 'processando',
+        resposta_status = NULL,
+        resposta_corpo = NULL,
+        bloqueado_ate = EXCLUDED.bloqueado_ate,
+        expira_em = EXCLUDED.expira_em,
+        criado_em = CURRENT_TIMESTAMP
+    WHERE idempotency_keys.expira_em <= CURRENT_TIMESTAMP
+       OR (idempotency_keys.status = 'processando'
+           AND idempotency_keys.bloqueado_ate <= CURRENT_TIMESTAMP
+           AND idempotency_keys.hash_requisicao = EXCLUDED.hash_requisicao)
+    RETURNING rota
+"""
+
+SQL_CONSULTAR = """
+    SELECT status, hash_requisicao, resposta_status, resposta_corpo
+    FROM idempotency_keys WHERE rota = %s AND chave = %s
+"""
+
+SQL_RENOVAR = """
+    UPDATE idempotency_keys SET bloqueado_ate = CURRENT_TIMESTAMP + %s * INTERVAL '1 second'
+    WHERE rota = %s AND chave = %s AND status = 'processando'
+"""
+
+SQL_CONCLUIR = """
+    UPDATE idempotency_keys SET
+        status = 'concluida',
+        resposta_status = %s,
+        resposta_corpo = %s,
+        expira_em = CURRENT_TIMESTAMP + %s * INTERVAL '1 second'
+    WHERE rota = %s AND chave = %s AND status = 'processando'
+"""
+
+SQL_LIBERAR = """
+    DELETE FROM idempotency_keys WHERE rota = %s AND chave = %s AND status = 'processando'
+"""
+
+SQL_LIMPAR_EXPIRADAS = """
+    DELETE FROM idempotency_keys WHERE ctid = ANY(ARRAY(
+        SELECT ctid FROM idempotency_keys WHERE expira_em <= CURRENT_TIMESTAMP LIMIT %s
+    ))
+"""
+
+
+class IdempotencyStore:
+    """Reserva, resposta gravada e expiração das chaves de idempotência"""
+
+    def __init__(self, db_manager=None, ttl=None, posse=None, espera=None):
+        self.db_manager = db_manager or init_database()
+        self.ttl = DatabaseConfig.IDEMPOTENCY_TTL_HOURS * 3600 if ttl is None else ttl
+        self.posse = DatabaseConfig.IDEMPOTENCY_LEASE if posse is None else posse
+        self.espera = DatabaseConfig.IDEMPOTENCY_WAIT if espera is None else espera
+
+    @consulta_nomeada
+    def reservar(self, rota, chave, hash_requisicao):
+        """
+        Tentar reservar a chave para esta requisição
+
+        Returns:
+            tuple: (estado, resposta) - NOVA (a requisição deve ser
+                processada), CONCLUIDA com (status, corpo) gravados,
+                PROCESSANDO (outra requisição está em andamento) ou
+                CONFLITO (mesma chave com outro corpo)
+        """
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(SQL_RESERVAR, {
+                'rota': rota, 'chave': chave, 'hash': hash_requisicao,
+                'posse': self.posse, 'ttl': self.ttl,
+            })
+            if cursor.fetchone():
+                conn.commit()
+                return NOVA, None
+
+            cursor.execute(SQL_CONSULTAR, (rota, chave))
+            existente = cursor.fetchone()
+            conn.rollback()
+
+        if existente is None:
+            # Apagada entre o INSERT e o SELECT: tentar de novo
+            return self.reservar(rota, chave, hash_requisicao)
+        if existente['hash_requisicao'] != hash_requisicao:
+            return CONFLITO, None
+        if existente['status'] == CONCLUIDA:
+            return CONCLUIDA, (existente['resposta_status'], existente['resposta_corpo'])
+        return PROCESSANDO, None
+
+    def reservar_ou_aguardar(self, rota, chave, hash_requisicao):
+        """
+        Reservar; se outra requisição com a mesma chave estiver em
+        andamento, aguardar até `espera` segundos pela resposta dela
+        """
+        prazo = time.monotonic() + self.espera
+        intervalo = 0.1
+        while True:
+            estado, resposta = self.reservar(rota, chave, hash_requisicao)
+            if estado != PROCESSANDO or time.monotonic() >= prazo:
+                return estado, resposta
+            time.sleep(min(intervalo, max(prazo - time.monotonic(), 0)))
+            intervalo = min(intervalo * 2, 1.0)
+
+    @consulta_nomeada
+    def renovar(self, rota, chave):
+        """Estender a posse da reserva; False se ela não existe mais"""
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(SQL_RENOVAR, (self.posse, rota, chave))
+            ok = cursor.rowcount == 1
+            conn.commit()
+        return ok
+
+    @contextmanager
+    def manter_posse(self, rota, chave):
+        """Renovar a posse em uma thread a cada terço do prazo até sair do bloco"""
+        fim = threading.Event()
+
+        def renovar():
+            while not fim.wait(self.posse / 3):
+                try:
+                    if not self.renovar(rota, chave):
+                        return
+                except Exception as e:
+                    logger.warning(f"⚠️ Não foi possível renovar a chave de idempotência: {e}")
+
+        thread = threading.Thread(target=renovar, name='idempotency-lease', daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            fim.set()
+            thread.join()
+
+    @consulta_nomeada
+    def concluir(self, rota, chave, status, corpo):
+        """Gravar a resposta da requisição que detém a chave"""
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(SQL_CONCLUIR, (status, Json(corpo), self.ttl, rota, chave))
+            conn.commit()
+
+    @consulta_nomeada
+    def liberar(self, rota, chave):
+        """Apagar a reserva (falha no processamento: a repetição processa de novo)"""
+        try:
+            with self.db_manager.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(SQL_LIBERAR, (rota, chave))
+                conn.commit()
+        except Exception as e:
+            logger.error(f"❌ Erro ao liberar chave de idempotência: {e}")
+
+    @consulta_nomeada
+    def limpar_expiradas(self, limite=1000):
+        """Apagar até `limite` chaves expiradas; retorna quantas foram apagadas"""
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(SQL_LIMPAR_EXPIRADAS, (limite,))
+            apagadas = cursor.rowcount
+            conn.commit()
+        return apagadas
+
+
+_idempotency_store = None
+
+def get_idempotency_store():
+    """Obter instância global das chaves de idempotência"""
+    global _idempotency_store
+    if _idempotency_store is None:
+        _idempotency_store = IdempotencyStore()
+    return _idempotency_store
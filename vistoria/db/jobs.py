@@ -0,0 +1,512 @@
+#!/usr/bin/env python3
+"""
+Fila de tarefas persistente em PostgreSQL
+Sistema Vistoria Agil - PostgreSQL Integration
+
+Trabalho pesado (backup JSON, PDF) sai da requisição: a rota chama
+enfileirar() e responde; workers pegam as tarefas com FOR UPDATE SKIP
+LOCKED, em ordem de prioridade. Falhas são repetidas com espera
+exponencial até max_tentativas; depois a tarefa fica 'morta' até ser
+reenfileirada. Enquanto o handler roda, o worker renova o prazo de
+posse (DB_JOB_LEASE) a cada terço dele; tarefa de um worker que morreu
+volta para a fila quando o prazo vence, ou fica 'morta' se já gastou
+as tentativas (um handler que derruba o processo não repete para sempre).
+
+Cada tipo de tarefa é registrado com @tarefa(tipo, campos=...); o
+payload é validado contra os campos ao enfileirar e chega ao handler
+como linha tipada (db/rows.py). Tabela: migração 8.
+
+Workers rodam como threads da aplicação (DB_JOB_WORKERS > 0) ou pela
+CLI, a partir da pasta vistoria/:
+    python -m db.jobs worker [--concorrencia 4] [--tipos backup_vistoria,gerar_pdf]
+    python -m db.jobs status
+    python -m db.jobs retry <id>
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import importlib
+import logging
+import threading
+import traceback
+from functools import partial
+
+from psycopg2.extras import Json
+
+from .database import DatabaseConfig, init_database
+from .metrics import consulta_nomeada
+from .rows import row_type
+
+logger = logging.getLogger(__name__)
+
+# Payloads podem trazer datas (dados da vistoria)
+_json_dumps = partial(json.dumps, default=str)
+
+PENDENTE = 'pendente'
+EXECUTANDO = 'executando'
+CONCLUIDO = 'concluido'
+MORTO = 'morto'
+
+# Módulos que registram handlers (importados pelos workers)
+MODULOS_HANDLERS = ('utils.tarefas',)
+
+SQL_ENFILEIRAR = """
+    INSERT INTO jobs (tipo, payload, prioridade, max_tentativas, executar_em)
+    VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP + %s * INTERVAL '1 second')
+    RETURNING id
+"""
+
+# Posse vencida (worker morreu) sem tentativas restantes
+SQL_MATAR_ABANDONADAS = """
+    UPDATE jobs SET status = 'morto',
+        ultimo_erro = concat_ws(E'\\n', ultimo_erro, 'Prazo de posse vencido (worker ' || worker || ')'),
+        atualizado_em = CURRENT_TIMESTAMP
+    WHERE id = ANY(ARRAY(
+        SELECT id FROM jobs
+        WHERE status = 'executando' AND bloqueado_ate <= CURRENT_TIMESTAMP
+          AND tentativas >= max_tentativas
+        FOR UPDATE SKIP LOCKED
+    ))
+"""
+
+# Pendentes vencidas ou executando com posse vencida (worker morreu) e
+# tentativas restantes
+SQL_RESERVAR = """
+    WITH proximas AS (
+        SELECT id FROM jobs
+        WHERE ((status = 'pendente' AND executar_em <= CURRENT_TIMESTAMP)
+               OR (status = 'executando' AND bloqueado_ate <= CURRENT_TIMESTAMP
+                   AND tentativas < max_tentativas))
+          AND tipo = ANY(%(tipos)s)
+        ORDER BY prioridade DESC, executar_em, id
+        LIMIT %(limite)s
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE jobs j SET
+        status = 'executando',
+        tentativas = j.tentativas + 1,
+        worker = %(worker)s,
+        bloqueado_ate = CURRENT_TIMESTAMP + %(posse)s * INTERVAL '1 second',
+        iniciado_em = CURRENT_TIMESTAMP,
+        atualizado_em = CURRENT_TIMESTAMP
+    FROM proximas
+    WHERE j.id = proximas.id
+    RETURNING j.id, j.tipo, j.payload, j.tentativas, j.max_tentativas
+"""
+
+SQL_RENOVAR = """
+    UPDATE jobs SET bloqueado_ate = CURRENT_TIMESTAMP + %s * INTERVAL '1 second'
+    WHERE id = %s AND worker = %s AND status = 'executando'
+"""
+
+SQL_CONCLUIR = """
+    UPDATE jobs SET status = 'concluido', resultado = %s, ultimo_erro = NULL,
+        concluido_em = CURRENT_TIMESTAMP, atualizado_em = CURRENT_TIMESTAMP
+    WHERE id = %s AND worker = %s AND status = 'executando'
+"""
+
+SQL_FALHAR = """
+    UPDATE jobs SET
+        status = CASE WHEN tentativas >= max_tentativas THEN 'morto' ELSE 'pendente' END,
+        executar_em = CURRENT_TIMESTAMP + %s * INTERVAL '1 second',
+        ultimo_erro = %s,
+        atualizado_em = CURRENT_TIMESTAMP
+    WHERE id = %s AND worker = %s AND status = 'executando'
+    RETURNING status
+"""
+
+SQL_REENFILEIRAR = """
+    UPDATE jobs SET status = 'pendente', tentativas = 0, executar_em = CURRENT_TIMESTAMP,
+        atualizado_em = CURRENT_TIMESTAMP
+    WHERE id = %s AND status = 'morto'
+    RETURNING id
+"""
+
+SQL_OBTER = """
+    SELECT id, tipo, status, prioridade, tentativas, max_tentativas, ultimo_erro,
+        resultado, criado_em, executar_em, iniciado_em, concluido_em
+    FROM jobs WHERE id = %s
+"""
+
+SQL_ESTATISTICAS = """
+    SELECT tipo, status, count(*) AS total,
+        EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - min(executar_em))
+            FILTER (WHERE status = 'pendente' AND executar_em <= CURRENT_TIMESTAMP) AS atraso_s
+    FROM jobs
+    WHERE status <> 'concluido' OR concluido_em > CURRENT_TIMESTAMP - INTERVAL '1 hour'
+    GROUP BY tipo, status
+"""
+
+SQL_LIMPAR_CONCLUIDOS = """
+    DELETE FROM jobs WHERE id = ANY(ARRAY(
+        SELECT id FROM jobs
+        WHERE status = 'concluido'
+          AND concluido_em <= CURRENT_TIMESTAMP - %s * INTERVAL '1 hour'
+        LIMIT %s
+    ))
+"""
+
+
+class Tarefa:
+    """Tipo de tarefa registrado: handler, campos do payload e política de repetição"""
+
+    def __init__(self, tipo, handler, campos, prioridade, max_tentativas):
+        self.tipo = tipo
+        self.handler = handler
+        self.campos = tuple(campos)
+        self.payload_type = row_type(f'Payload_{tipo}', self.campos)
+        self.prioridade = prioridade
+        self.max_tentativas = max_tentativas
+
+    def validar(self, payload):
+        faltando = set(self.campos) - set(payload)
+        extras = set(payload) - set(self.campos)
+        if faltando or extras:
+            raise ValueError(
+                f"Payload inválido para '{self.tipo}': "
+                f"faltando {sorted(faltando)}, desconhecidos {sorted(extras)}"
+            )
+
+    def executar(self, payload):
+        return self.handler(self.payload_type(**{c: payload.get(c) for c in self.campos}))
+
+
+_tarefas = {}
+
+def tarefa(tipo, campos, prioridade=0, max_tentativas=None):
+    """
+    Registrar handler de um tipo de tarefa
+
+    O handler recebe o payload como linha tipada com os `campos` e pode
+    retornar um dict JSON, gravado em jobs.resultado.
+    """
+    def registrar(handler):
+        _tarefas[tipo] = Tarefa(tipo, handler, campos, prioridade,
+                                max_tentativas or DatabaseConfig.JOB_MAX_ATTEMPTS)
+        return handler
+    return registrar
+
+
+def carregar_handlers(modulos=MODULOS_HANDLERS):
+    for modulo in modulos:
+        importlib.import_module(modulo)
+    return dict(_tarefas)
+
+
+def _espera_backoff(tentativas):
+    """Espera antes da próxima tentativa: base * 2^(n-1), limitada"""
+    return min(DatabaseConfig.JOB_BACKOFF_BASE * 2 ** (tentativas - 1), DatabaseConfig.JOB_BACKOFF_MAX)
+
+
+class JobQueue:
+    """Operações na tabela jobs"""
+
+    def __init__(self, db_manager=None):
+        self.db_manager = db_manager or init_database()
+
+    @consulta_nomeada
+    def enfileirar(self, tipo, payload, prioridade=None, atraso=0, conn=None):
+        """
+        Enfileirar uma tarefa
+
+        Args:
+            conn: conexão com transação aberta, para a tarefa só existir
+                se a transação de quem enfileira for confirmada
+
+        Returns:
+            int: id da tarefa
+        """
+        definicao = _tarefas.get(tipo)
+        if definicao is None:
+            raise ValueError(f"Tipo de tarefa desconhecido: {tipo}")
+        definicao.validar(payload)
+        valores = (tipo, Json(payload, dumps=_json_dumps),
+                   definicao.prioridade if prioridade is None else prioridade,
+                   definicao.max_tentativas, atraso)
+
+        if conn is not None:
+            cursor = conn.cursor()
+            cursor.execute(SQL_ENFILEIRAR, valores)
+            return cursor.fetchone()['id']
+
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(SQL_ENFILEIRAR, valores)
+            job_id = cursor.fetchone()['id']
+            conn.commit()
+        return job_id
+
+    @consulta_nomeada
+    def reservar(self, worker, tipos, limite=1):
+        """Reservar até `limite` tarefas; antes, marca como mortas as abandonadas sem tentativas"""
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(SQL_MATAR_ABANDONADAS)
+            if cursor.rowcount:
+                logger.error(f"❌ {cursor.rowcount} tarefas mortas: prazo de posse vencido sem tentativas restantes")
+            cursor.execute(SQL_RESERVAR, {
+                'tipos': list(tipos), 'limite': limite, 'worker': worker,
+                'posse': DatabaseConfig.JOB_LEASE,
+            })
+            jobs = cursor.fetchall()
+            conn.commit()
+        return jobs
+
+    @consulta_nomeada
+    def renovar(self, job_id, worker):
+        """Estender o prazo de posse; False se a tarefa não é mais deste worker"""
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(SQL_RENOVAR, (DatabaseConfig.JOB_LEASE, job_id, worker))
+            ok = cursor.rowcount == 1
+            conn.commit()
+        return ok
+
+    @consulta_nomeada
+    def concluir(self, job_id, worker, resultado=None):
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            resultado = Json(resultado, dumps=_json_dumps) if resultado is not None else None
+            cursor.execute(SQL_CONCLUIR, (resultado, job_id, worker))
+            conn.commit()
+
+    @consulta_nomeada
+    def falhar(self, job_id, worker, tentativas, erro):
+        """Registrar falha; retorna o novo status ('pendente' ou 'morto')"""
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(SQL_FALHAR, (_espera_backoff(tentativas), erro[-4000:], job_id, worker))
+            linha = cursor.fetchone()
+            conn.commit()
+        return linha['status'] if linha else None
+
+    @consulta_nomeada
+    def reenfileirar(self, job_id):
+        """Devolver uma tarefa morta à fila; False se ela não estiver morta"""
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(SQL_REENFILEIRAR, (job_id,))
+            ok = cursor.fetchone() is not None
+            conn.commit()
+        return ok
+
+    @consulta_nomeada
+    def obter(self, job_id):
+        """Tarefa pelo id (lida no primário: o status é consultado logo após enfileirar)"""
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(SQL_OBTER, (job_id,))
+            return cursor.fetchone()
+
+    @consulta_nomeada
+    def estatisticas(self):
+        """Contagem por tipo e status (concluídas: última hora) e atraso da fila"""
+        with self.db_manager.connection(read_only=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute(SQL_ESTATISTICAS)
+            linhas = cursor.fetchall()
+
+        stats = {}
+        for linha in linhas:
+            tipo = stats.setdefault(linha['tipo'], {'lag_s': 0.0})
+            tipo[linha['status']] = linha['total']
+            if linha['atraso_s'] is not None:
+                tipo['lag_s'] = round(float(linha['atraso_s']), 1)
+        return stats
+
+    @consulta_nomeada
+    def limpar_concluidos(self, horas=None, limite=1000):
+        """Apagar tarefas concluídas há mais de DB_JOB_RETENTION_HOURS"""
+        horas = DatabaseConfig.JOB_RETENTION_HOURS if horas is None else horas
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(SQL_LIMPAR_CONCLUIDOS, (horas, limite))
+            apagadas = cursor.rowcount
+            conn.commit()
+        return apagadas
+
+
+class JobWorker:
+    """Threads que executam as tarefas da fila"""
+
+    def __init__(self, queue=None, concorrencia=None, tipos=None, intervalo=None):
+        self.queue = queue or get_job_queue()
+        self.concorrencia = concorrencia or DatabaseConfig.JOB_WORKERS or 1
+        self.tipos = tuple(tipos) if tipos else None
+        self.intervalo = DatabaseConfig.JOB_POLL_INTERVAL if intervalo is None else intervalo
+        self.nome = f"{socket.gethostname()}:{os.getpid()}"
+        self._parar = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+
+        # Estatísticas
+        self._executadas = 0
+        self._falhas = 0
+        self._mortas = 0
+
+    def _executar_uma(self, worker):
+        """Reservar e executar uma tarefa; False se a fila estiver vazia"""
+        jobs = self.queue.reservar(worker, self.tipos or tuple(_tarefas))
+        if not jobs:
+            return False
+
+        job = jobs[0]
+        definicao = _tarefas[job['tipo']]
+        inicio = time.perf_counter()
+        fim = threading.Event()
+        renovador = threading.Thread(target=self._renovar_posse, args=(job['id'], worker, fim),
+                                     name=f'job-lease-{job["id"]}', daemon=True)
+        renovador.start()
+        try:
+            try:
+                resultado = definicao.executar(job['payload'])
+            finally:
+                fim.set()
+                renovador.join()
+        except Exception as e:
+            status = self.queue.falhar(job['id'], worker, job['tentativas'],
+                                       f"{e}\n{traceback.format_exc()}")
+            with self._lock:
+                self._falhas += 1
+                self._mortas += status == MORTO
+            nivel = logging.ERROR if status == MORTO else logging.WARNING
+            logger.log(nivel, f"❌ Tarefa {job['id']} ({job['tipo']}) falhou "
+                              f"[{job['tentativas']}/{job['max_tentativas']}]: {e}")
+            return True
+
+        self.queue.concluir(job['id'], worker, resultado)
+        with self._lock:
+            self._executadas += 1
+        logger.info(f"✅ Tarefa {job['id']} ({job['tipo']}) em {time.perf_counter() - inicio:.2f}s")
+        return True
+
+    def _renovar_posse(self, job_id, worker, fim):
+        """Renovar a posse da tarefa a cada terço de DB_JOB_LEASE até `fim`"""
+        while not fim.wait(DatabaseConfig.JOB_LEASE / 3):
+            try:
+                if not self.queue.renovar(job_id, worker):
+                    logger.warning(f"⚠️ Tarefa {job_id} não pertence mais a {worker}")
+                    return
+            except Exception as e:
+                logger.warning(f"⚠️ Não foi possível renovar a posse da tarefa {job_id}: {e}")
+
+    def _loop(self, indice):
+        worker = f"{self.nome}:{indice}"
+        while not self._parar.is_set():
+            try:
+                if not self._executar_uma(worker):
+                    self._parar.wait(self.intervalo)
+            except Exception as e:
+                logger.error(f"❌ Erro no worker de tarefas: {e}")
+                self._parar.wait(self.intervalo)
+
+    def start(self):
+        if not self._threads:
+            self._parar.clear()
+            for i in range(self.concorrencia):
+                thread = threading.Thread(target=self._loop, args=(i,), name=f'job-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=10.0):
+        self._parar.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': len(self._threads),
+                'executed': self._executadas,
+                'failed': self._falhas,
+                'dead': self._mortas,
+            }
+
+
+# Instâncias globais
+_job_queue = None
+_job_worker = None
+
+def get_job_queue():
+    """Obter instância global da fila de tarefas"""
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue()
+    return _job_queue
+
+def enfileirar(tipo, payload, prioridade=None, atraso=0, conn=None):
+    """Enfileirar tarefa na fila global (ver JobQueue.enfileirar)"""
+    return get_job_queue().enfileirar(tipo, payload, prioridade, atraso, conn)
+
+def start_job_workers():
+    """Iniciar os workers dentro da aplicação, se DB_JOB_WORKERS > 0"""
+    global _job_worker
+    if _job_worker is None and DatabaseConfig.JOB_WORKERS > 0:
+        carregar_handlers()
+        _job_worker = JobWorker().start()
+    return _job_worker
+
+def stop_job_workers():
+    global _job_worker
+    if _job_worker is not None:
+        _job_worker.stop()
+        _job_worker = None
+
+def get_job_worker_stats():
+    return _job_worker.stats() if _job_worker else {}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fila de tarefas da vistoria')
+    sub = parser.add_subparsers(dest='comando', required=True)
+    cmd = sub.add_parser('worker', help='Executar tarefas até Ctrl+C')
+    cmd.add_argument('--concorrencia', type=int, default=None, help='Threads de execução')
+    cmd.add_argument('--tipos', default=None, help='Só estes tipos (separados por vírgula)')
+    sub.add_parser('status', help='Tarefas por tipo e status')
+    cmd = sub.add_parser('retry', help='Reenfileirar tarefa morta')
+    cmd.add_argument('id', type=int)
+    args = parser.parse_args(argv)
+
+    queue = get_job_queue()
+    worker = None
+    try:
+        if args.comando == 'status':
+            for tipo, stats in sorted(queue.estatisticas().items()):
+                print(f"{tipo}: " + ', '.join(f"{k}={v}" for k, v in sorted(stats.items())))
+            return 0
+
+        if args.comando == 'retry':
+            if queue.reenfileirar(args.id):
+                print(f"✅ Tarefa {args.id} reenfileirada")
+                return 0
+            print(f"⚠️ Tarefa {args.id} não está morta")
+            return 1
+
+        registrados = carregar_handlers()
+        tipos = args.tipos.split(',') if args.tipos else None
+        desconhecidos = set(tipos or ()) - set(registrados)
+        if desconhecidos:
+            print(f"❌ Tipos desconhecidos: {', '.join(sorted(desconhecidos))}")
+            return 1
+
+        worker = JobWorker(queue, concorrencia=args.concorrencia, tipos=tipos).start()
+        print(f"⚙️ {worker.concorrencia} workers ({', '.join(tipos or sorted(registrados))}) - Ctrl+C para parar")
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        if worker:
+            worker.stop()
+        return 0
+    except Exception as e:
+        logger.error(f"❌ Erro na fila de tarefas: {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
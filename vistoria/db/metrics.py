@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Instrumentação das consultas: latência por consulta nomeada, espera no
+pool, linhas retornadas, log de consultas lentas e contagem por requisição
+Sistema Vistoria Agil - PostgreSQL Integration
+
+Os cursores do pool (InstrumentedCursor / InstrumentedTupleCursor) medem
+cada execute e fetch. O nome da consulta vem do método de VistoriaDatabase
+decorado com @consulta_nomeada; fora deles, do primeiro verbo do SQL.
+"""
+
+import os
+import re
+import time
+import logging
+import threading
+import functools
+from bisect import bisect_left
+from collections import Counter
+from contextvars import ContextVar
+
+from psycopg2.extensions import cursor as _TupleCursor
+from psycopg2.extras import RealDictCursor
+
+logger = logging.getLogger(__name__)
+slow_logger = logging.getLogger('vistoria.slow_query')
+
+# Consultas acima deste tempo vão para o log de consultas lentas (0 desativa)
+SLOW_QUERY_MS = float(os.getenv('DB_SLOW_QUERY_MS', '200'))
+# A mesma consulta repetida mais vezes que isso numa requisição = suspeita de N+1
+N_PLUS_ONE_THRESHOLD = int(os.getenv('DB_N_PLUS_ONE_THRESHOLD', '10'))
+
+# Limites superiores (ms) dos baldes do histograma; o último é +inf
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+_nome_consulta = ContextVar('nome_consulta', default=None)
+_requisicao = ContextVar('requisicao_db', default=None)
+
+
+class Histograma:
+    """Histograma cumulativo de latências com baldes fixos (ms)"""
+
+    __slots__ = ('baldes', 'count', 'total_ms', 'max_ms')
+
+    def __init__(self):
+        self.baldes = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observar(self, ms):
+        self.baldes[bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentil(self, p):
+        """Limite superior do balde que contém o percentil p (0-100)"""
+        if not self.count:
+            return 0.0
+        alvo = self.count * p / 100.0
+        acumulado = 0
+        for limite, n in zip(BUCKETS_MS + (float('inf'),), self.baldes):
+            acumulado += n
+            if acumulado >= alvo:
+                return limite if limite != float('inf') else round(self.max_ms, 3)
+        return round(self.max_ms, 3)
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'total_ms': round(self.total_ms, 3),
+            'avg_ms': round(self.total_ms / self.count, 3) if self.count else 0.0,
+            'max_ms': round(self.max_ms, 3),
+            'p50_ms': self.percentil(50),
+            'p95_ms': self.percentil(95),
+            'p99_ms': self.percentil(99),
+            'buckets': {
+                (f'le_{limite}' if i < len(BUCKETS_MS) else 'inf'): n
+                for i, (limite, n) in enumerate(zip(BUCKETS_MS + (None,), self.baldes))
+            },
+        }
+
+
+class QueryMetrics:
+    """Métricas agregadas do processo (thread-safe)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._execute = {}          # nome -> Histograma
+            self._fetch_ms = Counter()  # nome -> ms gastos em fetch*
+            self._rows = Counter()      # nome -> linhas retornadas/afetadas
+            self._pool_wait = Histograma()
+            self._slow = 0
+
+    def registrar_execute(self, nome, ms, linhas):
+        with self._lock:
+            hist = self._execute.get(nome)
+            if hist is None:
+                hist = self._execute[nome] = Histograma()
+            hist.observar(ms)
+            if linhas and linhas > 0:
+                self._rows[nome] += linhas
+            if SLOW_QUERY_MS and ms >= SLOW_QUERY_MS:
+                self._slow += 1
+
+    def registrar_fetch(self, nome, ms):
+        with self._lock:
+            self._fetch_ms[nome] += ms
+
+    def registrar_espera_pool(self, ms):
+        with self._lock:
+            self._pool_wait.observar(ms)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'queries': {
+                    nome: {
+                        **hist.to_dict(),
+                        'fetch_ms': round(self._fetch_ms[nome], 3),
+                        'rows': self._rows[nome],
+                    }
+                    for nome, hist in sorted(self._execute.items())
+                },
+                'pool_wait': self._pool_wait.to_dict(),
+                'slow_queries': self._slow,
+                'slow_query_ms': SLOW_QUERY_MS,
+            }
+
+
+metrics = QueryMetrics()
+
+
+def consulta_nomeada(func):
+    """Nomear as consultas executadas dentro do método (o mais externo vence)"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _nome_consulta.get() is not None:
+            return func(*args, **kwargs)
+        token = _nome_consulta.set(func.__name__)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _nome_consulta.reset(token)
+    return wrapper
+
+
+_VERBO = re.compile(r'^\s*(?:WITH\b.*?\)\s*)?(\w+)(?:\s+(?:INTO|FROM)?\s*(\w+))?', re.IGNORECASE | re.DOTALL)
+
+
+def _nome_atual(sql):
+    nome = _nome_consulta.get()
+    if nome:
+        return nome
+    if isinstance(sql, bytes):
+        sql = sql.decode('utf-8', 'replace')
+    match = _VERBO.match(str(sql))
+    return f"sql:{match.group(1).lower()}" if match else 'sql'
+
+
+def _redigir(params):
+    """Parâmetros sem os valores: só tipo e tamanho"""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {chave: _redigir_valor(valor) for chave, valor in params.items()}
+    return [_redigir_valor(valor) for valor in params]
+
+
+def _redigir_valor(valor):
+    if valor is None:
+        return None
+    if isinstance(valor, (str, bytes)):
+        return f'<{type(valor).__name__}:{len(valor)}>'
+    if isinstance(valor, (list, tuple)):
+        return f'<{type(valor).__name__}:{len(valor)}>'
+    return f'<{type(valor).__name__}>'
+
+
+def _sql_resumido(sql, limite=500):
+    if isinstance(sql, bytes):
+        sql = sql.decode('utf-8', 'replace')
+    sql = ' '.join(str(sql).split())
+    return sql if len(sql) <= limite else sql[:limite] + '...'
+
+
+def _registrar(nome, sql, params, ms, linhas):
+    metrics.registrar_execute(nome, ms, linhas)
+    req = _requisicao.get()
+    if req is not None:
+        req['count'] += 1
+        req['ms'] += ms
+        req['por_nome'][nome] += 1
+    if SLOW_QUERY_MS and ms >= SLOW_QUERY_MS:
+        slow_logger.warning(
+            f"🐢 Consulta lenta {nome}: {ms:.1f} ms, {linhas} linhas - "
+            f"{_sql_resumido(sql)} params={_redigir(params)}"
+        )
+
+
+class _InstrumentacaoMixin:
+    """Medir execute/executemany e fetch* do cursor"""
+
+    def execute(self, query, vars=None):
+        nome = _nome_atual(query)
+        inicio = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            _registrar(nome, query, vars, (time.perf_counter() - inicio) * 1000.0, self.rowcount)
+
+    def executemany(self, query, vars_list):
+        nome = _nome_atual(query)
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            _registrar(nome, query, None, (time.perf_counter() - inicio) * 1000.0, self.rowcount)
+
+    def _medir_fetch(self, metodo, *args):
+        inicio = time.perf_counter()
+        try:
+            return metodo(*args)
+        finally:
+            metrics.registrar_fetch(_nome_atual(self.query), (time.perf_counter() - inicio) * 1000.0)
+
+    def fetchone(self):
+        return self._medir_fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._medir_fetch(super().fetchmany, *(() if size is None else (size,)))
+
+    def fetchall(self):
+        return self._medir_fetch(super().fetchall)
+
+
+class InstrumentedCursor(_InstrumentacaoMixin, RealDictCursor):
+    """RealDictCursor instrumentado (cursor padrão das conexões do pool)"""
+
+
+class InstrumentedTupleCursor(_InstrumentacaoMixin, _TupleCursor):
+    """Cursor de tuplas instrumentado (projeções)"""
+
+
+def registrar_espera_pool(segundos):
+    metrics.registrar_espera_pool(segundos * 1000.0)
+    req = _requisicao.get()
+    if req is not None:
+        req['pool_wait_ms'] += segundos * 1000.0
+
+
+def iniciar_requisicao():
+    """Começar a contar consultas da requisição atual"""
+    return _requisicao.set({'count': 0, 'ms': 0.0, 'pool_wait_ms': 0.0, 'por_nome': Counter()})
+
+
+def finalizar_requisicao(token, descricao=''):
+    """
+    Encerrar a contagem e devolver o resumo da requisição
+
+    Consultas repetidas mais que N_PLUS_ONE_THRESHOLD vezes geram um aviso.
+    """
+    req = _requisicao.get()
+    _requisicao.reset(token)
+    if req is None:
+        return None
+    repetidas = {nome: n for nome, n in req['por_nome'].items() if n > N_PLUS_ONE_THRESHOLD}
+    if repetidas:
+        logger.warning(f"⚠️ Possível N+1 em {descricao}: {repetidas}")
+    return req
+
+
+def get_query_metrics():
+    return metrics.snapshot()
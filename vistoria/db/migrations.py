@@ -0,0 +1,782 @@
+#!/usr/bin/env python3
+"""
+Migrações versionadas do schema - tabelas e índices das consultas principais
+Sistema Vistoria Agil - PostgreSQL Integration
+
+Uso (a partir da pasta vistoria/):
+    python -m db.migrations upgrade              # aplicar migrações pendentes
+    python -m db.migrations status               # listar versões aplicadas/pendentes
+    python -m db.migrations check-plans --seed 50000
+        # popular dados sintéticos e falhar se alguma consulta do
+        # VistoriaDatabase fizer Seq Scan (no CI: TEST_DATABASE_URL=... pytest tests/)
+"""
+
+import sys
+import json
+import argparse
+import logging
+from datetime import datetime, timedelta
+
+import psycopg2
+
+from .rows import VistoriaCliente
+from .partitions import TABELAS_PARTICIONADAS, garantir_particoes_intervalo
+from .database import (
+    DatabaseConfig, VistoriaDatabase,
+    SQL_BUSCAR_POR_TOKEN, SQL_BUSCAR_POR_ID, SQL_BUSCAR_FOTOS,
+    SQL_ATUALIZAR_ASSINATURA, SQL_LISTAR_RECENTES, SQL_EXPIRAR_VISTORIAS, SQL_CRIADO_EM_FOTO,
+)
+
+logger = logging.getLogger(__name__)
+
+# Chave do pg_advisory_lock que serializa migrações entre processos
+MIGRATION_LOCK_KEY = 7283401
+
+# Cada migração: version, nome, statements e se roda dentro de transação.
+# Índices em tabelas já populadas usam CREATE INDEX CONCURRENTLY, que não
+# pode rodar em transação - essas migrações são aplicadas em autocommit.
+MIGRATIONS = [
+    {
+        'version': 1,
+        'nome': 'schema_inicial',
+        'transacional': True,
+        'sql': [
+            """
+            CREATE TABLE IF NOT EXISTS vistorias (
+                id SERIAL PRIMARY KEY,
+                token VARCHAR(64) NOT NULL,
+                placa VARCHAR(10),
+                chassi VARCHAR(32),
+                modelo VARCHAR(100),
+                cor VARCHAR(50),
+                ano INTEGER,
+                nome_conferente VARCHAR(150),
+                nome_cliente VARCHAR(150),
+                km_rodado VARCHAR(20),
+                proprio BOOLEAN DEFAULT TRUE,
+                nome_terceiro VARCHAR(150),
+                ar_condicionado BOOLEAN DEFAULT FALSE,
+                antenas BOOLEAN DEFAULT FALSE,
+                tapetes BOOLEAN DEFAULT FALSE,
+                tapete_porta_malas BOOLEAN DEFAULT FALSE,
+                bateria BOOLEAN DEFAULT FALSE,
+                retrovisor_direito BOOLEAN DEFAULT FALSE,
+                retrovisor_esquerdo BOOLEAN DEFAULT FALSE,
+                extintor BOOLEAN DEFAULT FALSE,
+                roda_comum BOOLEAN DEFAULT FALSE,
+                roda_especial BOOLEAN DEFAULT FALSE,
+                chave_principal BOOLEAN DEFAULT FALSE,
+                chave_reserva BOOLEAN DEFAULT FALSE,
+                manual BOOLEAN DEFAULT FALSE,
+                documento BOOLEAN DEFAULT FALSE,
+                nota_fiscal BOOLEAN DEFAULT FALSE,
+                limpador_dianteiro BOOLEAN DEFAULT FALSE,
+                limpador_traseiro BOOLEAN DEFAULT FALSE,
+                triangulo BOOLEAN DEFAULT FALSE,
+                macaco BOOLEAN DEFAULT FALSE,
+                chave_roda BOOLEAN DEFAULT FALSE,
+                pneu_step BOOLEAN DEFAULT FALSE,
+                carregador_eletrico BOOLEAN DEFAULT FALSE,
+                marca_pneu_dianteiro_esquerdo VARCHAR(100),
+                marca_pneu_dianteiro_direito VARCHAR(100),
+                marca_pneu_traseiro_esquerdo VARCHAR(100),
+                marca_pneu_traseiro_direito VARCHAR(100),
+                status VARCHAR(30) NOT NULL DEFAULT 'aguardando_assinatura',
+                token_expira_em TIMESTAMP,
+                assinatura_arquivo_path TEXT,
+                assinatura_cliente_nome VARCHAR(150),
+                assinatura_data TIMESTAMP,
+                assinatura_checksum VARCHAR(64),
+                criado_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                atualizado_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS fotos_vistoria (
+                id SERIAL PRIMARY KEY,
+                vistoria_id INTEGER NOT NULL REFERENCES vistorias(id) ON DELETE CASCADE,
+                categoria VARCHAR(100) NOT NULL,
+                tipo VARCHAR(20) NOT NULL,
+                arquivo_nome VARCHAR(255),
+                arquivo_path TEXT,
+                arquivo_url TEXT,
+                arquivo_tamanho BIGINT,
+                arquivo_tipo VARCHAR(100),
+                arquivo_checksum VARCHAR(64),
+                criado_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS observacoes_fotos_vistoria (
+                id SERIAL PRIMARY KEY,
+                foto_vistoria_id INTEGER NOT NULL REFERENCES fotos_vistoria(id) ON DELETE CASCADE,
+                descricao TEXT NOT NULL,
+                tipo VARCHAR(30) DEFAULT 'dano',
+                gravidade VARCHAR(20) DEFAULT 'baixa',
+                prioridade VARCHAR(20) DEFAULT 'normal',
+                status VARCHAR(20) NOT NULL DEFAULT 'ativa',
+                criado_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+        ]
+    },
+    {
+        'version': 2,
+        'nome': 'indices_consultas_principais',
+        'transacional': False,
+        'sql': [
+            # buscar_vistoria_por_token / atualizar_assinatura_vistoria
+            "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ux_vistorias_token ON vistorias (token)",
+            # listar_vistorias_recentes e paginação keyset de listar_vistorias_resumo
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_vistorias_criado_em ON vistorias (criado_em DESC, id DESC)",
+            # buscar_fotos_vistoria (WHERE vistoria_id + ORDER BY tipo, categoria, id)
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_fotos_vistoria_vistoria "
+            "ON fotos_vistoria (vistoria_id, tipo, categoria, id)",
+            # LEFT JOIN de observações ativas
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_observacoes_foto_ativa "
+            "ON observacoes_fotos_vistoria (foto_vistoria_id) WHERE status = 'ativa'",
+        ]
+    },
+    {
+        'version': 3,
+        'nome': 'indices_filtros_listagem',
+        'transacional': False,
+        'sql': [
+            # Filtros de listar_vistorias_resumo, combinados com a ordenação keyset
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_vistorias_status_criado_em "
+            "ON vistorias (status, criado_em DESC, id DESC)",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_vistorias_placa_prefixo "
+            "ON vistorias (upper(replace(placa, '-', '')) text_pattern_ops)",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_vistorias_conferente_prefixo "
+            "ON vistorias (lower(nome_conferente) text_pattern_ops)",
+        ]
+    },
+    {
+        # Particionamento mensal por criado_em da vistoria (PostgreSQL 12+).
+        # As tabelas antigas ficam como *_legado; os dados são copiados
+        # depois, em lotes de transações curtas, por
+        # `python -m db.partitions migrate-legacy` (aqui só há o RENAME e
+        # tabelas vazias: o ACCESS EXCLUSIVE dura segundos, não a cópia).
+        # Até a cópia terminar, vistorias antigas não aparecem na aplicação.
+        # As *_legado ficam até serem removidas manualmente após a conferência.
+        # Fotos e observações levam vistoria_criado_em para ficar na mesma
+        # partição mensal da vistoria; vistorias_chaves é o índice global
+        # id/token -> criado_em usado para podar partições nas buscas.
+        'version': 4,
+        'nome': 'particionamento_mensal',
+        'transacional': True,
+        'sql': [
+            "ALTER TABLE observacoes_fotos_vistoria RENAME TO observacoes_fotos_vistoria_legado",
+            "ALTER TABLE fotos_vistoria RENAME TO fotos_vistoria_legado",
+            "ALTER TABLE vistorias RENAME TO vistorias_legado",
+            # Os nomes dos índices das migrações 2 e 3 passam para as tabelas novas
+            "DROP INDEX IF EXISTS ux_vistorias_token, ix_vistorias_criado_em, ix_fotos_vistoria_vistoria, "
+            "ix_observacoes_foto_ativa, ix_vistorias_status_criado_em, ix_vistorias_placa_prefixo, "
+            "ix_vistorias_conferente_prefixo",
+            # As sequências continuam gerando os IDs das tabelas novas
+            "ALTER SEQUENCE vistorias_id_seq OWNED BY NONE",
+            "ALTER SEQUENCE fotos_vistoria_id_seq OWNED BY NONE",
+            "ALTER SEQUENCE observacoes_fotos_vistoria_id_seq OWNED BY NONE",
+            """
+            CREATE TABLE vistorias (
+                LIKE vistorias_legado INCLUDING DEFAULTS,
+                PRIMARY KEY (id, criado_em)
+            ) PARTITION BY RANGE (criado_em)
+            """,
+            """
+            CREATE TABLE fotos_vistoria (
+                LIKE fotos_vistoria_legado INCLUDING DEFAULTS,
+                vistoria_criado_em TIMESTAMP NOT NULL,
+                PRIMARY KEY (id, vistoria_criado_em),
+                CONSTRAINT fk_fotos_vistoria FOREIGN KEY (vistoria_id, vistoria_criado_em)
+                    REFERENCES vistorias (id, criado_em) ON DELETE CASCADE
+            ) PARTITION BY RANGE (vistoria_criado_em)
+            """,
+            """
+            CREATE TABLE observacoes_fotos_vistoria (
+                LIKE observacoes_fotos_vistoria_legado INCLUDING DEFAULTS,
+                vistoria_criado_em TIMESTAMP NOT NULL,
+                PRIMARY KEY (id, vistoria_criado_em),
+                CONSTRAINT fk_observacoes_foto FOREIGN KEY (foto_vistoria_id, vistoria_criado_em)
+                    REFERENCES fotos_vistoria (id, vistoria_criado_em) ON DELETE CASCADE
+            ) PARTITION BY RANGE (vistoria_criado_em)
+            """,
+            "ALTER SEQUENCE vistorias_id_seq OWNED BY vistorias.id",
+            "ALTER SEQUENCE fotos_vistoria_id_seq OWNED BY fotos_vistoria.id",
+            "ALTER SEQUENCE observacoes_fotos_vistoria_id_seq OWNED BY observacoes_fotos_vistoria.id",
+            # Unicidade global de id e token (a PK particionada inclui criado_em);
+            # arquivo = mês já arquivado por db.partitions
+            """
+            CREATE TABLE vistorias_chaves (
+                id INTEGER PRIMARY KEY,
+                token VARCHAR(64) NOT NULL UNIQUE,
+                criado_em TIMESTAMP NOT NULL,
+                arquivo VARCHAR(7)
+            )
+            """,
+            """
+            CREATE FUNCTION registrar_chave_vistoria() RETURNS trigger AS $$
+            BEGIN
+                INSERT INTO vistorias_chaves (id, token, criado_em) VALUES (NEW.id, NEW.token, NEW.criado_em)
+                ON CONFLICT (id) DO UPDATE SET arquivo = NULL
+                WHERE vistorias_chaves.token = EXCLUDED.token AND vistorias_chaves.criado_em = EXCLUDED.criado_em;
+                IF NOT FOUND THEN
+                    RAISE unique_violation USING MESSAGE = 'token ou id de vistoria duplicado: ' || NEW.token;
+                END IF;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+            """,
+            """
+            CREATE TRIGGER tg_vistorias_chaves AFTER INSERT ON vistorias
+            FOR EACH ROW EXECUTE FUNCTION registrar_chave_vistoria()
+            """,
+            # Cria as três partições de um mês (idempotente); usada também por
+            # db.partitions para manter partições à frente
+            """
+            CREATE FUNCTION criar_particao_mensal(mes DATE) RETURNS VOID AS $$
+            DECLARE
+                inicio DATE := date_trunc('month', mes);
+                fim DATE := (date_trunc('month', mes) + INTERVAL '1 month')::date;
+                sufixo TEXT := to_char(date_trunc('month', mes), '"_p"YYYY_MM');
+            BEGIN
+                EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF vistorias FOR VALUES FROM (%L) TO (%L)',
+                               'vistorias' || sufixo, inicio, fim);
+                EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF fotos_vistoria FOR VALUES FROM (%L) TO (%L)',
+                               'fotos_vistoria' || sufixo, inicio, fim);
+                EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF observacoes_fotos_vistoria '
+                               'FOR VALUES FROM (%L) TO (%L)',
+                               'observacoes_fotos_vistoria' || sufixo, inicio, fim);
+            END
+            $$ LANGUAGE plpgsql
+            """,
+            """
+            SELECT criar_particao_mensal(mes::date)
+            FROM generate_series(
+                date_trunc('month', LEAST(
+                    (SELECT min(criado_em) FROM vistorias_legado), CURRENT_TIMESTAMP::timestamp
+                )),
+                date_trunc('month', CURRENT_TIMESTAMP) + INTERVAL '3 months',
+                INTERVAL '1 month'
+            ) AS mes
+            """,
+            # Índices no pai valem para todas as partições (atuais e futuras)
+            "CREATE INDEX ix_vistorias_criado_em ON vistorias (criado_em DESC, id DESC)",
+            "CREATE INDEX ix_vistorias_status_criado_em ON vistorias (status, criado_em DESC, id DESC)",
+            "CREATE INDEX ix_vistorias_placa_prefixo ON vistorias (upper(replace(placa, '-', '')) text_pattern_ops)",
+            "CREATE INDEX ix_vistorias_conferente_prefixo ON vistorias (lower(nome_conferente) text_pattern_ops)",
+            "CREATE INDEX ix_fotos_vistoria_vistoria ON fotos_vistoria (vistoria_id, tipo, categoria, id)",
+            "CREATE INDEX ix_observacoes_foto_ativa ON observacoes_fotos_vistoria (foto_vistoria_id) "
+            "WHERE status = 'ativa'",
+        ]
+    },
+    {
+        # Varredura de expiração (db/sweeper.py): índice parcial só com as
+        # pendentes, então expiradas/assinadas não são lidas. Em tabela
+        # particionada o índice não pode ser CONCURRENTLY.
+        'version': 5,
+        'nome': 'indice_expiracao_pendentes',
+        'transacional': True,
+        'sql': [
+            "CREATE INDEX IF NOT EXISTS ix_vistorias_pendentes_expira_em "
+            "ON vistorias (token_expira_em) WHERE status = 'aguardando_assinatura'",
+        ]
+    },
+    {
+        # Busca aproximada (VistoriaDatabase.buscar_vistorias): um índice GIN
+        # de trigramas sobre um único texto com placa (como digitada e no
+        # formato Mercosul), chassi, cliente, modelo e conferente
+        'version': 6,
+        'nome': 'busca_trigramas',
+        'transacional': True,
+        'sql': [
+            "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+            # Mesma regra de VistoriaDatabase.normalizar_placa: ABC-1234 -> ABC1C34
+            """
+            CREATE OR REPLACE FUNCTION normalizar_placa(placa TEXT) RETURNS TEXT AS $$
+                SELECT CASE WHEN n ~ '^[A-Z]{3}[0-9]{4}$'
+                            THEN substr(n, 1, 4) || translate(substr(n, 5, 1), '0123456789', 'ABCDEFGHIJ')
+                                 || substr(n, 6)
+                            ELSE n END
+                FROM (SELECT upper(regexp_replace(coalesce(placa, ''), '[^A-Za-z0-9]', '', 'g')) AS n) s
+            $$ LANGUAGE sql IMMUTABLE PARALLEL SAFE
+            """,
+            """
+            CREATE OR REPLACE FUNCTION documento_busca_vistoria(
+                placa TEXT, chassi TEXT, nome_cliente TEXT, modelo TEXT, nome_conferente TEXT
+            ) RETURNS TEXT AS $$
+                SELECT lower(concat_ws(' ',
+                    regexp_replace(placa, '[^A-Za-z0-9]', '', 'g'), normalizar_placa(placa),
+                    regexp_replace(chassi, '[^A-Za-z0-9]', '', 'g'),
+                    nome_cliente, modelo, nome_conferente
+                ))
+            $$ LANGUAGE sql IMMUTABLE PARALLEL SAFE
+            """,
+            "CREATE INDEX IF NOT EXISTS ix_vistorias_busca_trgm ON vistorias USING gin "
+            "(documento_busca_vistoria(placa, chassi, nome_cliente, modelo, nome_conferente) gin_trgm_ops)",
+        ]
+    },
+    {
+        'version': 7,
+        'nome': 'chaves_idempotencia',
+        'transacional': True,
+        'sql': [
+            """
+            CREATE TABLE IF NOT EXISTS idempotency_keys (
+                rota VARCHAR(100) NOT NULL,
+                chave VARCHAR(255) NOT NULL,
+                hash_requisicao CHAR(64) NOT NULL,
+                status VARCHAR(20) NOT NULL DEFAULT 'processando',
+                resposta_status INTEGER,
+                resposta_corpo JSONB,
+                bloqueado_ate TIMESTAMP NOT NULL,
+                criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                expira_em TIMESTAMP NOT NULL,
+                PRIMARY KEY (rota, chave)
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS ix_idempotency_keys_expira_em ON idempotency_keys (expira_em)",
+        ]
+    },
+    {
+        'version': 8,
+        'nome': 'fila_tarefas',
+        'transacional': True,
+        'sql': [
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id BIGSERIAL PRIMARY KEY,
+                tipo VARCHAR(50) NOT NULL,
+                payload JSONB NOT NULL DEFAULT '{}',
+                status VARCHAR(20) NOT NULL DEFAULT 'pendente'
+                    CHECK (status IN ('pendente', 'executando', 'concluido', 'morto')),
+                prioridade SMALLINT NOT NULL DEFAULT 0,
+                tentativas INTEGER NOT NULL DEFAULT 0,
+                max_tentativas INTEGER NOT NULL DEFAULT 5,
+                executar_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                bloqueado_ate TIMESTAMP,
+                worker VARCHAR(100),
+                ultimo_erro TEXT,
+                resultado JSONB,
+                criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                iniciado_em TIMESTAMP,
+                concluido_em TIMESTAMP,
+                atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS ix_jobs_pendentes ON jobs (prioridade DESC, executar_em, id) "
+            "WHERE status = 'pendente'",
+            "CREATE INDEX IF NOT EXISTS ix_jobs_executando ON jobs (bloqueado_ate) WHERE status = 'executando'",
+            "CREATE INDEX IF NOT EXISTS ix_jobs_concluidos ON jobs (concluido_em) WHERE status = 'concluido'",
+        ]
+    },
+    {
+        'version': 9,
+        'nome': 'armazenamento_por_conteudo',
+        'transacional': True,
+        'sql': [
+            """
+            CREATE TABLE IF NOT EXISTS blobs (
+                sha256 CHAR(64) PRIMARY KEY,
+                caminho TEXT NOT NULL,
+                tamanho BIGINT NOT NULL,
+                mimetype VARCHAR(100),
+                largura INTEGER,
+                altura INTEGER,
+                referencias INTEGER NOT NULL DEFAULT 0,
+                criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                sem_referencia_desde TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS ix_blobs_sem_referencia ON blobs (sem_referencia_desde) "
+            "WHERE referencias <= 0",
+            "ALTER TABLE fotos_vistoria ADD COLUMN IF NOT EXISTS blob_sha256 CHAR(64) REFERENCES blobs (sha256)",
+            "CREATE INDEX IF NOT EXISTS ix_fotos_vistoria_blob ON fotos_vistoria (blob_sha256)",
+            # Contagem de referências mantida pelo banco (inclui partições futuras)
+            """
+            CREATE OR REPLACE FUNCTION contar_referencias_blob() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    IF OLD.blob_sha256 IS NOT NULL THEN
+                        UPDATE blobs SET
+                            referencias = referencias - 1,
+                            sem_referencia_desde = CASE WHEN referencias <= 1 THEN CURRENT_TIMESTAMP END
+                        WHERE sha256 = OLD.blob_sha256;
+                    END IF;
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    IF NEW.blob_sha256 IS NOT NULL THEN
+                        UPDATE blobs SET referencias = referencias + 1, sem_referencia_desde = NULL
+                        WHERE sha256 = NEW.blob_sha256;
+                    END IF;
+                END IF;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+            """,
+            "DROP TRIGGER IF EXISTS trg_fotos_referencias_blob ON fotos_vistoria",
+            "CREATE TRIGGER trg_fotos_referencias_blob "
+            "AFTER INSERT OR DELETE OR UPDATE OF blob_sha256 ON fotos_vistoria "
+            "FOR EACH ROW EXECUTE FUNCTION contar_referencias_blob()",
+        ]
+    },
+    {
+        'version': 10,
+        'nome': 'fotos_normalizadas',
+        'transacional': True,
+        'sql': [
+            # Tamanho recebido (antes da normalização), dimensões do arquivo
+            # guardado e, com PHOTO_KEEP_ORIGINAL, o blob do original
+            "ALTER TABLE fotos_vistoria ADD COLUMN IF NOT EXISTS arquivo_tamanho_original BIGINT",
+            "ALTER TABLE fotos_vistoria ADD COLUMN IF NOT EXISTS largura INTEGER",
+            "ALTER TABLE fotos_vistoria ADD COLUMN IF NOT EXISTS altura INTEGER",
+            "ALTER TABLE fotos_vistoria ADD COLUMN IF NOT EXISTS original_blob_sha256 CHAR(64) "
+            "REFERENCES blobs (sha256)",
+            # O original também conta como referência do blob
+            """
+            CREATE OR REPLACE FUNCTION contar_referencias_blob() RETURNS trigger AS $$
+            DECLARE
+                sha CHAR(64);
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    FOREACH sha IN ARRAY ARRAY[OLD.blob_sha256, OLD.original_blob_sha256] LOOP
+                        IF sha IS NOT NULL THEN
+                            UPDATE blobs SET
+                                referencias = referencias - 1,
+                                sem_referencia_desde = CASE WHEN referencias <= 1 THEN CURRENT_TIMESTAMP END
+                            WHERE sha256 = sha;
+                        END IF;
+                    END LOOP;
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    FOREACH sha IN ARRAY ARRAY[NEW.blob_sha256, NEW.original_blob_sha256] LOOP
+                        IF sha IS NOT NULL THEN
+                            UPDATE blobs SET referencias = referencias + 1, sem_referencia_desde = NULL
+                            WHERE sha256 = sha;
+                        END IF;
+                    END LOOP;
+                END IF;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+            """,
+            "DROP TRIGGER IF EXISTS trg_fotos_referencias_blob ON fotos_vistoria",
+            "CREATE TRIGGER trg_fotos_referencias_blob "
+            "AFTER INSERT OR DELETE OR UPDATE OF blob_sha256, original_blob_sha256 ON fotos_vistoria "
+            "FOR EACH ROW EXECUTE FUNCTION contar_referencias_blob()",
+        ]
+    },
+    {
+        'version': 11,
+        'nome': 'uploads_sessoes',
+        'transacional': True,
+        'sql': [
+            # Uploads em partes (db/uploads.py). blob_sha256 sem FK: a coleta
+            # de blobs não espera a sessão expirar (o JOIN em resolver basta)
+            """
+            CREATE TABLE IF NOT EXISTS uploads_sessoes (
+                id VARCHAR(64) PRIMARY KEY,
+                nome VARCHAR(255),
+                mimetype VARCHAR(100),
+                tamanho BIGINT NOT NULL,
+                recebido BIGINT NOT NULL DEFAULT 0,
+                sha256_esperado CHAR(64),
+                status VARCHAR(20) NOT NULL DEFAULT 'recebendo',
+                blob_sha256 CHAR(64),
+                criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                expira_em TIMESTAMP NOT NULL
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS ix_uploads_sessoes_expira ON uploads_sessoes (expira_em)",
+        ]
+    },
+    {
+        'version': 12,
+        'nome': 'hash_perceptual_fotos',
+        'transacional': True,
+        'sql': [
+            # pHash de 64 bits (utils/phash.py) e, para quase-duplicatas
+            # marcadas, a categoria da foto mantida na mesma vistoria
+            "ALTER TABLE fotos_vistoria ADD COLUMN IF NOT EXISTS phash BIGINT",
+            "ALTER TABLE fotos_vistoria ADD COLUMN IF NOT EXISTS duplicata_de VARCHAR(100)",
+            # Busca do mesmo hash entre vistorias. Em tabela particionada o
+            # índice não pode ser CONCURRENTLY.
+            "CREATE INDEX IF NOT EXISTS ix_fotos_vistoria_phash ON fotos_vistoria (phash) "
+            "WHERE phash IS NOT NULL",
+        ]
+    },
+    {
+        # Rede de segurança das partições mensais: sem partição do mês (nem
+        # sweeper nem `db.partitions ensure` rodando), o INSERT cai na
+        # DEFAULT em vez de falhar. `ensure` avisa quando ela tem linhas.
+        'version': 13,
+        'nome': 'particoes_default',
+        'transacional': True,
+        'sql': [
+            "CREATE TABLE IF NOT EXISTS vistorias_default PARTITION OF vistorias DEFAULT",
+            "CREATE TABLE IF NOT EXISTS fotos_vistoria_default PARTITION OF fotos_vistoria DEFAULT",
+            "CREATE TABLE IF NOT EXISTS observacoes_fotos_vistoria_default "
+            "PARTITION OF observacoes_fotos_vistoria DEFAULT",
+        ]
+    },
+]
+
+
+def get_migration_connection():
+    """Conexão dedicada (fora do pool) para aplicar migrações"""
+    return psycopg2.connect(**DatabaseConfig.get_connection_params())
+
+
+def _garantir_tabela_controle(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                nome VARCHAR(100) NOT NULL,
+                aplicada_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+    conn.commit()
+
+
+def versoes_aplicadas(conn):
+    """Conjunto de versões já registradas em schema_migrations"""
+    _garantir_tabela_controle(conn)
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT version FROM schema_migrations")
+        versoes = {row['version'] for row in cursor.fetchall()}
+    conn.commit()
+    return versoes
+
+
+def _aplicar(conn, migracao):
+    """Aplicar uma migração e registrá-la em schema_migrations"""
+    if migracao['transacional']:
+        with conn.cursor() as cursor:
+            for statement in migracao['sql']:
+                cursor.execute(statement)
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, nome) VALUES (%s, %s)",
+                (migracao['version'], migracao['nome'])
+            )
+        conn.commit()
+        return
+
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            for statement in migracao['sql']:
+                cursor.execute(statement)
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, nome) VALUES (%s, %s)",
+                (migracao['version'], migracao['nome'])
+            )
+    finally:
+        conn.autocommit = False
+
+
+def apply_migrations(conn=None):
+    """
+    Aplicar todas as migrações pendentes, em ordem de versão
+
+    Returns:
+        list: Versões aplicadas nesta execução
+    """
+    proprio = conn is None
+    conn = conn or get_migration_connection()
+    aplicadas_agora = []
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_KEY,))
+        conn.commit()
+        try:
+            aplicadas = versoes_aplicadas(conn)
+            for migracao in sorted(MIGRATIONS, key=lambda m: m['version']):
+                if migracao['version'] in aplicadas:
+                    continue
+                logger.info(f"🔧 Aplicando migração {migracao['version']}: {migracao['nome']}")
+                try:
+                    _aplicar(conn, migracao)
+                except Exception:
+                    if not conn.autocommit:
+                        conn.rollback()
+                    raise
+                aplicadas_agora.append(migracao['version'])
+                logger.info(f"✅ Migração {migracao['version']} aplicada")
+        finally:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_KEY,))
+            conn.commit()
+    finally:
+        if proprio:
+            conn.close()
+    return aplicadas_agora
+
+
+def seed_dados(conn, quantidade):
+    """Inserir vistorias sintéticas (3 fotos cada, 1 observação a cada 3 fotos)"""
+    with conn.cursor() as cursor:
+        # Uma vistoria por minuto para trás: garantir as partições do período
+        agora = datetime.now()
+        garantir_particoes_intervalo(cursor, agora - timedelta(minutes=quantidade), agora)
+        cursor.execute("""
+            INSERT INTO vistorias (token, placa, modelo, cor, ano, nome_conferente, nome_cliente,
+                                   status, token_expira_em, criado_em)
+            SELECT 'SEED_' || g || '_' || md5(random()::text),
+                   chr(65 + g % 26) || chr(65 + (g / 26) % 26) || chr(65 + (g / 676) % 26) || lpad((g % 10000)::text, 4, '0'),
+                   'Modelo ' || (g % 50), 'Cor ' || (g % 10), 2000 + g % 25,
+                   'Conferente ' || (g % 40), 'Cliente ' || g,
+                   (ARRAY['aguardando_assinatura', 'assinado'])[1 + g % 2],
+                   now() + interval '24 hours',
+                   now() - (g || ' minutes')::interval
+            FROM generate_series(1, %s) AS g
+            RETURNING id
+        """, (quantidade,))
+        ids = [row['id'] for row in cursor.fetchall()]
+        cursor.execute("""
+            INSERT INTO fotos_vistoria (vistoria_id, vistoria_criado_em, categoria, tipo, arquivo_nome, arquivo_url)
+            SELECT k.id, k.criado_em, c.categoria, c.tipo, c.categoria || '.jpg',
+                   '/uploads/fotos/' || c.categoria || '.jpg'
+            FROM vistorias_chaves k
+            CROSS JOIN (VALUES ('frente', 'obrigatoria'), ('pneu_de', 'pneu'), ('foto_obs_1', 'observacao'))
+                AS c(categoria, tipo)
+            WHERE k.id = ANY(%s)
+        """, (ids,))
+        cursor.execute("""
+            INSERT INTO observacoes_fotos_vistoria (foto_vistoria_id, vistoria_criado_em, descricao)
+            SELECT id, vistoria_criado_em, 'Risco na lataria' FROM fotos_vistoria
+            WHERE categoria = 'foto_obs_1' AND vistoria_id = ANY(%s)
+        """, (ids,))
+        cursor.execute("ANALYZE vistorias")
+        cursor.execute("ANALYZE fotos_vistoria")
+        cursor.execute("ANALYZE observacoes_fotos_vistoria")
+    conn.commit()
+    return len(ids)
+
+
+def consultas_para_verificar(cursor):
+    """(nome, sql, params) de cada consulta do VistoriaDatabase"""
+    cursor.execute("SELECT id, token, criado_em FROM vistorias ORDER BY id DESC LIMIT 1")
+    amostra = cursor.fetchone()
+    cursor.execute("SELECT id FROM fotos_vistoria ORDER BY id DESC LIMIT 1")
+    foto = cursor.fetchone()
+    if not amostra or not foto:
+        raise RuntimeError("Tabelas vistorias/fotos_vistoria vazias - use --seed para popular dados")
+
+    cursor_pagina = VistoriaDatabase.codificar_cursor(amostra['criado_em'], amostra['id'])
+    agora = datetime.now()
+    consultas = [
+        ('buscar_vistoria_por_token', SQL_BUSCAR_POR_TOKEN, (amostra['token'],)),
+        ('buscar_vistoria_por_id', SQL_BUSCAR_POR_ID, (amostra['id'],)),
+        ('buscar_vistoria_por_token[projecao]',
+         VistoriaDatabase.sql_projecao(VistoriaCliente, 'token'), (amostra['token'],)),
+        ('buscar_fotos_vistoria', SQL_BUSCAR_FOTOS, (amostra['id'],)),
+        ('buscar_vistoria_completa',
+         VistoriaDatabase.sql_agregado('token', VistoriaCliente), (amostra['token'],)),
+        ('atualizar_assinatura_vistoria', SQL_ATUALIZAR_ASSINATURA, ('x', 'x', None, amostra['token'])),
+        ('listar_vistorias_recentes', SQL_LISTAR_RECENTES, (10,)),
+        ('expirar_vistorias', SQL_EXPIRAR_VISTORIAS, (500,)),
+        # Sem chave de partição: um Index Scan por partição
+        ('inserir_observacao_foto', SQL_CRIADO_EM_FOTO, (foto['id'],)),
+    ]
+    variantes_resumo = {
+        'primeira_pagina': {},
+        'com_cursor': {'cursor': cursor_pagina},
+        'status': {'status': 'aguardando_assinatura'},
+        'placa': {'placa': 'ABC'},
+        'conferente': {'conferente': 'Conferente 1'},
+        'periodo': {'data_inicio': agora - timedelta(days=7), 'data_fim': agora},
+    }
+    for nome, filtros in variantes_resumo.items():
+        sql, params, _, _ = VistoriaDatabase.montar_consulta_resumo(limit=20, **filtros)
+        consultas.append((f'listar_vistorias_resumo[{nome}]', sql, params))
+    for nome, termo in (('placa', 'ABC-1234'), ('nome', 'Cliente 12')):
+        sql, params = VistoriaDatabase.montar_consulta_busca(termo)
+        consultas.append((f'buscar_vistorias[{nome}]', sql, params))
+    return consultas
+
+
+def _seq_scans(plano, tabelas):
+    """Relações com Seq Scan em um plano EXPLAIN (FORMAT JSON), incluindo partições"""
+    encontrados = []
+    relacao = plano.get('Relation Name') or ''
+    if plano.get('Node Type') == 'Seq Scan' and (
+        relacao in tabelas or any(relacao.startswith(f'{t}_p') for t in tabelas)
+    ):
+        encontrados.append(relacao)
+    for filho in plano.get('Plans', []):
+        encontrados.extend(_seq_scans(filho, tabelas))
+    return encontrados
+
+
+def seq_scans_consulta(cursor, sql, params):
+    """
+    Tabelas do VistoriaDatabase com Seq Scan no plano de `sql`
+
+    Precisa de enable_seqscan desligado na transação do cursor: assim um
+    Seq Scan só aparece quando não há índice utilizável.
+    """
+    cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+    plano = cursor.fetchone()['QUERY PLAN']
+    if isinstance(plano, str):
+        plano = json.loads(plano)
+    return _seq_scans(plano[0]['Plan'], set(TABELAS_PARTICIONADAS) | {'vistorias_chaves'})
+
+
+def check_query_plans(conn):
+    """
+    Rodar EXPLAIN em cada consulta do VistoriaDatabase com enable_seqscan
+    desligado; se ainda houver Seq Scan, falta um índice utilizável.
+    (O mesmo teste roda no pytest: tests/test_query_plans.py)
+
+    Returns:
+        list: (nome da consulta, tabelas com Seq Scan) das consultas reprovadas
+    """
+    reprovadas = []
+    with conn.cursor() as cursor:
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        for nome, sql, params in consultas_para_verificar(cursor):
+            seq = seq_scans_consulta(cursor, sql, params)
+            status = '❌' if seq else '✅'
+            print(f"{status} {nome}" + (f" - Seq Scan em {', '.join(seq)}" if seq else ''))
+            if seq:
+                reprovadas.append((nome, seq))
+    conn.rollback()
+    return reprovadas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Migrações do banco de vistorias')
+    sub = parser.add_subparsers(dest='comando', required=True)
+    sub.add_parser('upgrade', help='Aplicar migrações pendentes')
+    sub.add_parser('status', help='Mostrar migrações aplicadas e pendentes')
+    check = sub.add_parser('check-plans', help='Falhar se alguma consulta fizer Seq Scan')
+    check.add_argument('--seed', type=int, default=0, help='Inserir N vistorias sintéticas antes')
+    args = parser.parse_args(argv)
+
+    conn = get_migration_connection()
+    try:
+        if args.comando == 'upgrade':
+            aplicadas = apply_migrations(conn)
+            print(f"✅ {len(aplicadas)} migrações aplicadas: {aplicadas}" if aplicadas else "✅ Schema já atualizado")
+            return 0
+
+        if args.comando == 'status':
+            aplicadas = versoes_aplicadas(conn)
+            for migracao in MIGRATIONS:
+                marca = '✅' if migracao['version'] in aplicadas else '⏳'
+                print(f"{marca} {migracao['version']:04d} {migracao['nome']}")
+            return 0
+
+        apply_migrations(conn)
+        if args.seed:
+            print(f"🌱 {seed_dados(conn, args.seed)} vistorias sintéticas inseridas")
+        reprovadas = check_query_plans(conn)
+        return 1 if reprovadas else 0
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,513 @@
+#!/usr/bin/env python3
+"""
+Partições mensais de vistorias, fotos e observações e arquivamento
+Sistema Vistoria Agil - PostgreSQL Integration
+
+As tabelas são particionadas por mês de criação da vistoria (migração 4).
+Cada mês tem três partições: vistorias_pAAAA_MM, fotos_vistoria_pAAAA_MM e
+observacoes_fotos_vistoria_pAAAA_MM.
+
+Uso (a partir da pasta vistoria/):
+    python -m db.partitions ensure [--meses 3]      # criar partições à frente
+    python -m db.partitions migrate-legacy [--lote 1000]
+        # copiar os dados de antes da migração 4 (*_legado), em lotes
+    python -m db.partitions list                    # partições, linhas e tamanhos
+    python -m db.partitions archive --antes 2024-01 [--dir arquivo_vistorias]
+        # exportar meses anteriores para CSV.gz, desanexar e remover
+    python -m db.partitions consultar --token VIST_...
+        # ler uma vistoria arquivada direto dos arquivos
+    python -m db.partitions restore --mes 2023-06   # recriar o mês a partir do arquivo
+
+O ensure também roda no startup e uma vez por dia em db/sweeper.py; o
+cron só é necessário se DB_EXPIRY_SWEEP_INTERVAL = 0 e nenhum
+`python -m db.sweeper loop` estiver rodando. Sem nenhum deles, as
+vistorias de meses sem partição caem em vistorias_default (migração 13)
+e o ensure avisa: criar a partição de um mês que tem linhas na DEFAULT
+falha até elas serem movidas.
+
+Os tokens/IDs de meses arquivados continuam em vistorias_chaves (coluna
+`arquivo` = mês), então a consulta sob demanda sabe qual arquivo abrir.
+"""
+
+import os
+import sys
+import csv
+import gzip
+import json
+import argparse
+import logging
+from datetime import date, datetime
+
+import psycopg2
+
+from .database import DatabaseConfig
+
+logger = logging.getLogger(__name__)
+
+# Tabelas particionadas, na ordem pai -> filhas (restauração); o
+# arquivamento desanexa na ordem inversa por causa das chaves estrangeiras
+TABELAS_PARTICIONADAS = ('vistorias', 'fotos_vistoria', 'observacoes_fotos_vistoria')
+
+# FKs clonadas nas partições filhas (nomes definidos na migração 4)
+FKS_PARTICOES = {
+    'fotos_vistoria': 'fk_fotos_vistoria',
+    'observacoes_fotos_vistoria': 'fk_observacoes_foto',
+}
+
+SQL_DESCONTAR_BLOBS = """
+    UPDATE blobs b SET referencias = b.referencias - r.n
+    FROM (SELECT sha256, count(*) AS n FROM (
+              SELECT blob_sha256 AS sha256 FROM {particao}
+              UNION ALL
+              SELECT original_blob_sha256 FROM {particao}
+          ) s WHERE sha256 IS NOT NULL GROUP BY sha256) r
+    WHERE b.sha256 = r.sha256
+"""
+
+ORDEM_TIPO_FOTO = {'obrigatoria': 1, 'pneu': 2, 'observacao': 3}
+
+SQL_LISTAR_PARTICOES = """
+    SELECT p.relname AS pai, c.relname AS particao,
+           pg_get_expr(c.relpartbound, c.oid) AS limites,
+           GREATEST(c.reltuples, 0)::bigint AS linhas_estimadas,
+           pg_table_size(c.oid) AS tamanho_tabela,
+           pg_indexes_size(c.oid) AS tamanho_indices,
+           s.last_autovacuum, s.last_vacuum
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    JOIN pg_class p ON p.oid = i.inhparent
+    LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+    WHERE p.relname IN %s
+    ORDER BY c.relname
+"""
+
+
+def inicio_mes(valor):
+    """Primeiro dia do mês de `valor` (date, datetime ou 'AAAA-MM')"""
+    if isinstance(valor, str):
+        valor = datetime.strptime(valor[:7], '%Y-%m')
+    return date(valor.year, valor.month, 1)
+
+
+def somar_meses(mes, n):
+    total = mes.year * 12 + mes.month - 1 + n
+    return date(total // 12, total % 12 + 1, 1)
+
+
+def meses_entre(inicio, fim):
+    """Meses de inicio até fim (inclusive)"""
+    mes = inicio_mes(inicio)
+    fim = inicio_mes(fim)
+    while mes <= fim:
+        yield mes
+        mes = somar_meses(mes, 1)
+
+
+def nome_particao(tabela, mes):
+    return f"{tabela}_p{mes.year:04d}_{mes.month:02d}"
+
+
+def rotulo_mes(mes):
+    return f"{mes.year:04d}-{mes.month:02d}"
+
+
+def get_partition_connection():
+    """Conexão dedicada (fora do pool) para manutenção de partições"""
+    return psycopg2.connect(**DatabaseConfig.get_connection_params())
+
+
+def garantir_particoes_intervalo(cursor, inicio, fim):
+    """Criar (se faltarem) as partições dos meses de inicio até fim"""
+    for mes in meses_entre(inicio, fim):
+        cursor.execute("SELECT criar_particao_mensal(%s)", (mes,))
+
+
+def nome_particao_default(tabela):
+    return f"{tabela}_default"
+
+
+def avisar_particao_default(cursor):
+    """Avisar (log) se vistorias_default tem linhas; retorna True nesse caso"""
+    default = nome_particao_default('vistorias')
+    if not _particao_existe(cursor, default):
+        return False
+    cursor.execute(f"SELECT min(criado_em) AS de, max(criado_em) AS ate FROM {default}")
+    linhas = cursor.fetchone()
+    if linhas['de'] is None:
+        return False
+    logger.warning(
+        f"⚠️ {default} tem vistorias de {linhas['de']} a {linhas['ate']}: faltou "
+        f"partição mensal. Criar a partição desses meses falha até as linhas (e as de "
+        f"{nome_particao_default('fotos_vistoria')}/{nome_particao_default('observacoes_fotos_vistoria')}) "
+        f"serem movidas, e o archive não as inclui"
+    )
+    return True
+
+
+def garantir_particoes(conn, meses_a_frente=None):
+    """
+    Partições do mês atual e dos próximos `meses_a_frente` meses
+
+    Returns:
+        bool: True se vistorias_default tem linhas (ver avisar_particao_default)
+    """
+    meses_a_frente = DatabaseConfig.PARTITION_MONTHS_AHEAD if meses_a_frente is None else meses_a_frente
+    atual = inicio_mes(date.today())
+    with conn.cursor() as cursor:
+        com_default = avisar_particao_default(cursor)
+        garantir_particoes_intervalo(cursor, atual, somar_meses(atual, meses_a_frente))
+    conn.commit()
+    return com_default
+
+
+def _colunas(cursor, tabela):
+    cursor.execute("""
+        SELECT attname FROM pg_attribute
+        WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped
+        ORDER BY attnum
+    """, (tabela,))
+    return [row['attname'] for row in cursor.fetchall()]
+
+
+def migrar_legado(conn, lote=1000):
+    """
+    Copiar vistorias, fotos e observações de *_legado para as partições
+
+    Cada lote de vistorias (com suas fotos e observações) é uma transação
+    curta: só as linhas novas ficam travadas e a aplicação segue no ar.
+    Vistorias já presentes em vistorias_chaves (copiadas ou arquivadas)
+    são puladas, então o comando pode ser interrompido e rodado de novo.
+    Só as colunas das tabelas legadas são copiadas: as adicionadas por
+    migrações posteriores ficam com o valor padrão.
+
+    Returns:
+        int: vistorias copiadas
+    """
+    with conn.cursor() as cursor:
+        if not _particao_existe(cursor, 'vistorias_legado'):
+            conn.rollback()
+            return 0
+        colunas = {tabela: _colunas(cursor, f"{tabela}_legado") for tabela in TABELAS_PARTICIONADAS}
+        # A migração 4 levou os índices para as tabelas novas
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_fotos_legado_vistoria ON fotos_vistoria_legado (vistoria_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_observacoes_legado_foto "
+                       "ON observacoes_fotos_vistoria_legado (foto_vistoria_id)")
+    conn.commit()
+
+    def lista(tabela, alias):
+        return ', '.join(f"{alias}.{coluna}" for coluna in colunas[tabela])
+
+    total = 0
+    ultimo = 0
+    while True:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT l.id FROM vistorias_legado l
+                WHERE l.id > %s AND NOT EXISTS (SELECT 1 FROM vistorias_chaves k WHERE k.id = l.id)
+                ORDER BY l.id
+                LIMIT %s
+            """, (ultimo, lote))
+            ids = [row['id'] for row in cursor.fetchall()]
+            if not ids:
+                conn.rollback()
+                return total
+            cursor.execute(f"""
+                INSERT INTO vistorias ({', '.join(colunas['vistorias'])})
+                SELECT {lista('vistorias', 'v')} FROM vistorias_legado v WHERE v.id = ANY(%s)
+            """, (ids,))
+            cursor.execute(f"""
+                INSERT INTO fotos_vistoria ({', '.join(colunas['fotos_vistoria'])}, vistoria_criado_em)
+                SELECT {lista('fotos_vistoria', 'f')}, v.criado_em
+                FROM fotos_vistoria_legado f JOIN vistorias_legado v ON v.id = f.vistoria_id
+                WHERE v.id = ANY(%s)
+            """, (ids,))
+            cursor.execute(f"""
+                INSERT INTO observacoes_fotos_vistoria
+                    ({', '.join(colunas['observacoes_fotos_vistoria'])}, vistoria_criado_em)
+                SELECT {lista('observacoes_fotos_vistoria', 'o')}, v.criado_em
+                FROM observacoes_fotos_vistoria_legado o
+                JOIN fotos_vistoria_legado f ON f.id = o.foto_vistoria_id
+                JOIN vistorias_legado v ON v.id = f.vistoria_id
+                WHERE v.id = ANY(%s)
+            """, (ids,))
+        conn.commit()
+        total += len(ids)
+        ultimo = ids[-1]
+        logger.info(f"📦 {total} vistorias legadas copiadas (até id {ultimo})")
+
+
+def listar_particoes(conn):
+    """Partições com linhas estimadas, tamanho da tabela/índices e último vacuum"""
+    with conn.cursor() as cursor:
+        cursor.execute(SQL_LISTAR_PARTICOES, (TABELAS_PARTICIONADAS,))
+        particoes = [dict(row) for row in cursor.fetchall()]
+    conn.rollback()
+    return particoes
+
+
+def _particao_existe(cursor, nome):
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL AS existe", (nome,))
+    return cursor.fetchone()['existe']
+
+
+def _pasta_mes(diretorio, mes):
+    return os.path.join(diretorio, f"{mes.year:04d}_{mes.month:02d}")
+
+
+def exportar_mes(cursor, mes, diretorio):
+    """
+    Exportar as três partições do mês para <dir>/AAAA_MM/<tabela>.csv.gz
+
+    Roda na transação de arquivar_mes, com as partições já travadas: os
+    três arquivos e as contagens vêm do mesmo estado. Os arquivos são
+    gravados como .part e renomeados no fim; o manifest.json (linhas por
+    tabela) é o último a ser escrito.
+
+    Returns:
+        dict: manifesto do mês
+    """
+    pasta = _pasta_mes(diretorio, mes)
+    os.makedirs(pasta, exist_ok=True)
+    manifesto = {'mes': rotulo_mes(mes), 'exportado_em': datetime.now().isoformat(), 'linhas': {}}
+
+    for tabela in TABELAS_PARTICIONADAS:
+        particao = nome_particao(tabela, mes)
+        destino = os.path.join(pasta, f"{tabela}.csv.gz")
+        parcial = destino + '.part'
+        with gzip.open(parcial, 'wb') as arquivo:
+            cursor.copy_expert(f"COPY {particao} TO STDOUT WITH (FORMAT csv, HEADER)", arquivo)
+        with open(parcial, 'rb') as arquivo:
+            os.fsync(arquivo.fileno())
+        os.replace(parcial, destino)
+        cursor.execute(f"SELECT count(*) AS n FROM {particao}")
+        manifesto['linhas'][tabela] = cursor.fetchone()['n']
+
+    with open(os.path.join(pasta, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifesto, f, indent=2)
+    return manifesto
+
+
+def _remover_mes(cursor, mes):
+    """Desanexar e apagar as partições do mês (na transação de arquivar_mes)"""
+    for tabela in reversed(TABELAS_PARTICIONADAS):
+        particao = nome_particao(tabela, mes)
+        cursor.execute(f"ALTER TABLE {tabela} DETACH PARTITION {particao}")
+        if tabela in FKS_PARTICOES:
+            # Sem isso o DETACH da partição referenciada falharia
+            cursor.execute(f"ALTER TABLE {particao} DROP CONSTRAINT IF EXISTS {FKS_PARTICOES[tabela]}")
+    cursor.execute(
+        "UPDATE vistorias_chaves SET arquivo = %s WHERE criado_em >= %s AND criado_em < %s",
+        (rotulo_mes(mes), mes, somar_meses(mes, 1))
+    )
+    for tabela in TABELAS_PARTICIONADAS:
+        cursor.execute(f"DROP TABLE {nome_particao(tabela, mes)}")
+
+
+def arquivar_mes(conn, mes, diretorio):
+    """
+    Exportar e remover as partições do mês numa única transação
+
+    LOCK ... IN SHARE MODE barra escritas nas três partições (uma
+    assinatura atrasada, a expiração do db/sweeper.py) até o DROP, mas
+    não leituras: nada muda entre o COPY e a remoção. Se algo falhar, as
+    partições ficam; os arquivos são sobrescritos na próxima execução.
+
+    Returns:
+        dict: manifesto do mês
+    """
+    particoes = ', '.join(nome_particao(tabela, mes) for tabela in TABELAS_PARTICIONADAS)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"LOCK TABLE {particoes} IN SHARE MODE")
+            manifesto = exportar_mes(cursor, mes, diretorio)
+            _remover_mes(cursor, mes)
+        conn.commit()
+        return manifesto
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def arquivar(conn, antes, diretorio=None):
+    """
+    Arquivar todos os meses anteriores a `antes` (nunca o mês atual)
+
+    Returns:
+        list: manifestos dos meses arquivados
+    """
+    diretorio = diretorio or DatabaseConfig.ARCHIVE_DIR
+    limite = inicio_mes(antes)
+    if limite > inicio_mes(date.today()):
+        raise ValueError("Só é possível arquivar meses anteriores ao atual")
+
+    with conn.cursor() as cursor:
+        avisar_particao_default(cursor)
+        cursor.execute("""
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'vistorias'::regclass AND c.relname <> %s
+        """, (nome_particao_default('vistorias'),))
+        meses = sorted(
+            inicio_mes(f"{nome[-7:-3]}-{nome[-2:]}") for nome in (row['relname'] for row in cursor.fetchall())
+        )
+    conn.rollback()
+
+    arquivados = []
+    for mes in meses:
+        if mes >= limite:
+            continue
+        manifesto = arquivar_mes(conn, mes, diretorio)
+        logger.info(f"📦 {rotulo_mes(mes)} arquivado: {manifesto['linhas']}")
+        arquivados.append(manifesto)
+    return arquivados
+
+
+def _ler_csv(pasta, tabela):
+    with gzip.open(os.path.join(pasta, f"{tabela}.csv.gz"), 'rt', encoding='utf-8', newline='') as arquivo:
+        yield from csv.DictReader(arquivo)
+
+
+def buscar_vistoria_arquivada(conn, token, diretorio=None):
+    """
+    Ler uma vistoria arquivada dos arquivos do mês (sem restaurar)
+
+    Returns:
+        dict: mesmo formato de VistoriaDatabase.buscar_vistoria_completa
+            (valores como texto do CSV), ou None se o token não estiver
+            em um mês arquivado
+    """
+    diretorio = diretorio or DatabaseConfig.ARCHIVE_DIR
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT id, arquivo FROM vistorias_chaves WHERE token = %s", (token,))
+        chave = cursor.fetchone()
+    conn.rollback()
+    if not chave or not chave['arquivo']:
+        return None
+
+    pasta = _pasta_mes(diretorio, inicio_mes(chave['arquivo']))
+    vistoria_id = str(chave['id'])
+    vistoria = next((row for row in _ler_csv(pasta, 'vistorias') if row['id'] == vistoria_id), None)
+    if vistoria is None:
+        return None
+
+    fotos = {
+        row['id']: {
+            'foto_id': row['id'],
+            'categoria': row['categoria'],
+            'tipo': row['tipo'],
+            'arquivo_nome': row['arquivo_nome'],
+            'arquivo_path': row['arquivo_path'],
+            'arquivo_url': row['arquivo_url'],
+            'foto_criado_em': row['criado_em'],
+            'observacoes': [],
+        }
+        for row in _ler_csv(pasta, 'fotos_vistoria') if row['vistoria_id'] == vistoria_id
+    }
+    for row in _ler_csv(pasta, 'observacoes_fotos_vistoria'):
+        foto = fotos.get(row['foto_vistoria_id'])
+        if foto is not None and row['status'] == 'ativa':
+            foto['observacoes'].append({
+                'observacao_id': row['id'],
+                'descricao': row['descricao'],
+                'prioridade': row['prioridade'],
+            })
+
+    vistoria['fotos'] = sorted(
+        fotos.values(),
+        key=lambda f: (ORDEM_TIPO_FOTO.get(f['tipo'], 4), f['categoria'], int(f['foto_id']))
+    )
+    vistoria['arquivo'] = chave['arquivo']
+    return vistoria
+
+
+def restaurar(conn, mes, diretorio=None):
+    """Recriar as partições de um mês arquivado a partir dos CSV.gz"""
+    diretorio = diretorio or DatabaseConfig.ARCHIVE_DIR
+    mes = inicio_mes(mes)
+    pasta = _pasta_mes(diretorio, mes)
+    try:
+        with conn.cursor() as cursor:
+            for tabela in TABELAS_PARTICIONADAS:
+                if _particao_existe(cursor, nome_particao(tabela, mes)):
+                    raise RuntimeError(f"{nome_particao(tabela, mes)} já existe")
+            cursor.execute("SELECT criar_particao_mensal(%s)", (mes,))
+            for tabela in TABELAS_PARTICIONADAS:
+                with gzip.open(os.path.join(pasta, f"{tabela}.csv.gz"), 'rb') as arquivo:
+                    # Colunas do cabeçalho: arquivos anteriores a uma migração não têm as novas
+                    colunas = next(csv.reader([arquivo.readline().decode('utf-8')]))
+                    cursor.copy_expert(
+                        f"COPY {nome_particao(tabela, mes)} ({', '.join(colunas)}) FROM STDIN WITH (FORMAT csv)",
+                        arquivo
+                    )
+            # Fotos arquivadas nunca deixaram de contar (db/blobs.py); o gatilho
+            # contou de novo no COPY
+            cursor.execute(SQL_DESCONTAR_BLOBS.format(particao=nome_particao('fotos_vistoria', mes)))
+        # O gatilho de vistorias_chaves limpa a coluna `arquivo` das vistorias do mês
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def _formatar_bytes(n):
+    for unidade in ('B', 'KB', 'MB', 'GB'):
+        if n < 1024:
+            return f"{n:.0f} {unidade}"
+        n /= 1024.0
+    return f"{n:.1f} TB"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Partições mensais e arquivamento de vistorias')
+    sub = parser.add_subparsers(dest='comando', required=True)
+    ens = sub.add_parser('ensure', help='Criar partições do mês atual e dos próximos meses')
+    ens.add_argument('--meses', type=int, default=None, help='Meses à frente (padrão: DB_PARTITION_MONTHS_AHEAD)')
+    leg = sub.add_parser('migrate-legacy', help='Copiar os dados de *_legado (migração 4) em lotes')
+    leg.add_argument('--lote', type=int, default=1000, help='Vistorias por transação')
+    sub.add_parser('list', help='Listar partições com tamanhos')
+    arq = sub.add_parser('archive', help='Arquivar meses anteriores a --antes')
+    arq.add_argument('--antes', required=True, help='Mês AAAA-MM (exclusivo)')
+    arq.add_argument('--dir', default=None, help='Diretório do arquivo (padrão: DB_ARCHIVE_DIR)')
+    con = sub.add_parser('consultar', help='Ler uma vistoria arquivada')
+    con.add_argument('--token', required=True)
+    con.add_argument('--dir', default=None)
+    res = sub.add_parser('restore', help='Restaurar um mês arquivado')
+    res.add_argument('--mes', required=True, help='Mês AAAA-MM')
+    res.add_argument('--dir', default=None)
+    args = parser.parse_args(argv)
+
+    conn = get_partition_connection()
+    try:
+        if args.comando == 'ensure':
+            if garantir_particoes(conn, args.meses):
+                print(f"⚠️ {nome_particao_default('vistorias')} tem linhas: faltou partição mensal")
+            print("✅ Partições garantidas")
+        elif args.comando == 'migrate-legacy':
+            print(f"✅ {migrar_legado(conn, args.lote)} vistorias legadas copiadas")
+        elif args.comando == 'list':
+            for p in listar_particoes(conn):
+                print(f"{p['particao']:<45} {p['linhas_estimadas']:>10} linhas  "
+                      f"tabela {_formatar_bytes(p['tamanho_tabela']):>8}  "
+                      f"índices {_formatar_bytes(p['tamanho_indices']):>8}  {p['limites']}")
+        elif args.comando == 'archive':
+            arquivados = arquivar(conn, args.antes, args.dir)
+            print(f"✅ {len(arquivados)} meses arquivados: {[m['mes'] for m in arquivados]}")
+        elif args.comando == 'consultar':
+            vistoria = buscar_vistoria_arquivada(conn, args.token, args.dir)
+            if vistoria is None:
+                print(f"❌ Token não encontrado no arquivo: {args.token}")
+                return 1
+            print(json.dumps(vistoria, ensure_ascii=False, indent=2))
+        else:
+            restaurar(conn, args.mes, args.dir)
+            print(f"✅ {args.mes} restaurado")
+        return 0
+    except Exception as e:
+        logger.error(f"❌ Erro na manutenção de partições: {e}")
+        return 1
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Pool de conexões thread-safe com limite e timeout de checkout
+Sistema Vistoria Agil - PostgreSQL Integration
+"""
+
+import threading
+import time
+import logging
+from collections import deque
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(PoolError):
+    """Nenhuma conexão ficou livre dentro do tempo de espera"""
+
+
+class BoundedConnectionPool:
+    """
+    Pool de conexões PostgreSQL seguro para múltiplas threads.
+
+    Diferente do SimpleConnectionPool, quando todas as conexões estão em uso
+    o chamador espera (até `timeout` segundos) em vez de receber
+    "connection pool exhausted". Conexões quebradas ou antigas são
+    descartadas e substituídas no checkout.
+    """
+
+    def __init__(self, minconn, maxconn, timeout=10.0, max_lifetime=3600.0,
+                 validate_after=30.0, **connect_kwargs):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("Parâmetros inválidos para o pool: minconn/maxconn")
+
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.validate_after = validate_after
+        self._connect_kwargs = connect_kwargs
+
+        self._cond = threading.Condition(threading.Lock())
+        self._idle = deque()      # (conn, criado_em, devolvido_em)
+        self._in_use = {}         # id(conn) -> criado_em
+        self._size = 0            # conexões abertas + reservadas
+        self._waiters = 0
+        self._closed = False
+
+        # Estatísticas
+        self._checkouts = 0
+        self._timeouts = 0
+        self._recycled = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+        for _ in range(minconn):
+            conn = self._connect()
+            self._idle.append((conn, time.monotonic(), time.monotonic()))
+            self._size += 1
+
+    def _connect(self):
+        """Abrir uma nova conexão física"""
+        return psycopg2.connect(**self._connect_kwargs)
+
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_usable(self, conn, criado_em, devolvido_em):
+        """Verificar se uma conexão ociosa pode ser reutilizada"""
+        if conn.closed:
+            return False
+        if conn.info.transaction_status == extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        agora = time.monotonic()
+        if self.max_lifetime and agora - criado_em > self.max_lifetime:
+            return False
+        if self.validate_after is not None and agora - devolvido_em > self.validate_after:
+            try:
+                # Cursor simples: a validação não entra nas métricas de consultas
+                with conn.cursor(cursor_factory=extensions.cursor) as cursor:
+                    cursor.execute("SELECT 1")
+                conn.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+
+    def getconn(self, timeout=None):
+        """
+        Obter conexão do pool, esperando até `timeout` segundos.
+
+        Raises:
+            PoolTimeoutError: se nenhuma conexão ficar livre a tempo
+            PoolError: se o pool estiver fechado
+        """
+        timeout = self.timeout if timeout is None else timeout
+        inicio = time.monotonic()
+        deadline = inicio + timeout
+
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolError("connection pool is closed")
+                if self._idle:
+                    conn, criado_em, devolvido_em = self._idle.pop()
+                    break
+                if self._size < self.maxconn:
+                    # Reservar vaga; a conexão é aberta fora do lock
+                    self._size += 1
+                    conn, criado_em, devolvido_em = None, None, None
+                    break
+
+                restante = deadline - time.monotonic()
+                if restante <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeoutError(
+                        f"Nenhuma conexão livre após {timeout:.1f}s "
+                        f"({self.maxconn} em uso, {self._waiters} aguardando)"
+                    )
+                self._waiters += 1
+                try:
+                    self._cond.wait(restante)
+                finally:
+                    self._waiters -= 1
+
+            espera = time.monotonic() - inicio
+            self._checkouts += 1
+            self._wait_total += espera
+            self._wait_max = max(self._wait_max, espera)
+
+        # A vaga já pertence a este chamador: validar ou abrir fora do lock
+        try:
+            if conn is not None and not self._is_usable(conn, criado_em, devolvido_em):
+                logger.warning("♻️ Conexão inválida ou antiga descartada do pool")
+                self._close_quietly(conn)
+                conn = None
+                with self._cond:
+                    self._recycled += 1
+            if conn is None:
+                conn = self._connect()
+                criado_em = time.monotonic()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._in_use[id(conn)] = criado_em
+        return conn
+
+    def putconn(self, conn, discard=False):
+        """Devolver conexão ao pool (ou descartá-la se estiver quebrada)"""
+        with self._cond:
+            criado_em = self._in_use.pop(id(conn), None)
+        if criado_em is None:
+            raise PoolError("conexão não pertence a este pool")
+
+        if not discard and not conn.closed:
+            status = conn.info.transaction_status
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                discard = True
+            elif status != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    discard = True
+
+        with self._cond:
+            if discard or conn.closed or self._closed:
+                self._size -= 1
+                conn_to_close = conn
+            else:
+                self._idle.append((conn, criado_em, time.monotonic()))
+                conn_to_close = None
+            self._cond.notify()
+
+        if conn_to_close is not None:
+            self._close_quietly(conn_to_close)
+
+    def closeall(self):
+        """Fechar todas as conexões ociosas e impedir novos checkouts"""
+        with self._cond:
+            self._closed = True
+            ociosas = list(self._idle)
+            self._idle.clear()
+            self._size -= len(ociosas)
+            self._cond.notify_all()
+        for conn, _, _ in ociosas:
+            self._close_quietly(conn)
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def stats(self):
+        """Estatísticas atuais do pool"""
+        with self._cond:
+            return {
+                'max': self.maxconn,
+                'size': self._size,
+                'in_use': len(self._in_use),
+                'idle': len(self._idle),
+                'waiters': self._waiters,
+                'checkouts': self._checkouts,
+                'timeouts': self._timeouts,
+                'recycled': self._recycled,
+                'wait_time_total': round(self._wait_total, 6),
+                'wait_time_max': round(self._wait_max, 6),
+                'wait_time_avg': round(self._wait_total / self._checkouts, 6) if self._checkouts else 0.0,
+            }
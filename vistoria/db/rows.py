@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Projeções de colunas por caso de uso e tipos de linha compactos
+Sistema Vistoria Agil - PostgreSQL Integration
+
+Cada projeção seleciona só as colunas que a rota usa e devolve uma tupla
+nomeada (sem __dict__ por instância). As linhas continuam aceitando
+acesso por chave (`row['status']`, `row.get('placa')`) para não quebrar
+o código que antes recebia dicts.
+"""
+
+from collections import namedtuple
+
+CAMPOS_QUESTIONARIO = (
+    'ar_condicionado', 'antenas', 'tapetes', 'tapete_porta_malas', 'bateria',
+    'retrovisor_direito', 'retrovisor_esquerdo', 'extintor', 'roda_comum', 'roda_especial',
+    'chave_principal', 'chave_reserva', 'manual', 'documento', 'nota_fiscal',
+    'limpador_dianteiro', 'limpador_traseiro', 'triangulo', 'macaco', 'chave_roda', 'pneu_step',
+    'carregador_eletrico'
+)
+
+CAMPOS_PNEUS = (
+    'marca_pneu_dianteiro_esquerdo', 'marca_pneu_dianteiro_direito',
+    'marca_pneu_traseiro_esquerdo', 'marca_pneu_traseiro_direito'
+)
+
+
+def row_type(nome, colunas):
+    """Criar tipo de linha (namedtuple com __slots__ vazio) para as colunas"""
+    base = namedtuple(f'_{nome}', colunas)
+    # Só colunas: count, index, _fields etc. da tupla não são chaves
+    chaves = frozenset(colunas)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            if key not in chaves:
+                raise KeyError(key)
+            return getattr(self, key)
+        return tuple.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in chaves else default
+
+    return type(nome, (base,), {
+        '__slots__': (),
+        'COLUMNS': tuple(colunas),
+        'SELECT_LIST': ', '.join(colunas),
+        '__getitem__': __getitem__,
+        'get': get,
+        'keys': lambda self: self._fields,
+        'to_dict': lambda self: dict(self._asdict()),
+    })
+
+
+# Verificação de validade do link (página de assinatura e confirmação)
+VistoriaStatus = row_type('VistoriaStatus', (
+    'id', 'token', 'status', 'token_expira_em'
+))
+
+# /api/pdf_info
+VistoriaInfo = row_type('VistoriaInfo', (
+    'token', 'nome_cliente', 'placa', 'modelo', 'status'
+))
+
+# /api/dados_vistoria_cliente
+VistoriaCliente = row_type('VistoriaCliente', (
+    'id', 'token', 'status', 'token_expira_em',
+    'placa', 'chassi', 'modelo', 'cor', 'ano', 'km_rodado',
+    'proprio', 'nome_terceiro', 'nome_cliente', 'nome_conferente', 'criado_em',
+) + CAMPOS_QUESTIONARIO + CAMPOS_PNEUS)
@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""
+Armazenamento de arquivos por chave (assinaturas, documentos avulsos,
+fotos do formulário, backups JSON e PDFs)
+Sistema Vistoria Agil - PostgreSQL Integration
+
+Os arquivos são gravados e lidos por chave ('assinaturas/ab/cd/nome.png')
+em streaming, por um dos drivers:
+
+    local  pasta DB_STORAGE_ROOT (padrão: a pasta da aplicação, onde já
+           estão assinaturas/, pdfs/ etc.); gravação em .part + os.replace
+    s3     bucket DB_STORAGE_S3_BUCKET em qualquer serviço compatível
+           (DB_STORAGE_S3_ENDPOINT=http://localhost:9000 para o MinIO);
+           credenciais pelas variáveis padrão AWS_ACCESS_KEY_ID etc.
+
+Com DB_STORAGE_LAYOUT=hash (padrão) as chaves novas ficam em subpastas
+ab/cd/ do SHA-256 do nome (ou do grupo, ex.: o token da vistoria, para
+achar os backups de uma vistoria sem listar a pasta inteira): nenhum
+diretório acumula centenas de milhares de arquivos. 'plano' mantém o
+layout antigo. Chaves já gravadas no banco continuam válidas: o layout
+só decide a chave de arquivos novos.
+
+Escopo: este módulo não torna a aplicação multi-nó. Ficam fora daqui,
+sempre no sistema de arquivos local:
+    - as fotos e documentos do envio da vistoria (array photos, a maior
+      parte dos arquivos), guardados como blobs por conteúdo em
+      DB_BLOB_DIR: a coleta usa mtime, os.replace e os.link (db/blobs.py);
+    - as partes dos uploads em partes (DB_UPLOAD_SESSION_DIR): cada PUT
+      escreve no meio do arquivo, o que o S3 não permite;
+    - o cache de derivadas (/uploads?w=...), que precisa de caminhos.
+O driver s3 cobre só assinaturas, o documento avulso e as fotos do
+formulário (uploads/documentos, uploads/fotos), backups e PDFs.
+Mais de um nó da aplicação, com ou sem s3, exige a pasta uploads/
+inteira num sistema de arquivos POSIX compartilhado (NFS, EFS etc.).
+
+A partir da pasta vistoria/:
+    python -m db.storage ls assinaturas/
+    python -m db.storage put <arquivo> <chave>
+    python -m db.storage get <chave> <arquivo>
+    python -m db.storage check
+        # gravar, ler, listar e apagar uma chave de teste (ex.: contra um
+        # MinIO local com DB_STORAGE_BACKEND=s3)
+"""
+
+import io
+import os
+import sys
+import shutil
+import hashlib
+import argparse
+import logging
+import tempfile
+import mimetypes
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+from .database import DatabaseConfig
+
+try:
+    import boto3
+    from botocore.config import Config as BotoConfig
+    from botocore.exceptions import ClientError
+except ImportError:  # só o driver s3 precisa do boto3
+    boto3 = None
+
+logger = logging.getLogger(__name__)
+
+TAMANHO_BLOCO = 64 * 1024
+# Gravação no S3: até este tamanho em memória, depois arquivo temporário
+EM_MEMORIA = 8 * 1024 * 1024
+LAYOUTS = ('hash', 'plano')
+
+
+def validar_chave(chave):
+    """Chave relativa com '/', sem '..', partes vazias ou ocultas; retorna a chave"""
+    partes = (chave or '').split('/')
+    if '\\' in chave or any(not p or p.startswith('.') for p in partes):
+        raise ValueError(f"Chave inválida: {chave!r}")
+    return chave
+
+
+def tipo_da_chave(chave, padrao='application/octet-stream'):
+    return mimetypes.guess_type(chave)[0] or padrao
+
+
+class Armazenamento(ABC):
+    """Interface dos drivers; `chave` aplica o layout às chaves novas"""
+
+    def __init__(self, layout='hash'):
+        if layout not in LAYOUTS:
+            raise ValueError(f"DB_STORAGE_LAYOUT deve ser um de {', '.join(LAYOUTS)}")
+        self.layout = layout
+
+    def chave(self, pasta, nome, grupo=None):
+        """Chave de um arquivo novo em `pasta` (subpastas pelo nome ou pelo grupo)"""
+        if self.layout == 'plano':
+            return validar_chave(f'{pasta}/{nome}')
+        h = hashlib.sha256((grupo or nome).encode('utf-8')).hexdigest()
+        return validar_chave(f'{pasta}/{h[:2]}/{h[2:4]}/{nome}')
+
+    def prefixo_grupo(self, pasta, grupo):
+        """Prefixo das chaves gravadas com chave(pasta, ..., grupo=grupo)"""
+        if self.layout == 'plano':
+            return f'{pasta}/'
+        h = hashlib.sha256(grupo.encode('utf-8')).hexdigest()
+        return f'{pasta}/{h[:2]}/{h[2:4]}/'
+
+    @abstractmethod
+    def escrever(self, chave, mimetype=None):
+        """
+        Context manager com um arquivo binário para gravar `chave`; só
+        aparece se o bloco terminar sem erro
+        """
+
+    def gravar(self, chave, stream, mimetype=None):
+        """Copiar um stream binário para `chave`"""
+        with self.escrever(chave, mimetype) as destino:
+            shutil.copyfileobj(stream, destino, TAMANHO_BLOCO)
+        return chave
+
+    def gravar_arquivo(self, chave, caminho, mimetype=None):
+        """Mover um arquivo local (temporário) para `chave`"""
+        with open(caminho, 'rb') as origem:
+            self.gravar(chave, origem, mimetype)
+        os.remove(caminho)
+        return chave
+
+    @abstractmethod
+    def abrir(self, chave):
+        """Arquivo binário para leitura (FileNotFoundError se não existe)"""
+
+    @abstractmethod
+    def existe(self, chave):
+        """True se a chave existe"""
+
+    @abstractmethod
+    def remover(self, chave):
+        """Apagar; False se não existia"""
+
+    @abstractmethod
+    def listar(self, prefixo):
+        """Chaves da pasta de `prefixo` (sem descer em subpastas) que começam com ele"""
+
+    def caminho_local(self, chave):
+        """Caminho no disco, se o driver for local (senão None)"""
+        return None
+
+    @contextmanager
+    def arquivo_local(self, chave):
+        """Caminho de um arquivo local com o conteúdo (PIL/ReportLab precisam de caminho)"""
+        caminho = self.caminho_local(chave)
+        if caminho is not None:
+            if not os.path.isfile(caminho):
+                raise FileNotFoundError(chave)
+            yield caminho
+            return
+        fd, temporario = tempfile.mkstemp(suffix=os.path.splitext(chave)[1])
+        try:
+            with os.fdopen(fd, 'wb') as destino, self.abrir(chave) as origem:
+                shutil.copyfileobj(origem, destino, TAMANHO_BLOCO)
+            yield temporario
+        finally:
+            os.remove(temporario)
+
+
+class ArmazenamentoLocal(Armazenamento):
+    """Arquivos em uma pasta do disco (local ou montagem compartilhada)"""
+
+    def __init__(self, raiz='.', layout='hash'):
+        super().__init__(layout)
+        self.raiz = os.path.abspath(raiz)
+
+    def caminho_local(self, chave):
+        return os.path.join(self.raiz, *validar_chave(chave).split('/'))
+
+    @contextmanager
+    def escrever(self, chave, mimetype=None):
+        destino = self.caminho_local(chave)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        fd, parcial = tempfile.mkstemp(suffix='.part', dir=os.path.dirname(destino))
+        try:
+            with os.fdopen(fd, 'wb') as arquivo:
+                yield arquivo
+            os.replace(parcial, destino)
+        except BaseException:
+            os.remove(parcial)
+            raise
+
+    def gravar_arquivo(self, chave, caminho, mimetype=None):
+        destino = self.caminho_local(chave)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        try:
+            os.replace(caminho, destino)
+        except OSError:  # outro disco
+            super().gravar_arquivo(chave, caminho, mimetype)
+        return chave
+
+    def abrir(self, chave):
+        return open(self.caminho_local(chave), 'rb')
+
+    def existe(self, chave):
+        return os.path.isfile(self.caminho_local(chave))
+
+    def remover(self, chave):
+        try:
+            os.remove(self.caminho_local(chave))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def listar(self, prefixo):
+        pasta, _, inicio = prefixo.rpartition('/')
+        try:
+            entradas = os.scandir(self.caminho_local(pasta) if pasta else self.raiz)
+        except FileNotFoundError:
+            return []
+        with entradas:
+            nomes = sorted(e.name for e in entradas
+                           if e.is_file() and e.name.startswith(inicio) and not e.name.endswith('.part'))
+        return [f'{pasta}/{nome}' if pasta else nome for nome in nomes]
+
+
+class _CorpoS3(io.RawIOBase):
+    """Body do get_object como arquivo (BufferedReader, with, close)"""
+
+    def __init__(self, corpo):
+        self._corpo = corpo
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        dados = self._corpo.read(len(buffer))
+        buffer[:len(dados)] = dados
+        return len(dados)
+
+    def close(self):
+        if not self.closed:
+            self._corpo.close()
+        super().close()
+
+
+class ArmazenamentoS3(Armazenamento):
+    """Objetos em um bucket S3 ou compatível (MinIO)"""
+
+    def __init__(self, bucket, prefixo='', endpoint_url=None, regiao=None, layout='hash'):
+        if boto3 is None:
+            raise RuntimeError('boto3 não instalado: pip install boto3')
+        if not bucket:
+            raise ValueError('DB_STORAGE_S3_BUCKET obrigatório para DB_STORAGE_BACKEND=s3')
+        super().__init__(layout)
+        self.bucket = bucket
+        self.prefixo = prefixo.strip('/') + '/' if prefixo.strip('/') else ''
+        self.cliente = boto3.client(
+            's3', endpoint_url=endpoint_url or None, region_name=regiao or None,
+            # MinIO e afins não resolvem bucket.host: endereço por caminho
+            config=BotoConfig(s3={'addressing_style': 'path'} if endpoint_url else {})
+        )
+
+    def _objeto(self, chave):
+        return self.prefixo + validar_chave(chave)
+
+    @staticmethod
+    def _nao_encontrado(erro):
+        return erro.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+
+    @contextmanager
+    def escrever(self, chave, mimetype=None):
+        with tempfile.SpooledTemporaryFile(max_size=EM_MEMORIA) as arquivo:
+            yield arquivo
+            arquivo.seek(0)
+            self.gravar(chave, arquivo, mimetype)
+
+    def gravar(self, chave, stream, mimetype=None):
+        # upload_fileobj lê em partes (multipart acima de 8 MB)
+        self.cliente.upload_fileobj(
+            stream, self.bucket, self._objeto(chave),
+            ExtraArgs={'ContentType': mimetype or tipo_da_chave(chave)}
+        )
+        return chave
+
+    def abrir(self, chave):
+        try:
+            resposta = self.cliente.get_object(Bucket=self.bucket, Key=self._objeto(chave))
+        except ClientError as e:
+            if self._nao_encontrado(e):
+                raise FileNotFoundError(chave) from e
+            raise
+        return io.BufferedReader(_CorpoS3(resposta['Body']), TAMANHO_BLOCO)
+
+    def existe(self, chave):
+        try:
+            self.cliente.head_object(Bucket=self.bucket, Key=self._objeto(chave))
+            return True
+        except ClientError as e:
+            if self._nao_encontrado(e):
+                return False
+            raise
+
+    def remover(self, chave):
+        if not self.existe(chave):
+            return False
+        self.cliente.delete_object(Bucket=self.bucket, Key=self._objeto(chave))
+        return True
+
+    def listar(self, prefixo):
+        chaves = []
+        paginas = self.cliente.get_paginator('list_objects_v2').paginate(
+            Bucket=self.bucket, Prefix=self.prefixo + prefixo, Delimiter='/'
+        )
+        for pagina in paginas:
+            chaves.extend(obj['Key'][len(self.prefixo):] for obj in pagina.get('Contents', []))
+        return sorted(chaves)
+
+
+_storage = None
+
+def get_storage():
+    """Obter o armazenamento configurado (DB_STORAGE_BACKEND)"""
+    global _storage
+    if _storage is None:
+        if DatabaseConfig.STORAGE_BACKEND == 's3':
+            _storage = ArmazenamentoS3(
+                DatabaseConfig.STORAGE_S3_BUCKET,
+                prefixo=DatabaseConfig.STORAGE_S3_PREFIX,
+                endpoint_url=DatabaseConfig.STORAGE_S3_ENDPOINT,
+                regiao=DatabaseConfig.STORAGE_S3_REGION,
+                layout=DatabaseConfig.STORAGE_LAYOUT
+            )
+        elif DatabaseConfig.STORAGE_BACKEND == 'local':
+            _storage = ArmazenamentoLocal(DatabaseConfig.STORAGE_ROOT, layout=DatabaseConfig.STORAGE_LAYOUT)
+        else:
+            raise ValueError(f"DB_STORAGE_BACKEND desconhecido: {DatabaseConfig.STORAGE_BACKEND}")
+        logger.info(f"🗄️ Armazenamento de arquivos: {DatabaseConfig.STORAGE_BACKEND} ({DatabaseConfig.STORAGE_LAYOUT})")
+        if DatabaseConfig.STORAGE_BACKEND == 's3':
+            logger.warning(f"⚠️ s3 guarda só assinaturas, documentos avulsos, fotos do formulário, backups e PDFs: fotos e "
+                           f"documentos do envio ({DatabaseConfig.BLOB_DIR}) e uploads em partes "
+                           f"({DatabaseConfig.UPLOAD_SESSION_DIR}) ficam no disco; com mais de um nó, "
+                           f"uploads/ precisa ser um sistema de arquivos compartilhado")
+    return _storage
+
+
+def verificar(storage, pasta='verificacao'):
+    """
+    Gravar, ler, listar e apagar uma chave de teste; levanta exceção se
+    algo não bate (python -m db.storage check)
+    """
+    conteudo = os.urandom(64 * 1024)
+    chave = storage.chave(pasta, f'teste_{os.getpid()}.bin', grupo='verificacao')
+    with storage.escrever(chave, 'application/octet-stream') as destino:
+        destino.write(conteudo)
+    try:
+        with storage.abrir(chave) as origem:
+            if origem.read() != conteudo:
+                raise RuntimeError(f"Conteúdo lido de {chave} difere do gravado")
+        if chave not in storage.listar(storage.prefixo_grupo(pasta, 'verificacao')):
+            raise RuntimeError(f"{chave} não aparece na listagem")
+    finally:
+        storage.remover(chave)
+    if storage.existe(chave):
+        raise RuntimeError(f"{chave} continua existindo após remover")
+    return chave
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Arquivos no armazenamento configurado')
+    sub = parser.add_subparsers(dest='comando', required=True)
+    ls = sub.add_parser('ls', help='Listar chaves de uma pasta')
+    ls.add_argument('prefixo')
+    put = sub.add_parser('put', help='Enviar um arquivo local')
+    put.add_argument('arquivo')
+    put.add_argument('chave')
+    get = sub.add_parser('get', help='Baixar uma chave')
+    get.add_argument('chave')
+    get.add_argument('arquivo')
+    sub.add_parser('check', help='Gravar, ler, listar e apagar uma chave de teste')
+    args = parser.parse_args(argv)
+
+    storage = get_storage()
+    try:
+        if args.comando == 'ls':
+            for chave in storage.listar(args.prefixo):
+                print(chave)
+        elif args.comando == 'put':
+            with open(args.arquivo, 'rb') as origem:
+                storage.gravar(args.chave, origem)
+            print(f"✅ {args.arquivo} -> {args.chave}")
+        elif args.comando == 'check':
+            print(f"✅ Armazenamento ok ({DatabaseConfig.STORAGE_BACKEND}): {verificar(storage)}")
+        else:
+            with storage.abrir(args.chave) as origem, open(args.arquivo, 'wb') as destino:
+                shutil.copyfileobj(origem, destino, TAMANHO_BLOCO)
+            print(f"✅ {args.chave} -> {args.arquivo}")
+        return 0
+    except Exception as e:
+        logger.error(f"❌ Erro no armazenamento: {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
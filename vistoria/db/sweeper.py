@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Varredura periódica de links de assinatura expirados
+Sistema Vistoria Agil - PostgreSQL Integration
+
+Vistorias 'aguardando_assinatura' com token_expira_em vencido passam a
+'expirado' em lotes (FOR UPDATE SKIP LOCKED, então vários processos podem
+varrer ao mesmo tempo), saem do cache de tokens e, opcionalmente, têm as
+fotos movidas para uma pasta de armazenamento frio (servida em /frio/).
+
+Roda como thread da aplicação (DB_EXPIRY_SWEEP_INTERVAL > 0) ou pela CLI,
+a partir da pasta vistoria/:
+    python -m db.sweeper once [--lote 500] [--cold-storage /mnt/frio]
+    python -m db.sweeper loop [--intervalo 60]
+
+A cada varredura também são apagadas as chaves de idempotência expiradas,
+as tarefas concluídas há mais de DB_JOB_RETENTION_HOURS (db/jobs.py), as
+sessões de upload vencidas (db/uploads.py) e os blobs de fotos sem
+referência (db/blobs.py), e uma vez por dia são criadas as partições
+mensais à frente (db/partitions.py), para que um processo que fica no ar
+por meses não dependa do cron.
+
+A expiração de um lote e a troca dos caminhos das fotos para o
+armazenamento frio são confirmadas na mesma transação: se a troca
+falhar, as vistorias continuam pendentes e voltam na próxima varredura.
+Fotos em blobs (db/blobs.py) são copiadas para o armazenamento frio e
+deixam de referenciar o blob, que a coleta apaga quando nenhuma outra
+foto o usa; o original guardado com PHOTO_KEEP_ORIGINAL continua no blob.
+
+Pela CLI o cache dos processos da aplicação não é limpo: as entradas
+expiram sozinhas em DB_TOKEN_CACHE_TTL segundos.
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import logging
+import threading
+from datetime import date
+
+from psycopg2.extras import execute_values
+
+from .database import DatabaseConfig, get_vistoria_db
+from .idempotency import get_idempotency_store
+from .blobs import get_blob_store
+from .uploads import get_upload_store
+from .jobs import get_job_queue
+from .partitions import garantir_particoes
+
+logger = logging.getLogger(__name__)
+
+SQL_FOTOS_EXPIRADAS = """
+    SELECT f.id, f.vistoria_criado_em, f.arquivo_path, f.blob_sha256
+    FROM fotos_vistoria f
+    JOIN unnest(%s::int[], %s::timestamp[]) AS e(id, criado_em)
+        ON f.vistoria_id = e.id AND f.vistoria_criado_em = e.criado_em
+    WHERE f.arquivo_path IS NOT NULL AND f.arquivo_path <> ''
+"""
+
+SQL_ATUALIZAR_CAMINHOS = """
+    UPDATE fotos_vistoria f SET arquivo_path = n.arquivo_path, arquivo_url = n.arquivo_url,
+        blob_sha256 = NULL  -- o gatilho desconta a referência (db/blobs.py)
+    FROM (VALUES %s) AS n(id, vistoria_criado_em, arquivo_path, arquivo_url)
+    WHERE f.id = n.id AND f.vistoria_criado_em = n.vistoria_criado_em
+"""
+
+
+class ExpirySweeper:
+    """Expira vistorias vencidas em lotes, em uma thread de fundo"""
+
+    def __init__(self, db=None, intervalo=None, lote=None, cold_storage_dir=None):
+        self.db = db or get_vistoria_db()
+        self.intervalo = DatabaseConfig.EXPIRY_SWEEP_INTERVAL if intervalo is None else intervalo
+        self.lote = lote or DatabaseConfig.EXPIRY_SWEEP_BATCH
+        self.cold_storage_dir = (DatabaseConfig.COLD_STORAGE_DIR if cold_storage_dir is None
+                                 else cold_storage_dir)
+        self._parar = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        # Estatísticas
+        self._execucoes = 0
+        self._expiradas = 0
+        self._fotos_movidas = 0
+        self._chaves_removidas = 0
+        self._uploads_removidos = 0
+        self._blobs_removidos = 0
+        self._erros = 0
+        self._ultima_execucao = None
+        self._particoes_em = None
+
+    def varrer(self):
+        """
+        Expirar todas as vistorias vencidas agora (lote a lote)
+
+        Returns:
+            int: vistorias expiradas nesta varredura
+        """
+        self._garantir_particoes()
+        total = 0
+        while not self._parar.is_set():
+            if self.cold_storage_dir:
+                expiradas = self._expirar_movendo_fotos()
+            else:
+                expiradas = self.db.expirar_vistorias(self.lote)
+            total += len(expiradas)
+            if len(expiradas) < self.lote:
+                break
+
+        chaves = self._limpar_idempotencia()
+        get_job_queue().limpar_concluidos(limite=self.lote)
+        uploads = self._limpar_uploads()
+        blobs = self._coletar_blobs()
+
+        with self._lock:
+            self._execucoes += 1
+            self._expiradas += total
+            self._chaves_removidas += chaves
+            self._uploads_removidos += uploads
+            self._blobs_removidos += blobs
+            self._ultima_execucao = time.time()
+        if total:
+            logger.info(f"⌛ {total} vistorias expiradas")
+        return total
+
+    def _garantir_particoes(self):
+        """Criar as partições dos próximos meses, uma vez por dia"""
+        hoje = date.today()
+        if self._particoes_em == hoje:
+            return
+        try:
+            with self.db.db_manager.connection() as conn:
+                garantir_particoes(conn)
+            self._particoes_em = hoje
+        except Exception as e:
+            # Não impede a expiração; tenta de novo na próxima varredura
+            with self._lock:
+                self._erros += 1
+            logger.error(f"❌ Erro ao garantir partições mensais: {e}")
+
+    def _limpar_idempotencia(self):
+        """Apagar as chaves de idempotência expiradas (db/idempotency.py)"""
+        store = get_idempotency_store()
+        total = 0
+        while not self._parar.is_set():
+            apagadas = store.limpar_expiradas(self.lote)
+            total += apagadas
+            if apagadas < self.lote:
+                break
+        return total
+
+    def _limpar_uploads(self):
+        """Apagar as sessões de upload expiradas e suas partes (db/uploads.py)"""
+        store = get_upload_store()
+        total = 0
+        while not self._parar.is_set():
+            apagadas = store.limpar_expiradas(self.lote)
+            total += apagadas
+            if apagadas < self.lote:
+                break
+        return total
+
+    def _coletar_blobs(self):
+        """Apagar os blobs sem referência há mais de DB_BLOB_GC_GRACE_HOURS"""
+        store = get_blob_store()
+        total = 0
+        while not self._parar.is_set():
+            apagados = store.coletar(limite=self.lote)
+            total += apagados
+            if apagados < self.lote:
+                break
+        return total
+
+    def _destino(self, caminho, criado_em):
+        return os.path.join(self.cold_storage_dir, criado_em.strftime('%Y_%m'), os.path.basename(caminho))
+
+    def _url(self, destino):
+        """URL servida por /frio/<path> (routes/vistoria_routes.py)"""
+        return '/frio/' + os.path.relpath(destino, self.cold_storage_dir).replace(os.sep, '/')
+
+    @staticmethod
+    def _copiar(origem, destino):
+        """Link (mesmo disco) ou cópia para destino, publicado com os.replace"""
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        parcial = destino + '.part'
+        if os.path.exists(parcial):
+            os.remove(parcial)
+        try:
+            os.link(origem, parcial)
+        except OSError:
+            shutil.copy2(origem, parcial)
+        os.replace(parcial, destino)
+
+    def _expirar_movendo_fotos(self):
+        """
+        Expirar um lote e mover as fotos para o armazenamento frio
+
+        Copia e grava os novos caminhos na transação da expiração; só
+        depois do commit apaga os originais (como BlobStore.backfill). Se
+        a transação falhar, as cópias são apagadas e as vistorias e fotos
+        ficam como estavam. Arquivos de blob não são apagados aqui.
+
+        Returns:
+            list: vistorias expiradas (ver VistoriaDatabase.expirar_vistorias)
+        """
+        movidas = []
+        copias = []
+        try:
+            with self.db.db_manager.connection() as conn:
+                expiradas = self.db.expirar_vistorias(self.lote, conn=conn)
+                if expiradas:
+                    cursor = conn.cursor()
+                    cursor.execute(SQL_FOTOS_EXPIRADAS, (
+                        [v['id'] for v in expiradas], [v['criado_em'] for v in expiradas]
+                    ))
+                    for foto in cursor.fetchall():
+                        origem = foto['arquivo_path']
+                        if not os.path.exists(origem):
+                            continue
+                        destino = self._destino(origem, foto['vistoria_criado_em'])
+                        try:
+                            self._copiar(origem, destino)
+                        except OSError as e:
+                            logger.warning(f"⚠️ Não foi possível copiar {origem}: {e}")
+                            continue
+                        copias.append(destino)
+                        movidas.append((foto['id'], foto['vistoria_criado_em'], destino, self._url(destino),
+                                        None if foto['blob_sha256'] else origem))
+                    if movidas:
+                        execute_values(cursor, SQL_ATUALIZAR_CAMINHOS, [m[:4] for m in movidas],
+                                       template="(%s::integer, %s::timestamp, %s::text, %s::text)")
+                conn.commit()
+        except Exception:
+            for destino in copias:
+                if os.path.exists(destino):
+                    os.remove(destino)
+            raise
+
+        self.db.registrar_expiradas(expiradas)
+        # Só depois do commit: os originais deixam de ser referenciados
+        for *_, origem in movidas:
+            if origem is None:
+                continue
+            try:
+                os.remove(origem)
+            except OSError as e:
+                logger.warning(f"⚠️ Não foi possível remover {origem}: {e}")
+
+        with self._lock:
+            self._fotos_movidas += len(movidas)
+        return expiradas
+
+    def _executar(self):
+        while not self._parar.wait(self.intervalo):
+            try:
+                self.varrer()
+            except Exception as e:
+                with self._lock:
+                    self._erros += 1
+                logger.error(f"❌ Erro na varredura de expiração: {e}")
+
+    def start(self):
+        """Iniciar a thread de fundo (primeira varredura após `intervalo`)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._executar, name='expiry-sweeper', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'interval': self.intervalo,
+                'runs': self._execucoes,
+                'expired': self._expiradas,
+                'photos_moved': self._fotos_movidas,
+                'idempotency_keys_removed': self._chaves_removidas,
+                'upload_sessions_removed': self._uploads_removidos,
+                'blobs_removed': self._blobs_removidos,
+                'errors': self._erros,
+                'last_run': self._ultima_execucao,
+            }
+
+
+# Instância global (thread dentro da aplicação)
+_sweeper = None
+
+def start_expiry_sweeper():
+    """Iniciar a varredura em fundo, se DB_EXPIRY_SWEEP_INTERVAL > 0"""
+    global _sweeper
+    if _sweeper is None and DatabaseConfig.EXPIRY_SWEEP_INTERVAL > 0:
+        _sweeper = ExpirySweeper().start()
+    return _sweeper
+
+def stop_expiry_sweeper():
+    global _sweeper
+    if _sweeper is not None:
+        _sweeper.stop()
+        _sweeper = None
+
+def get_sweeper_stats():
+    return _sweeper.stats() if _sweeper else {}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Expirar links de assinatura vencidos')
+    sub = parser.add_subparsers(dest='comando', required=True)
+    for nome, ajuda in (('once', 'Uma varredura completa'), ('loop', 'Varrer periodicamente')):
+        cmd = sub.add_parser(nome, help=ajuda)
+        cmd.add_argument('--lote', type=int, default=None, help='Vistorias por transação')
+        cmd.add_argument('--cold-storage', default=None, help='Mover as fotos das expiradas para esta pasta')
+        if nome == 'loop':
+            cmd.add_argument('--intervalo', type=float, default=None, help='Segundos entre varreduras')
+    args = parser.parse_args(argv)
+
+    sweeper = ExpirySweeper(
+        intervalo=getattr(args, 'intervalo', None) or DatabaseConfig.EXPIRY_SWEEP_INTERVAL or 60,
+        lote=args.lote,
+        cold_storage_dir=args.cold_storage
+    )
+    try:
+        if args.comando == 'once':
+            print(f"✅ {sweeper.varrer()} vistorias expiradas")
+            return 0
+
+        print(f"⌛ Varrendo a cada {sweeper.intervalo:.0f}s (Ctrl+C para parar)")
+        sweeper.varrer()
+        sweeper.start()
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        sweeper.stop()
+        return 0
+    except Exception as e:
+        logger.error(f"❌ Erro na varredura de expiração: {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
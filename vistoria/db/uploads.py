@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Sessões de upload em partes (fotos enviadas fora do JSON da vistoria)
+Sistema Vistoria Agil - PostgreSQL Integration
+
+O cliente cria a sessão com o tamanho do arquivo, envia as partes com o
+offset (PUT, em qualquer número de requisições; um envio interrompido
+mantém o que chegou) e finaliza com o SHA-256. O arquivo conferido vai
+para o armazenamento por conteúdo (db/blobs.py) e o envio da vistoria
+passa a citar o upload_id no lugar da data URL.
+
+Partes em DB_UPLOAD_SESSION_DIR/<id>.part. Sessões expiram após
+DB_UPLOAD_SESSION_TTL_HOURS (não maior que DB_BLOB_GC_GRACE_HOURS: o blob
+de um upload ainda não usado não tem referência) e são apagadas pelo
+db/sweeper.py. Tabela: migração 11.
+"""
+
+import os
+import re
+import secrets
+import logging
+
+from .database import DatabaseConfig, init_database
+from .metrics import consulta_nomeada
+
+logger = logging.getLogger(__name__)
+
+RECEBENDO = 'recebendo'
+FINALIZANDO = 'finalizando'
+CONCLUIDO = 'concluido'
+
+ID_VALIDO = re.compile(r'[A-Za-z0-9_-]{16,64}')
+# Finalização abandonada (processo morto) pode ser retomada após este prazo
+POSSE_FINALIZACAO = 300
+
+SQL_CRIAR = """
+    INSERT INTO uploads_sessoes (id, nome, mimetype, tamanho, sha256_esperado, expira_em)
+    VALUES (%s, %s, %s, %s, %s, CURRENT_TIMESTAMP + %s * INTERVAL '1 hour')
+    RETURNING id, nome, mimetype, tamanho, recebido, status, expira_em
+"""
+
+SQL_OBTER = """
+    SELECT id, nome, mimetype, tamanho, recebido, sha256_esperado, status, blob_sha256, expira_em
+    FROM uploads_sessoes WHERE id = %s AND expira_em > CURRENT_TIMESTAMP
+"""
+
+# Partes só continuam o que já chegou (offset <= recebido): sem buracos
+SQL_AVANCAR = """
+    UPDATE uploads_sessoes SET recebido = GREATEST(recebido, %s), atualizado_em = CURRENT_TIMESTAMP
+    WHERE id = %s AND status = 'recebendo' AND %s <= recebido AND expira_em > CURRENT_TIMESTAMP
+    RETURNING recebido
+"""
+
+SQL_INICIAR_FINALIZACAO = f"""
+    UPDATE uploads_sessoes SET status = 'finalizando', atualizado_em = CURRENT_TIMESTAMP
+    WHERE id = %s AND recebido = tamanho AND expira_em > CURRENT_TIMESTAMP
+      AND (status = 'recebendo'
+           OR (status = 'finalizando'
+               AND atualizado_em <= CURRENT_TIMESTAMP - INTERVAL '{POSSE_FINALIZACAO} seconds'))
+    RETURNING id, nome, mimetype, tamanho, sha256_esperado
+"""
+
+# Upload de conteúdo já guardado sem referência: o prazo da coleta recomeça
+SQL_REGISTRAR_BLOB = """
+    INSERT INTO blobs (sha256, caminho, tamanho, mimetype, largura, altura)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    ON CONFLICT (sha256) DO UPDATE SET
+        sem_referencia_desde = CASE WHEN blobs.referencias <= 0 THEN CURRENT_TIMESTAMP END
+"""
+
+SQL_CONCLUIR = """
+    UPDATE uploads_sessoes SET status = 'concluido', blob_sha256 = %s, atualizado_em = CURRENT_TIMESTAMP
+    WHERE id = %s AND status = 'finalizando'
+"""
+
+SQL_REINICIAR = """
+    UPDATE uploads_sessoes SET status = 'recebendo', recebido = %s, atualizado_em = CURRENT_TIMESTAMP
+    WHERE id = %s AND status = 'finalizando'
+"""
+
+SQL_RESOLVER = """
+    SELECT s.id, b.sha256, b.caminho, b.tamanho, b.mimetype, b.largura, b.altura
+    FROM uploads_sessoes s
+    JOIN blobs b ON b.sha256 = s.blob_sha256
+    WHERE s.id = ANY(%s) AND s.status = 'concluido' AND s.expira_em > CURRENT_TIMESTAMP
+"""
+
+SQL_LIMPAR_EXPIRADAS = """
+    DELETE FROM uploads_sessoes WHERE id IN (
+        SELECT id FROM uploads_sessoes WHERE expira_em <= CURRENT_TIMESTAMP
+        LIMIT %s FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id
+"""
+
+
+def caminho_parcial(upload_id):
+    """Arquivo das partes recebidas de uma sessão"""
+    if not ID_VALIDO.fullmatch(upload_id or ''):
+        raise ValueError(f"upload_id inválido: {upload_id!r}")
+    return os.path.join(DatabaseConfig.UPLOAD_SESSION_DIR, upload_id + '.part')
+
+
+def caminho_copia(upload_id):
+    """Cópia das partes conferida e guardada nos blobs na finalização"""
+    caminho_parcial(upload_id)  # valida o id
+    return os.path.join(DatabaseConfig.UPLOAD_SESSION_DIR, upload_id + '.final')
+
+
+class UploadStore:
+    """Sessões de upload: criação, progresso, finalização e expiração"""
+
+    def __init__(self, db_manager=None, ttl_horas=None):
+        self.db_manager = db_manager or init_database()
+        self.ttl_horas = DatabaseConfig.UPLOAD_SESSION_TTL_HOURS if ttl_horas is None else ttl_horas
+
+    @consulta_nomeada
+    def criar(self, tamanho, nome=None, mimetype=None, sha256=None):
+        """Criar a sessão e o arquivo vazio das partes; retorna a linha criada"""
+        upload_id = secrets.token_urlsafe(24)
+        parcial = caminho_parcial(upload_id)
+        os.makedirs(os.path.dirname(parcial), exist_ok=True)
+        open(parcial, 'wb').close()
+        try:
+            with self.db_manager.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(SQL_CRIAR, (upload_id, nome, mimetype, tamanho, sha256, self.ttl_horas))
+                sessao = cursor.fetchone()
+                conn.commit()
+        except Exception:
+            os.remove(parcial)
+            raise
+        return sessao
+
+    @consulta_nomeada
+    def obter(self, upload_id):
+        """Sessão não expirada, ou None (lida no primário: vem logo após criar/PUT)"""
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(SQL_OBTER, (upload_id,))
+            return cursor.fetchone()
+
+    @consulta_nomeada
+    def avancar(self, upload_id, offset, fim):
+        """
+        Registrar que os bytes [offset, fim) foram gravados
+
+        Returns:
+            int: bytes recebidos, ou None se a sessão não aceita esta parte
+                (offset além do recebido, finalizada ou expirada)
+        """
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(SQL_AVANCAR, (fim, upload_id, offset))
+            row = cursor.fetchone()
+            conn.commit()
+        return row['recebido'] if row else None
+
+    @consulta_nomeada
+    def iniciar_finalizacao(self, upload_id):
+        """Passar a 'finalizando' (só uma requisição por vez); None se não couber"""
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(SQL_INICIAR_FINALIZACAO, (upload_id,))
+            sessao = cursor.fetchone()
+            conn.commit()
+        return sessao
+
+    @consulta_nomeada
+    def concluir(self, upload_id, arquivo):
+        """
+        Registrar o blob e concluir a sessão (mesma transação)
+
+        Args:
+            arquivo (dict): sha256, path, size, mimetype, largura, altura
+        """
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(SQL_REGISTRAR_BLOB, (
+                arquivo['sha256'], arquivo['path'], arquivo['size'],
+                arquivo.get('mimetype'), arquivo.get('largura'), arquivo.get('altura')
+            ))
+            cursor.execute(SQL_CONCLUIR, (arquivo['sha256'], upload_id))
+            conn.commit()
+
+    @consulta_nomeada
+    def reiniciar(self, upload_id, recebido=0):
+        """
+        Devolver a sessão em finalização para 'recebendo'
+
+        recebido=0 (checksum não confere) recomeça o envio; com o tamanho
+        recebido, a finalização pode ser repetida (erro ao guardar o arquivo)
+        """
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(SQL_REINICIAR, (recebido, upload_id))
+            conn.commit()
+
+    @consulta_nomeada
+    def resolver(self, upload_ids):
+        """
+        Arquivos dos uploads concluídos citados no envio da vistoria
+
+        Returns:
+            dict: upload_id -> linha (sha256, caminho, tamanho, mimetype,
+                largura, altura); IDs ausentes não existem, não foram
+                finalizados ou expiraram
+        """
+        if not upload_ids:
+            return {}
+        # Primário: o envio da vistoria vem logo após finalizar
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(SQL_RESOLVER, (list(upload_ids),))
+            return {row['id']: row for row in cursor.fetchall()}
+
+    @consulta_nomeada
+    def limpar_expiradas(self, limite=1000):
+        """Apagar sessões expiradas e as partes que sobraram; retorna quantas"""
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(SQL_LIMPAR_EXPIRADAS, (limite,))
+            apagadas = [row['id'] for row in cursor.fetchall()]
+            conn.commit()
+
+        for upload_id in apagadas:
+            for caminho in (caminho_parcial(upload_id), caminho_copia(upload_id)):
+                try:
+                    os.remove(caminho)
+                except FileNotFoundError:
+                    pass  # concluída: o arquivo já está nos blobs
+                except OSError as e:
+                    logger.warning(f"⚠️ Não foi possível remover partes de {upload_id}: {e}")
+        return len(apagadas)
+
+
+_upload_store = None
+
+def get_upload_store():
+    """Obter instância global das sessões de upload"""
+    global _upload_store
+    if _upload_store is None:
+        _upload_store = UploadStore()
+    return _upload_store
@@ -21,6 +21,7 @@ class FotoModel:
     arquivo_path: Optional[str] = None
     arquivo_url: Optional[str] = None
     arquivo_tamanho: Optional[int] = None
+    arquivo_tamanho_original: Optional[int] = None  # antes da normalização
     arquivo_mime_type: Optional[str] = None
     arquivo_checksum: Optional[str] = None
     largura: Optional[int] = None
@@ -4,21 +4,40 @@ Rotas da API
 import json
 from flask import Blueprint, request, jsonify
 from datetime import datetime
-from db import get_vistoria_db
-from utils import save_uploaded_photo, save_signature_image, save_vistoria_complete
+from db import get_vistoria_db, get_pool_stats, get_cache_stats, get_query_metrics
+from db.sweeper import get_sweeper_stats
+from db.jobs import get_job_queue, get_job_worker_stats
+from utils import save_uploaded_photo, save_signature_image, save_vistoria_complete, uploads_ausentes
+from utils.json_stream import ler_json_streaming, JSONStreamError
+from utils.derivadas import get_derivative_cache_stats
 from .assinatura_routes import prepare_vistoria_data_for_saving
+from .idempotency import idempotente, corpo_requisicao
 
 api_bp = Blueprint('api', __name__)
 
 
 @api_bp.route('/api/salvar_vistoria_completa', methods=['POST'])
+@idempotente
 def salvar_vistoria_completa():
     """API para salvar vistoria completa incluindo assinatura presencial"""
+    corpo = None
     try:
-        # Obter dados JSON
-        data = request.get_json()
+        # Ler o JSON em streaming: as fotos base64 vão direto para arquivos temporários
+        if not request.is_json:
+            return jsonify({
+                'success': False,
+                'message': 'Content-Type deve ser application/json'
+            }), 415
+        try:
+            corpo = ler_json_streaming(corpo_requisicao())
+        except JSONStreamError as e:
+            return jsonify({
+                'success': False,
+                'message': f'JSON inválido: {e}'
+            }), 400
+        data = corpo.dados
         
-        if not data:
+        if not data or not isinstance(data, dict):
             return jsonify({
                 'success': False,
                 'message': 'Dados não fornecidos'
@@ -63,11 +82,12 @@ def salvar_vistoria_completa():
         photos_array = data.get('photos', [])
         print(f"🔍 PROCESSAMENTO: Array 'photos' contém {len(photos_array)} itens")
         for photo in photos_array:
-            if photo and photo.get('url'):
+            if photo and (photo.get('url') or photo.get('upload_id')):
                 photos_data.append({
                     'category': photo.get('category'),
                     'name': photo.get('name'),
                     'url': photo.get('url'),
+                    'upload_id': photo.get('upload_id'),  # enviada por /api/uploads
                     'size': photo.get('size', 0),
                     'type': photo.get('type', 'image/jpeg')
                 })
@@ -78,17 +98,25 @@ def salvar_vistoria_completa():
             fotos = data.get('fotos', {})
             print(f"🔍 FALLBACK: Objeto 'fotos' contém {len(fotos)} itens")
             for field_name, foto_data in fotos.items():
-                if foto_data and foto_data.get('url'):
+                if foto_data and (foto_data.get('url') or foto_data.get('upload_id')):
                     photos_data.append({
                         'category': field_name,
                         'name': field_name,
-                        'url': foto_data['url'],
+                        'url': foto_data.get('url'),
+                        'upload_id': foto_data.get('upload_id'),
                         'size': foto_data.get('size', 0),
                         'type': foto_data.get('type', 'image/jpeg')
                     })
                     print(f"   ✅ Adicionada (fallback): {field_name}")
         
         print(f"🔍 TOTAL FINAL: {len(photos_data)} fotos serão processadas")
+        ausentes = uploads_ausentes(photos_data)
+        if ausentes:
+            return jsonify({
+                'success': False,
+                'message': 'Uploads não finalizados ou expirados',
+                'upload_ids': ausentes
+            }), 400
         dados_convertidos['photos'] = photos_data
         
         # Processar documento se fornecido
@@ -145,6 +173,10 @@ def salvar_vistoria_completa():
             'success': False,
             'message': f'Erro interno: {str(e)}'
         }), 500
+    finally:
+        # Temporários que não viraram arquivo da vistoria
+        if corpo is not None:
+            corpo.limpar()
 
 
 @api_bp.route('/api/salvar_vistoria', methods=['POST'])
@@ -212,6 +244,12 @@ def health_check():
             'service': 'Sistema Ágil - Vistoria',
             'version': '2.0.0',
             'database': db_status,
+            'pool': get_pool_stats(),
+            'token_cache': get_cache_stats(),
+            'queries': get_query_metrics(),
+            'expiry_sweeper': get_sweeper_stats(),
+            'job_workers': get_job_worker_stats(),
+            'image_derivatives': get_derivative_cache_stats(),
             'timestamp': datetime.now().isoformat()
         })
     except Exception as e:
@@ -221,33 +259,96 @@ def health_check():
         }), 500
 
 
+@api_bp.route('/api/jobs')
+def status_fila():
+    """Tarefas por tipo e status e atraso da fila"""
+    try:
+        return jsonify({
+            'success': True,
+            'data': get_job_queue().estatisticas(),
+            'workers': get_job_worker_stats()
+        })
+    except Exception as e:
+        print(f"❌ Erro ao consultar fila de tarefas: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'Erro interno: {str(e)}'
+        }), 500
+
+
+@api_bp.route('/api/jobs/<int:job_id>')
+def status_tarefa(job_id):
+    """Status, tentativas e resultado de uma tarefa"""
+    try:
+        job = get_job_queue().obter(job_id)
+        if not job:
+            return jsonify({
+                'success': False,
+                'message': 'Tarefa não encontrada'
+            }), 404
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'id': job['id'],
+                'tipo': job['tipo'],
+                'status': job['status'],
+                'tentativas': job['tentativas'],
+                'max_tentativas': job['max_tentativas'],
+                'erro': (job['ultimo_erro'] or '').split('\n', 1)[0] or None,
+                'resultado': job['resultado'],
+                'criado_em': job['criado_em'].isoformat() if job['criado_em'] else None,
+                'proxima_tentativa': job['executar_em'].isoformat() if job['status'] == 'pendente' else None,
+                'concluido_em': job['concluido_em'].isoformat() if job['concluido_em'] else None
+            }
+        })
+    except Exception as e:
+        print(f"❌ Erro ao consultar tarefa: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'Erro interno: {str(e)}'
+        }), 500
+
+
 @api_bp.route('/api/vistorias')
 def listar_vistorias():
     """Listar vistorias do banco de dados"""
     try:
         vistoria_db = get_vistoria_db()
         
-        # Parâmetros de paginação
-        page = int(request.args.get('page', 1))
-        per_page = int(request.args.get('per_page', 20))
-        status = request.args.get('status')
-        
-        offset = (page - 1) * per_page
-        
-        vistorias = vistoria_db.listar_vistorias_resumo(
+        # Parâmetros de paginação (cursor da página anterior em vez de número de página)
+        per_page = min(max(int(request.args.get('per_page', 20)), 1), 100)
+        cursor = request.args.get('cursor')
+
+        # Filtros opcionais (datas em ISO 8601)
+        data_inicio = request.args.get('data_inicio')
+        data_fim = request.args.get('data_fim')
+
+        resultado = vistoria_db.listar_vistorias_resumo(
             limit=per_page,
-            offset=offset,
-            status=status
+            cursor=cursor,
+            status=request.args.get('status'),
+            placa=request.args.get('placa'),
+            conferente=request.args.get('conferente'),
+            data_inicio=datetime.fromisoformat(data_inicio) if data_inicio else None,
+            data_fim=datetime.fromisoformat(data_fim) if data_fim else None
         )
-        
+
         return jsonify({
             'success': True,
-            'total': len(vistorias),
-            'page': page,
+            'total': len(resultado['vistorias']),
+            'total_estimado': resultado['total_estimado'],
             'per_page': per_page,
-            'vistorias': vistorias
+            'next_cursor': resultado['next_cursor'],
+            'vistorias': resultado['vistorias']
         })
-        
+
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': f'Parâmetro inválido: {str(e)}'
+        }), 400
+
     except Exception as e:
         print(f"❌ Erro ao listar vistorias: {e}")
         return jsonify({
@@ -256,6 +357,40 @@ def listar_vistorias():
         }), 500
 
 
+@api_bp.route('/api/vistorias/search')
+def buscar_vistorias():
+    """Busca aproximada por placa (qualquer formato), chassi, cliente, modelo e conferente"""
+    try:
+        per_page = min(max(int(request.args.get('per_page', 20)), 1), 100)
+
+        resultado = get_vistoria_db().buscar_vistorias(
+            request.args.get('q', ''),
+            limit=per_page,
+            cursor=request.args.get('cursor')
+        )
+
+        return jsonify({
+            'success': True,
+            'total': len(resultado['vistorias']),
+            'per_page': per_page,
+            'next_cursor': resultado['next_cursor'],
+            'vistorias': resultado['vistorias']
+        })
+
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': f'Parâmetro inválido: {str(e)}'
+        }), 400
+
+    except Exception as e:
+        print(f"❌ Erro na busca de vistorias: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'Erro na busca: {str(e)}'
+        }), 500
+
+
 @api_bp.route('/api/vistoria/<vistoria_id>')
 def obter_vistoria(vistoria_id):
     """Obter vistoria completa por ID"""
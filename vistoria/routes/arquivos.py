@@ -0,0 +1,23 @@
+"""
+Resposta com um arquivo do armazenamento (db/storage.py)
+
+No driver local o Flask envia o caminho (ETag, Range, sendfile); no S3 o
+objeto é repassado em streaming, sem passar pelo disco.
+"""
+from flask import send_file, abort
+from db.storage import get_storage, tipo_da_chave
+
+
+def enviar_arquivo(chave, **opcoes):
+    """send_file da chave; 404 se não existe ou a chave é inválida"""
+    storage = get_storage()
+    opcoes.setdefault('mimetype', tipo_da_chave(chave))
+    try:
+        caminho = storage.caminho_local(chave)
+        if caminho is not None:
+            if not storage.existe(chave):
+                abort(404)
+            return send_file(caminho, **opcoes)
+        return send_file(storage.abrir(chave), **opcoes)
+    except (ValueError, FileNotFoundError):
+        abort(404)
@@ -3,12 +3,21 @@ Rotas de assinatura remota
 """
 from flask import Blueprint, render_template, request, jsonify
 from datetime import datetime, timedelta
-from db import get_vistoria_db
-from utils import save_signature_image, save_vistoria_complete
+from db import get_vistoria_db, VistoriaStatus, VistoriaCliente
+from db.storage import get_storage
+from utils import save_signature_image, save_vistoria_complete, uploads_ausentes
+from utils.tarefas import BACKUP_DIR
 
 assinatura_bp = Blueprint('assinatura', __name__)
 
 
+def link_expirado(vistoria):
+    """Link vencido: já marcado pela varredura (db/sweeper.py) ou com data passada"""
+    if vistoria['status'] == 'expirado':
+        return True
+    return bool(vistoria['token_expira_em'] and datetime.now() > vistoria['token_expira_em'])
+
+
 def prepare_vistoria_data_for_saving(vistoria_data):
     """
     Converte dados básicos do frontend para o formato esperado pelo save_vistoria_complete
@@ -82,11 +91,12 @@ def gerar_link_assinatura():
         # Processar fotos do campo 'fotos' (formato antigo)
         fotos = vistoria_data.get('fotos', {})
         for field_name, foto_data in fotos.items():
-            if foto_data and foto_data.get('url'):
+            if foto_data and (foto_data.get('url') or foto_data.get('upload_id')):
                 photos_data.append({
                     'category': field_name,
                     'name': field_name,
-                    'url': foto_data['url'],
+                    'url': foto_data.get('url'),
+                    'upload_id': foto_data.get('upload_id'),  # enviada por /api/uploads
                     'size': foto_data.get('size', 0),
                     'type': foto_data.get('type', 'image/jpeg')
                 })
@@ -94,15 +104,23 @@ def gerar_link_assinatura():
         # Processar fotos do campo 'photos' (formato novo - incluindo documento)
         photos_array = vistoria_data.get('photos', [])
         for photo in photos_array:
-            if photo and photo.get('url'):
+            if photo and (photo.get('url') or photo.get('upload_id')):
                 photos_data.append({
                     'category': photo['category'],
                     'name': photo['name'],
-                    'url': photo['url'],
+                    'url': photo.get('url'),
+                    'upload_id': photo.get('upload_id'),
                     'size': photo.get('size', 0),
                     'type': photo.get('type', 'image/jpeg')
                 })
         
+        ausentes = uploads_ausentes(photos_data)
+        if ausentes:
+            return jsonify({
+                'success': False,
+                'message': 'Uploads não finalizados ou expirados',
+                'upload_ids': ausentes
+            }), 400
         dados_convertidos['photos'] = photos_data
         
         print(f"🔍 DEBUG: Total de fotos processadas: {len(photos_data)}")
@@ -160,13 +178,13 @@ def assinatura_cliente():
     
     try:
         vistoria_db = get_vistoria_db()
-        vistoria = vistoria_db.buscar_vistoria_por_token(token)
+        vistoria = vistoria_db.buscar_vistoria_por_token(token, projecao=VistoriaStatus)
         
         if not vistoria:
             return render_template('link_expirado.html'), 404
         
-        # Verificar se não expirou
-        if vistoria['token_expira_em'] and datetime.now() > vistoria['token_expira_em']:
+        # Verificar se não expirou (status pela varredura; data para o intervalo entre varreduras)
+        if link_expirado(vistoria):
             return render_template('link_expirado.html'), 410  # Token expirado
         
         # Verificar se já foi assinado
@@ -195,7 +213,8 @@ def dados_vistoria_cliente():
     
     try:
         vistoria_db = get_vistoria_db()
-        vistoria = vistoria_db.buscar_vistoria_por_token(token)
+        # Vistoria + fotos + observações em uma única consulta
+        vistoria = vistoria_db.buscar_vistoria_completa(token, projecao=VistoriaCliente)
         
         print(f"🔍 Vistoria encontrada: {vistoria is not None}")
         if vistoria:
@@ -208,7 +227,7 @@ def dados_vistoria_cliente():
             }), 404
         
         # Verificar expiração
-        if vistoria['token_expira_em'] and datetime.now() > vistoria['token_expira_em']:
+        if link_expirado(vistoria):
             return jsonify({
                 'success': False,
                 'message': 'Link expirado'
@@ -221,8 +240,8 @@ def dados_vistoria_cliente():
                 'message': 'Esta vistoria já foi assinada. O link não é mais válido.'
             }), 410
         
-        # Buscar fotos da vistoria
-        fotos = vistoria_db.buscar_fotos_vistoria(vistoria['id'])
+        # Fotos já agrupadas (uma entrada por foto) e ordenadas
+        fotos = vistoria['fotos']
         print(f"🔍 Fotos encontradas: {len(fotos) if fotos else 0}")
         if fotos:
             print(f"🔍 Primeira foto: {fotos[0] if len(fotos) > 0 else 'Nenhuma'}")
@@ -230,45 +249,44 @@ def dados_vistoria_cliente():
         # CORREÇÃO TEMPORÁRIA: Se não há fotos no banco, buscar no backup JSON
         if not fotos:
             print("⚠️ Nenhuma foto encontrada no banco, tentando buscar no backup...")
-            # Buscar arquivo de backup da vistoria
-            import os
+            # Buscar arquivo de backup da vistoria (subpasta do token; backups antigos na raiz)
             import json
-            backup_dir = 'vistorias_backup'
-            if os.path.exists(backup_dir):
-                backup_files = [f for f in os.listdir(backup_dir) if f.startswith(f'vistoria_{vistoria["token"]}_')]
-                if backup_files:
-                    latest_backup = max(backup_files)
-                    backup_path = os.path.join(backup_dir, latest_backup)
-                    try:
-                        with open(backup_path, 'r', encoding='utf-8') as f:
-                            backup_data = json.load(f)
-                        
-                        # Extrair fotos do backup
-                        backup_fotos = backup_data.get('dados_originais', {}).get('fotos', {})
-                        fotos = []
-                        for field_name, foto_data in backup_fotos.items():
-                            if foto_data and foto_data.get('url'):
-                                # Determinar tipo baseado na categoria
-                                if field_name == 'documento_nota_fiscal':
-                                    tipo = 'documento'
-                                elif 'pneu' in field_name.lower():
-                                    tipo = 'pneu'
-                                elif 'obs' in field_name.lower():
-                                    tipo = 'observacao'
-                                else:
-                                    tipo = 'obrigatoria'
-                                    
-                                fotos.append({
-                                    'categoria': field_name,
-                                    'tipo': tipo,
-                                    'arquivo_nome': f'{field_name}.jpg',
-                                    'arquivo_path': '',
-                                    'arquivo_url': foto_data['url'],
-                                    'observacao_descricao': None
-                                })
-                        print(f"✅ {len(fotos)} fotos recuperadas do backup")
-                    except Exception as e:
-                        print(f"❌ Erro ao ler backup: {e}")
+            storage = get_storage()
+            nome = f'vistoria_{vistoria["token"]}_'
+            backup_files = (storage.listar(storage.prefixo_grupo(BACKUP_DIR, vistoria['token']) + nome)
+                            or storage.listar(f'{BACKUP_DIR}/{nome}'))
+            if backup_files:
+                backup_path = max(backup_files)
+                try:
+                    with storage.abrir(backup_path) as f:
+                        backup_data = json.load(f)
+                    
+                    # Extrair fotos do backup
+                    backup_fotos = backup_data.get('dados_originais', {}).get('fotos', {})
+                    fotos = []
+                    for field_name, foto_data in backup_fotos.items():
+                        if foto_data and foto_data.get('url'):
+                            # Determinar tipo baseado na categoria
+                            if field_name == 'documento_nota_fiscal':
+                                tipo = 'documento'
+                            elif 'pneu' in field_name.lower():
+                                tipo = 'pneu'
+                            elif 'obs' in field_name.lower():
+                                tipo = 'observacao'
+                            else:
+                                tipo = 'obrigatoria'
+                                
+                            fotos.append({
+                                'categoria': field_name,
+                                'tipo': tipo,
+                                'arquivo_nome': f'{field_name}.jpg',
+                                'arquivo_path': '',
+                                'arquivo_url': foto_data['url'],
+                                'observacoes': []
+                            })
+                    print(f"✅ {len(fotos)} fotos recuperadas do backup")
+                except Exception as e:
+                    print(f"❌ Erro ao ler backup: {e}")
         
         # Converter dados do banco para formato do frontend
         vistoria_data = {
@@ -328,9 +346,10 @@ def dados_vistoria_cliente():
                 'type': foto['tipo']
             }
             
-            # Adicionar observação se houver
-            if foto.get('observacao_descricao'):
-                photo_data['observacao'] = foto['observacao_descricao']
+            # Adicionar observações ativas se houver
+            observacoes = [obs['descricao'] for obs in foto.get('observacoes', [])]
+            if observacoes:
+                photo_data['observacao'] = '; '.join(observacoes)
             
             vistoria_data['photos'].append(photo_data)
         
@@ -371,7 +390,7 @@ def confirmar_assinatura_cliente():
             }), 400
         
         vistoria_db = get_vistoria_db()
-        vistoria = vistoria_db.buscar_vistoria_por_token(token)
+        vistoria = vistoria_db.buscar_vistoria_por_token(token, projecao=VistoriaStatus)
         
         if not vistoria:
             return jsonify({
@@ -380,7 +399,7 @@ def confirmar_assinatura_cliente():
             }), 404
         
         # Verificar expiração
-        if vistoria['token_expira_em'] and datetime.now() > vistoria['token_expira_em']:
+        if link_expirado(vistoria):
             return jsonify({
                 'success': False,
                 'message': 'Link expirado'
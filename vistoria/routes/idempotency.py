@@ -0,0 +1,108 @@
+"""
+Cabeçalho Idempotency-Key nas rotas de envio
+
+Reenvios com a mesma chave (timeout no 4G) recebem a resposta gravada da
+primeira requisição, com o cabeçalho Idempotent-Replayed, sem decodificar
+as fotos nem criar outra vistoria. Sem o cabeçalho a rota funciona como
+antes.
+
+O corpo é copiado em blocos (memória até CORPO_EM_MEMORIA, depois disco)
+enquanto o hash é calculado; a rota deve lê-lo com corpo_requisicao().
+"""
+import hashlib
+import logging
+import tempfile
+from functools import wraps
+from flask import request, jsonify, make_response, g
+from db.idempotency import get_idempotency_store, CONCLUIDA, CONFLITO, PROCESSANDO
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_CHAVE = 255
+TAMANHO_BLOCO = 64 * 1024
+CORPO_EM_MEMORIA = 1024 * 1024
+
+
+def corpo_requisicao():
+    """Stream do corpo da requisição (a cópia feita por @idempotente, se houver)"""
+    return g.get('corpo_requisicao') or request.stream
+
+
+def _copiar_corpo():
+    """Copiar o corpo para g.corpo_requisicao; retorna o SHA-256"""
+    hash_requisicao = hashlib.sha256()
+    corpo = tempfile.SpooledTemporaryFile(max_size=CORPO_EM_MEMORIA)
+    for bloco in iter(lambda: request.stream.read(TAMANHO_BLOCO), b''):
+        hash_requisicao.update(bloco)
+        corpo.write(bloco)
+    corpo.seek(0)
+    g.corpo_requisicao = corpo
+    return hash_requisicao.hexdigest()
+
+
+def idempotente(view):
+    """Gravar a resposta da rota por Idempotency-Key e repeti-la nos reenvios"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        chave = request.headers.get(IDEMPOTENCY_HEADER, '').strip()
+        if not chave:
+            return view(*args, **kwargs)
+        if len(chave) > MAX_CHAVE:
+            return jsonify({
+                'success': False,
+                'message': f'{IDEMPOTENCY_HEADER} deve ter no máximo {MAX_CHAVE} caracteres'
+            }), 400
+
+        rota = request.endpoint
+        try:
+            hash_requisicao = _copiar_corpo()
+            return _executar(view, rota, chave, hash_requisicao, args, kwargs)
+        finally:
+            corpo = g.pop('corpo_requisicao', None)
+            if corpo is not None:
+                corpo.close()
+
+    return wrapper
+
+
+def _executar(view, rota, chave, hash_requisicao, args, kwargs):
+    store = get_idempotency_store()
+    estado, gravada = store.reservar_ou_aguardar(rota, chave, hash_requisicao)
+
+    if estado == CONCLUIDA:
+        status, corpo = gravada
+        resposta = make_response(jsonify(corpo), status)
+        resposta.headers['Idempotent-Replayed'] = 'true'
+        return resposta
+    if estado == CONFLITO:
+        return jsonify({
+            'success': False,
+            'message': f'{IDEMPOTENCY_HEADER} já usada com outra requisição'
+        }), 422
+    if estado == PROCESSANDO:
+        resposta = make_response(jsonify({
+            'success': False,
+            'message': 'Requisição com esta chave ainda em processamento'
+        }), 409)
+        resposta.headers['Retry-After'] = '5'
+        return resposta
+
+    try:
+        with store.manter_posse(rota, chave):
+            resposta = make_response(view(*args, **kwargs))
+    except Exception:
+        store.liberar(rota, chave)
+        raise
+
+    # Erros do servidor não são gravados: o reenvio processa de novo
+    corpo = resposta.get_json(silent=True) if resposta.is_json else None
+    if resposta.status_code >= 500 or corpo is None:
+        store.liberar(rota, chave)
+        return resposta
+    try:
+        store.concluir(rota, chave, resposta.status_code, corpo)
+    except Exception as e:
+        logger.error(f"❌ Erro ao gravar resposta idempotente: {e}")
+        store.liberar(rota, chave)
+    return resposta
@@ -4,9 +4,13 @@ Rotas para geração e download de PDF
 import os
 from flask import Blueprint, request, jsonify, send_file
 from datetime import datetime
-from db import get_vistoria_db
+from db import get_vistoria_db, VistoriaInfo
+from db.jobs import enfileirar, get_job_queue
+from db.storage import get_storage
 from utils.pdf_utils import generate_vistoria_pdf
-from utils.professional_pdf import generate_professional_pdf
+from utils.professional_pdf import generate_professional_pdf, montar_dados_pdf
+from utils.tarefas import PDF_DIR
+from .arquivos import enviar_arquivo
 
 pdf_bp = Blueprint('pdf', __name__)
 
@@ -30,30 +34,30 @@ def gerar_pdf_vistoria_old(token):
         # Preparar dados básicos para o PDF antigo
         pdf_data = {**vistoria}  # Usar todos os dados da vistoria
         
-        # Diretório para salvar PDF
-        pdf_dir = os.path.join(os.path.dirname(__file__), '..', 'pdfs')
-        os.makedirs(pdf_dir, exist_ok=True)
-        
-        # Nome do arquivo PDF
+        # Nome do arquivo PDF (chave em pdfs/ no armazenamento)
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         pdf_filename = f'vistoria_old_{token}_{timestamp}.pdf'
-        pdf_path = os.path.join(pdf_dir, pdf_filename)
-        
-        # Gerar PDF usando método antigo
-        success = generate_vistoria_pdf(pdf_data, pdf_path)
-        
-        if success and os.path.exists(pdf_path):
-            return send_file(
-                pdf_path,
-                as_attachment=True,
-                download_name=f'Vistoria_Old_{vistoria.get("placa", token)}.pdf',
-                mimetype='application/pdf'
-            )
-        else:
+        storage = get_storage()
+        pdf_chave = storage.chave(PDF_DIR, pdf_filename, grupo=token)
+        
+        # Gerar PDF usando método antigo (exceção no bloco: nada é gravado na chave)
+        try:
+            with storage.escrever(pdf_chave, 'application/pdf') as destino:
+                if not generate_vistoria_pdf(pdf_data, destino):
+                    raise RuntimeError(f"Falha ao gerar PDF: {pdf_filename}")
+        except RuntimeError as e:
+            print(f"❌ {e}")
             return jsonify({
                 'success': False,
                 'message': 'Erro ao gerar PDF'
             }), 500
+        
+        return enviar_arquivo(
+            pdf_chave,
+            as_attachment=True,
+            download_name=f'Vistoria_Old_{vistoria.get("placa", token)}.pdf',
+            mimetype='application/pdf'
+        )
             
     except Exception as e:
         print(f"❌ Erro ao gerar PDF antigo: {e}")
@@ -73,9 +77,9 @@ def gerar_pdf_vistoria(token):
         include_photos = request.args.get('include_photos', 'true').lower() == 'true'
         print(f"📸 Incluir fotos no PDF: {include_photos}")
         
-        # Buscar dados da vistoria no banco
+        # Buscar vistoria, fotos e observações no banco (uma consulta)
         db = get_vistoria_db()
-        vistoria = db.buscar_vistoria_por_token(token)
+        vistoria = db.buscar_vistoria_completa(token)
         
         if not vistoria:
             return jsonify({
@@ -95,8 +99,8 @@ def gerar_pdf_vistoria(token):
             if any(word in k.lower() for word in ['nome', 'cliente', 'terceiro']):
                 print(f"   {k}: '{v}'")
         
-        # Buscar fotos da vistoria
-        fotos = db.buscar_fotos_vistoria(vistoria['id'])
+        # Fotos já vêm agrupadas e ordenadas na consulta
+        fotos = vistoria['fotos']
         print(f"📸 Fotos encontradas: {len(fotos)}")
         
         # Debug: Mostrar detalhes das fotos
@@ -104,40 +108,7 @@ def gerar_pdf_vistoria(token):
             print(f"   Foto {i+1}: {foto.get('categoria')} - {foto.get('arquivo_nome')}")
         
         # Preparar dados para o PDF profissional
-        pdf_data = {
-            'id': vistoria.get('id'),
-            'token': vistoria.get('token'),
-            'nome_cliente': vistoria.get('nome_cliente'),
-            'nome_terceiro': vistoria.get('nome_terceiro'),
-            'proprio': vistoria.get('proprio'),
-            'nome_conferente': vistoria.get('nome_conferente'),
-            'data_vistoria': vistoria.get('criado_em'),
-            'status': vistoria.get('status'),
-            'km_rodado': vistoria.get('km_rodado'),
-            'veiculo': {
-                'placa': vistoria.get('placa'),
-                'marca': vistoria.get('marca'),
-                'modelo': vistoria.get('modelo'),
-                'cor': vistoria.get('cor'),
-                'ano': str(vistoria.get('ano')) if vistoria.get('ano') else None,
-                'chassi': vistoria.get('chassi'),
-                'renavam': vistoria.get('renavam')
-            },
-            'pneus': {
-                'marca_pneu_dianteiro_esquerdo': vistoria.get('marca_pneu_dianteiro_esquerdo'),
-                'marca_pneu_dianteiro_direito': vistoria.get('marca_pneu_dianteiro_direito'),
-                'marca_pneu_traseiro_esquerdo': vistoria.get('marca_pneu_traseiro_esquerdo'),
-                'marca_pneu_traseiro_direito': vistoria.get('marca_pneu_traseiro_direito')
-            },
-            'fotos': [{'categoria': foto.get('categoria'), 'nome': foto.get('arquivo_nome'), 'path': foto.get('arquivo_path')} for foto in fotos],
-            'assinado_em': vistoria.get('assinatura_data'),
-            'token_assinatura': vistoria.get('token'),
-            'assinatura_cliente_nome': vistoria.get('assinatura_cliente_nome') or vistoria.get('nome_cliente'),
-            # Opções do PDF (incluir fotos ou não)
-            'pdf_options': {
-                'include_photos': include_photos
-            }
-        }
+        pdf_data = montar_dados_pdf(vistoria, include_photos)
         
         # Debug: Mostrar o que será passado para o PDF
         print(f"📄 DEBUG - Dados que serão passados para o PDF:")
@@ -145,53 +116,35 @@ def gerar_pdf_vistoria(token):
         print(f"   nome_terceiro no pdf_data: '{pdf_data.get('nome_terceiro')}'")
         print(f"   assinatura_cliente_nome no pdf_data: '{pdf_data.get('assinatura_cliente_nome')}'")
         
-        # Adicionar campos do questionário
-        questionnaire_fields = [
-            'ar_condicionado', 'antenas', 'tapetes', 'tapete_porta_malas', 'bateria',
-            'retrovisor_direito', 'retrovisor_esquerdo', 'extintor', 'roda_comum', 'roda_especial',
-            'chave_principal', 'chave_reserva', 'manual', 'documento', 'nota_fiscal',
-            'limpador_dianteiro', 'limpador_traseiro', 'triangulo', 'macaco', 'chave_roda', 'pneu_step',
-            'carregador_eletrico'  # Novo campo adicionado
-        ]
-        
-        for field in questionnaire_fields:
-            pdf_data[field] = vistoria.get(field, False)
-        
-        # Adicionar observações
-        for i in range(1, 5):
-            obs_field = f'desc_obs_{i}'
-            pdf_data[obs_field] = vistoria.get(obs_field, '')
-            pdf_data[obs_field] = vistoria.get(obs_field, '')
-        
-        # Criar diretório para PDFs se não existir
-        pdf_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pdfs')
-        os.makedirs(pdf_dir, exist_ok=True)
-        
-        # Nome do arquivo PDF
+        # Nome do arquivo PDF (chave em pdfs/ no armazenamento)
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         pdf_filename = f'vistoria_{token}_{timestamp}.pdf'
-        pdf_path = os.path.join(pdf_dir, pdf_filename)
-        
-        # Gerar PDF usando biblioteca profissional (novo método)
-        print(f"📄 Gerando PDF profissional: {pdf_path}")
-        success = generate_professional_pdf(pdf_data, pdf_path)
+        storage = get_storage()
+        pdf_chave = storage.chave(PDF_DIR, pdf_filename, grupo=token)
         
-        if success and os.path.exists(pdf_path):
-            print(f"✅ PDF gerado com sucesso: {pdf_filename}")
-            
-            # Retornar o arquivo PDF
-            return send_file(
-                pdf_path,
-                as_attachment=True,
-                download_name=f'Vistoria_{vistoria.get("placa", token)}.pdf',
-                mimetype='application/pdf'
-            )
-        else:
-            print(f"❌ Falha ao gerar PDF")
+        # Gerar PDF usando biblioteca profissional (novo método); exceção no
+        # bloco: nada é gravado na chave
+        print(f"📄 Gerando PDF profissional: {pdf_chave}")
+        try:
+            with storage.escrever(pdf_chave, 'application/pdf') as destino:
+                if not generate_professional_pdf(pdf_data, destino):
+                    raise RuntimeError(f"Falha ao gerar PDF: {pdf_filename}")
+        except RuntimeError as e:
+            print(f"❌ {e}")
             return jsonify({
                 'success': False,
                 'message': 'Erro ao gerar PDF'
             }), 500
+        
+        print(f"✅ PDF gerado com sucesso: {pdf_filename}")
+        
+        # Retornar o arquivo PDF
+        return enviar_arquivo(
+            pdf_chave,
+            as_attachment=True,
+            download_name=f'Vistoria_{vistoria.get("placa", token)}.pdf',
+            mimetype='application/pdf'
+        )
     
     except Exception as e:
         print(f"❌ Erro ao gerar PDF: {e}")
@@ -201,13 +154,90 @@ def gerar_pdf_vistoria(token):
         }), 500
 
 
+@pdf_bp.route('/api/gerar_pdf/<token>', methods=['POST'])
+def enfileirar_pdf_vistoria(token):
+    """Enfileirar a geração do PDF; acompanhar em /api/jobs/<id>"""
+    try:
+        include_photos = request.args.get('include_photos', 'true').lower() == 'true'
+        
+        vistoria = get_vistoria_db().buscar_vistoria_por_token(token, projecao=VistoriaInfo)
+        if not vistoria:
+            return jsonify({
+                'success': False,
+                'message': 'Vistoria não encontrada'
+            }), 404
+        
+        job_id = enfileirar('gerar_pdf', {'token': token, 'include_photos': include_photos})
+        print(f"📄 PDF enfileirado para token {token}: tarefa {job_id}")
+        
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status_url': f'/api/jobs/{job_id}',
+            'download_url': f'/api/pdf/{job_id}'
+        }), 202
+    
+    except Exception as e:
+        print(f"❌ Erro ao enfileirar PDF: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'Erro interno: {str(e)}'
+        }), 500
+
+
+@pdf_bp.route('/api/pdf/<int:job_id>', methods=['GET'])
+def baixar_pdf_gerado(job_id):
+    """Baixar o PDF gerado por uma tarefa gerar_pdf concluída"""
+    try:
+        job = get_job_queue().obter(job_id)
+        if not job or job['tipo'] != 'gerar_pdf':
+            return jsonify({
+                'success': False,
+                'message': 'Tarefa não encontrada'
+            }), 404
+        
+        if job['status'] != 'concluido':
+            return jsonify({
+                'success': False,
+                'status': job['status'],
+                'message': 'PDF ainda não gerado'
+            }), 409 if job['status'] == 'morto' else 202
+        
+        resultado = job['resultado'] or {}
+        pdf_chave = resultado.get('pdf_chave')
+        pdf_path = resultado.get('pdf_path')  # tarefas anteriores ao armazenamento
+        download_name = resultado.get('download_name', os.path.basename(pdf_chave or pdf_path or ''))
+        if pdf_chave and get_storage().existe(pdf_chave):
+            return enviar_arquivo(pdf_chave, as_attachment=True,
+                                  download_name=download_name, mimetype='application/pdf')
+        if not pdf_path or not os.path.exists(pdf_path):
+            return jsonify({
+                'success': False,
+                'message': 'Arquivo do PDF não encontrado'
+            }), 410
+        
+        return send_file(
+            pdf_path,
+            as_attachment=True,
+            download_name=download_name,
+            mimetype='application/pdf'
+        )
+    
+    except Exception as e:
+        print(f"❌ Erro ao baixar PDF: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'Erro interno: {str(e)}'
+        }), 500
+
+
 @pdf_bp.route('/api/pdf_info/<token>', methods=['GET'])
 def obter_info_pdf(token):
     """Obter informações para geração de PDF"""
     try:
         # Buscar dados da vistoria no banco
         db = get_vistoria_db()
-        vistoria = db.buscar_vistoria_por_token(token)
+        vistoria = db.buscar_vistoria_por_token(token, projecao=VistoriaInfo)
         
         if not vistoria:
             return jsonify({
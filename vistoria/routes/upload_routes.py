@@ -0,0 +1,267 @@
+"""
+Upload de fotos em partes, retomável (db/uploads.py)
+
+    POST /api/uploads                      {tamanho, nome?, tipo?, sha256?} -> upload_id
+    PUT  /api/uploads/<id>                 corpo binário, cabeçalho Upload-Offset
+    GET  /api/uploads/<id>                 bytes recebidos (onde retomar)
+    POST /api/uploads/<id>/finalizar       {sha256?} -> arquivo conferido
+
+Depois de finalizada, a foto entra no envio da vistoria como
+{"category": ..., "upload_id": ...} no lugar da data URL.
+"""
+import os
+import re
+from flask import Blueprint, request, jsonify
+from werkzeug.exceptions import ClientDisconnected
+from db.database import DatabaseConfig
+from db.blobs import get_blob_store
+from db.uploads import get_upload_store, caminho_parcial, caminho_copia, RECEBENDO, CONCLUIDO
+from utils.file_utils import gravar_stream
+
+upload_bp = Blueprint('upload', __name__)
+
+OFFSET_HEADER = 'Upload-Offset'
+TAMANHO_BLOCO = 64 * 1024
+SHA256_VALIDO = re.compile(r'[0-9a-f]{64}')
+
+
+def _progresso(sessao, recebido=None):
+    """Resposta com o estado da sessão (e o cabeçalho Upload-Offset)"""
+    recebido = sessao['recebido'] if recebido is None else recebido
+    response = jsonify({
+        'success': True,
+        'upload_id': sessao['id'],
+        'status': sessao['status'],
+        'tamanho': sessao['tamanho'],
+        'offset': recebido,
+        'expira_em': sessao['expira_em'].isoformat()
+    })
+    response.headers[OFFSET_HEADER] = str(recebido)
+    return response
+
+
+def _sha256(valor):
+    valor = (valor or '').strip().lower()
+    return valor if SHA256_VALIDO.fullmatch(valor) else None
+
+
+def _sessao(upload_id):
+    """Sessão não expirada; None também para IDs malformados"""
+    try:
+        caminho_parcial(upload_id)
+    except ValueError:
+        return None
+    return get_upload_store().obter(upload_id)
+
+
+@upload_bp.route('/api/uploads', methods=['POST'])
+def criar_upload():
+    """Abrir uma sessão de upload para um arquivo de `tamanho` bytes"""
+    try:
+        data = request.get_json(silent=True) or {}
+        try:
+            tamanho = int(data.get('tamanho'))
+        except (TypeError, ValueError):
+            tamanho = 0
+        if not 0 < tamanho <= DatabaseConfig.UPLOAD_MAX_BYTES:
+            return jsonify({
+                'success': False,
+                'message': f'tamanho deve estar entre 1 e {DatabaseConfig.UPLOAD_MAX_BYTES} bytes'
+            }), 400
+        sha256 = None
+        if data.get('sha256'):
+            sha256 = _sha256(data['sha256'])
+            if sha256 is None:
+                return jsonify({'success': False, 'message': 'sha256 deve ter 64 dígitos hexadecimais'}), 400
+
+        sessao = get_upload_store().criar(
+            tamanho, nome=(data.get('nome') or '')[:255] or None,
+            mimetype=(data.get('tipo') or '')[:100] or None, sha256=sha256
+        )
+        print(f"📤 Upload {sessao['id']} criado: {tamanho} bytes")
+        response = _progresso(sessao)
+        response.headers['Location'] = f"/api/uploads/{sessao['id']}"
+        return response, 201
+
+    except Exception as e:
+        print(f"❌ Erro ao criar upload: {e}")
+        return jsonify({'success': False, 'message': f'Erro interno: {str(e)}'}), 500
+
+
+@upload_bp.route('/api/uploads/<upload_id>', methods=['GET'])
+def progresso_upload(upload_id):
+    """Bytes já recebidos: o cliente retoma o PUT a partir deste offset"""
+    try:
+        sessao = _sessao(upload_id)
+        if not sessao:
+            return jsonify({'success': False, 'message': 'Upload não encontrado ou expirado'}), 404
+        return _progresso(sessao)
+
+    except Exception as e:
+        print(f"❌ Erro ao consultar upload: {e}")
+        return jsonify({'success': False, 'message': f'Erro interno: {str(e)}'}), 500
+
+
+@upload_bp.route('/api/uploads/<upload_id>', methods=['PUT'])
+def enviar_parte(upload_id):
+    """
+    Gravar o corpo a partir de Upload-Offset (ou ?offset=)
+
+    O offset não pode passar do que já foi recebido (409 informa onde
+    retomar). Se a conexão cair no meio, os bytes que chegaram contam.
+    """
+    try:
+        sessao = _sessao(upload_id)
+        if not sessao:
+            return jsonify({'success': False, 'message': 'Upload não encontrado ou expirado'}), 404
+        if sessao['status'] != RECEBENDO:
+            return jsonify({'success': False, 'message': 'Upload já finalizado'}), 409
+
+        try:
+            offset = int(request.headers.get(OFFSET_HEADER, request.args.get('offset', '')))
+        except ValueError:
+            return jsonify({'success': False, 'message': f'{OFFSET_HEADER} obrigatório'}), 400
+        tamanho = request.content_length
+        if tamanho is None:
+            return jsonify({'success': False, 'message': 'Content-Length obrigatório'}), 411
+        if tamanho > DatabaseConfig.UPLOAD_CHUNK_MAX_BYTES:
+            return jsonify({
+                'success': False,
+                'message': f'Cada parte pode ter até {DatabaseConfig.UPLOAD_CHUNK_MAX_BYTES} bytes'
+            }), 413
+        if offset < 0 or offset + tamanho > sessao['tamanho']:
+            return jsonify({'success': False, 'message': 'Parte fora do tamanho declarado'}), 400
+        if offset > sessao['recebido']:
+            response = _progresso(sessao)
+            response.status_code = 409
+            return response
+
+        escritos = 0
+        interrompido = False
+        with open(caminho_parcial(upload_id), 'r+b') as parcial:
+            parcial.seek(offset)
+            try:
+                while escritos < tamanho:
+                    bloco = request.stream.read(min(TAMANHO_BLOCO, tamanho - escritos))
+                    if not bloco:
+                        break
+                    parcial.write(bloco)
+                    escritos += len(bloco)
+            except ClientDisconnected:
+                interrompido = True
+
+        recebido = get_upload_store().avancar(upload_id, offset, offset + escritos)
+        if recebido is None:
+            # Finalizada, expirada ou outro PUT mudou o estado enquanto gravávamos
+            sessao = _sessao(upload_id)
+            if not sessao:
+                return jsonify({'success': False, 'message': 'Upload não encontrado ou expirado'}), 404
+            response = _progresso(sessao)
+            response.status_code = 409
+            return response
+        if interrompido or escritos < tamanho:
+            print(f"⚠️ Upload {upload_id}: parte interrompida em {offset + escritos}")
+        return _progresso(sessao, recebido)
+
+    except Exception as e:
+        print(f"❌ Erro ao gravar parte do upload: {e}")
+        return jsonify({'success': False, 'message': f'Erro interno: {str(e)}'}), 500
+
+
+@upload_bp.route('/api/uploads/<upload_id>/finalizar', methods=['POST'])
+def finalizar_upload(upload_id):
+    """
+    Conferir o SHA-256 do arquivo completo e guardá-lo nos blobs
+
+    O checksum vem da criação ou deste corpo. Se não conferir, a sessão
+    volta ao offset 0 (422). Repetir a finalização de um upload concluído
+    devolve o mesmo resultado.
+
+    O checksum é calculado numa cópia das partes, e é a cópia que vai
+    para os blobs: um PUT que passou da checagem de status antes da
+    finalização continua gravando nas partes, nunca no blob conferido.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        store = get_upload_store()
+        sessao = _sessao(upload_id)
+        if not sessao:
+            return jsonify({'success': False, 'message': 'Upload não encontrado ou expirado'}), 404
+
+        esperado = sessao['sha256_esperado']
+        if data.get('sha256'):
+            informado = _sha256(data['sha256'])
+            if informado is None or (esperado and informado != esperado):
+                return jsonify({'success': False, 'message': 'sha256 inválido ou diferente do informado na criação'}), 400
+            esperado = informado
+        if not esperado:
+            return jsonify({'success': False, 'message': 'sha256 obrigatório para finalizar'}), 400
+
+        if sessao['status'] == CONCLUIDO:
+            return jsonify({'success': True, 'upload_id': upload_id, 'sha256': sessao['blob_sha256']})
+        if sessao['recebido'] < sessao['tamanho']:
+            response = _progresso(sessao)
+            response.status_code = 409
+            return response
+
+        sessao = store.iniciar_finalizacao(upload_id)
+        if not sessao:
+            return jsonify({'success': False, 'message': 'Finalização em andamento'}), 409
+
+        parcial = caminho_parcial(upload_id)
+        copia = caminho_copia(upload_id)
+        try:
+            with open(parcial, 'rb') as origem:
+                arquivo = gravar_stream(origem, copia)
+            if arquivo.size != sessao['tamanho'] or arquivo.checksum != esperado:
+                print(f"❌ Upload {upload_id}: checksum não confere ({arquivo.checksum})")
+                os.remove(copia)
+                with open(parcial, 'r+b') as f:
+                    f.truncate(0)
+                store.reiniciar(upload_id)
+                return jsonify({
+                    'success': False,
+                    'message': 'Checksum não confere: envie o arquivo novamente',
+                    'sha256_recebido': arquivo.checksum,
+                    'offset': 0
+                }), 422
+
+            blobs = get_blob_store()
+            padrao = os.path.splitext(sessao['nome'] or '')[1].lower() or '.bin'
+            caminho, _ = blobs.guardar(copia, arquivo.checksum, blobs.extensao(arquivo.mimetype, padrao))
+            store.concluir(upload_id, {
+                'sha256': arquivo.checksum,
+                'path': caminho,
+                'size': arquivo.size,
+                'mimetype': arquivo.mimetype or sessao['mimetype'],
+                'largura': arquivo.largura,
+                'altura': arquivo.altura
+            })
+        except Exception:
+            if os.path.exists(copia):
+                os.remove(copia)
+            if os.path.exists(parcial):
+                store.reiniciar(upload_id, recebido=sessao['tamanho'])
+            else:
+                store.reiniciar(upload_id)  # partes perdidas: recomeçar
+            raise
+
+        try:
+            os.remove(parcial)
+        except OSError as e:
+            print(f"⚠️ Upload {upload_id}: partes não removidas ({e}); a expiração da sessão apaga")
+
+        print(f"✅ Upload {upload_id} finalizado: {arquivo.size} bytes, {arquivo.mimetype}")
+        return jsonify({
+            'success': True,
+            'upload_id': upload_id,
+            'sha256': arquivo.checksum,
+            'tamanho': arquivo.size,
+            'tipo': arquivo.mimetype,
+            'largura': arquivo.largura,
+            'altura': arquivo.altura
+        })
+
+    except Exception as e:
+        print(f"❌ Erro ao finalizar upload: {e}")
+        return jsonify({'success': False, 'message': f'Erro interno: {str(e)}'}), 500
@@ -1,8 +1,13 @@
 """
 Rotas principais da vistoria
 """
-from flask import Blueprint, render_template, send_from_directory, session
+import os
+from flask import Blueprint, render_template, send_from_directory, send_file, session, request, jsonify, abort
+from werkzeug.security import safe_join
+from db.database import DatabaseConfig
 from routes.auth_routes import require_login
+from utils.derivadas import pedido_derivada, aceita_derivada, validar_parametros, get_derivative_cache
+from .arquivos import enviar_arquivo
 
 vistoria_bp = Blueprint('vistoria', __name__)
 
@@ -31,17 +36,59 @@ def assets_static(filename):
 
 @vistoria_bp.route('/uploads/<path:filename>')
 def uploaded_files(filename):
-    """Servir arquivos de upload com cache headers"""
+    """
+    Servir arquivos de upload com cache headers
+    
+    Imagens aceitam ?w=&fmt=&q= (utils/derivadas.py): a versão
+    redimensionada é gerada uma vez e servida do cache em disco.
+    Pastas internas (.tmp, .sessoes de uploads em partes) não são servidas.
+    Arquivos que não estão em uploads/ no disco (fotos do formulário e
+    documentos no armazenamento S3, db/storage.py) vêm do armazenamento,
+    sem derivadas.
+    """
+    if any(parte.startswith('.') for parte in filename.split('/')):
+        abort(404)
+    origem = safe_join('uploads', filename)
+    local = origem is not None and os.path.isfile(origem)
+    if not local:
+        response = enviar_arquivo(f'uploads/{filename}')
+        response.headers['Cache-Control'] = 'public, max-age=31536000'  # 1 ano
+        return response
+    
+    if pedido_derivada(request.args) and aceita_derivada(filename):
+        try:
+            largura, fmt, qualidade = validar_parametros(request.args)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        try:
+            caminho, mimetype = get_derivative_cache().obter(origem, largura, fmt, qualidade)
+        except Exception as e:
+            print(f"❌ Erro ao gerar derivada de {filename}: {e}")
+            return jsonify({'success': False, 'message': 'Não foi possível redimensionar a imagem'}), 422
+        response = send_file(caminho, mimetype=mimetype)
+        response.headers['Cache-Control'] = 'public, max-age=31536000'  # 1 ano
+        return response
+    
     response = send_from_directory('uploads', filename)
     # Adicionar headers de cache para performance
     response.headers['Cache-Control'] = 'public, max-age=31536000'  # 1 ano
     return response
 
 
+@vistoria_bp.route('/frio/<path:filename>')
+def cold_storage_files(filename):
+    """Servir fotos de vistorias expiradas movidas para DB_COLD_STORAGE_DIR (db/sweeper.py)"""
+    if not DatabaseConfig.COLD_STORAGE_DIR:
+        abort(404)
+    response = send_from_directory(DatabaseConfig.COLD_STORAGE_DIR, filename)
+    response.headers['Cache-Control'] = 'private, max-age=86400'  # 1 dia
+    return response
+
+
 @vistoria_bp.route('/assinaturas/<path:filename>')
 def signature_files(filename):
-    """Servir arquivos de assinatura com cache headers"""
-    response = send_from_directory('assinaturas', filename)
+    """Servir arquivos de assinatura (armazenamento, db/storage.py) com cache headers"""
+    response = enviar_arquivo(f'assinaturas/{filename}')
     # Cache menos agressivo para assinaturas
     response.headers['Cache-Control'] = 'private, max-age=86400'  # 1 dia
     return response
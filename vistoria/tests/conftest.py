@@ -0,0 +1,5 @@
+"""Testes rodam a partir da pasta vistoria/ (mesmos imports da aplicação)"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
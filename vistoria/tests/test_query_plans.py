@@ -0,0 +1,55 @@
+"""
+Nenhuma consulta do VistoriaDatabase pode fazer Seq Scan
+
+Mesmo teste de `python -m db.migrations check-plans`, para o CI. Precisa
+de um banco descartável: TEST_DATABASE_URL=postgresql://... pytest
+As migrações são aplicadas e, se o banco estiver vazio, dados sintéticos
+são inseridos.
+"""
+import os
+
+import pytest
+
+pytest.importorskip('psycopg2')
+
+TEST_DATABASE_URL = os.getenv('TEST_DATABASE_URL')
+
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason='TEST_DATABASE_URL não definida')
+
+VISTORIAS_SINTETICAS = 5000
+
+
+@pytest.fixture(scope='module')
+def conn():
+    import psycopg2
+    from psycopg2.extras import RealDictCursor
+    from db.migrations import apply_migrations, seed_dados
+
+    conn = psycopg2.connect(TEST_DATABASE_URL, cursor_factory=RealDictCursor)
+    try:
+        apply_migrations(conn)
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT EXISTS (SELECT 1 FROM fotos_vistoria) AS tem")
+            vazio = not cursor.fetchone()['tem']
+        conn.rollback()
+        if vazio:
+            seed_dados(conn, VISTORIAS_SINTETICAS)
+        yield conn
+    finally:
+        conn.close()
+
+
+def test_consultas_sem_seq_scan(conn):
+    from db.migrations import consultas_para_verificar, seq_scans_consulta
+
+    reprovadas = {}
+    with conn.cursor() as cursor:
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        consultas = consultas_para_verificar(cursor)
+        assert {'expirar_vistorias', 'inserir_observacao_foto'} <= {nome for nome, _, _ in consultas}
+        for nome, sql, params in consultas:
+            seq = seq_scans_consulta(cursor, sql, params)
+            if seq:
+                reprovadas[nome] = seq
+    conn.rollback()
+    assert not reprovadas, f"Seq Scan (falta índice): {reprovadas}"
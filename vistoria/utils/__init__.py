@@ -2,7 +2,7 @@
 Utilitários
 """
 from .file_utils import calculate_file_checksum, save_signature_image, save_uploaded_photo
-from .photo_utils import process_vistoria_photos
+from .photo_utils import process_vistoria_photos, uploads_ausentes
 from .vistoria_utils import save_vistoria_complete
 
 __all__ = [
@@ -10,5 +10,6 @@ __all__ = [
     'save_signature_image', 
     'save_uploaded_photo',
     'process_vistoria_photos',
+    'uploads_ausentes',
     'save_vistoria_complete'
 ]
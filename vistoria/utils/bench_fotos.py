@@ -0,0 +1,91 @@
+"""
+Benchmark da gravação de fotos: tempo total x número de fotos x threads
+
+Gera JPEGs sintéticos do tamanho de uma foto de celular (todos
+diferentes, para não cair na deduplicação dos blobs), monta as data URLs
+como no envio da vistoria e mede prepare_vistoria_photos em uma pasta
+temporária, com um BlobStore novo a cada repetição. A partir da pasta vistoria/:
+    python -m utils.bench_fotos [--fotos 5 10 20 40] [--workers 1 2 4 8] [--largura 4000]
+"""
+import io
+import os
+import sys
+import time
+import base64
+import shutil
+import argparse
+import tempfile
+from contextlib import redirect_stdout
+from PIL import Image
+import db.blobs
+from db.blobs import BlobStore
+from .photo_utils import prepare_vistoria_photos
+
+
+def gerar_fotos(quantidade: int, largura: int, altura: int) -> list:
+    """Fotos no formato do array 'photos' (ruído novo em cada uma: nenhuma se repete)"""
+    fotos = []
+    for i in range(quantidade):
+        buffer = io.BytesIO()
+        Image.effect_noise((largura, altura), 64).convert('RGB').save(buffer, 'JPEG', quality=90)
+        fotos.append({
+            'category': f'foto_bench_{i}',
+            'name': f'foto_bench_{i}.jpg',
+            'type': 'image/jpeg',
+            'url': 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode()
+        })
+    return fotos
+
+
+def medir(fotos: list, workers: int, repeticoes: int) -> float:
+    """Melhor tempo (s) de prepare_vistoria_photos em uma pasta limpa"""
+    melhor = None
+    origem = os.getcwd()
+    store_global = db.blobs._blob_store
+    for _ in range(repeticoes):
+        pasta = tempfile.mkdtemp(prefix='bench_fotos_')
+        try:
+            os.chdir(pasta)
+            # O BlobStore global guarda o caminho absoluto do primeiro uso
+            db.blobs._blob_store = BlobStore(raiz=os.path.join(pasta, 'uploads', 'blobs'))
+            with redirect_stdout(io.StringIO()):
+                inicio = time.perf_counter()
+                salvas = prepare_vistoria_photos(fotos, 'bench', workers=workers)
+                decorrido = time.perf_counter() - inicio
+            if len(salvas) != len(fotos):
+                raise RuntimeError(f'{len(fotos) - len(salvas)} fotos falharam')
+        finally:
+            db.blobs._blob_store = store_global
+            os.chdir(origem)
+            shutil.rmtree(pasta, ignore_errors=True)
+        melhor = decorrido if melhor is None else min(melhor, decorrido)
+    return melhor
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark da gravação paralela de fotos')
+    parser.add_argument('--fotos', type=int, nargs='+', default=[5, 10, 20, 40])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--largura', type=int, default=4000)
+    parser.add_argument('--altura', type=int, default=3000)
+    parser.add_argument('--repeticoes', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    print(f"🖼️ Gerando {max(args.fotos)} fotos {args.largura}x{args.altura}...")
+    todas = gerar_fotos(max(args.fotos), args.largura, args.altura)
+    tamanho_medio = sum(len(f['url']) for f in todas) / len(todas) * 3 / 4 / 1024 / 1024
+    print(f"   ~{tamanho_medio:.1f} MB por foto, CPUs: {os.cpu_count()}")
+    print()
+
+    cabecalho = f"{'fotos':>6} | " + ' | '.join(f"{w:>2} thr (s)" for w in args.workers) + ' | speedup'
+    print(cabecalho)
+    print('-' * len(cabecalho))
+    for quantidade in args.fotos:
+        tempos = [medir(todas[:quantidade], w, args.repeticoes) for w in args.workers]
+        print(f"{quantidade:>6} | " + ' | '.join(f"{t:>10.3f}" for t in tempos)
+              + f" | {tempos[0] / min(tempos):>6.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,244 @@
+"""
+Derivadas redimensionadas das imagens de uploads/ (?w=480&fmt=webp&q=70)
+
+Cada combinação (arquivo, largura, formato, qualidade) é gerada uma vez
+e guardada em DERIVATIVE_CONFIG['FOLDER']; a chave inclui mtime e tamanho
+do original, então um arquivo substituído gera outra derivada. Só as
+larguras e qualidades da lista branca são aceitas.
+
+O cache tem limite de bytes (LRU pelo mtime, renovado a cada acerto): ao
+passar do limite, as derivadas mais antigas são apagadas até 90% dele.
+Pedidos simultâneos da mesma derivada esperam uma única geração (lock
+por chave no processo); entre processos, no máximo uma geração repetida,
+gravada com os.replace.
+"""
+import os
+import hashlib
+import tempfile
+import threading
+from contextlib import contextmanager
+from PIL import Image, ImageOps
+from config import DERIVATIVE_CONFIG, UPLOAD_CONFIG
+
+# fmt da URL -> (formato do PIL, MIME, extensão)
+FORMATOS = {
+    'jpeg': ('JPEG', 'image/jpeg', '.jpg'),
+    'jpg': ('JPEG', 'image/jpeg', '.jpg'),
+    'webp': ('WEBP', 'image/webp', '.webp'),
+}
+PARAMETROS = ('w', 'fmt', 'q')
+FRACAO_APOS_LIMPEZA = 0.9
+
+
+def pedido_derivada(args) -> bool:
+    """A URL pede uma derivada (algum de w, fmt, q)?"""
+    return any(p in args for p in PARAMETROS)
+
+
+def aceita_derivada(filename: str) -> bool:
+    """Só imagens (extensões de UPLOAD_CONFIG) têm derivadas; o resto é servido como está"""
+    return os.path.splitext(filename)[1].lower().lstrip('.') in UPLOAD_CONFIG['ALLOWED_EXTENSIONS']
+
+
+def validar_parametros(args) -> tuple:
+    """
+    Validar w, fmt e q contra a lista branca
+
+    Returns:
+        tuple: (largura, fmt, qualidade)
+
+    Raises:
+        ValueError: parâmetro ausente ou fora da lista (mensagem para o cliente)
+    """
+    larguras = DERIVATIVE_CONFIG['WIDTHS']
+    qualidades = DERIVATIVE_CONFIG['QUALITIES']
+    try:
+        largura = int(args.get('w', ''))
+    except ValueError:
+        largura = None
+    if largura not in larguras:
+        raise ValueError(f"w deve ser um de {', '.join(map(str, larguras))}")
+
+    fmt = args.get('fmt', 'jpeg').lower()
+    if fmt not in FORMATOS:
+        raise ValueError(f"fmt deve ser um de {', '.join(FORMATOS)}")
+
+    try:
+        qualidade = int(args.get('q', DERIVATIVE_CONFIG['DEFAULT_QUALITY']))
+    except ValueError:
+        qualidade = None
+    if qualidade not in qualidades:
+        raise ValueError(f"q deve ser um de {', '.join(map(str, qualidades))}")
+    return largura, fmt, qualidade
+
+
+class CacheDerivadas:
+    """Derivadas em disco com limite de tamanho e geração única por chave"""
+
+    def __init__(self, pasta, max_bytes):
+        self.pasta = os.path.abspath(pasta)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._gerando = {}  # chave -> [lock, pedidos aguardando]
+        self._total = None  # bytes no cache (varredura na primeira escrita)
+
+        # Estatísticas
+        self._acertos = 0
+        self._geradas = 0
+        self._removidas = 0
+
+    def _chave(self, origem, largura, fmt, qualidade):
+        st = os.stat(origem)
+        base = f'{os.path.abspath(origem)}|{st.st_mtime_ns}|{st.st_size}|{largura}|{fmt}|{qualidade}'
+        return hashlib.sha256(base.encode('utf-8')).hexdigest()
+
+    def _caminho(self, chave, extensao):
+        return os.path.join(self.pasta, chave[:2], chave + extensao)
+
+    @staticmethod
+    def _tocar(caminho):
+        """Renovar o mtime (uso recente); False se a derivada não existe"""
+        try:
+            os.utime(caminho)
+            return True
+        except FileNotFoundError:
+            return False
+
+    @contextmanager
+    def _exclusivo(self, chave):
+        """Uma geração por chave; os demais pedidos esperam por ela"""
+        with self._lock:
+            entrada = self._gerando.setdefault(chave, [threading.Lock(), 0])
+            entrada[1] += 1
+        try:
+            with entrada[0]:
+                yield
+        finally:
+            with self._lock:
+                entrada[1] -= 1
+                if not entrada[1]:
+                    del self._gerando[chave]
+
+    def obter(self, origem, largura, fmt, qualidade):
+        """
+        Caminho da derivada de `origem`, gerando-a se preciso
+
+        Returns:
+            tuple: (caminho, mimetype)
+
+        Raises:
+            FileNotFoundError: origem não existe
+        """
+        formato, mimetype, extensao = FORMATOS[fmt]
+        chave = self._chave(origem, largura, formato, qualidade)
+        destino = self._caminho(chave, extensao)
+        if self._tocar(destino):
+            with self._lock:
+                self._acertos += 1
+            return destino, mimetype
+
+        with self._exclusivo(chave):
+            if self._tocar(destino):  # gerada enquanto esperávamos
+                with self._lock:
+                    self._acertos += 1
+                return destino, mimetype
+            tamanho = self._gerar(origem, destino, largura, formato, qualidade)
+
+        self._registrar(destino, tamanho)
+        return destino, mimetype
+
+    def _gerar(self, origem, destino, largura, formato, qualidade):
+        with Image.open(origem) as original:
+            if original.format == 'JPEG':
+                original.draft('RGB', (largura, largura))
+            img = ImageOps.exif_transpose(original)
+        if img.width > largura:
+            img = img.resize((largura, max(1, round(img.height * largura / img.width))), Image.LANCZOS)
+
+        transparente = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+        if formato == 'WEBP':
+            img = img.convert('RGBA' if transparente else 'RGB')
+            opcoes = {'quality': qualidade, 'method': 4}
+        else:
+            img = img.convert('RGB')
+            opcoes = {'quality': qualidade, 'optimize': True, 'progressive': True}
+
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        fd, temporario = tempfile.mkstemp(suffix='.part', dir=os.path.dirname(destino))
+        try:
+            with os.fdopen(fd, 'wb') as arquivo:
+                img.save(arquivo, formato, **opcoes)
+            os.replace(temporario, destino)
+        except Exception:
+            os.remove(temporario)
+            raise
+        return os.path.getsize(destino)
+
+    def _registrar(self, destino, tamanho):
+        """Somar a nova derivada e limpar se o cache passou do limite"""
+        with self._lock:
+            self._geradas += 1
+            if self._total is None:
+                self._total = sum(t for _, t, _ in self._listar())
+            else:
+                self._total += tamanho
+            if self._total <= self.max_bytes:
+                return
+            self._limpar(manter=destino)
+
+    def _listar(self):
+        """(mtime, tamanho, caminho) de cada derivada"""
+        for pasta, _, arquivos in os.walk(self.pasta):
+            for nome in arquivos:
+                caminho = os.path.join(pasta, nome)
+                try:
+                    st = os.stat(caminho)
+                except FileNotFoundError:
+                    continue
+                yield st.st_mtime, st.st_size, caminho
+
+    def _limpar(self, manter):
+        """
+        Apagar as derivadas menos usadas até FRACAO_APOS_LIMPEZA do limite
+        (com self._lock); `manter` é a que acabou de ser gerada e vai ser servida
+        """
+        derivadas = sorted(self._listar())
+        total = sum(t for _, t, _ in derivadas)
+        alvo = self.max_bytes * FRACAO_APOS_LIMPEZA
+        for _, tamanho, caminho in derivadas:
+            if total <= alvo:
+                break
+            if caminho == manter or caminho.endswith('.part'):
+                continue
+            try:
+                os.remove(caminho)
+            except FileNotFoundError:
+                pass
+            total -= tamanho
+            self._removidas += 1
+        self._total = total
+
+    def stats(self):
+        with self._lock:
+            return {
+                'bytes': self._total,
+                'max_bytes': self.max_bytes,
+                'hits': self._acertos,
+                'generated': self._geradas,
+                'evicted': self._removidas,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_derivative_cache() -> CacheDerivadas:
+    """Obter instância global do cache de derivadas"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = CacheDerivadas(DERIVATIVE_CONFIG['FOLDER'], DERIVATIVE_CONFIG['MAX_BYTES'])
+        return _cache
+
+def get_derivative_cache_stats():
+    return get_derivative_cache().stats()
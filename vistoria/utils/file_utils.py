@@ -1,11 +1,324 @@
 """
 Utilitários para manipulação de arquivos
 """
+import io
 import os
 import base64
 import hashlib
 from datetime import datetime
-from PIL import Image
+from PIL import Image, ImageOps
+from db.storage import get_storage
+
+TAMANHO_BLOCO = 64 * 1024
+# Cabeçalho guardado para descobrir formato e dimensões (JPEG com EXIF
+# grande pode ter o SOF depois de dezenas de KB)
+MAX_CABECALHO = 512 * 1024
+_TENTATIVAS_CABECALHO = (4 * 1024, 16 * 1024, 64 * 1024, 256 * 1024, MAX_CABECALHO)
+_SEM_ESPACOS = str.maketrans('', '', ' \t\n\r')
+
+# Assinaturas de arquivos que não são imagem
+_MAGICOS = (
+    (b'%PDF', 'application/pdf'),
+    (b'PK\x03\x04', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'),
+    (b'\xd0\xcf\x11\xe0', 'application/msword'),
+)
+
+# Segmentos JPEG descartados ao tirar metadados sem reencodar:
+# APP1 (EXIF/XMP), APP13 (IPTC/Photoshop) e COM
+_JPEG_METADADOS = {0xE1, 0xED, 0xFE}
+
+
+class ArquivoIngerido:
+    """Resultado de GravadorArquivo: caminho, tamanho, SHA-256, MIME e dimensões"""
+    
+    __slots__ = ('path', 'size', 'checksum', 'mimetype', 'largura', 'altura')
+    
+    def __init__(self, path, size, checksum, mimetype, largura, altura):
+        self.path = path
+        self.size = size
+        self.checksum = checksum
+        self.mimetype = mimetype
+        self.largura = largura
+        self.altura = altura
+    
+    def __repr__(self):
+        return f'<ArquivoIngerido {self.path} {self.mimetype} {self.size} bytes>'
+
+
+class GravadorArquivo:
+    """
+    Grava um arquivo em uma única passagem
+    
+    Cada bloco escrito atualiza o SHA-256 e o tamanho; os primeiros bytes
+    identificam o MIME e, para imagens, as dimensões (só o cabeçalho é
+    lido pelo PIL, sem decodificar pixels). Nenhuma releitura do disco.
+    Como context manager, apaga o arquivo parcial se houver exceção.
+    Com gravar=False só calcula (o arquivo já existe em file_path); um
+    arquivo já aberto (ex.: db.storage escrever) recebe os bytes e não é
+    fechado nem apagado aqui.
+    """
+    
+    def __init__(self, file_path, gravar=True):
+        self.path = file_path
+        self._arquivo = None
+        self._proprio = False
+        if hasattr(file_path, 'write'):
+            self.path = None
+            self._arquivo = file_path
+        elif gravar:
+            self._proprio = True
+            pasta = os.path.dirname(file_path)
+            if pasta:
+                os.makedirs(pasta, exist_ok=True)
+            self._arquivo = open(file_path, 'wb')
+        self._hash = hashlib.sha256()
+        self._cabecalho = bytearray()
+        self._proxima_tentativa = 0
+        self.size = 0
+        self.mimetype = None
+        self.largura = None
+        self.altura = None
+    
+    def write(self, dados):
+        if not dados:
+            return
+        if self._arquivo is not None:
+            self._arquivo.write(dados)
+        self._hash.update(dados)
+        self.size += len(dados)
+        if self._proxima_tentativa is not None:
+            self._farejar(dados)
+    
+    def _farejar(self, dados):
+        self._cabecalho.extend(dados[:MAX_CABECALHO - len(self._cabecalho)])
+        if self.size < _TENTATIVAS_CABECALHO[self._proxima_tentativa] and len(self._cabecalho) < MAX_CABECALHO:
+            return
+        while (self._proxima_tentativa < len(_TENTATIVAS_CABECALHO) - 1
+               and _TENTATIVAS_CABECALHO[self._proxima_tentativa] <= self.size):
+            self._proxima_tentativa += 1
+        if self._identificar() or len(self._cabecalho) >= MAX_CABECALHO:
+            self._encerrar_farejo()
+    
+    def _identificar(self):
+        """Tentar descobrir MIME/dimensões com o cabeçalho atual"""
+        cabecalho = bytes(self._cabecalho)
+        for magico, mimetype in _MAGICOS:
+            if cabecalho.startswith(magico):
+                self.mimetype = mimetype
+                return True
+        try:
+            with Image.open(io.BytesIO(cabecalho)) as img:
+                self.largura, self.altura = img.size
+                # JPEG de celular com várias imagens (MPO) continua sendo JPEG
+                self.mimetype = 'image/jpeg' if img.format == 'MPO' else Image.MIME.get(img.format)
+            return True
+        except Exception:
+            # O plugin WebP do PIL precisa do arquivo inteiro: ao menos o MIME
+            if cabecalho[:4] == b'RIFF' and cabecalho[8:12] == b'WEBP':
+                self.mimetype = 'image/webp'
+            return False
+    
+    def _encerrar_farejo(self):
+        self._proxima_tentativa = None
+        self._cabecalho = bytearray()
+    
+    def fechar(self):
+        """Fechar o arquivo e retornar o ArquivoIngerido"""
+        if self._proxima_tentativa is not None:
+            self._identificar()
+            self._encerrar_farejo()
+        if self._proprio:
+            self._arquivo.close()
+        return ArquivoIngerido(self.path, self.size, self._hash.hexdigest(),
+                               self.mimetype, self.largura, self.altura)
+    
+    def descartar(self):
+        """Fechar e apagar o arquivo parcial"""
+        if not self._proprio:
+            return
+        self._arquivo.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.descartar()
+        elif self._proprio and not self._arquivo.closed:
+            self._arquivo.close()
+        return False
+
+
+class EscritorBase64:
+    """Decodifica base64 recebido aos pedaços para um GravadorArquivo"""
+    
+    def __init__(self, gravador):
+        self.gravador = gravador
+        self._resto = ''
+    
+    def escrever(self, texto):
+        texto = self._resto + texto.translate(_SEM_ESPACOS)
+        corte = len(texto) - len(texto) % 4
+        self._resto = texto[corte:]
+        if corte:
+            self.gravador.write(base64.b64decode(texto[:corte]))
+    
+    def finalizar(self):
+        if self._resto:
+            self.gravador.write(base64.b64decode(self._resto + '=' * (-len(self._resto) % 4)))
+            self._resto = ''
+        return self.gravador.fechar()
+
+
+def normalizar_imagem(arquivo: ArquivoIngerido, file_path: str, max_lado: int = 2048,
+                      formato: str = 'JPEG', qualidade: int = 82):
+    """
+    Gravar em file_path a foto orientada pelo EXIF, com o maior lado
+    limitado a max_lado e reencodada em JPEG/WEBP sem EXIF/XMP
+    (o perfil ICC é mantido)
+    
+    O JPEG é decodificado já reduzido (draft) quando a redução passa de 2x.
+    Imagens com transparência viram PNG se o formato for JPEG.
+    Um JPEG que não precisa girar nem reduzir e que ficaria maior
+    reencodado é regravado sem os segmentos de metadados (sem perda).
+    
+    Returns:
+        ArquivoIngerido do resultado, ou None (não é imagem ou é animada)
+    """
+    if not (arquivo.mimetype or '').startswith('image/'):
+        return None
+    try:
+        with Image.open(arquivo.path) as original:
+            if getattr(original, 'n_frames', 1) > 1 and original.format != 'MPO':
+                return None
+            orientacao = original.getexif().get(0x0112, 1)
+            fonte_jpeg = original.format in ('JPEG', 'MPO')
+            icc = original.info.get('icc_profile')
+            if original.format == 'JPEG':
+                original.draft('RGB', (max_lado, max_lado))
+            img = ImageOps.exif_transpose(original)
+            img.thumbnail((max_lado, max_lado), Image.LANCZOS)
+    except Exception as e:
+        print(f"⚠️ Não foi possível normalizar {arquivo.path}: {e}")
+        return None
+    
+    transparente = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+    opcoes = {'icc_profile': icc} if icc else {}
+    if formato == 'WEBP':
+        img = img.convert('RGBA' if transparente else 'RGB')
+        opcoes.update(quality=qualidade, method=4)
+    elif transparente:
+        formato = 'PNG'
+        img = img.convert('RGBA')
+        opcoes.update(optimize=True)
+    else:
+        formato = 'JPEG'
+        img = img.convert('RGB')
+        opcoes.update(quality=qualidade, optimize=True, progressive=True)
+    
+    with GravadorArquivo(file_path) as gravador:
+        img.save(gravador, formato, **opcoes)
+        resultado = gravador.fechar()
+    resultado.mimetype = resultado.mimetype or Image.MIME[formato]
+    if resultado.largura is None:
+        resultado.largura, resultado.altura = img.size
+    
+    inalterada = orientacao == 1 and (resultado.largura, resultado.altura) == (arquivo.largura, arquivo.altura)
+    if inalterada and fonte_jpeg and resultado.size >= arquivo.size:
+        with GravadorArquivo(file_path) as gravador:
+            _copiar_jpeg_sem_metadados(arquivo.path, gravador)
+            resultado = gravador.fechar()
+    return resultado
+
+
+def _copiar_jpeg_sem_metadados(origem: str, gravador):
+    """
+    Copiar o JPEG em origem para gravador sem APP1/APP13/COM
+    
+    Os dados comprimidos não são tocados. Só a primeira imagem é copiada:
+    as imagens extras de um MPO (e o índice MPF em APP2) são descartadas,
+    pois também levam EXIF.
+    
+    Raises:
+        ValueError: o arquivo não é um JPEG válido
+    """
+    with open(origem, 'rb') as arquivo:
+        dados = arquivo.read()
+    if dados[:2] != b'\xff\xd8':
+        raise ValueError('não é JPEG')
+    gravador.write(dados[:2])
+    pos = 2
+    while pos + 4 <= len(dados):
+        if dados[pos] != 0xFF:
+            raise ValueError(f'marcador inválido na posição {pos}')
+        marcador = dados[pos + 1]
+        if marcador == 0xFF:  # preenchimento
+            pos += 1
+            continue
+        tamanho = int.from_bytes(dados[pos + 2:pos + 4], 'big')
+        fim = pos + 2 + tamanho
+        segmento = dados[pos:fim]
+        if marcador == 0xDA:  # SOS: dados comprimidos até o EOI
+            eoi = dados.find(b'\xff\xd9', fim)
+            gravador.write(dados[pos:eoi + 2 if eoi >= 0 else len(dados)])
+            return
+        mpf = marcador == 0xE2 and segmento[4:8] == b'MPF\x00'
+        if marcador not in _JPEG_METADADOS and not mpf:
+            gravador.write(segmento)
+        pos = fim
+    raise ValueError('JPEG sem dados de imagem')
+
+
+def gravar_stream(stream, file_path) -> ArquivoIngerido:
+    """Copiar um stream binário para file_path (ou arquivo aberto) em uma passagem"""
+    with GravadorArquivo(file_path) as gravador:
+        for bloco in iter(lambda: stream.read(TAMANHO_BLOCO), b''):
+            gravador.write(bloco)
+        return gravador.fechar()
+
+
+def ingerir_arquivo(file_path: str) -> ArquivoIngerido:
+    """Checksum, MIME e dimensões de um arquivo já gravado (uma leitura)"""
+    gravador = GravadorArquivo(file_path, gravar=False)
+    with open(file_path, 'rb') as arquivo:
+        for bloco in iter(lambda: arquivo.read(TAMANHO_BLOCO), b''):
+            gravador.write(bloco)
+    return gravador.fechar()
+
+
+def gravar_data_url(data_url: str, file_path) -> ArquivoIngerido:
+    """Decodificar uma data URL base64 para file_path (ou arquivo aberto) em blocos"""
+    _, data = data_url.split(',', 1)
+    passo = TAMANHO_BLOCO // 3 * 4
+    with GravadorArquivo(file_path) as gravador:
+        escritor = EscritorBase64(gravador)
+        for inicio in range(0, len(data), passo):
+            escritor.escrever(data[inicio:inicio + passo])
+        return escritor.finalizar()
+
+
+def ler_arquivo_salvo(caminho: str) -> io.BytesIO:
+    """
+    Conteúdo de um arquivo pequeno gravado pela aplicação (ex.: assinatura)
+    
+    caminho é a chave no armazenamento (db/storage.py); caminhos absolutos
+    e com barras do Windows de registros antigos também são aceitos.
+    
+    Raises:
+        FileNotFoundError: o arquivo não existe
+    """
+    if os.path.isabs(caminho):
+        with open(caminho, 'rb') as arquivo:
+            return io.BytesIO(arquivo.read())
+    try:
+        with get_storage().abrir(caminho.replace('\\', '/')) as arquivo:
+            return io.BytesIO(arquivo.read())
+    except ValueError as e:  # chave inválida
+        raise FileNotFoundError(caminho) from e
 
 
 def calculate_file_checksum(file_path: str) -> str:
@@ -41,40 +354,24 @@ def save_signature_image(signature_data: str, token: str) -> dict:
         dict: Informações do arquivo salvo
     """
     try:
-        # Criar diretório de assinaturas se não existir
-        signatures_dir = 'assinaturas'
-        if not os.path.exists(signatures_dir):
-            os.makedirs(signatures_dir)
-        
-        # Extrair dados base64 da data URL
-        header, data = signature_data.split(',', 1)
-        
-        # Decodificar base64
-        image_data = base64.b64decode(data)
-        
-        # Gerar nome único para o arquivo
+        # Gerar nome único para o arquivo (chave no armazenamento, agrupada pelo token)
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f'assinatura_{token}_{timestamp}.png'
-        file_path = os.path.join(signatures_dir, filename)
-        
-        # Salvar arquivo
-        with open(file_path, 'wb') as f:
-            f.write(image_data)
+        storage = get_storage()
+        chave = storage.chave('assinaturas', filename, grupo=token)
         
-        # Calcular checksum
-        checksum = calculate_file_checksum(file_path)
+        # Decodificar e salvar (checksum e tamanho calculados na gravação)
+        with storage.escrever(chave, 'image/png') as destino:
+            arquivo = gravar_data_url(signature_data, destino)
         
-        # Obter informações do arquivo
-        file_size = os.path.getsize(file_path)
-        
-        print(f"✅ Assinatura salva: {file_path}")
+        print(f"✅ Assinatura salva: {chave}")
         
         return {
-            'path': file_path,
+            'path': chave,
             'filename': filename,
-            'size': file_size,
-            'checksum': checksum,
-            'mime_type': 'image/png'
+            'size': arquivo.size,
+            'checksum': arquivo.checksum,
+            'mime_type': arquivo.mimetype or 'image/png'
         }
         
     except Exception as e:
@@ -95,45 +392,29 @@ def save_uploaded_photo(file, category: str, vistoria_token: str) -> dict:
         dict: Informações do arquivo salvo
     """
     try:
-        # Criar diretório de uploads se não existir
-        uploads_dir = 'uploads/fotos'
-        if not os.path.exists(uploads_dir):
-            os.makedirs(uploads_dir)
-        
         # Gerar nome único para o arquivo
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         extension = file.filename.split('.')[-1] if '.' in file.filename else 'jpg'
         filename = f'{category}_{vistoria_token}_{timestamp}.{extension}'
-        file_path = os.path.join(uploads_dir, filename)
-        
-        # Salvar arquivo
-        file.save(file_path)
-        
-        # Obter informações da imagem
-        try:
-            with Image.open(file_path) as img:
-                width, height = img.size
-        except:
-            width, height = None, None
-        
-        # Calcular checksum
-        checksum = calculate_file_checksum(file_path)
+        storage = get_storage()
+        chave = storage.chave('uploads/fotos', filename)
         
-        # Obter informações do arquivo
-        file_size = os.path.getsize(file_path)
+        # Salvar arquivo (checksum, tamanho e dimensões na mesma passagem)
+        with storage.escrever(chave, file.content_type) as destino:
+            arquivo = gravar_stream(file.stream, destino)
         
-        print(f"✅ Foto salva: {file_path}")
+        print(f"✅ Foto salva: {chave}")
         
         return {
-            'path': file_path,
+            'path': chave,
             'filename': filename,
             'nome': file.filename,
-            'size': file_size,
-            'checksum': checksum,
-            'mime_type': file.content_type,
-            'largura': width,
-            'altura': height,
-            'url': f'/uploads/fotos/{filename}'
+            'size': arquivo.size,
+            'checksum': arquivo.checksum,
+            'mime_type': arquivo.mimetype or file.content_type,
+            'largura': arquivo.largura,
+            'altura': arquivo.altura,
+            'url': f'/{chave}'
         }
         
     except Exception as e:
@@ -0,0 +1,326 @@
+"""
+Leitura em streaming do JSON de envio de vistoria
+
+O corpo de /api/salvar_vistoria_completa chega a 50 MB, quase tudo data
+URLs base64. Em vez de request.get_json() (corpo bruto + dict com as
+strings base64 + bytes decodificados ao mesmo tempo), o corpo é lido em
+blocos e as data URLs dos caminhos de arquivo são decodificadas direto
+para arquivos temporários (GravadorArquivo: SHA-256, tamanho e dimensões
+calculados na mesma passagem); no dict resultante viram ArquivoDataUrl.
+O pico de memória fica limitado ao tamanho do bloco, não ao do corpo.
+"""
+import os
+import re
+import binascii
+import codecs
+import tempfile
+from .file_utils import GravadorArquivo, EscritorBase64
+
+# Caminhos cujas data URLs vão para arquivo ('*' = qualquer índice/chave)
+CAMINHOS_ARQUIVO = (
+    ('photos', '*', 'url'),
+    ('fotos', '*', 'url'),
+    ('documento', 'file'),
+)
+
+TAMANHO_BLOCO = 64 * 1024
+MAX_CABECALHO_DATA_URL = 256
+PASTA_TEMP = os.path.join('uploads', '.tmp')
+
+_HEX = frozenset('0123456789abcdefABCDEF')
+_ESPECIAL = re.compile(r'["\\]')
+_NUMERO = re.compile(r'-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?')
+_ESPACOS = ' \t\n\r'
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+class JSONStreamError(ValueError):
+    """Corpo JSON malformado"""
+
+
+class ArquivoDataUrl:
+    """Data URL base64 já decodificada em um arquivo temporário"""
+
+    __slots__ = ('mime', 'arquivo')
+
+    def __init__(self, mime, arquivo):
+        self.mime = mime
+        self.arquivo = arquivo
+
+    @property
+    def path(self):
+        return self.arquivo.path
+
+    @property
+    def size(self):
+        return self.arquivo.size
+
+    def __bool__(self):
+        return True
+
+    def __repr__(self):
+        return f'<ArquivoDataUrl {self.mime} {self.size} bytes>'
+
+    def mover_para(self, destino):
+        """Mover o temporário para o destino final; retorna o ArquivoIngerido"""
+        os.replace(self.arquivo.path, destino)
+        self.arquivo.path = destino
+        return self.arquivo
+
+
+class _Parser:
+    def __init__(self, stream, caminhos, pasta, tamanho_bloco):
+        self.stream = stream
+        self.caminhos = caminhos
+        self.pasta = pasta
+        self.tamanho_bloco = tamanho_bloco
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+        self.consumidos = 0  # bytes do corpo antes de buf
+        self.fim = False
+        self.arquivos = []
+
+    # --- leitura ---
+
+    def _carregar(self):
+        """Ler mais um bloco; False no fim do corpo"""
+        if self.fim:
+            return False
+        bloco = self.stream.read(self.tamanho_bloco)
+        self.consumidos += len(self.buf[:self.pos].encode('utf-8'))
+        if not bloco:
+            self.fim = True
+            self.buf = self.buf[self.pos:] + self.decoder.decode(b'', final=True)
+            self.pos = 0
+            return bool(self.buf)
+        self.buf = self.buf[self.pos:] + self.decoder.decode(bloco)
+        self.pos = 0
+        return True
+
+    def _garantir(self, n=1):
+        while len(self.buf) - self.pos < n:
+            if not self._carregar():
+                return False
+        return True
+
+    def _posicao(self, pos=None):
+        """Posição no corpo, em bytes, de buf[pos] (padrão: a atual)"""
+        return self.consumidos + len(self.buf[:self.pos if pos is None else pos].encode('utf-8'))
+
+    def _pular_espacos(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _ESPACOS:
+                self.pos += 1
+            if self.pos < len(self.buf) or not self._carregar():
+                return
+
+    def _proximo(self):
+        self._pular_espacos()
+        if not self._garantir():
+            raise JSONStreamError('Fim inesperado do JSON')
+        return self.buf[self.pos]
+
+    def _esperar(self, caractere):
+        if self._proximo() != caractere:
+            raise JSONStreamError(f"Esperado '{caractere}' no JSON")
+        self.pos += 1
+
+    # --- valores ---
+
+    def _e_arquivo(self, caminho):
+        return any(
+            len(padrao) == len(caminho)
+            and all(p == '*' or p == c for p, c in zip(padrao, caminho))
+            for padrao in self.caminhos
+        )
+
+    def valor(self, caminho):
+        c = self._proximo()
+        if c == '{':
+            return self._objeto(caminho)
+        if c == '[':
+            return self._lista(caminho)
+        if c == '"':
+            self.pos += 1
+            if self._e_arquivo(caminho):
+                return self._string_arquivo()
+            return ''.join(self._pedacos_string())
+        return self._literal()
+
+    def _objeto(self, caminho):
+        self.pos += 1
+        resultado = {}
+        if self._proximo() == '}':
+            self.pos += 1
+            return resultado
+        while True:
+            self._esperar('"')
+            chave = ''.join(self._pedacos_string())
+            self._esperar(':')
+            resultado[chave] = self.valor(caminho + (chave,))
+            c = self._proximo()
+            self.pos += 1
+            if c == '}':
+                return resultado
+            if c != ',':
+                raise JSONStreamError("Esperado ',' ou '}' no JSON")
+
+    def _lista(self, caminho):
+        self.pos += 1
+        resultado = []
+        if self._proximo() == ']':
+            self.pos += 1
+            return resultado
+        while True:
+            resultado.append(self.valor(caminho + (len(resultado),)))
+            c = self._proximo()
+            self.pos += 1
+            if c == ']':
+                return resultado
+            if c != ',':
+                raise JSONStreamError("Esperado ',' ou ']' no JSON")
+
+    def _literal(self):
+        # Garantir o literal inteiro no buffer (até o próximo delimitador)
+        while True:
+            i = self.pos
+            while i < len(self.buf) and self.buf[i] not in ',]}' + _ESPACOS:
+                i += 1
+            if i < len(self.buf) or not self._carregar():
+                break
+        texto = self.buf[self.pos:i]
+        self.pos = i
+        if texto == 'true':
+            return True
+        if texto == 'false':
+            return False
+        if texto == 'null':
+            return None
+        if _NUMERO.fullmatch(texto):
+            return float(texto) if any(x in texto for x in '.eE') else int(texto)
+        raise JSONStreamError(f'Valor inválido no JSON: {texto[:20]!r}')
+
+    def _pedacos_string(self):
+        """Gerar o conteúdo da string em pedaços (aspas de abertura já lidas)"""
+        while True:
+            if not self._garantir():
+                raise JSONStreamError('String não terminada no JSON')
+            m = _ESPECIAL.search(self.buf, self.pos)
+            if m is None:
+                pedaco = self.buf[self.pos:]
+                self.pos = len(self.buf)
+                yield pedaco
+                continue
+            if m.start() > self.pos:
+                yield self.buf[self.pos:m.start()]
+            self.pos = m.end()
+            if m.group() == '"':
+                return
+            yield self._escape()
+
+    def _escape(self):
+        if not self._garantir():
+            raise JSONStreamError('Escape incompleto no JSON')
+        c = self.buf[self.pos]
+        self.pos += 1
+        if c in _ESCAPES:
+            return _ESCAPES[c]
+        if c != 'u' or not self._garantir(4):
+            raise JSONStreamError('Escape inválido no JSON')
+        codigo = self._hex4(self.pos)
+        self.pos += 4
+        if 0xD800 <= codigo < 0xDC00 and self._garantir(6) and self.buf[self.pos:self.pos + 2] == '\\u':
+            baixo = self._hex4(self.pos + 2)
+            if 0xDC00 <= baixo < 0xE000:
+                self.pos += 6
+                codigo = 0x10000 + ((codigo - 0xD800) << 10) + (baixo - 0xDC00)
+        return chr(codigo)
+
+    def _hex4(self, inicio):
+        """Valor dos 4 dígitos hexadecimais de um escape \\uXXXX em buf[inicio:]"""
+        digitos = self.buf[inicio:inicio + 4]
+        # int(..., 16) também aceitaria sinal, espaços e '_'
+        if len(digitos) != 4 or not all(c in _HEX for c in digitos):
+            raise JSONStreamError(f'Escape \\u inválido no JSON na posição {self._posicao(inicio)}: {digitos!r}')
+        return int(digitos, 16)
+
+    def _string_arquivo(self):
+        """Decodificar data URL base64 para arquivo; outras strings ficam em memória"""
+        pedacos = self._pedacos_string()
+        cabecalho = ''
+        for pedaco in pedacos:
+            cabecalho += pedaco
+            if ',' in cabecalho or len(cabecalho) > MAX_CABECALHO_DATA_URL:
+                break
+
+        prefixo, virgula, inicio = cabecalho.partition(',')
+        if not (virgula and prefixo.startswith('data:') and prefixo.endswith(';base64')):
+            return cabecalho + ''.join(pedacos)
+
+        os.makedirs(self.pasta, exist_ok=True)
+        fd, temporario = tempfile.mkstemp(prefix='upload_', suffix='.part', dir=self.pasta)
+        os.close(fd)
+        with GravadorArquivo(temporario) as gravador:
+            escritor = EscritorBase64(gravador)
+            escritor.escrever(inicio)
+            for pedaco in pedacos:
+                escritor.escrever(pedaco)
+            arquivo = ArquivoDataUrl(prefixo[5:-7] or 'application/octet-stream', escritor.finalizar())
+        self.arquivos.append(arquivo)
+        return arquivo
+
+
+class CorpoStreaming:
+    """
+    JSON lido em streaming, com as data URLs em arquivos temporários
+
+    Use como context manager: na saída, os temporários que não foram
+    movidos (ArquivoDataUrl.mover_para) são apagados.
+    """
+
+    def __init__(self, stream, caminhos=CAMINHOS_ARQUIVO, pasta=PASTA_TEMP, tamanho_bloco=TAMANHO_BLOCO):
+        self.dados = None
+        self.arquivos = []
+        self._parser = _Parser(stream, caminhos, pasta, tamanho_bloco)
+
+    def carregar(self):
+        parser = self._parser
+        try:
+            self.dados = parser.valor(())
+            parser._pular_espacos()
+            if parser.pos < len(parser.buf):
+                raise JSONStreamError('Conteúdo após o fim do JSON')
+        except (UnicodeDecodeError, binascii.Error) as e:
+            raise JSONStreamError(str(e)) from e
+        finally:
+            self.arquivos = parser.arquivos
+        return self.dados
+
+    def limpar(self):
+        """Apagar temporários que continuam na pasta temporária"""
+        pasta = os.path.abspath(self._parser.pasta)
+        for arquivo in self.arquivos:
+            if os.path.dirname(os.path.abspath(arquivo.path)) == pasta:
+                try:
+                    os.remove(arquivo.path)
+                except OSError:
+                    pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.limpar()
+        return False
+
+
+def ler_json_streaming(stream, **kwargs):
+    """Criar CorpoStreaming e carregar o JSON (use o retorno com `with`)"""
+    corpo = CorpoStreaming(stream, **kwargs)
+    try:
+        corpo.carregar()
+    except Exception:
+        corpo.limpar()
+        raise
+    return corpo
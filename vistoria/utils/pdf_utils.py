@@ -12,6 +12,7 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.pdfgen import canvas
 from PIL import Image as PILImage
+from .file_utils import ler_arquivo_salvo
 
 
 class VistoriaPDFGenerator:
@@ -662,73 +663,51 @@ class VistoriaPDFGenerator:
         print(f"🖊️ DEBUG assinatura_path: {assinatura_path}")
         print(f"🖊️ DEBUG dados assinatura: {[(k,v) for k,v in data.items() if 'assinatura' in k.lower()]}")
         
-        # Construir caminho absoluto para assinatura
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # Voltar para pasta vistoria
         token = data.get('token', '')
         
-        # Tentar diferentes caminhos para a assinatura
-        possible_signature_paths = []
-        
-        # Se há caminho da assinatura no banco, tentar usá-lo
-        if assinatura_path:
-            # Se é caminho relativo, construir absoluto
-            if not os.path.isabs(assinatura_path):
-                possible_signature_paths.append(os.path.join(base_dir, assinatura_path))
-                # Normalizar barras do Windows
-                normalized_path = assinatura_path.replace('\\', os.sep)
-                possible_signature_paths.append(os.path.join(base_dir, normalized_path))
-            else:
-                possible_signature_paths.append(assinatura_path)
-        
-        # Adicionar caminhos alternativos baseados no token
-        possible_signature_paths.extend([
-            os.path.join(base_dir, 'assinaturas', f'assinatura_{token}.png'),
-            os.path.join(base_dir, f'assinatura_{token}.png'),
-            os.path.join(os.getcwd(), 'assinaturas', f'assinatura_{token}.png'),
-        ])
-        
-        # Se ainda não encontrou, buscar por padrão na pasta assinaturas
-        assinaturas_dir = os.path.join(base_dir, 'assinaturas')
-        if os.path.exists(assinaturas_dir):
-            for filename in os.listdir(assinaturas_dir):
-                if token in filename and filename.endswith('.png'):
-                    possible_signature_paths.append(os.path.join(assinaturas_dir, filename))
+        # Arquivo gravado na assinatura: chave no armazenamento (db/storage.py);
+        # a rota antiga passa as colunas do banco (assinatura_arquivo_path)
+        assinatura_path = assinatura_path or data.get('assinatura_arquivo_path')
+        possible_signature_paths = [assinatura_path] if assinatura_path else []
         
         signature_loaded = False
         
         for sig_path in possible_signature_paths:
-            if os.path.exists(sig_path):
-                try:
-                    print(f"🖊️ Carregando assinatura: {sig_path}")
-                    
-                    # Título para a imagem da assinatura
-                    sig_title = Paragraph("Assinatura Digital:", self.styles['InfoLabel'])
-                    elements.append(sig_title)
-                    elements.append(Spacer(1, 5))
-                    
-                    # Carregar e redimensionar imagem da assinatura
-                    signature_img = Image(sig_path)
-                    signature_img.drawHeight = 1.5*inch  # Altura fixa
-                    signature_img.drawWidth = 4*inch     # Largura fixa
-                    
-                    elements.append(signature_img)
-                    elements.append(Spacer(1, 10))
-                    
-                    # Informação sobre integridade
-                    checksum_info = data.get('assinatura_checksum')
-                    if checksum_info:
-                        integrity_text = f"Verificação de integridade: {checksum_info[:16]}..."
-                        integrity = Paragraph(integrity_text, self.styles['InfoValue'])
-                        elements.append(integrity)
-                    
-                    signature_loaded = True
-                    print(f"✅ Assinatura carregada com sucesso: {sig_path}")
-                    break
-                    
-                except Exception as e:
-                    print(f"⚠️ Erro ao carregar assinatura em {sig_path}: {e}")
-                    continue
-        
+            try:
+                sig_data = ler_arquivo_salvo(sig_path)
+            except FileNotFoundError:
+                continue
+            try:
+                print(f"🖊️ Carregando assinatura: {sig_path}")
+                
+                # Título para a imagem da assinatura
+                sig_title = Paragraph("Assinatura Digital:", self.styles['InfoLabel'])
+                elements.append(sig_title)
+                elements.append(Spacer(1, 5))
+                
+                # Carregar e redimensionar imagem da assinatura
+                signature_img = Image(sig_data)
+                signature_img.drawHeight = 1.5*inch  # Altura fixa
+                signature_img.drawWidth = 4*inch     # Largura fixa
+                
+                elements.append(signature_img)
+                elements.append(Spacer(1, 10))
+                
+                # Informação sobre integridade
+                checksum_info = data.get('assinatura_checksum')
+                if checksum_info:
+                    integrity_text = f"Verificação de integridade: {checksum_info[:16]}..."
+                    integrity = Paragraph(integrity_text, self.styles['InfoValue'])
+                    elements.append(integrity)
+                
+                signature_loaded = True
+                print(f"✅ Assinatura carregada com sucesso: {sig_path}")
+                break
+                
+            except Exception as e:
+                print(f"⚠️ Erro ao carregar assinatura em {sig_path}: {e}")
+                continue
+    
         if not signature_loaded:
             # Verificar se há data de assinatura
             assinado_em = data.get('assinado_em')
@@ -0,0 +1,86 @@
+"""
+Hash perceptual (pHash) das fotos, para achar quase-duplicatas
+
+A foto é reduzida a 32x32 em tons de cinza (o JPEG já é decodificado
+reduzido, via draft), passa por uma DCT 2D (duas multiplicações de
+matriz no NumPy) e os 8x8 coeficientes de baixa frequência viram 64
+bits: 1 onde o coeficiente passa da mediana. Fotos parecidas (a mesma
+foto reenviada, reencodada ou tirada em sequência) ficam a poucos bits
+de distância (Hamming).
+
+O hash é guardado em fotos_vistoria.phash como BIGINT (64 bits com sinal).
+"""
+import numpy as np
+from PIL import Image, ImageOps
+
+LADO = 32
+BITS = 8
+
+
+def _matriz_dct(n: int) -> np.ndarray:
+    """Matriz da DCT-II ortonormal n x n (DCT 2D de X = M @ X @ M.T)"""
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    matriz = np.cos(np.pi * (2 * x + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matriz[0] /= np.sqrt(2)
+    return matriz.astype(np.float32)
+
+
+_DCT = _matriz_dct(LADO)
+
+
+def _com_sinal(valor: int) -> int:
+    """64 bits sem sinal -> BIGINT do PostgreSQL"""
+    return valor - (1 << 64) if valor >= 1 << 63 else valor
+
+
+def hash_perceptual(img: Image.Image) -> int:
+    """pHash de 64 bits de uma imagem do PIL (já orientada)"""
+    cinza = img.convert('L').resize((LADO, LADO), Image.BILINEAR)
+    pixels = np.asarray(cinza, dtype=np.float32)
+    baixas = (_DCT @ pixels @ _DCT.T)[:BITS, :BITS].ravel()
+    # O DC (brilho médio) fica fora da mediana: só domina o limiar
+    bits = baixas > np.median(baixas[1:])
+    return _com_sinal(int.from_bytes(np.packbits(bits).tobytes(), 'big'))
+
+
+def hash_do_arquivo(file_path: str):
+    """pHash da imagem em file_path; None se não for possível abrir"""
+    try:
+        with Image.open(file_path) as img:
+            if img.format == 'JPEG':
+                img.draft('L', (LADO * 4, LADO * 4))
+            return hash_perceptual(ImageOps.exif_transpose(img))
+    except Exception as e:
+        print(f"⚠️ Não foi possível calcular o hash de {file_path}: {e}")
+        return None
+
+
+def distancias(hashes: list) -> np.ndarray:
+    """Matriz n x n das distâncias de Hamming entre os hashes"""
+    valores = np.asarray(hashes, dtype=np.int64).view(np.uint64)
+    diferentes = (valores[:, None] ^ valores[None, :]).view(np.uint8)
+    return np.unpackbits(diferentes.reshape(len(valores), len(valores), 8), axis=2).sum(axis=2)
+
+
+def quase_duplicadas(hashes: list, distancia_maxima: int) -> list:
+    """
+    Para cada hash, o índice da primeira foto anterior (não duplicada) a
+    até distancia_maxima bits, ou None
+
+    Cada foto é comparada só com as mantidas, então uma sequência de
+    fotos que muda aos poucos não vira uma corrente de duplicatas.
+    """
+    if not hashes:
+        return []
+    perto = distancias(hashes) <= distancia_maxima
+    mantidas = np.zeros(len(hashes), dtype=bool)
+    resultado = []
+    for i in range(len(hashes)):
+        anteriores = np.flatnonzero(perto[i, :i] & mantidas[:i])
+        if anteriores.size:
+            resultado.append(int(anteriores[0]))
+        else:
+            mantidas[i] = True
+            resultado.append(None)
+    return resultado
@@ -2,27 +2,305 @@
 Utilitários para processamento de fotos
 """
 import os
-import base64
+import tempfile
+import threading
 from datetime import datetime
-from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
+from config import PHOTO_CONFIG
 from db import get_vistoria_db
-from .file_utils import calculate_file_checksum
+from db.blobs import get_blob_store
+from db.uploads import get_upload_store
+from .file_utils import ArquivoIngerido, gravar_data_url, normalizar_imagem
+from .json_stream import ArquivoDataUrl, PASTA_TEMP
+from .phash import hash_do_arquivo, quase_duplicadas
 
+# Pool compartilhado entre requisições: limita o total de threads de fotos
+_pool = None
+_pool_lock = threading.Lock()
 
-def process_vistoria_photos(photos_data: list, vistoria_id: str, vistoria_token: str) -> list:
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=PHOTO_CONFIG['WORKERS'], thread_name_prefix='fotos')
+        return _pool
+
+
+def _executar_em_paralelo(funcao, trabalhos: list, workers: int = None) -> list:
     """
-    Processar e salvar fotos da vistoria no banco
+    Executar funcao(*trabalho) para cada trabalho, na ordem da entrada
+    
+    workers=1 (ou um único trabalho) roda na própria thread; None usa o
+    pool compartilhado (PHOTO_WORKERS); outro valor usa um pool só para
+    esta chamada (benchmark).
+    """
+    if workers is None:
+        workers = PHOTO_CONFIG['WORKERS']
+    if workers <= 1 or len(trabalhos) <= 1:
+        return [funcao(*trabalho) for trabalho in trabalhos]
+    if workers == PHOTO_CONFIG['WORKERS']:
+        return list(_get_pool().map(lambda trabalho: funcao(*trabalho), trabalhos))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='fotos') as pool:
+        return list(pool.map(lambda trabalho: funcao(*trabalho), trabalhos))
+
+
+def _temporario() -> str:
+    """Arquivo vazio na pasta temporária de uploads (mesmo disco dos blobs)"""
+    os.makedirs(PASTA_TEMP, exist_ok=True)
+    fd, temporario = tempfile.mkstemp(prefix='foto_', suffix='.part', dir=PASTA_TEMP)
+    os.close(fd)
+    return temporario
+
+
+def _normalizar(arquivo):
+    """normalizar_imagem com PHOTO_CONFIG; None se a foto fica como veio"""
+    destino = _temporario()
+    try:
+        normalizado = normalizar_imagem(arquivo, destino, PHOTO_CONFIG['MAX_SIDE'],
+                                        PHOTO_CONFIG['FORMAT'], PHOTO_CONFIG['QUALITY'])
+    except Exception as e:
+        print(f"⚠️ Erro ao normalizar foto, mantendo original: {e}")
+        normalizado = None
+    if normalizado is None and os.path.exists(destino):
+        os.remove(destino)
+    return normalizado
+
+
+def _uploads_concluidos(photos_data: list) -> dict:
+    """upload_id -> ArquivoIngerido do blob, para as fotos enviadas por /api/uploads"""
+    ids = {photo['upload_id'] for photo in photos_data if photo.get('upload_id')}
+    if not ids:
+        return {}
+    return {
+        upload_id: ArquivoIngerido(row['caminho'], row['tamanho'], row['sha256'],
+                                   row['mimetype'], row['largura'], row['altura'])
+        for upload_id, row in get_upload_store().resolver(ids).items()
+    }
+
+
+def uploads_ausentes(photos_data: list) -> list:
+    """upload_id citados que não existem, não foram finalizados ou expiraram"""
+    ids = {photo['upload_id'] for photo in photos_data if photo.get('upload_id')}
+    if not ids:
+        return []
+    return sorted(ids - set(get_upload_store().resolver(ids)))
+
+
+def _salvar_foto_isolada(i: int, total: int, photo: dict, vistoria_token: str, enviado=None):
+    """_salvar_foto sem deixar a falha de uma foto derrubar as outras"""
+    try:
+        return _salvar_foto(i, total, photo, vistoria_token, enviado)
+    except Exception as e:
+        print(f"❌ Erro ao processar foto {i+1}: {e}")
+        return None
+
+
+def _salvar_foto(i: int, total: int, photo: dict, vistoria_token: str, enviado=None):
+    """
+    Salvar o arquivo de uma foto da vistoria
+    
+    enviado: ArquivoIngerido do upload em partes (photo['upload_id']), já
+    conferido e guardado nos blobs; no lugar da data URL.
+    
+    Returns:
+        tuple: (categoria, arquivo_info) ou None se a foto falhou
+    """
+    print(f"🔍 DEBUG: ========== FOTO {i+1}/{total} ==========")
+    print(f"🔍 DEBUG: Dados completos da foto: {photo}")
+    print(f"🔍 DEBUG: Foto {i+1}: categoria='{photo.get('category')}', name='{photo.get('name')}', type='{photo.get('type')}'")
+    category = photo.get('category') or photo.get('name', 'unknown')
+    
+    # Determinar tipo da foto - LÓGICA MELHORADA
+    if any(x in category.lower() for x in ['pneu_', 'marca_pneu']):
+        tipo = 'pneu'
+    elif any(x in category.lower() for x in ['obs_', 'observacao']):
+        tipo = 'observacao'
+    elif category == 'documento_nota_fiscal' or 'documento' in category.lower():
+        tipo = 'documento'
+        print(f"📄 DEBUG: Documento detectado! Categoria: {category}")
+    else:
+        tipo = 'obrigatoria'
+    
+    print(f"🏷️ DEBUG: Tipo determinado: {tipo} para categoria: {category}")
+    
+    # Salvar arquivo físico
+    url = photo.get('url')
+    if photo.get('upload_id') and enviado is None:
+        print(f"❌ Upload {photo['upload_id']} não finalizado ou expirado: foto {category} ignorada")
+        return None
+    if enviado is not None or isinstance(url, ArquivoDataUrl) or (url and url.startswith('data:')):
+        # Foto em base64 - salvar como arquivo
+        try:
+            # Determinar extensão baseada no tipo MIME
+            mime_type = photo.get('type', 'image/jpeg')
+            if 'pdf' in mime_type:
+                extension = '.pdf'
+            elif 'word' in mime_type or 'msword' in mime_type:
+                extension = '.docx' if 'openxml' in mime_type else '.doc'
+            elif 'image' in mime_type:
+                if 'png' in mime_type:
+                    extension = '.png'
+                elif 'gif' in mime_type:
+                    extension = '.gif'
+                else:
+                    extension = '.jpg'
+            else:
+                extension = '.jpg'  # fallback
+            
+            # Decodificar para um temporário: checksum, tamanho e dimensões calculados na gravação
+            try:
+                if enviado is not None:
+                    # Upload em partes: o arquivo já está nos blobs
+                    arquivo = enviado
+                elif isinstance(url, ArquivoDataUrl):
+                    # Já decodificado pela leitura em streaming
+                    arquivo = url.arquivo
+                else:
+                    arquivo = gravar_data_url(url, _temporario())  # o gravador apaga o parcial se falhar
+                print(f"📄 DEBUG: Arquivo escrito: {arquivo.size} bytes, checksum {arquivo.checksum}")
+            except Exception as write_error:
+                print(f"❌ ERRO ao escrever arquivo: {write_error}")
+                raise
+            
+            # Normalizar fotos (documentos ficam como vieram: a redução atrapalharia a leitura)
+            original = None
+            if PHOTO_CONFIG['NORMALIZE'] and tipo != 'documento':
+                normalizado = _normalizar(arquivo)
+                if normalizado is not None:
+                    print(f"🖼️ DEBUG: Normalizada: {arquivo.size} -> {normalizado.size} bytes, "
+                          f"{normalizado.largura}x{normalizado.altura}")
+                    arquivo, original = normalizado, arquivo
+            
+            # Mesmo conteúdo já guardado (reenvio, foto repetida): o temporário é descartado
+            store = get_blob_store()
+            if arquivo is enviado:
+                os.utime(arquivo.path)  # reuso renova o mtime, como em guardar (coleta de blobs)
+                print(f"📄 DEBUG: Blob do upload {photo['upload_id']}: {arquivo.path}")
+            else:
+                arquivo.path, novo = store.guardar(
+                    arquivo.path, arquivo.checksum, store.extensao(arquivo.mimetype, extension)
+                )
+                print(f"📄 DEBUG: {'Blob gravado' if novo else 'Blob reaproveitado'}: {arquivo.path}")
+            
+            original_info = None
+            if original is not None and PHOTO_CONFIG['KEEP_ORIGINAL']:
+                if original is enviado:
+                    os.utime(original.path)
+                else:
+                    original.path, _ = store.guardar(
+                        original.path, original.checksum, store.extensao(original.mimetype, extension)
+                    )
+                original_info = {
+                    'blob': original.checksum,
+                    'path': original.path,
+                    'size': original.size,
+                    'mimetype': original.mimetype or mime_type,
+                    'largura': original.largura,
+                    'altura': original.altura
+                }
+            elif original is not None and original is not enviado:
+                os.remove(original.path)  # o upload sem referência sai na coleta de blobs
+            
+            # Nome legível (arquivo_nome); o arquivo em si fica no armazenamento por conteúdo
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            extension = store.extensao(arquivo.mimetype, extension)
+            if tipo == 'documento':
+                # Vários documentos podem ser gravados ao mesmo tempo: índice no nome
+                filename = f'documento_{vistoria_token}_{timestamp}_{i+1}{extension}'
+            else:
+                filename = f'{category}_{vistoria_token}_{timestamp}{extension}'
+            
+            # Hash perceptual para quase-duplicatas (documentos não entram)
+            phash = None
+            if tipo != 'documento' and (arquivo.mimetype or '').startswith('image/'):
+                phash = hash_do_arquivo(arquivo.path)
+            
+            arquivo_info = {
+                'filename': filename,
+                'path': arquivo.path,
+                'url': store.url(arquivo.path),
+                'size': arquivo.size,
+                'tamanho_original': original.size if original is not None else arquivo.size,
+                'mimetype': arquivo.mimetype or mime_type,  # MIME identificado pelo conteúdo
+                'checksum': arquivo.checksum,
+                'blob': arquivo.checksum,
+                'largura': arquivo.largura,
+                'altura': arquivo.altura,
+                'original': original_info,
+                'phash': phash
+            }
+            
+        except Exception as e:
+            print(f"❌ Erro ao processar foto {category}: {e}")
+            return None
+    else:
+        # Foto já salva - usar informações existentes
+        arquivo_info = {
+            'filename': photo.get('name', ''),
+            'path': '',  # Não temos o path físico
+            'url': photo.get('url', ''),
+            'size': photo.get('size'),
+            'mimetype': photo.get('type', 'image/jpeg'),
+            'checksum': '',
+            'largura': None,
+            'altura': None,
+            'phash': None
+        }
+    
+    return category, arquivo_info
+
+
+def aplicar_politica_duplicatas(fotos: list, politica: str = None, distancia: int = None) -> list:
+    """
+    Quase-duplicatas da mesma vistoria (pHash a até `distancia` bits de uma
+    foto anterior): 'marcar' preenche duplicata_de com a categoria da foto
+    mantida; 'descartar' tira a foto da lista; 'desligado' não compara
+    
+    Fotos de observação só são marcadas: a descrição é ligada a elas. O
+    blob de uma foto descartada fica sem referência e sai na coleta.
+    """
+    politica = politica or PHOTO_CONFIG['DUPLICATES']
+    if distancia is None:
+        distancia = PHOTO_CONFIG['DUPLICATE_DISTANCE']
+    comparadas = [i for i, (_, info) in enumerate(fotos) if info.get('phash') is not None]
+    if politica == 'desligado' or len(comparadas) < 2:
+        return fotos
+    
+    descartadas = set()
+    duplicatas = quase_duplicadas([fotos[i][1]['phash'] for i in comparadas], distancia)
+    for i, mantida in zip(comparadas, duplicatas):
+        if mantida is None:
+            continue
+        categoria, info = fotos[i]
+        original = fotos[comparadas[mantida]][0]
+        if politica == 'descartar' and 'obs_' not in categoria.lower():
+            descartadas.add(i)
+            print(f"🗑️ [DEDUP] Quase-duplicata descartada: {categoria} (igual a {original})")
+        else:
+            info['duplicata_de'] = original
+            print(f"⚠️ [DEDUP] Quase-duplicata marcada: {categoria} (igual a {original})")
+    return [foto for i, foto in enumerate(fotos) if i not in descartadas]
+
+
+def prepare_vistoria_photos(photos_data: list, vistoria_token: str, workers: int = None) -> list:
+    """
+    Salvar os arquivos das fotos da vistoria em disco (sem acessar o banco)
+    
+    As fotos são gravadas em paralelo (PHOTO_WORKERS threads); o resultado
+    segue a ordem de photos_data e uma foto com erro é só omitida.
+    Quase-duplicatas seguem PHOTO_DUPLICATES (aplicar_politica_duplicatas).
     
     Args:
-        photos_data (list): Lista de fotos com dados base64
-        vistoria_id (str): ID da vistoria no banco
-        vistoria_token (str): Token da vistoria
+        photos_data (list): Lista de fotos com dados base64 ou upload_id
+        vistoria_token (str): Token da vistoria (usado no nome dos arquivos)
+        workers (int): Threads para esta chamada (padrão: PHOTO_WORKERS)
         
     Returns:
-        list: Lista de IDs das fotos inseridas
+        list: Tuplas (categoria, arquivo_info) prontas para inserir em fotos_vistoria
     """
     print(f"🔍 [PHOTO_UTILS] ========== INÍCIO PROCESSAMENTO ==========")
-    print(f"🔍 [PHOTO_UTILS] Vistoria ID: {vistoria_id}, Token: {vistoria_token}")
+    print(f"🔍 [PHOTO_UTILS] Token: {vistoria_token}")
     print(f"🔍 [PHOTO_UTILS] Iniciando process_vistoria_photos com {len(photos_data)} fotos")
     
     # CORREÇÃO: Remover duplicatas baseadas na categoria - EXCETO DOCUMENTOS
@@ -48,198 +326,63 @@ def process_vistoria_photos(photos_data: list, vistoria_id: str, vistoria_token:
     
     print(f"🔍 [DEDUP] Resultado: {len(photos_data)} -> {len(unique_photos)} fotos (removidas {len(photos_data) - len(unique_photos)} duplicatas)")
     
-    foto_ids = []
-    vistoria_db = get_vistoria_db()
+    fotos = []
     
     try:
         print(f"🔍 DEBUG: Processando {len(unique_photos)} fotos únicas")
-        for i, photo in enumerate(unique_photos):
-            print(f"🔍 DEBUG: ========== FOTO {i+1}/{len(unique_photos)} ==========")
-            print(f"🔍 DEBUG: Dados completos da foto: {photo}")
-            print(f"🔍 DEBUG: Foto {i+1}: categoria='{photo.get('category')}', name='{photo.get('name')}', type='{photo.get('type')}'")
-            category = photo.get('category') or photo.get('name', 'unknown')
-            
-            # Determinar tipo da foto - LÓGICA MELHORADA
-            if any(x in category.lower() for x in ['pneu_', 'marca_pneu']):
-                tipo = 'pneu'
-            elif any(x in category.lower() for x in ['obs_', 'observacao']):
-                tipo = 'observacao'
-            elif category == 'documento_nota_fiscal' or 'documento' in category.lower():
-                tipo = 'documento'
-                print(f"📄 DEBUG: Documento detectado! Categoria: {category}")
-            else:
-                tipo = 'obrigatoria'
-            
-            print(f"🏷️ DEBUG: Tipo determinado: {tipo} para categoria: {category}")
-            
-                        # Salvar arquivo físico
-            if photo.get('url') and photo['url'].startswith('data:'):
-                # Foto em base64 - salvar como arquivo
-                try:
-                    # Determinar diretório baseado no tipo (usando mesmo método que vistoria_utils)
-                    if tipo == 'documento':
-                        uploads_dir = os.path.join('uploads', 'documentos')
-                        print(f"📁 DEBUG: Salvando documento em: {uploads_dir}")
-                    else:
-                        uploads_dir = os.path.join('uploads', 'fotos')
-                    
-                    # Garantir que o diretório seja absoluto baseado no diretório atual
-                    uploads_dir = os.path.abspath(uploads_dir)
-                    print(f"📁 DEBUG: Diretório absoluto: {uploads_dir}")
-                    print(f"📁 DEBUG: Diretório de trabalho atual: {os.getcwd()}")
-                    
-                    # Criar diretório se não existir
-                    if not os.path.exists(uploads_dir):
-                        os.makedirs(uploads_dir)
-                        print(f"📁 DEBUG: Diretório criado: {uploads_dir}")
-                    else:
-                        print(f"📁 DEBUG: Diretório já existe: {uploads_dir}")
-                    
-                    # Extrair dados base64
-                    header, data = photo['url'].split(',', 1)
-                    file_data = base64.b64decode(data)
-                    
-                    # Determinar extensão baseada no tipo MIME
-                    mime_type = photo.get('type', 'image/jpeg')
-                    if 'pdf' in mime_type:
-                        extension = '.pdf'
-                    elif 'word' in mime_type or 'msword' in mime_type:
-                        extension = '.docx' if 'openxml' in mime_type else '.doc'
-                    elif 'image' in mime_type:
-                        if 'png' in mime_type:
-                            extension = '.png'
-                        elif 'gif' in mime_type:
-                            extension = '.gif'
-                        else:
-                            extension = '.jpg'
-                    else:
-                        extension = '.jpg'  # fallback
-                    
-                    # Gerar nome do arquivo
-                    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                    if tipo == 'documento':
-                        filename = f'documento_{vistoria_token}_{timestamp}{extension}'
-                    else:
-                        filename = f'{category}_{vistoria_token}_{timestamp}{extension}'
-                    file_path = os.path.join(uploads_dir, filename)
-                    
-                    # Salvar arquivo
-                    print(f"📄 DEBUG: Tentando salvar arquivo em: {file_path}")
-                    print(f"📄 DEBUG: Tamanho dos dados: {len(file_data)} bytes")
-                    try:
-                        with open(file_path, 'wb') as f:
-                            f.write(file_data)
-                        print(f"📄 DEBUG: Arquivo escrito com sucesso!")
-                    except Exception as write_error:
-                        print(f"❌ ERRO ao escrever arquivo: {write_error}")
-                        raise
-                    
-                    if tipo == 'documento':
-                        print(f"📄 DEBUG: Documento salvo com sucesso em: {file_path}")
-                        print(f"📄 DEBUG: Tamanho do arquivo: {len(file_data)} bytes")
-                    
-                    # Verificar se o arquivo foi realmente criado
-                    if os.path.exists(file_path):
-                        print(f"✅ Arquivo confirmado no sistema: {file_path}")
-                    else:
-                        print(f"❌ ERRO: Arquivo não foi criado no sistema: {file_path}")
-                    
-                    # Obter informações
-                    try:
-                        file_size = os.path.getsize(file_path)
-                        print(f"📄 DEBUG: Tamanho do arquivo confirmado: {file_size} bytes")
-                    except Exception as size_error:
-                        print(f"❌ ERRO ao obter tamanho do arquivo: {size_error}")
-                        raise
-                    
-                    try:
-                        checksum = calculate_file_checksum(file_path)
-                        print(f"📄 DEBUG: Checksum calculado: {checksum}")
-                    except Exception as checksum_error:
-                        print(f"❌ ERRO ao calcular checksum: {checksum_error}")
-                        raise
-                    
-                    # Obter dimensões (só para imagens)
-                    width, height = None, None
-                    if 'image' in mime_type:
-                        try:
-                            with Image.open(file_path) as img:
-                                width, height = img.size
-                        except Exception as e:
-                            print(f"⚠️ Não foi possível obter dimensões da imagem {filename}: {e}")
-                            width, height = None, None
-                    
-                    # Determinar URL baseada no tipo
-                    if tipo == 'documento':
-                        url_path = f'/uploads/documentos/{filename}'
-                    else:
-                        url_path = f'/uploads/fotos/{filename}'
-                    
-                    arquivo_info = {
-                        'filename': filename,
-                        'path': file_path,
-                        'url': url_path,
-                        'size': file_size,
-                        'mimetype': mime_type,  # Usar o tipo MIME correto
-                        'checksum': checksum,
-                        'largura': width,
-                        'altura': height
-                    }
-                    
-                except Exception as e:
-                    print(f"❌ Erro ao processar foto {category}: {e}")
-                    continue
-            else:
-                # Foto já salva - usar informações existentes
-                arquivo_info = {
-                    'filename': photo.get('name', ''),
-                    'path': '',  # Não temos o path físico
-                    'url': photo.get('url', ''),
-                    'size': photo.get('size'),
-                    'mimetype': photo.get('type', 'image/jpeg'),
-                    'checksum': '',
-                    'largura': None,
-                    'altura': None
-                }
-            
-            # Inserir foto no banco
-            print(f"🔍 [PHOTO_UTILS] ========== INSERINDO NO BANCO ==========")
-            print(f"🔍 [PHOTO_UTILS] Vistoria ID: {vistoria_id}")
-            print(f"🔍 [PHOTO_UTILS] Categoria: {category}")
-            print(f"🔍 [PHOTO_UTILS] Tipo determinado: {tipo}")
-            print(f"🔍 [PHOTO_UTILS] Arquivo info: {arquivo_info}")
-            
-            try:
-                foto_id = vistoria_db.inserir_foto_vistoria(
-                    vistoria_id=vistoria_id,
-                    categoria=category,
-                    arquivo_info=arquivo_info
-                )
-                
-                foto_ids.append(foto_id)
-                
-                if tipo == 'documento':
-                    print(f"📄 [SUCESSO] DOCUMENTO INSERIDO NO BANCO! ID: {foto_id}")
-                    print(f"📄 [SUCESSO] Categoria: {category}")
-                    print(f"📄 [SUCESSO] Arquivo: {arquivo_info.get('filename')}")
-                    print(f"📄 [SUCESSO] Tamanho: {arquivo_info.get('size')} bytes")
-                else:
-                    print(f"✅ [PHOTO_UTILS] Foto inserida no banco: {category} - ID: {foto_id}")
-                
-            except Exception as insert_error:
-                print(f"❌ [ERRO CRÍTICO] Falha ao inserir no banco:")
-                print(f"   - Categoria: {category}")
-                print(f"   - Tipo: {tipo}")
-                print(f"   - Erro: {insert_error}")
-                print(f"   - Arquivo info: {arquivo_info}")
-                # Não adicionar à lista em caso de erro
-                foto_ids.append(None)
+        enviados = _uploads_concluidos(unique_photos)
+        trabalhos = [(i, len(unique_photos), photo, vistoria_token, enviados.get(photo.get('upload_id')))
+                     for i, photo in enumerate(unique_photos)]
+        fotos = [foto for foto in _executar_em_paralelo(_salvar_foto_isolada, trabalhos, workers) if foto]
+        fotos = aplicar_politica_duplicatas(fotos)
         
         print(f"🔍 [PHOTO_UTILS] ========== FIM PROCESSAMENTO ==========")
-        print(f"🔍 [PHOTO_UTILS] Total de fotos processadas: {len(foto_ids)}")
-        print(f"🔍 [PHOTO_UTILS] IDs das fotos: {foto_ids}")
-        return foto_ids
+        print(f"🔍 [PHOTO_UTILS] Total de fotos processadas: {len(fotos)}")
+        return fotos
         
     except Exception as e:
         print(f"❌ Erro ao processar fotos: {e}")
-        return foto_ids
+        return fotos
+
+
+def remove_photo_files(fotos: list) -> None:
+    """
+    Remover arquivos gravados por prepare_vistoria_photos (ex.: transação falhou)
+    
+    Blobs não são apagados aqui: o mesmo conteúdo pode estar em outra
+    vistoria ou em um envio em andamento. Os sem linha em blobs saem com
+    python -m db.blobs gc --orfaos.
+    """
+    for _, arquivo_info in fotos:
+        if arquivo_info.get('blob'):
+            continue
+        path = arquivo_info.get('path')
+        if path and os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(f"⚠️ Não foi possível remover {path}: {e}")
+
+
+def process_vistoria_photos(photos_data: list, vistoria_id: str, vistoria_token: str) -> list:
+    """
+    Processar e salvar fotos da vistoria no banco
+    
+    Args:
+        photos_data (list): Lista de fotos com dados base64
+        vistoria_id (str): ID da vistoria no banco
+        vistoria_token (str): Token da vistoria
+        
+    Returns:
+        list: Lista de IDs das fotos inseridas
+    """
+    fotos = prepare_vistoria_photos(photos_data, vistoria_token)
+    if not fotos:
+        return []
+    
+    try:
+        return get_vistoria_db().inserir_fotos_vistoria(vistoria_id, fotos)
+    except Exception as e:
+        print(f"❌ Erro ao inserir fotos no banco: {e}")
+        remove_photo_files(fotos)
+        return []
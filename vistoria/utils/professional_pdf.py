@@ -13,6 +13,8 @@ from reportlab.lib.utils import ImageReader
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 from flask import current_app
+from db.rows import CAMPOS_QUESTIONARIO
+from .file_utils import ler_arquivo_salvo
 
 
 class ProfessionalPDFGenerator:
@@ -546,20 +548,17 @@ class ProfessionalPDFGenerator:
         if token and assinado_em and assinado_em != 'N/A':
             # Tentar exibir a imagem da assinatura
             try:
-                # Buscar arquivo de assinatura na pasta assinaturas
-                signature_path = None
-                assinaturas_dir = os.path.join(os.path.dirname(__file__), '..', 'assinaturas')
+                # Arquivo gravado na assinatura (chave no armazenamento, vinda do banco)
+                signature_data = None
+                if data.get('assinatura_path'):
+                    try:
+                        signature_data = ler_arquivo_salvo(data['assinatura_path'])
+                    except FileNotFoundError:
+                        print(f"⚠️ Assinatura não encontrada: {data['assinatura_path']}")
                 
-                if os.path.exists(assinaturas_dir):
-                    # Procurar por arquivo de assinatura com o token
-                    for filename in os.listdir(assinaturas_dir):
-                        if token in filename and filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-                            signature_path = os.path.join(assinaturas_dir, filename)
-                            break
-                
-                if signature_path and os.path.exists(signature_path):
+                if signature_data is not None:
                     # Criar imagem da assinatura centralizada
-                    signature_img = Image(signature_path)
+                    signature_img = Image(signature_data)
                     # Redimensionar para caber bem no documento
                     signature_img.drawHeight = 3*cm
                     signature_img.drawWidth = 8*cm
@@ -660,3 +659,53 @@ def generate_professional_pdf(vistoria_data, output_path):
     """Função principal para gerar PDF profissional"""
     generator = ProfessionalPDFGenerator()
     return generator.generate_pdf(vistoria_data, output_path)
+
+
+
+def montar_dados_pdf(vistoria, include_photos=True):
+    """Montar os dados do PDF a partir de buscar_vistoria_completa()"""
+    fotos = vistoria['fotos']
+    pdf_data = {
+        'id': vistoria.get('id'),
+        'token': vistoria.get('token'),
+        'nome_cliente': vistoria.get('nome_cliente'),
+        'nome_terceiro': vistoria.get('nome_terceiro'),
+        'proprio': vistoria.get('proprio'),
+        'nome_conferente': vistoria.get('nome_conferente'),
+        'data_vistoria': vistoria.get('criado_em'),
+        'status': vistoria.get('status'),
+        'km_rodado': vistoria.get('km_rodado'),
+        'veiculo': {
+            'placa': vistoria.get('placa'),
+            'marca': vistoria.get('marca'),
+            'modelo': vistoria.get('modelo'),
+            'cor': vistoria.get('cor'),
+            'ano': str(vistoria.get('ano')) if vistoria.get('ano') else None,
+            'chassi': vistoria.get('chassi'),
+            'renavam': vistoria.get('renavam')
+        },
+        'pneus': {
+            'marca_pneu_dianteiro_esquerdo': vistoria.get('marca_pneu_dianteiro_esquerdo'),
+            'marca_pneu_dianteiro_direito': vistoria.get('marca_pneu_dianteiro_direito'),
+            'marca_pneu_traseiro_esquerdo': vistoria.get('marca_pneu_traseiro_esquerdo'),
+            'marca_pneu_traseiro_direito': vistoria.get('marca_pneu_traseiro_direito')
+        },
+        'fotos': [{'categoria': foto.get('categoria'), 'nome': foto.get('arquivo_nome'), 'path': foto.get('arquivo_path')} for foto in fotos],
+        'assinado_em': vistoria.get('assinatura_data'),
+        'token_assinatura': vistoria.get('token'),
+        'assinatura_cliente_nome': vistoria.get('assinatura_cliente_nome') or vistoria.get('nome_cliente'),
+        'assinatura_path': vistoria.get('assinatura_arquivo_path'),
+        # Opções do PDF (incluir fotos ou não)
+        'pdf_options': {
+            'include_photos': include_photos
+        }
+    }
+
+    for field in CAMPOS_QUESTIONARIO:
+        pdf_data[field] = vistoria.get(field, False)
+
+    for i in range(1, 5):
+        obs_field = f'desc_obs_{i}'
+        pdf_data[obs_field] = vistoria.get(obs_field, '')
+
+    return pdf_data
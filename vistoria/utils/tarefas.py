@@ -0,0 +1,92 @@
+"""
+Handlers da fila de tarefas (db/jobs.py)
+"""
+import io
+import json
+from datetime import datetime
+from db import get_vistoria_db
+from db.jobs import tarefa
+from db.storage import get_storage
+from .json_stream import ArquivoDataUrl
+from .professional_pdf import generate_professional_pdf, montar_dados_pdf
+
+BACKUP_DIR = 'vistorias_backup'
+PDF_DIR = 'pdfs'
+
+
+def dados_para_backup(vistoria_data: dict, fotos: list = ()) -> dict:
+    """
+    Cópia dos dados da vistoria sem o base64 das fotos e do documento
+    (nem os ArquivoDataUrl da leitura em streaming)
+
+    Os arquivos já foram gravados em uploads/; `fotos` (as tuplas de
+    prepare_vistoria_photos) vira a lista 'arquivos', que db/bulk.py usa
+    para encontrá-los no armazenamento por conteúdo.
+    """
+    def sem_base64(item):
+        if isinstance(item, dict):
+            return {k: v for k, v in item.items()
+                    if not (k in ('url', 'file') and (isinstance(v, ArquivoDataUrl)
+                                                      or isinstance(v, str) and v.startswith('data:')))}
+        return item
+
+    dados = dict(vistoria_data)
+    if 'photos' in dados:
+        dados['photos'] = [sem_base64(photo) for photo in dados['photos']]
+    if isinstance(dados.get('fotos'), dict):
+        dados['fotos'] = {campo: sem_base64(foto) for campo, foto in dados['fotos'].items()}
+    if 'documento' in dados:
+        dados['documento'] = sem_base64(dados['documento'])
+    if fotos:
+        dados['arquivos'] = [
+            {'categoria': categoria, 'path': info.get('path'), 'blob': info.get('blob')}
+            for categoria, info in fotos
+        ]
+    return dados
+
+
+@tarefa('backup_vistoria', campos=('vistoria_id', 'token', 'dados', 'created_at'), prioridade=-10)
+def backup_vistoria(payload):
+    """Gravar o backup JSON da vistoria em vistorias_backup/ (agrupado pelo token)"""
+    timestamp = datetime.fromisoformat(payload.created_at).strftime('%Y%m%d_%H%M%S')
+    storage = get_storage()
+    backup_file = storage.chave(BACKUP_DIR, f'vistoria_{payload.token}_{timestamp}.json', grupo=payload.token)
+
+    backup_data = {
+        'vistoria_id': str(payload.vistoria_id),
+        'token': payload.token,
+        'dados_originais': payload.dados,
+        'created_at': payload.created_at,
+        'backup_version': '1.0'
+    }
+
+    with storage.escrever(backup_file, 'application/json') as destino:
+        texto = io.TextIOWrapper(destino, encoding='utf-8')
+        json.dump(backup_data, texto, ensure_ascii=False, indent=2, default=str)
+        texto.flush()
+        texto.detach()  # o arquivo é fechado e publicado por escrever()
+
+    print(f"📋 Backup salvo: {backup_file}")
+    return {'backup_file': backup_file}
+
+
+@tarefa('gerar_pdf', campos=('token', 'include_photos'), prioridade=10)
+def gerar_pdf(payload):
+    """Gerar o PDF profissional da vistoria em pdfs/ (baixado por /api/pdf/<job_id>)"""
+    vistoria = get_vistoria_db().buscar_vistoria_completa(payload.token)
+    if not vistoria:
+        raise ValueError(f"Vistoria não encontrada: {payload.token}")
+
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    pdf_filename = f'vistoria_{payload.token}_{timestamp}.pdf'
+    storage = get_storage()
+    pdf_chave = storage.chave(PDF_DIR, pdf_filename, grupo=payload.token)
+
+    with storage.escrever(pdf_chave, 'application/pdf') as destino:
+        if not generate_professional_pdf(montar_dados_pdf(vistoria, payload.include_photos), destino):
+            raise RuntimeError(f"Falha ao gerar PDF: {pdf_filename}")
+
+    return {
+        'pdf_chave': pdf_chave,
+        'download_name': f'Vistoria_{vistoria.get("placa") or payload.token}.pdf'
+    }
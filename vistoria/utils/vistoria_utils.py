@@ -2,11 +2,13 @@
 Utilitários para processamento de vistoria
 """
 import os
-import json
-import base64
 from datetime import datetime
 from db import get_vistoria_db
-from .photo_utils import process_vistoria_photos
+from db.jobs import enfileirar
+from db.storage import get_storage
+from .file_utils import gravar_data_url
+from .photo_utils import prepare_vistoria_photos, remove_photo_files
+from .tarefas import dados_para_backup
 
 
 def save_document(document_data: dict, token: str) -> str:
@@ -18,42 +20,31 @@ def save_document(document_data: dict, token: str) -> str:
         token (str): Token da vistoria
     
     Returns:
-        str: Caminho relativo do arquivo salvo
+        str: Chave do arquivo no armazenamento (db/storage.py)
     """
     try:
         if not document_data or 'file' not in document_data:
             return ''
         
-        # Criar diretório de documentos se não existir
-        docs_dir = os.path.join('uploads', 'documentos')
-        if not os.path.exists(docs_dir):
-            os.makedirs(docs_dir)
-            print(f"📁 Pasta criada: {docs_dir}")
-        
         # Gerar nome único do arquivo
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         original_name = document_data.get('name', 'documento')
         file_extension = os.path.splitext(original_name)[1]
         filename = f'documento_{token}_{timestamp}{file_extension}'
+        storage = get_storage()
+        chave = storage.chave('uploads/documentos', filename)
         
-        # Caminho completo do arquivo
-        file_path = os.path.join(docs_dir, filename)
-        
-        # Salvar arquivo (assumindo que file é base64)
+        # Salvar arquivo (base64 decodificado em blocos, direto no armazenamento)
         file_content = document_data['file']
-        if isinstance(file_content, str) and file_content.startswith('data:'):
-            # Remover o prefixo data:mime;base64,
-            base64_data = file_content.split(',')[1]
-            file_bytes = base64.b64decode(base64_data)
-        else:
-            # Se já for bytes ou outro formato
-            file_bytes = file_content
-        
-        with open(file_path, 'wb') as f:
-            f.write(file_bytes)
+        with storage.escrever(chave, document_data.get('type')) as destino:
+            if isinstance(file_content, str) and file_content.startswith('data:'):
+                gravar_data_url(file_content, destino)
+            else:
+                # Se já for bytes ou outro formato
+                destino.write(file_content)
         
-        print(f"📄 Documento salvo: {file_path}")
-        return f'uploads/documentos/{filename}'
+        print(f"📄 Documento salvo: {chave}")
+        return chave
         
     except Exception as e:
         print(f"❌ Erro ao salvar documento: {e}")
@@ -63,6 +54,9 @@ def save_document(document_data: dict, token: str) -> str:
 def save_vistoria_complete(vistoria_data):
     """
     Salva uma vistoria completa com todas as dependências
+    
+    Os arquivos das fotos são gravados primeiro; vistoria, fotos e
+    observações são inseridos depois em uma única transação.
     """
     try:
         print("🔧 [VISTORIA_UTILS] Iniciando save_vistoria_complete")
@@ -73,25 +67,10 @@ def save_vistoria_complete(vistoria_data):
         print(f"🔍 [VISTORIA_UTILS] Dados dos pneus recebidos: {pneus_data}")
         print(f"🔍 [VISTORIA_UTILS] Chaves dos pneus: {list(pneus_data.keys())}")
         
-        # 1. Inserir vistoria principal
-        try:
-            print(f"🔧 Tentando inserir vistoria com dados: {vistoria_data.keys()}")
-            vistoria_db = get_vistoria_db()
-            result = vistoria_db.inserir_vistoria(vistoria_data)
-            
-            if not result or not isinstance(result, dict):
-                raise Exception(f"Resultado inválido da inserção: {result}")
-                
-            vistoria_id = result['id']
-            vistoria_token = result['token']
-            
-            print(f"✅ Vistoria inserida: ID={vistoria_id}, Token={vistoria_token}")
-            
-        except Exception as insert_error:
-            print(f"❌ Erro específico na inserção: {insert_error}")
-            raise Exception(f"Falha ao inserir vistoria: {insert_error}")
+        vistoria_db = get_vistoria_db()
+        vistoria_token = vistoria_db.gerar_token_unico()
         
-        # 2. Processar e salvar fotos
+        # 1. Salvar arquivos das fotos (antes da transação, usando o token já gerado)
         photos = vistoria_data.get('photos', [])
         print(f"🔍 DEBUG: Fotos recebidas: {len(photos)}")
         
@@ -113,83 +92,76 @@ def save_vistoria_complete(vistoria_data):
             print(f"🔍 DEBUG: Total de fotos recebidas: {len(photos)}")
             print(f"🔍 DEBUG: Tipos de category encontrados: {[photo.get('category') for photo in photos]}")
         
-        if photos:
-            foto_ids = process_vistoria_photos(photos, vistoria_id, vistoria_token)
-            print(f"✅ {len(foto_ids)} fotos processadas")
-        else:
+        fotos = prepare_vistoria_photos(photos, vistoria_token) if photos else []
+        if not fotos:
             print("⚠️ Nenhuma foto encontrada para processar")
         
-        # 3. Processar observações das fotos (se houver)
-        observacoes_salvas = 0
+        # 2. Associar observações às fotos correspondentes (foto_obs_1 até foto_obs_4)
+        observacoes = []
+        categorias = [categoria for categoria, _ in fotos]
         
         for i in range(1, 5):  # obs_1 até obs_4
             desc_key = f'desc_obs_{i}'
             
             if desc_key in vistoria_data and vistoria_data[desc_key].strip():
-                print(f"� Processando observação {i}: {vistoria_data[desc_key]}")
+                print(f"📝 Processando observação {i}: {vistoria_data[desc_key]}")
                 
-                # Procurar foto correspondente da observação
                 foto_categoria = f'foto_obs_{i}'
-                
-                # Encontrar a foto com essa categoria entre as fotos processadas
-                foto_encontrada = False
-                for j, photo in enumerate(photos):
-                    if photo.get('category') == foto_categoria or photo.get('name') == foto_categoria:
-                        # Aqui temos o índice da foto, foto_ids[j] seria o ID
-                        if j < len(foto_ids) and foto_ids[j]:
-                            foto_id = foto_ids[j]
-                            descricao = vistoria_data[desc_key].strip()
-                            
-                            # Salvar observação no banco
-                            try:
-                                obs_id = vistoria_db.inserir_observacao_foto(
-                                    foto_vistoria_id=foto_id,
-                                    descricao=descricao,
-                                    tipo='dano',
-                                    gravidade='media',
-                                    prioridade='normal'
-                                )
-                                observacoes_salvas += 1
-                                print(f"✅ Observação {i} salva: ID={obs_id}, Foto={foto_id}")
-                                foto_encontrada = True
-                            except Exception as e:
-                                print(f"❌ Erro ao salvar observação {i}: {e}")
-                        break
-                
-                if not foto_encontrada:
+                if foto_categoria in categorias:
+                    observacoes.append({
+                        'foto_index': categorias.index(foto_categoria),
+                        'descricao': vistoria_data[desc_key].strip(),
+                        'tipo': 'dano',
+                        'gravidade': 'media',
+                        'prioridade': 'normal'
+                    })
+                else:
                     print(f"⚠️ Foto para observação {i} não encontrada - categoria: {foto_categoria}")
             else:
                 print(f"⚠️ Observação {i} vazia ou não encontrada")
         
-        if observacoes_salvas > 0:
-            print(f"✅ {observacoes_salvas} observações salvas no banco")
-        
-        # 4. Salvar backup em JSON (para segurança)
-        backup_dir = 'vistorias_backup'
-        if not os.path.exists(backup_dir):
-            os.makedirs(backup_dir)
-        
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        backup_file = os.path.join(backup_dir, f'vistoria_{vistoria_token}_{timestamp}.json')
-        
-        backup_data = {
-            'vistoria_id': str(vistoria_id),
-            'token': vistoria_token,
-            'dados_originais': vistoria_data,
-            'created_at': datetime.now().isoformat(),
-            'backup_version': '1.0'
-        }
-        
-        with open(backup_file, 'w', encoding='utf-8') as f:
-            json.dump(backup_data, f, ensure_ascii=False, indent=2, default=str)
+        # 3. Inserir vistoria, fotos e observações em uma única transação
+        try:
+            print(f"🔧 Tentando inserir vistoria com dados: {vistoria_data.keys()}")
+            result = vistoria_db.inserir_vistoria_completa(
+                vistoria_data,
+                fotos=fotos,
+                observacoes=observacoes,
+                token=vistoria_token
+            )
+            
+            if not result or not isinstance(result, dict):
+                raise Exception(f"Resultado inválido da inserção: {result}")
+                
+            vistoria_id = result['id']
+            vistoria_token = result['token']
+            
+            print(f"✅ Vistoria inserida: ID={vistoria_id}, Token={vistoria_token}")
+            print(f"✅ {len(result['foto_ids'])} fotos e {len(result['observacao_ids'])} observações salvas")
+            
+        except Exception as insert_error:
+            print(f"❌ Erro específico na inserção: {insert_error}")
+            remove_photo_files(fotos)
+            raise Exception(f"Falha ao inserir vistoria: {insert_error}")
         
-        print(f"📋 Backup salvo: {backup_file}")
+        # 4. Backup em JSON (para segurança) gravado fora da requisição
+        try:
+            backup_job = enfileirar('backup_vistoria', {
+                'vistoria_id': str(vistoria_id),
+                'token': vistoria_token,
+                'dados': dados_para_backup(vistoria_data, fotos),
+                'created_at': datetime.now().isoformat()
+            })
+            print(f"📋 Backup enfileirado: tarefa {backup_job}")
+        except Exception as backup_error:
+            backup_job = None
+            print(f"⚠️ Não foi possível enfileirar o backup: {backup_error}")
         
         return {
             'success': True,
             'vistoria_id': str(vistoria_id),
             'token': vistoria_token,
-            'backup_file': backup_file
+            'backup_job': backup_job
         }
         
     except Exception as e: